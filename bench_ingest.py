@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ingest with bulk-load index tuning (refresh_interval -1, replicas
+deferred, one final refresh, force-merge) vs the previous behaviour (every
+bulk request refreshes the index).
+
+Needs a running Elasticsearch (ES_HOST); no embedding API calls: vectors
+are random. Each run loads the same synthetic corpus into a throwaway index
+(dropped afterwards) through the real ingest pipeline, then reports
+sentences/sec, the speedup, segment counts and the median search latency
+("took") before and after the force-merge.
+
+Usage:
+    python bench_ingest.py
+    python bench_ingest.py --sentences 30000 --merge-segments 1
+"""
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import settings
+from services import ingest_pipeline
+from services.retriever import index_sentences_pipelined
+from vector.elastic_client import (
+    EMBEDDING_DIMS, create_versioned_index, drop_index, measure_search_latency, segment_count,
+)
+
+WORDS = "and the lord said unto moses speak to the children of israel that they go forward in the wilderness".split()
+
+
+def _corpus(count: int, rng: random.Random):
+    return [f"{i}:{i % 31} " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24))) + "." for i in range(count)]
+
+
+def _random_embeddings(rng: random.Random):
+    def embed(texts):
+        return [[rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMS)] for _ in texts]
+    return embed
+
+
+def _run(label: str, sentences, tuned: bool, merge_segments: int):
+    settings.INGEST_BULK_TUNING = tuned
+    index = create_versioned_index()
+    try:
+        started = time.perf_counter()
+        result = index_sentences_pipelined(
+            sentences, file_id="bench", index=index, force_merge_segments=merge_segments if tuned else 0
+        )
+        elapsed = time.perf_counter() - started
+        row = {
+            "label": label,
+            "seconds": elapsed,
+            "rate": len(sentences) / elapsed,
+            "bulk_rate": result["stages"]["bulk"]["sentences_per_sec"],
+        }
+        merge = result.get("force_merge")
+        if merge and "error" not in merge:
+            row.update(segments=merge["segments_after"], segments_loaded=merge["segments_before"],
+                       latency_loaded=merge["latency_before"], latency=merge["latency_after"],
+                       merge_seconds=merge["merge_seconds"])
+        else:
+            row.update(segments=segment_count(index), latency=measure_search_latency(index))
+        return row
+    finally:
+        drop_index(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--merge-segments", type=int, default=max(1, settings.INGEST_FORCE_MERGE_SEGMENTS))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sentences = _corpus(args.sentences, rng)
+    ingest_pipeline.get_embeddings_batch = _random_embeddings(rng)
+    # Throwaway indices get their own prefix (never the live alias)
+    settings.ES_INDEX_NAME = f"{settings.ES_INDEX_NAME}_bench"
+    original_tuning = settings.INGEST_BULK_TUNING
+    try:
+        baseline = _run("refresh per bulk request", sentences, tuned=False, merge_segments=0)
+        tuned = _run("bulk-load tuning", sentences, tuned=True, merge_segments=args.merge_segments)
+    finally:
+        settings.INGEST_BULK_TUNING = original_tuning
+
+    print(f"\n{args.sentences} sentences, {EMBEDDING_DIMS}-dim random vectors\n")
+    print(f"{'mode':<26} {'seconds':>8} {'sent/s':>8} {'bulk/s':>8} {'segments':>9} {'text ms':>8} {'vector ms':>10}")
+    for row in (baseline, tuned):
+        print(f"{row['label']:<26} {row['seconds']:>8.1f} {row['rate']:>8.0f} {row['bulk_rate']:>8.0f} "
+              f"{row['segments']:>9} {row['latency']['text_ms']!s:>8} {row['latency']['vector_ms']!s:>10}")
+    print(f"\nIngest speedup: {tuned['rate'] / baseline['rate']:.2f}x")
+    if "latency_loaded" in tuned:
+        print(f"Force-merge: {tuned['segments_loaded']} -> {tuned['segments']} segments in {tuned['merge_seconds']:.1f}s; "
+              f"search latency before/after merge: text {tuned['latency_loaded']['text_ms']} -> "
+              f"{tuned['latency']['text_ms']} ms, vector {tuned['latency_loaded']['vector_ms']} -> "
+              f"{tuned['latency']['vector_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: phrase proximity boost, min-window (services/retriever.py) vs the
+previous Cartesian-product implementation (kept here as the reference).
+
+Sentences repeat the query words ("the Lord ... the Lord ..."), the case
+where every position of every word multiplies the product. The legacy
+timing is skipped once a single call would exceed --legacy-budget seconds.
+
+Usage:
+    python bench_proximity.py
+    python bench_proximity.py --lengths 20 80 320 --query-lengths 2 3 4
+"""
+import re
+import sys
+import time
+import argparse
+import random
+from itertools import product
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.retriever import calculate_phrase_proximity_boost, _tokenize
+
+FILLER = "and he said unto them that they should go into the city of david with".split()
+QUERY_WORDS = ["the", "lord", "is", "my", "shepherd", "i", "shall", "not", "want"]
+
+
+def legacy_proximity_boost(query: str, text: str) -> float:
+    """The product-based scoring this module replaced (reference for equivalence)."""
+    query_words = re.findall(r'\b\w+\b', query.lower().strip())
+    if len(query_words) <= 1:
+        return 0.0
+    text_lower = text.lower()
+    pattern = r'\b' + r'\s+'.join(re.escape(w) for w in query_words) + r'\b'
+    if re.search(pattern, text_lower):
+        return 2.0
+    text_words = re.findall(r'\b\w+\b', text_lower)
+    word_positions = {}
+    for query_word in query_words:
+        positions = [i for i, w in enumerate(text_words) if w == query_word]
+        if positions:
+            word_positions[query_word] = positions
+    if len(word_positions) < len(query_words):
+        return 0.0
+    min_avg_distance = float('inf')
+    for combo in product(*[word_positions[w] for w in query_words]):
+        if not all(combo[i] < combo[i + 1] for i in range(len(combo) - 1)):
+            continue
+        total_distance = sum(combo[i + 1] - combo[i] - 1 for i in range(len(combo) - 1))
+        min_avg_distance = min(min_avg_distance, total_distance / (len(combo) - 1))
+    if min_avg_distance == float('inf'):
+        return 0.0
+    for limit, boost in ((0, 2.0), (1, 1.5), (2, 1.0), (3, 0.6), (5, 0.3)):
+        if min_avg_distance <= limit:
+            return boost
+    return 0.1
+
+
+def make_sentence(rng: random.Random, length: int, query_words) -> str:
+    """Filler text where about a third of the words are query words (many repeats)."""
+    words = [rng.choice(query_words) if rng.random() < 0.35 else rng.choice(FILLER) for _ in range(length)]
+    return " ".join(words).capitalize() + "."
+
+
+def _time(fn, query, sentences, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for s in sentences:
+            fn(query, s)
+    return (time.perf_counter() - started) / (repeat * len(sentences))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 20, 40, 80, 160, 320])
+    parser.add_argument("--query-lengths", type=int, nargs="+", default=[2, 3, 4])
+    parser.add_argument("--sentences", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-budget", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'query words':>11} {'sentence':>8} | {'min-window':>12} {'(cold)':>12} | {'legacy':>12} | speedup")
+    for qlen in args.query_lengths:
+        query_words = QUERY_WORDS[:qlen]
+        query = " ".join(query_words)
+        legacy_too_slow = False
+        for length in args.lengths:
+            sentences = [make_sentence(rng, length, query_words) for _ in range(args.sentences)]
+            mismatches = 0
+            _tokenize.cache_clear()
+            cold = _time(calculate_phrase_proximity_boost, query, sentences, 1)
+            warm = _time(calculate_phrase_proximity_boost, query, sentences, args.repeat)
+            legacy = None
+            if not legacy_too_slow:
+                started = time.perf_counter()
+                legacy_proximity_boost(query, sentences[0])
+                if time.perf_counter() - started > args.legacy_budget:
+                    legacy_too_slow = True
+                else:
+                    legacy = _time(legacy_proximity_boost, query, sentences, 1)
+                    mismatches = sum(
+                        legacy_proximity_boost(query, s) != calculate_phrase_proximity_boost(query, s)
+                        for s in sentences
+                    )
+            legacy_cell = f"{legacy * 1e6:10.1f}µs" if legacy is not None else f"{'(skipped)':>12}"
+            speedup = f"{legacy / warm:7.1f}x" if legacy is not None else "      -"
+            note = f"  [{mismatches} MISMATCHES]" if mismatches else ""
+            print(f"{qlen:>11} {length:>8} | {warm * 1e6:10.1f}µs {cold * 1e6:10.1f}µs | {legacy_cell} | {speedup}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: unified query analysis (one LLM call) vs the per-call sequence
+used by /ask (keywords → synonyms per keyword, parallels, variants).
+
+Both paths run with the LLM cache disabled so every call hits the API.
+The per-call path is timed the way /ask runs it (StageGraph: independent
+calls overlap), so the difference is what UNIFIED_ANALYSIS saves per request.
+
+Usage:
+    python bench_query_analysis.py
+    python bench_query_analysis.py --repeat 5 "What is grace?" "Woman at the Master's table"
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import services.keyword_extractor as keyword_extractor
+import services.biblical_parallels as biblical_parallels
+import services.prompt_builder as prompt_builder
+import services.query_analyzer as query_analyzer
+from services.llm_cache import LLMResponseCache
+from services.stage_runner import StageGraph
+
+DEFAULT_QUERIES = [
+    "What is grace?",
+    "Lord give me faith like the woman at the Master's table",
+    "How did Moses lead Israel through the wilderness?",
+]
+
+
+def _disable_llm_cache():
+    uncached = LLMResponseCache(None, model="bench")
+    for module in (keyword_extractor, biblical_parallels, prompt_builder, query_analyzer):
+        module.llm_cache = uncached
+
+
+async def _per_call(query: str):
+    async def synonyms(results):
+        keywords = results["keywords"]
+        values = await asyncio.gather(*(asyncio.to_thread(keyword_extractor.generate_synonyms, k) for k in keywords))
+        return dict(zip(keywords, values))
+
+    graph = StageGraph(label="bench per-call")
+    graph.add("keywords", keyword_extractor.extract_keywords, query)
+    graph.add("parallels", biblical_parallels.analyze_biblical_parallels, query)
+    graph.add("synonyms", synonyms, deps=["keywords"])
+    graph.add("variants", prompt_builder.generate_question_variants, query)
+    results = await graph.run()
+    return results, graph.timings()
+
+
+def _summary(values):
+    return f"mean {statistics.mean(values):6.2f}s  median {statistics.median(values):6.2f}s  max {max(values):6.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    _disable_llm_cache()
+    per_call_times, unified_times, fallbacks = [], [], 0
+
+    for query in args.queries:
+        print(f"\n{'=' * 70}\n{query}\n{'=' * 70}")
+        for i in range(args.repeat):
+            started = time.perf_counter()
+            results, timings = asyncio.run(_per_call(query))
+            per_call = time.perf_counter() - started
+            per_call_times.append(per_call)
+
+            started = time.perf_counter()
+            analysis = query_analyzer.analyze_query(query)
+            unified = time.perf_counter() - started
+            unified_times.append(unified)
+            if analysis is None:
+                fallbacks += 1
+
+            print(f"  run {i + 1}: per-call {per_call:5.2f}s (sequential {timings['sequential_ms'] / 1000:5.2f}s, "
+                  f"{2 + len(results['keywords'])} LLM calls) | unified {unified:5.2f}s (1 call)"
+                  + ("  [INVALID → fallback]" if analysis is None else ""))
+            if i == 0:
+                print(f"    per-call keywords: {results['keywords']}  synonyms: {results['synonyms']}")
+                if analysis is not None:
+                    print(f"    unified  keywords: {analysis.keywords}  synonyms: {analysis.synonyms}")
+
+    print(f"\n{'=' * 70}")
+    print(f"per-call : {_summary(per_call_times)}")
+    print(f"unified  : {_summary(unified_times)}")
+    print(f"speedup  : {statistics.mean(per_call_times) / statistics.mean(unified_times):.2f}x "
+          f"| unified replies failing validation: {fallbacks}/{len(unified_times)}")
+
+
+if __name__ == "__main__":
+    main()
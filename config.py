@@ -13,7 +13,7 @@ class Settings(BaseSettings):
     ES_HOST: str = "http://localhost:9200"
     ES_USERNAME: Optional[str] = None
     ES_PASSWORD: Optional[str] = None
-    ES_INDEX_NAME: str = "demo_documents"
+    ES_INDEX_NAME: str = "demo_documents"  # Alias; the data lives in versioned indices behind it
 
     APP_PORT: int = 8000
 
@@ -28,6 +28,77 @@ class Settings(BaseSettings):
     LLM_TIMEOUT: int = 300  # 5 minutes timeout for LLM calls
     UPLOAD_TIMEOUT: int = 3600  # 1 hour timeout for large file uploads
 
+    # Vector search
+    VECTOR_SEARCH_MODE: str = "knn"  # "knn" (HNSW approximate) or "exact" (brute-force script_score cosine)
+    VECTOR_INDEX_TYPE: str = "hnsw"  # dense_vector index_options type: hnsw, int8_hnsw, ...
+    KNN_NUM_CANDIDATES_FACTOR: int = 10  # num_candidates = size * factor (higher = better recall, slower)
+    MSEARCH_PAGE_SIZE: int = 8  # Level 0/2 combos searched per _msearch round trip (1 = one search per combo)
+    COMBINATION_PRUNING: bool = True  # Skip Level 0/2 combos whose terms/pairs never occur in the corpus
+    POSTING_ACCELERATOR: bool = False  # Level 0/2 combos intersected in-process from per-term posting lists (BM25 ranking)
+    POSTING_MAX_DOCS: int = 10000  # Terms matching more documents fall back to one ES search per combo
+    # Semantic slot + Level 4: lexical and vector sub-queries in one _msearch, fused
+    HYBRID_FUSION: str = "rrf"  # "rrf", "weighted" (min-max normalized scores) or "vector" (vector only)
+    HYBRID_RRF_K: int = 60  # RRF rank constant: higher = flatter contribution of top ranks
+    HYBRID_VECTOR_WEIGHT: float = 0.5  # Vector share of the fused score (lexical gets 1 - weight)
+    PROXIMITY_RESCORE: bool = True  # knn_search proximity boost as an ES rescore (False = re-rank in Python)
+    PROXIMITY_RESCORE_WINDOW: int = 200  # Vector hits re-ranked by the rescore phase
+    # Max average words between consecutive query words → boost (final = vector score * (1 + boost))
+    PROXIMITY_BOOST_TIERS: str = "0:2.0,1:1.5,2:1.0,3:0.6,5:0.3,*:0.1"
+    # Raw search hits cached per query shape (exclusions applied afterwards), per worker;
+    # every worker drops its entries when /upload, /replace or /documents bumps the generation
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 2048
+    INDEX_GENERATION_PATH: str = "cache/index_generation.sqlite3"
+    # Document count / max level / per-file counts / index size served from memory;
+    # also refreshed after every ingest or delete (0 = no background refresh)
+    CORPUS_STATS_REFRESH_SECONDS: int = 30
+
+    # Ingest pipeline (embedding and bulk writes run concurrently)
+    INGEST_EMBED_WORKERS: int = 4  # Parallel embedding API calls
+    INGEST_BULK_WORKERS: int = 2  # Parallel _bulk writers
+    INGEST_QUEUE_SIZE: int = 4  # Max batches waiting between stages (backpressure)
+    INGEST_BULK_MAX_BYTES: int = 10 * 1024 * 1024  # Bulk requests are sized by bytes, not doc count
+    # During a load: refresh_interval -1 (and replicas 0 on a new index generation), restored
+    # afterwards, then a single refresh; bulk requests no longer refresh the index each time
+    INGEST_BULK_TUNING: bool = True
+    # Segments a new generation built by /replace is force-merged to before the alias flip (0 = no merge)
+    INGEST_FORCE_MERGE_SEGMENTS: int = 1
+    # /upload returns a job id; dedicated worker threads run the ingest (resumable after restarts)
+    INGEST_JOB_WORKERS: int = 1  # Jobs indexed concurrently per API process
+    INGEST_JOBS_DB_PATH: str = "cache/ingest_jobs.sqlite3"
+    INGEST_JOBS_DIR: str = "uploads/jobs"  # Uploaded files, kept until their job finishes
+    # /replace builds the next index generation copying the vectors of sentences already
+    # indexed (matched by sentence hash): only new ones are embedded
+    INCREMENTAL_REPLACE: bool = True
+
+    # Persistent embedding cache (SQLite file shared by all workers)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000  # ~6KB per 1536-dim vector → ~1.2GB max
+
+    # One JSON-schema LLM call for keywords + synonyms + parallels + variants in /ask
+    # (falls back to the separate calls when the reply does not validate)
+    UNIFIED_ANALYSIS: bool = False
+
+    # Persistent cache for auxiliary LLM calls (keywords, synonyms, parallels)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MEANING: bool = False  # Also cache the keyword meaning (sampled at temperature 0.7: one fixed text per query)
+    LLM_CACHE_PATH: str = "cache/llm.sqlite3"
+    LLM_CACHE_MAX_ENTRIES: int = 50_000
+    LLM_CACHE_TTL_HOURS: int = 24 * 7  # Answers expire so prompt/model drift is picked up
+
+    # Sessions ("Tell me more" state). Use sqlite/redis to run several uvicorn workers
+    SESSION_BACKEND: str = "memory"  # memory | sqlite (one host) | redis (any Redis-protocol server)
+    SESSION_TTL_MINUTES: int = 30  # Sliding expiry since last access
+    SESSION_SQLITE_PATH: str = "cache/sessions.sqlite3"
+    SESSION_REDIS_URL: str = "redis://localhost:6379/0"
+    SESSION_SKETCH_LIMIT: int = 300  # Most recent used sentences also excluded as near duplicates (older: exact only)
+
+    # Speculative prefetch of the next "Tell me more" batch (extra ES load, see GET /debug/prefetch)
+    PREFETCH_ENABLED: bool = False
+    PREFETCH_WORKERS: int = 2  # Background threads computing next batches
+    PREFETCH_MAX_PENDING: int = 8  # Skip prefetching when this many are already running
+
     @field_validator("ES_USERNAME", "ES_PASSWORD", "DEEPSEEK_BASE_URL", "OPENAI_API_KEY", mode="before")
     @classmethod
     def empty_str_to_none(cls, v):
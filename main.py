@@ -14,13 +14,16 @@ Full-featured Q&A system with:
 - Buffer 10-20% for better retrieval
 """
 import os
+import json
+import time
 import uuid
 import logging
 from datetime import datetime
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Optional
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import ClientDisconnect
 import asyncio
@@ -39,24 +42,26 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 from config import settings
-from vector.elastic_client import init_index, es
-from services.splitter import split_into_sentences
+from vector.elastic_client import init_index, prune_indices, es
+from services.splitter import iter_sentences
+from services.text_decoder import SAMPLE_BYTES, detect_encoding, iter_text_chunks
 from services.retriever import (
     index_sentences, 
-    index_sentences_batch,
     get_top_unique_sentences_grouped,
     get_sentences_by_level,
-    get_max_level,
     delete_all_documents,
-    get_document_count
 )
 from services.prompt_builder import (
     generate_question_variants,
     extract_keywords,
     build_final_prompt,
     call_llm,
+    call_llm_stream,
 )
 from services.session_manager import session_manager
+from services.corpus_stats import corpus_stats
+from services.ingest_jobs import ingest_jobs, describe_job
+from services.session_store import encode_session
 from services.keyword_extractor import (
     extract_keywords as extract_clean_keywords,
     get_magical_words_for_level3,
@@ -68,12 +73,16 @@ from services.biblical_parallels import (
     gather_biblical_parallels_sentences,
 )
 from services.deduplicator import deduplicate_sentences
+from services.query_analyzer import analyze_query
+from services.prefetcher import prefetcher, state_fingerprint, snapshot_state
+from services.stage_runner import StageGraph, iterate_in_thread
 from models.request_models import (
     AskRequest, 
     AskResponse, 
     ContinueRequest, 
     ContinueResponse,
-    UploadResponse,
+    UploadJobResponse,
+    JobStatus,
     DocumentStats,
     HealthResponse,
     ErrorResponse
@@ -218,10 +227,17 @@ signal.signal(signal.SIGINT, signal_handler)
 async def startup_event():
     try:
         init_index()
+        # Generations left by replace jobs that were cancelled or crashed (not resumable ones)
+        prune_indices(keep=ingest_jobs.store.active_target_indices())
         logger.info("✓ Elasticsearch index initialized")
     except Exception as e:
         logger.error(f"Warning: Could not initialize Elasticsearch index: {e}")
         logger.warning("Server will continue without Elasticsearch connection.")
+    # Count / max level / health served from memory, refreshed in the background
+    corpus_stats.start()
+    # Ingest job workers (also resume jobs interrupted by a restart)
+    ingest_jobs.on_corpus_replaced = prefetcher.store.clear
+    ingest_jobs.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -229,8 +245,14 @@ async def shutdown_event():
     logger.info("Shutting down gracefully...")
     # Add any cleanup here (close connections, save state, etc.)
     try:
-        # Clear session data
-        session_manager.clear_all_sessions()
+        # Close session backend connections. Shared stores (sqlite/redis) are NOT
+        # cleared: other workers are still serving those sessions.
+        if not session_manager.store.shared:
+            session_manager.clear_all_sessions()
+        session_manager.close()
+        prefetcher.close()
+        corpus_stats.close()
+        ingest_jobs.close()  # a running job is requeued and resumes at its watermark
         logger.info("✓ Cleanup completed")
     except Exception as e:
         logger.error(f"Error during shutdown cleanup: {e}")
@@ -245,49 +267,38 @@ CHUNK_SIZE = 1024 * 1024  # 1MB chunks for streaming
 
 @app.post(
     "/upload",
-    response_model=UploadResponse,
+    response_model=UploadJobResponse,
+    status_code=202,
     tags=["📁 File Management"],
-    summary="Upload and index .txt file",
+    summary="Upload a .txt file and queue its indexing",
     description="""
 ## Upload Text File
 
 ### ⚙️ Processing:
-1. **Streaming read** - Read file in chunks (1MB) to prevent RAM overflow
-2. **Sentence splitting** - Split into individual sentences
-3. **Level assignment** - Every 5 sentences = 1 level
-4. **Batch embedding** - Create embeddings in batches (efficient)
-5. **Elasticsearch indexing** - Store in vector database
+1. **Streaming read** - Read file in chunks (1MB), stored on disk
+2. **Encoding detection** - From the first 64KB; the file must contain at least one sentence
+3. **Job queued** - The response returns right away with a `job_id`
 
-### 📊 Response:
+In the background, an ingest worker decodes the file chunk by chunk, streams
+sentences out as soon as they are complete (every 5 sentences = 1 level) and
+embeds + writes them in batches. A job interrupted by a restart resumes at
+its last committed batch.
+
+### 📊 Response (202):
+- `job_id`: Poll `GET /jobs/{job_id}` for sentences split / embedded / indexed, throughput and ETA
 - `file_id`: Unique file ID
 - `filename`: Original filename
-- `total_sentences`: Number of indexed sentences
-- `max_level`: Highest level (indicates how many levels for "Tell me more")
-- `buffer_info`: Buffer capability information
 
 ### ⚠️ Notes:
 - Only `.txt` files supported
 - Encoding: UTF-8 or Latin-1 (auto-detect)
     """,
     responses={
-        200: {
-            "description": "File uploaded successfully",
-            "content": {
-                "application/json": {
-                    "example": {
-                        "file_id": "550e8400-e29b-41d4-a716-446655440000",
-                        "filename": "document.txt",
-                        "total_sentences": 50,
-                        "max_level": 10,
-                        "message": "File processed successfully. 50 sentences indexed across 11 levels."
-                    }
-                }
-            }
-        },
+        202: {"description": "File stored, ingest job queued"},
         400: {"description": "Invalid file type or empty file"}
     }
 )
-async def upload_file(
+def upload_file(
     file: UploadFile = File(
         ..., 
         description="The .txt file to upload. Recommended max size: 200MB"
@@ -308,6 +319,14 @@ async def upload_file(
     
     **Supported encodings:** UTF-8, UTF-16, Latin-1, CP1252 (Windows)
     """
+    return _enqueue_upload(file, split_mode)
+
+
+def _enqueue_upload(file: UploadFile, split_mode: str, mode: str = "upload") -> UploadJobResponse:
+    """
+    Store the upload for its ingest job and queue the job (mode "replace": diff against the index).
+    Blocking file I/O: the upload handlers are plain `def`, FastAPI runs them in its threadpool.
+    """
     # Allow any text file extension
     allowed_extensions = [".txt", ".text", ".md", ".csv", ".log", ".dat"]
     file_ext = "." + file.filename.split(".")[-1].lower() if "." in file.filename else ""
@@ -316,142 +335,132 @@ async def upload_file(
         # Just warn, don't block - try to process anyway
         print(f"[Upload] Warning: Unusual file extension '{file_ext}', will try to process as text")
 
-    # Streaming read to prevent RAM overflow with large files
-    chunks = []
-    total_size = 0
-    MAX_SIZE = 200 * 1024 * 1024  # 200MB limit
-    
+    # Streaming read to prevent RAM overflow with large files: chunks go
+    # straight to the job's file, which the ingest worker reads later
+    job_id = str(uuid.uuid4())
+    path = ingest_jobs.upload_path(job_id)
+    queued = False
     try:
-        while True:
-            chunk = await file.read(CHUNK_SIZE)
-            if not chunk:
-                break
-            chunks.append(chunk)
-            total_size += len(chunk)
-            
-            if total_size > MAX_SIZE:
+        total_size = 0
+        MAX_SIZE = 200 * 1024 * 1024  # 200MB limit
+
+        try:
+            with open(path, "wb") as out:
+                while True:
+                    chunk = file.file.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    total_size += len(chunk)
+
+                    if total_size > MAX_SIZE:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"File too large. Maximum size is 200MB. Your file: {total_size / (1024*1024):.1f}MB"
+                        )
+                    out.write(chunk)
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Error reading file: {str(e)}"
+            )
+
+        if total_size == 0:
+            raise HTTPException(
+                status_code=400,
+                detail="File is empty or could not be read."
+            )
+
+        # Encoding from a sample; reject files without a single sentence before queueing
+        with open(path, "rb") as f:
+            encoding = detect_encoding(f.read(SAMPLE_BYTES))
+            f.seek(0)
+            try:
+                first = next(iter_sentences(iter_text_chunks(f, encoding, CHUNK_SIZE), split_mode=split_mode), None)
+            except Exception as e:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"File too large. Maximum size is 200MB. Your file: {total_size / (1024*1024):.1f}MB"
+                    detail=f"Error splitting text into sentences: {str(e)}"
                 )
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Error reading file: {str(e)}"
-        )
-    
-    if not chunks:
-        raise HTTPException(
-            status_code=400,
-            detail="File is empty or could not be read."
-        )
-    
-    content_bytes = b"".join(chunks)
-    
-    # Try multiple encodings - cp1252 first for Windows files with smart quotes
-    text = None
-    best_encoding = None
-    
-    # First try strict UTF-8
-    try:
-        text = content_bytes.decode("utf-8")
-        # Validate: check if result has mostly printable chars
-        printable_ratio = sum(1 for c in text[:1000] if c.isprintable() or c in '\n\r\t') / min(len(text), 1000)
-        if printable_ratio > 0.95:
-            best_encoding = "utf-8"
-            print(f"[Upload] Successfully decoded with UTF-8 (printable ratio: {printable_ratio:.2%})")
-        else:
-            text = None  # Reset, try other encodings
-    except UnicodeDecodeError:
-        pass
-    
-    # If UTF-8 failed or gave bad results, try Windows encodings
-    if text is None:
-        for encoding in ["cp1252", "utf-8-sig", "utf-16", "iso-8859-1", "latin-1"]:
-            try:
-                candidate = content_bytes.decode(encoding)
-                # Validate result
-                printable_ratio = sum(1 for c in candidate[:1000] if c.isprintable() or c in '\n\r\t') / min(len(candidate), 1000)
-                if printable_ratio > 0.90:
-                    text = candidate
-                    best_encoding = encoding
-                    print(f"[Upload] Successfully decoded with {encoding} (printable ratio: {printable_ratio:.2%})")
-                    break
-            except (UnicodeDecodeError, LookupError):
-                continue
-    
-    if text is None:
-        # Last resort: decode with errors='replace' to replace bad chars with ?
-        text = content_bytes.decode("utf-8", errors="replace")
-        print(f"[Upload] Warning: Used fallback decoding with character replacement")
-    
-    # Clean up text: remove null bytes, normalize line endings
-    text = text.replace("\x00", "")  # Remove null bytes
-    text = text.replace("\r\n", "\n").replace("\r", "\n")  # Normalize line endings
-    
-    # Remove BOM if present
-    if text.startswith("\ufeff"):
-        text = text[1:]
-    
-    try:
-        sentences = split_into_sentences(text, split_mode=split_mode)
-        print(f"[Upload] Split mode: {split_mode}, Total sentences: {len(sentences)}")
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Error splitting text into sentences: {str(e)}"
-        )
-    
-    if not sentences:
-        raise HTTPException(
-            status_code=400, 
-            detail="No valid sentences found in file. Make sure the file contains readable text."
-        )
 
-    # Index sentences with batch processing
-    try:
-        file_id = str(uuid.uuid4())
-        max_level = index_sentences_batch(sentences, file_id=file_id, batch_size=500)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error indexing sentences: {str(e)}"
-        )
+        if first is None:
+            raise HTTPException(
+                status_code=400,
+                detail="No valid sentences found in file. Make sure the file contains readable text."
+            )
 
-    return UploadResponse(
+        file_id = str(uuid.uuid4())
+        job = ingest_jobs.enqueue(job_id, file_id, file.filename, encoding, split_mode, total_size, mode=mode)
+        queued = True
+    finally:
+        if not queued and os.path.exists(path):
+            os.remove(path)
+
+    print(f"[Upload] Job {job_id} ({mode}) queued: {file.filename} ({total_size} bytes, {encoding}, split mode {split_mode})")
+    return UploadJobResponse(
+        job_id=job_id,
         file_id=file_id,
         filename=file.filename,
-        total_sentences=len(sentences),
-        max_level=max_level,
-        message=f"File processed successfully. {len(sentences)} sentences indexed across {max_level + 1} levels.",
-        buffer_info=f"With 15% buffer, queries can retrieve up to {int(15 * 1.15)} sentences"
+        status=job["status"],
+        total_bytes=total_size,
+        encoding=encoding,
+        status_url=f"/jobs/{job_id}",
+        message="File received. Indexing runs in the background."
     )
 
 
+@app.get(
+    "/jobs/{job_id}",
+    response_model=JobStatus,
+    tags=["📁 File Management"],
+    summary="Ingest job progress",
+    description="""
+## Progress of an upload's ingest job
+
+Sentences split, embedded and indexed, the committed watermark (resume
+point), indexing throughput of the current run and an ETA extrapolated from
+the share of the file read so far.
+    """
+)
+async def get_job(job_id: str):
+    """Get ingest job progress."""
+    job = ingest_jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobStatus(**describe_job(job))
+
+
 @app.post(
     "/replace",
-    response_model=UploadResponse,
+    response_model=UploadJobResponse,
+    status_code=202,
     tags=["📁 File Management"],
     summary="Replace all data",
     description="""
 ## Replace Current Data with New File
 
 ### ⚙️ Processing:
-1. **Delete all** old documents in Elasticsearch
-2. **Upload and index** new file
+1. **Cancel** ingest jobs still queued or running
+2. **Upload** new file and queue its replace job (same response as `/upload`)
+3. The job writes the file into a **new index generation**: sentences already
+   indexed copy their vectors, only new ones are embedded
+   (`INCREMENTAL_REPLACE=false`: every sentence is embedded)
+4. The `ES_INDEX_NAME` alias **flips** atomically to the new index and the
+   old one is dropped: /ask serves the full old corpus until then, never a
+   half-built one
 
 ### ⚠️ Warning:
 - This action CANNOT be undone
 - All current sessions will be invalidated
     """
 )
-async def replace_file(
+def replace_file(
     file: UploadFile = File(..., description="New .txt file to replace current data")
 ):
-    """Replace all data with new file."""
-    delete_all_documents()
-    session_manager.clear_all()
-    return await upload_file(file)
+    """Replace all data with new file (plain def: cancel_all waits for running jobs)."""
+    ingest_jobs.cancel_all()  # an older job would race this one
+    session_manager.clear_all_sessions()
+    prefetcher.store.clear()  # batches were computed from the old data (cleared again after the flip)
+    return _enqueue_upload(file, split_mode="auto", mode="replace")
 
 
 @app.delete(
@@ -461,6 +470,9 @@ async def replace_file(
     description="""
 ## Delete All Data
 
+The `ES_INDEX_NAME` alias flips to a new empty index and the old index is
+dropped: no `delete_by_query`, no deleted-document tombstones left to merge.
+
 ### ⚠️ Warning:
 - This action CANNOT be undone
 - You need to upload a new file before using /ask
@@ -476,11 +488,13 @@ async def replace_file(
         }
     }
 )
-async def delete_all():
-    """Delete all documents in Elasticsearch."""
-    count = get_document_count()
+def delete_all():
+    """Delete all documents in Elasticsearch (plain def: blocking calls run in the threadpool)."""
+    count = corpus_stats.document_count()
+    ingest_jobs.cancel_all()  # an old job would keep writing after the delete
     success = delete_all_documents()
-    session_manager.clear_all()
+    session_manager.clear_all_sessions()
+    prefetcher.store.clear()  # batches were computed from the old data
     
     if success:
         return {"message": "All documents deleted successfully", "documents_deleted": count}
@@ -504,13 +518,17 @@ async def delete_all():
 )
 async def get_count():
     """Get current document statistics."""
-    count = get_document_count()
-    max_level = get_max_level()
+    snapshot = corpus_stats.get()
+    count = snapshot.document_count
+    max_level = snapshot.max_level
     return DocumentStats(
         total_documents=count,
         max_level=max_level,
         levels_available=max_level + 1 if count > 0 else 0,
-        ready=count > 0
+        ready=count > 0,
+        files=snapshot.files,
+        index_size_bytes=snapshot.index_size_bytes,
+        stats_age_seconds=snapshot.to_dict()["age_seconds"],
     )
 
 
@@ -518,6 +536,418 @@ async def get_count():
 # MODULE 2-6: Ask Question (First Query)
 # ============================================================
 
+# ---------- Stage functions for the /ask and /continue graphs ----------
+# Blocking stages run in worker threads (see services/stage_runner.py).
+
+QUERY_STOPWORDS = {'what', 'where', 'when', 'who', 'why', 'how', 'which', 'whom', 'whose',
+                   'is', 'are', 'was', 'were', 'be', 'been', 'being',
+                   'the', 'a', 'an', 'and', 'or', 'but', 'if', 'so', 'as',
+                   'to', 'of', 'in', 'on', 'at', 'by', 'for', 'with', 'about',
+                   'do', 'does', 'did', 'can', 'could', 'will', 'would', 'should', 'may', 'might',
+                   'this', 'that', 'these', 'those', 'it', 'its'}
+
+
+def _extract_query_keywords(query: str) -> List[str]:
+    """Extract clean keywords (filtered from magic words), with simple-split fallback."""
+    clean_keywords = extract_clean_keywords(query)
+    
+    logger.info(f"[API /ask] Extracted keywords: {clean_keywords}")
+    print(f"[DEBUG] Query: '{query}' → Keywords extracted: {clean_keywords}")
+    
+    if not clean_keywords:
+        # Fallback: use simple word extraction
+        clean_keywords = [w for w in query.lower().split() if len(w) > 3][:5]
+        print(f"[DEBUG] Fallback keywords: {clean_keywords}")
+    return clean_keywords
+
+
+async def _generate_synonyms_map(keywords: List[str]) -> Dict[str, List[str]]:
+    """One synonym LLM call per keyword, all in flight at once."""
+    synonyms = await asyncio.gather(*(asyncio.to_thread(generate_synonyms, kw) for kw in keywords))
+    return dict(zip(keywords, synonyms))
+
+
+async def _synonyms_stage(results: Dict[str, Any]) -> Dict[str, List[str]]:
+    return await _generate_synonyms_map(results["keywords"])
+
+
+# With UNIFIED_ANALYSIS the stages below read the single analysis call and
+# only fall back to their own LLM call when it failed (analysis is None).
+def _analysis_keywords_stage(results: Dict[str, Any], query: str) -> List[str]:
+    analysis = results["analysis"]
+    if analysis is None or not analysis.keywords:
+        return _extract_query_keywords(query)
+    logger.info(f"[API /ask] Extracted keywords (unified analysis): {analysis.keywords}")
+    return analysis.keywords
+
+
+def _analysis_parallels_stage(results: Dict[str, Any], query: str) -> Dict[str, List[str]]:
+    analysis = results["analysis"]
+    if analysis is None:
+        return analyze_biblical_parallels(query)
+    return analysis.parallels
+
+
+async def _analysis_synonyms_stage(results: Dict[str, Any]) -> Dict[str, List[str]]:
+    analysis = results["analysis"]
+    if analysis is None:
+        return await _generate_synonyms_map(results["keywords"])
+    return analysis.synonyms
+
+
+def _analysis_variants_stage(results: Dict[str, Any], query: str) -> str:
+    analysis = results["analysis"]
+    if analysis is None or not analysis.question_variants:
+        return generate_question_variants(query)
+    return analysis.question_variants
+
+
+def _add_query_analysis_stages(graph: StageGraph, query: str):
+    """Register keywords / parallels / synonyms / variants (unified call or one call each)."""
+    if settings.UNIFIED_ANALYSIS:
+        graph.add("analysis", analyze_query, query)
+        graph.add("keywords", _analysis_keywords_stage, query, deps=["analysis"])
+        graph.add("parallels", _analysis_parallels_stage, query, deps=["analysis"])
+        graph.add("synonyms", _analysis_synonyms_stage, deps=["analysis", "keywords"])
+        graph.add("variants", _analysis_variants_stage, query, deps=["analysis"])
+    else:
+        graph.add("keywords", _extract_query_keywords, query)
+        graph.add("parallels", analyze_biblical_parallels, query)
+        graph.add("synonyms", _synonyms_stage, deps=["keywords"])
+        graph.add("variants", generate_question_variants, query)
+
+
+def _biblical_sources_stage(results: Dict[str, Any], query: str):
+    """Pre-Level 0: supporting pulls for the biblical parallels analysis."""
+    return gather_biblical_parallels_sentences(
+        results["parallels"],
+        existing_texts=set(),
+        base_query=query,
+    )
+
+
+def _ask_retrieval_stage(results: Dict[str, Any], req: AskRequest):
+    """Get first batch of sentences using multi-level retrieval."""
+    clean_keywords = results["keywords"]
+    biblical_parallels = results["parallels"]
+
+    # Count meaningful words in original query (excluding stopwords and question words)
+    query_words = [w.lower().strip('?!.,;:') for w in req.query.split()]
+    meaningful_query_words = [w for w in query_words if w not in QUERY_STOPWORDS and len(w) > 2]
+    
+    print(f"[DEBUG] Meaningful words in query: {meaningful_query_words}")
+    
+    # If query has only 1 meaningful word → start from Level 1 (keyword + magical words)
+    # NEW LOGIC: Level 1 = keyword + magic words (e.g., "heaven is")
+    if len(meaningful_query_words) <= 1:
+        start_level = 1
+        print(f"[INFO] Only 1 meaningful word found → Starting from Level 1 (keyword + magic words)")
+    else:
+        start_level = 0
+    initial_state = {
+        "current_level": start_level,
+        "level_offsets": {"0.0": 0, "0": 0, "1": 0, "2": 0, "3": 0, "4": 0},
+        "used_sentence_ids": [],  # Start fresh - Level 0+ should not be filtered by Level 0.0
+        "biblical_parallels": biblical_parallels
+    }
+    
+    source_sentences, updated_state, level_used = get_next_batch(
+        session_state=initial_state,
+        keywords=clean_keywords,
+        batch_size=req.limit if req.limit else 15,
+        enabled_levels=req.enabled_levels if req.enabled_levels else None,
+        original_query=req.query,  # NEW: Pass original query for semantic search
+        semantic_count=5,  # NEW: Always get 5 semantic results
+        synonyms=results["synonyms"],
+    )
+    
+    if not source_sentences:
+        # Fallback to old method if multi-level returns nothing
+        logger.warning(f"[API /ask] Multi-level retrieval returned no results, using fallback")
+        source_sentences = get_top_unique_sentences_grouped(
+            req.query, 
+            limit=req.limit,
+            buffer_percentage=req.buffer_percentage
+        )
+    return source_sentences, updated_state, level_used
+
+
+def _continue_retrieval_stage(session, session_state: Dict[str, Any], keywords: List[str], req: ContinueRequest,
+                              synonyms: Dict[str, List[str]]):
+    """
+    Next batch for "Tell me more", with a forced Level 4 (Vector) fallback.
+    Synonyms are generated only if the walk reaches Level 2/3 (added to `synonyms`).
+    """
+    # Get next batch using multi-level retriever
+    # DISABLE forced semantic results for "Tell Me More" to ensure clean level progression
+    source_sentences, updated_state, level_used = get_next_batch(
+        session_state=session_state,
+        keywords=keywords,
+        batch_size=req.limit if req.limit else 15,
+        original_query=session.original_query if session.original_query else " ".join(keywords),
+        semantic_count=5,  # RESTORED: User wants 5 vector results always (blended)
+        synonyms=synonyms,
+    )
+    
+    # FALLBACK: If levels 0-3 yielded nothing (or we skipped past them), 
+    # force a check on Level 4 (Vector) to ensure we don't return empty-handed prematurely.
+    if not source_sentences:
+        logger.info("[API /continue] No results from current level walk. Forcing Level 4 (Vector) fallback.")
+        # Temporarily force current_level to 4 in a copy of the state
+        fallback_state = session_state.copy()
+        fallback_state["current_level"] = 4
+        
+        # Call get_next_batch strictly for Level 4
+        # We use enabled_levels=[4] to be sure
+        fallback_sentences, fallback_updated_state, fallback_level_used = get_next_batch(
+            session_state=fallback_state,
+            keywords=keywords,
+            batch_size=req.limit if req.limit else 15,
+            original_query=session.original_query,
+            enabled_levels=[4],
+            semantic_count=0,
+            synonyms=synonyms,
+        )
+        
+        if fallback_sentences:
+            source_sentences = fallback_sentences
+            updated_state = fallback_updated_state
+            level_used = fallback_level_used
+            logger.info(f"[API /continue] Fallback successful! Found {len(source_sentences)} sentences.")
+    return source_sentences, updated_state, level_used
+
+
+def _continue_keywords(session) -> List[str]:
+    return session.keywords if session.keywords else [w for w in session.original_query.lower().split() if len(w) > 3][:5]
+
+
+def _schedule_prefetch(session_id: str, limit: int):
+    """Start computing the next /continue batch in the background (PREFETCH_ENABLED)."""
+    if not prefetcher.enabled:
+        return
+    session = session_manager.get_session(session_id)
+    if session is None:
+        return
+    keywords = _continue_keywords(session)
+    state = session.get_state_dict()
+    fingerprint = state_fingerprint(state, keywords, limit)
+    # Private copy: get_next_batch mutates the state it is given
+    snapshot = snapshot_state(state)
+    req = ContinueRequest(session_id=session_id, limit=limit)
+
+    def compute():
+        return _continue_retrieval_stage(session, snapshot, keywords, req, {})
+
+    prefetcher.schedule(session_id, fingerprint, compute)
+
+
+def _build_synonym_preview(keywords: List[str], synonyms: Dict[str, List[str]], endpoint: str):
+    """
+    Level 2/3 synonym debug info for display, built from already generated synonyms
+    (keywords without any are shown with none; no LLM call here).
+    """
+    level2_synonyms = []
+    level3_synonym_magic_pairs = []
+    level2_synonyms_by_keyword = []
+    level3_synonym_magic_by_keyword = []
+    try:
+        display_retriever = MultiLevelRetriever([kw for kw in keywords if kw in synonyms], synonyms=synonyms)
+        level2_synonyms = display_retriever._get_all_synonym_terms()[:30]
+        magic_words_preview = get_magical_words_for_level3()[:5]
+        synonym_preview = level2_synonyms[:5]
+        level3_synonym_magic_pairs = [
+            f"{syn} + {magic}" for syn in synonym_preview for magic in magic_words_preview
+        ][:50]
+
+        # Group synonyms by keyword for clarity
+        for kw in keywords:
+            syns = synonyms.get(kw, [])[:10]
+            level2_synonyms_by_keyword.append({"keyword": kw, "synonyms": syns})
+            # Build Level 3 pairs per keyword (using first few synonyms and magic words)
+            syn_preview_kw = syns[:5]
+            pairs_kw = [f"{s} + {m}" for s in syn_preview_kw for m in magic_words_preview][:20]
+            level3_synonym_magic_by_keyword.append({"keyword": kw, "pairs": pairs_kw})
+    except Exception as e:
+        logger.warning(f"[API {endpoint}] Unable to build synonym preview: {e}")
+    return level2_synonyms, level2_synonyms_by_keyword, level3_synonym_magic_pairs, level3_synonym_magic_by_keyword
+
+
+def _sources_stage(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Final Level 0+ source sentences: retrieval minus anything already in Level 0.0."""
+    biblical_parallels = results["parallels"]
+    biblical_parallels_sentences, biblical_used_texts = results["biblical_sources"]
+    source_sentences = results["retrieval"][0]
+    logger.info(
+        f"[API /ask] Biblical parallels extracted: stories={len(biblical_parallels.get('stories_characters', []))}, "
+        f"refs={len(biblical_parallels.get('scripture_references', []))}, "
+        f"metaphors={len(biblical_parallels.get('biblical_metaphors', []))}, "
+        f"keywords={len(biblical_parallels.get('keywords', []))}; sentences={len(biblical_parallels_sentences)}"
+    )
+
+    # NOTE: Do NOT merge biblical_parallels_sentences into source_sentences
+    # They are displayed separately in UI:
+    # - Level 0.0 (Biblical Parallels) section shows biblical_sources
+    # - Source Sentences section shows only Level 0+ sentences (source_sentences)
+    
+    # Dedup source_sentences to remove any overlap with Level 0.0
+    # This ensures the same sentence doesn't appear in both sections
+    source_sentences, _ = deduplicate_sentences(
+        source_sentences,
+        existing_texts=biblical_used_texts,  # Remove sentences already in Level 0.0
+        similarity_threshold=0.95,
+    )
+    
+    logger.info(f"[API /ask] Retrieved {len(source_sentences)} source sentences (Level 0+), {len(biblical_parallels_sentences)} biblical sources (Level 0.0)")
+    return source_sentences
+
+
+def _ensure_documents():
+    """404 before any work (or any streamed byte) when nothing is indexed."""
+    if corpus_stats.document_count() == 0:
+        raise HTTPException(
+            status_code=404, 
+            detail="No documents found. Please upload a file first using POST /upload"
+        )
+
+
+async def _prepare_ask(req: AskRequest, on_stage_done=None) -> Dict[str, Any]:
+    """
+    Steps 1-4 of /ask: everything up to (not including) the answer LLM call.
+    Shared by POST /ask and POST /ask/stream.
+    """
+    # Steps 1-3 run as a dependency graph so independent LLM/ES calls overlap:
+    #   keywords ──► synonyms ──┐
+    #   parallels ──────────────┼──► retrieval ──┐
+    #   parallels ──► biblical_sources ──────────┴──► sources
+    #   variants, meaning (independent)
+    # With UNIFIED_ANALYSIS, keywords/parallels/synonyms/variants all come from
+    # one "analysis" LLM call instead.
+    graph = StageGraph(label="/ask", on_stage_done=on_stage_done)
+    _add_query_analysis_stages(graph, req.query)
+    graph.add("biblical_sources", _biblical_sources_stage, req.query, deps=["parallels"])
+    graph.add("retrieval", _ask_retrieval_stage, req, deps=["keywords", "parallels", "synonyms"])
+    graph.add("sources", _sources_stage, deps=["retrieval", "biblical_sources"])
+    # Use pre-provided keyword_meaning if available, otherwise generate via LLM
+    if not req.keyword_meaning:
+        graph.add("meaning", extract_keywords, req.query)
+    results = await graph.run()
+
+    clean_keywords = results["keywords"]
+    biblical_parallels = results["parallels"]
+    biblical_parallels_sentences, _ = results["biblical_sources"]
+    _, updated_state, level_used = results["retrieval"]
+    source_sentences = results["sources"]
+
+    if not source_sentences:
+        raise HTTPException(
+            status_code=404, 
+            detail="No source sentences found matching your query. Try rephrasing your question."
+        )
+
+    # Prepare Level 2/3 synonym debug info for display (reuses the synonyms stage)
+    (
+        level2_synonyms,
+        level2_synonyms_by_keyword,
+        level3_synonym_magic_pairs,
+        level3_synonym_magic_by_keyword,
+    ) = _build_synonym_preview(clean_keywords, results["synonyms"], "/ask")
+
+    question_variants = results["variants"]
+    if req.keyword_meaning:
+        keyword_meaning = req.keyword_meaning
+        print(f"[INFO] Using pre-provided keyword_meaning")
+    else:
+        keyword_meaning = results["meaning"]
+        print(f"[INFO] Generated keyword_meaning via LLM")
+
+    # Step 4: Build final prompt with custom_prompt support
+    prompt = build_final_prompt(
+        user_query=req.query,
+        question_variants=question_variants,
+        keyword_meaning=keyword_meaning,
+        source_sentences=source_sentences,
+        continue_mode=False,
+        custom_prompt=req.custom_prompt,
+        biblical_parallels=biblical_parallels,
+        biblical_sources=biblical_parallels_sentences,
+    )
+
+    return {
+        "graph": graph,
+        "clean_keywords": clean_keywords,
+        "biblical_parallels": biblical_parallels,
+        "biblical_sources": biblical_parallels_sentences,
+        "source_sentences": source_sentences,
+        "updated_state": updated_state,
+        "level_used": level_used,
+        "level2_synonyms": level2_synonyms,
+        "level2_synonyms_by_keyword": level2_synonyms_by_keyword,
+        "level3_synonym_magic_pairs": level3_synonym_magic_pairs,
+        "level3_synonym_magic_by_keyword": level3_synonym_magic_by_keyword,
+        "question_variants": question_variants,
+        "keyword_meaning": keyword_meaning,
+        "prompt": prompt,
+    }
+
+
+def _finalize_ask(req: AskRequest, ctx: Dict[str, Any], answer: str) -> AskResponse:
+    """Step 6 of /ask: create the session and build the response (runs in a worker thread)."""
+    source_sentences = ctx["source_sentences"]
+    updated_state = ctx["updated_state"]
+
+    # Step 6: Create session with keywords and level tracking
+    session = session_manager.create_session(
+        query=req.query, 
+        max_level=20,  # 21 levels: 0-20 for deep testing
+        keywords=ctx["clean_keywords"]
+    )
+    
+    # IMPORTANT: state_dict carries the IDs of every sentence get_next_batch used;
+    # the texts of this response are added on top (stored as IDs as well)
+    
+    # Add biblical_parallels to updated_state for session storage
+    updated_state["biblical_parallels"] = ctx["biblical_parallels"]
+    
+    # Update session with complete state from retriever
+    session_manager.update_session(
+        session.session_id,
+        used_sentences=[s["text"] for s in source_sentences],
+        question_variants=ctx["question_variants"],
+        keywords=ctx["keyword_meaning"],
+        state_dict=updated_state
+    )
+    # The first "Tell me more" uses the default continue limit
+    _schedule_prefetch(session.session_id, ContinueRequest.model_fields["limit"].default)
+    
+    # Calculate current_level from state
+    current_level = updated_state.get("current_level", 0)
+    
+    # can_continue = True if current_level < 20 (still have levels to explore)
+    can_continue = current_level <= 20
+
+    return AskResponse(
+        session_id=session.session_id,
+        answer=answer,
+        question_variants=ctx["question_variants"],
+        keywords=ctx["clean_keywords"],  # Add extracted keywords list
+        level2_synonyms=ctx["level2_synonyms"],
+        level2_synonyms_by_keyword=ctx["level2_synonyms_by_keyword"],
+        level3_synonym_magic_pairs=ctx["level3_synonym_magic_pairs"],
+        level3_synonym_magic_by_keyword=ctx["level3_synonym_magic_by_keyword"],
+        keyword_meaning=ctx["keyword_meaning"],
+        source_sentences=source_sentences,
+        current_level=ctx["level_used"],
+        max_level=20,
+        prompt_used=ctx["prompt"],
+        can_continue=can_continue,
+        sentences_retrieved=len(source_sentences),
+        buffer_applied=req.buffer_percentage if req.buffer_percentage else 0,
+        biblical_parallels=ctx["biblical_parallels"],
+        biblical_sources=ctx["biblical_sources"],
+        stage_timings=ctx["graph"].timings(),
+    )
+
+
 @app.post(
     "/ask",
     response_model=AskResponse,
@@ -581,225 +1011,204 @@ async def ask(req: AskRequest):
     logger.info(f"[API /ask] New request - query='{req.query}', limit={req.limit}")
     
     # Check if data exists
-    if get_document_count() == 0:
+    _ensure_documents()
+
+    ctx = await _prepare_ask(req)
+
+    # Step 5: Call LLM (timed as the last stage of the graph)
+    ctx["graph"].add("answer", call_llm, ctx["prompt"])
+    answer = (await ctx["graph"].run())["answer"]
+
+    return await asyncio.to_thread(_finalize_ask, req, ctx, answer)
+
+
+# ============================================================
+# MODULE 7: Continue / Tell me more
+# ============================================================
+
+async def _get_session_or_404(session_id: str):
+    # Session stores may read disk (sqlite) or the network (redis): off the event loop
+    session = await asyncio.to_thread(session_manager.get_session, session_id)
+    if not session:
+        logger.warning(f"[API /continue] Session not found: {session_id}")
         raise HTTPException(
-            status_code=404, 
-            detail="No documents found. Please upload a file first using POST /upload"
+            status_code=404,
+            detail="Session not found or expired (30 min timeout). Please ask a new question with POST /ask"
         )
-    
-    # Step 1: Extract clean keywords (filtered from magic words)
-    clean_keywords = extract_clean_keywords(req.query)
-    
-    logger.info(f"[API /ask] Extracted keywords: {clean_keywords}")
-    print(f"[DEBUG] Query: '{req.query}' → Keywords extracted: {clean_keywords}")
-    
-    if not clean_keywords:
-        # Fallback: use simple word extraction
-        clean_keywords = [w for w in req.query.lower().split() if len(w) > 3][:5]
-        print(f"[DEBUG] Fallback keywords: {clean_keywords}")
+    return session
 
-    # Pre-Level 0: Biblical parallels analysis + supporting pulls
-    biblical_parallels = analyze_biblical_parallels(req.query)
-    # Store in initial state for Level 0.0 pagination
-    initial_state = {
-        "current_level": 0,
-        "level_offsets": {"0.0": 0, "0": 0, "1": 0, "2": 0, "3": 0, "4": 0},
-        "used_sentence_ids": [],
-        "biblical_parallels": biblical_parallels
-    }
-    
-    biblical_parallels_sentences, biblical_used_texts = gather_biblical_parallels_sentences(
-        biblical_parallels,
-        existing_texts=set(),
-        base_query=req.query,
-    )
-    logger.info(
-        f"[API /ask] Biblical parallels extracted: stories={len(biblical_parallels.get('stories_characters', []))}, "
-        f"refs={len(biblical_parallels.get('scripture_references', []))}, "
-        f"metaphors={len(biblical_parallels.get('biblical_metaphors', []))}, "
-        f"keywords={len(biblical_parallels.get('keywords', []))}; sentences={len(biblical_parallels_sentences)}"
-    )
-    
-    # Prepare Level 2/3 synonym debug info for display
-    level2_synonyms = []
-    level3_synonym_magic_pairs = []
-    level2_synonyms_by_keyword = []
-    level3_synonym_magic_by_keyword = []
-    try:
-        display_retriever = MultiLevelRetriever(clean_keywords)
-        level2_synonyms = display_retriever._get_all_synonym_terms()[:30]
-        magic_words_preview = get_magical_words_for_level3()[:5]
-        synonym_preview = level2_synonyms[:5]
-        level3_synonym_magic_pairs = [
-            f"{syn} + {magic}" for syn in synonym_preview for magic in magic_words_preview
-        ][:50]
 
-        # Group synonyms by keyword for clarity
-        for kw in clean_keywords:
-            syns = generate_synonyms(kw)[:10]
-            level2_synonyms_by_keyword.append({"keyword": kw, "synonyms": syns})
-            # Build Level 3 pairs per keyword (using first few synonyms and magic words)
-            syn_preview_kw = syns[:5]
-            pairs_kw = [f"{s} + {m}" for s in syn_preview_kw for m in magic_words_preview][:20]
-            level3_synonym_magic_by_keyword.append({"keyword": kw, "pairs": pairs_kw})
-    except Exception as e:
-        logger.warning(f"[API /ask] Unable to build synonym preview: {e}")
+async def _prepare_continue(req: ContinueRequest, session, on_stage_done=None) -> Dict[str, Any]:
+    """
+    Everything in /continue up to (not including) the answer LLM call.
+    Shared by POST /continue and POST /continue/stream.
+    ctx["response"] is already set when all content has been explored.
+    """
+    # Check if can continue (unlimited now, relies on content availability)
+    # The get_next_batch function will return empty references if no more data is found
+    # and we can handle that via the return check below.
+    # if session.current_level > 3:
+    #    pass 
 
-    # Step 2: Get first batch of sentences using multi-level retrieval
-    # Count meaningful words in original query (excluding stopwords and question words)
-    stopwords = {'what', 'where', 'when', 'who', 'why', 'how', 'which', 'whom', 'whose',
-                 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-                 'the', 'a', 'an', 'and', 'or', 'but', 'if', 'so', 'as',
-                 'to', 'of', 'in', 'on', 'at', 'by', 'for', 'with', 'about',
-                 'do', 'does', 'did', 'can', 'could', 'will', 'would', 'should', 'may', 'might',
-                 'this', 'that', 'these', 'those', 'it', 'its'}
-    
-    # Extract meaningful nouns from query
-    query_words = [w.lower().strip('?!.,;:') for w in req.query.split()]
-    meaningful_query_words = [w for w in query_words if w not in stopwords and len(w) > 2]
-    
-    print(f"[DEBUG] Meaningful words in query: {meaningful_query_words}")
     
-    # If query has only 1 meaningful word → start from Level 1 (keyword + magical words)
-    # NEW LOGIC: Level 1 = keyword + magic words (e.g., "heaven is")
-    if len(meaningful_query_words) <= 1:
-        # Single keyword query → start at Level 1 for contextual search
-        initial_state = {
-            "current_level": 1,  # Changed from 3 to 1
-            "level_offsets": {"0.0": 0, "0": 0, "1": 0, "2": 0, "3": 0, "4": 0},
-            "used_sentence_ids": [],  # Start fresh - Level 0+ should not be filtered by Level 0.0
-            "biblical_parallels": biblical_parallels
-        }
-        print(f"[INFO] Only 1 meaningful word found → Starting from Level 1 (keyword + magic words)")
-    else:
-        initial_state = {
-            "current_level": 0,
-            "level_offsets": {"0.0": 0, "0": 0, "1": 0, "2": 0, "3": 0, "4": 0},
-            "used_sentence_ids": [],  # Start fresh - Level 0+ should not be filtered by Level 0.0
-            "biblical_parallels": biblical_parallels
-        }
+    # Get session state for retriever
+    session_state = session.get_state_dict()
     
-    source_sentences, updated_state, level_used = get_next_batch(
-        session_state=initial_state,
-        keywords=clean_keywords,
-        batch_size=req.limit if req.limit else 15,
-        enabled_levels=req.enabled_levels if req.enabled_levels else None,
-        original_query=req.query,  # NEW: Pass original query for semantic search
-        semantic_count=5  # NEW: Always get 5 semantic results
+    # Use stored keywords from session
+    keywords = _continue_keywords(session)
+
+    # Batch computed in the background after the previous response (same state only)
+    prefetched = await asyncio.to_thread(
+        prefetcher.take,
+        session.session_id,
+        state_fingerprint(session_state, keywords, req.limit or 15),
     )
-    
-    if not source_sentences:
-        # Fallback to old method if multi-level returns nothing
-        logger.warning(f"[API /ask] Multi-level retrieval returned no results, using fallback")
-        source_sentences = get_top_unique_sentences_grouped(
-            req.query, 
-            limit=req.limit,
-            buffer_percentage=req.buffer_percentage
-        )
 
-    # NOTE: Do NOT merge biblical_parallels_sentences into source_sentences
-    # They are displayed separately in UI:
-    # - Level 0.0 (Biblical Parallels) section shows biblical_sources
-    # - Source Sentences section shows only Level 0+ sentences (source_sentences)
-    
-    # Dedup source_sentences to remove any overlap with Level 0.0
-    # This ensures the same sentence doesn't appear in both sections
-    source_sentences, _ = deduplicate_sentences(
-        source_sentences,
-        existing_texts=biblical_used_texts,  # Remove sentences already in Level 0.0
-        similarity_threshold=0.95,
+    # Retrieval and the LLM helper calls are independent → run them concurrently.
+    # No up-front synonyms stage: the walk generates them only if it reaches Level 2/3
+    synonyms: Dict[str, List[str]] = {}
+    graph = StageGraph(label="/continue", on_stage_done=on_stage_done)
+    if prefetched is not None:
+        graph.add("retrieval", lambda: prefetched)
+    else:
+        graph.add("retrieval", _continue_retrieval_stage, session, session_state, keywords, req, synonyms)
+    # Generate NEW question variants (deeper exploration)
+    graph.add(
+        "variants",
+        generate_question_variants,
+        session.original_query,
+        previous_variants=session.used_variants,
+        continue_mode=True,
     )
+    # Generate deeper keyword meaning
+    graph.add(
+        "meaning",
+        extract_keywords,
+        session.original_query,
+        previous_keywords=session.previous_keywords,
+        continue_mode=True,
+    )
+    results = await graph.run()
+    source_sentences, updated_state, level_used = results["retrieval"]
+    if prefetched is not None and max(level_used, updated_state.get("current_level", 0)) >= 2:
+        # The prefetch walk generated them (LLM cache hits)
+        synonyms = await _generate_synonyms_map(keywords)
+
+    # Prepare Level 2/3 synonym debug info for display (only the synonyms the walk generated)
+    (
+        level2_synonyms,
+        level2_synonyms_by_keyword,
+        level3_synonym_magic_pairs,
+        level3_synonym_magic_by_keyword,
+    ) = _build_synonym_preview(keywords, synonyms, "/continue")
     
-    logger.info(f"[API /ask] Retrieved {len(source_sentences)} source sentences (Level 0+), {len(biblical_parallels_sentences)} biblical sources (Level 0.0)")
-    
+    # If no more sentences, return response with can_continue=False
     if not source_sentences:
-        raise HTTPException(
-            status_code=404, 
-            detail="No source sentences found matching your query. Try rephrasing your question."
-        )
-
-    # Step 3: Generate question variants + extract keyword meaning
-    question_variants = generate_question_variants(req.query)
-    
-    # Use pre-provided keyword_meaning if available, otherwise generate via LLM
-    if req.keyword_meaning:
-        keyword_meaning = req.keyword_meaning
-        print(f"[INFO] Using pre-provided keyword_meaning")
-    else:
-        keyword_meaning = extract_keywords(req.query)
-        print(f"[INFO] Generated keyword_meaning via LLM")
-
-    # Step 4: Build final prompt with custom_prompt support
+        return {"graph": graph, "response": ContinueResponse(
+            session_id=session.session_id,
+            answer="All available information has been explored. Please start a new conversation with a different question.",
+            question_variants=[],
+            keywords=session.keywords if hasattr(session, 'keywords') and session.keywords else [],
+            level2_synonyms=level2_synonyms,
+                level2_synonyms_by_keyword=level2_synonyms_by_keyword,
+            level3_synonym_magic_pairs=level3_synonym_magic_pairs,
+                level3_synonym_magic_by_keyword=level3_synonym_magic_by_keyword,
+            keyword_meaning="All keywords have been fully explored.",
+            source_sentences=[],
+            current_level=updated_state.get("current_level", 21),
+            max_level=20,
+            prompt_used="",
+            can_continue=False,
+            sentences_retrieved=0,
+            buffer_applied=0,
+            near_duplicate_window=settings.SESSION_SKETCH_LIMIT,
+            stage_timings=graph.timings(),
+        )}
+    
+    question_variants = results["variants"]
+    keyword_meaning = results["meaning"]
+    
+    # Build new prompt for deeper exploration
     prompt = build_final_prompt(
-        user_query=req.query,
+        user_query=session.original_query,
         question_variants=question_variants,
         keyword_meaning=keyword_meaning,
         source_sentences=source_sentences,
-        continue_mode=False,
-        custom_prompt=req.custom_prompt,
-        biblical_parallels=biblical_parallels,
-        biblical_sources=biblical_parallels_sentences,
+        continue_mode=True,
+        continue_count=session.continue_count + 1,
+        custom_prompt=req.custom_prompt
     )
 
-    # Step 5: Call LLM
-    answer = call_llm(prompt)
-    
-    # Step 6: Create session with keywords and level tracking
-    session = session_manager.create_session(
-        query=req.query, 
-        max_level=20,  # 21 levels: 0-20 for deep testing
-        keywords=clean_keywords
-    )
-    
-    # IMPORTANT: Update session.used_sentences first from state_dict
-    # This ensures all sentences from get_next_batch are tracked
-    all_used_texts = set(updated_state.get("used_sentence_ids", []))
-    all_used_texts.update([s["text"] for s in source_sentences])
-    
-    # Add biblical_parallels to updated_state for session storage
-    updated_state["biblical_parallels"] = biblical_parallels
+    return {
+        "graph": graph,
+        "response": None,
+        "session": session,
+        "keywords": keywords,
+        "source_sentences": source_sentences,
+        "updated_state": updated_state,
+        "level_used": level_used,
+        "level2_synonyms": level2_synonyms,
+        "level2_synonyms_by_keyword": level2_synonyms_by_keyword,
+        "level3_synonym_magic_pairs": level3_synonym_magic_pairs,
+        "level3_synonym_magic_by_keyword": level3_synonym_magic_by_keyword,
+        "question_variants": question_variants,
+        "keyword_meaning": keyword_meaning,
+        "prompt": prompt,
+    }
+
+
+def _finalize_continue(req: ContinueRequest, ctx: Dict[str, Any], answer: str) -> ContinueResponse:
+    """Sync the session with the new batch and build the response (runs in a worker thread)."""
+    session = ctx["session"]
+    source_sentences = ctx["source_sentences"]
+    updated_state = ctx["updated_state"]
+    level_used = ctx["level_used"]
+    question_variants = ctx["question_variants"]
+    keyword_meaning = ctx["keyword_meaning"]
+
+    # IMPORTANT: Sync all used sentence IDs from state_dict
+    # This ensures no duplicates in future /continue calls
     
-    # Update session with complete state from retriever
+    # Update session with new state
     session_manager.update_session(
         session.session_id,
-        used_sentences=list(all_used_texts),  # Pass ALL used texts
+        used_sentences=[s["text"] for s in source_sentences],
         question_variants=question_variants,
         keywords=keyword_meaning,
+        increment_level=True,
         state_dict=updated_state
     )
+    _schedule_prefetch(session.session_id, req.limit or 15)
     
-    # Calculate current_level from state
-    current_level = updated_state.get("current_level", 0)
+    # Get current level from updated state
+    current_level = updated_state.get("current_level", level_used)
     
-    # can_continue = True if current_level < 20 (still have levels to explore)
+    # can_continue = True if there are still levels to explore
     can_continue = current_level <= 20
-
-    return AskResponse(
+    
+    return ContinueResponse(
         session_id=session.session_id,
         answer=answer,
         question_variants=question_variants,
-        keywords=clean_keywords,  # Add extracted keywords list
-        level2_synonyms=level2_synonyms,
-        level2_synonyms_by_keyword=level2_synonyms_by_keyword,
-        level3_synonym_magic_pairs=level3_synonym_magic_pairs,
-        level3_synonym_magic_by_keyword=level3_synonym_magic_by_keyword,
+        keywords=session.keywords if hasattr(session, 'keywords') and session.keywords else [],
+        level2_synonyms=ctx["level2_synonyms"],
+        level2_synonyms_by_keyword=ctx["level2_synonyms_by_keyword"],
+        level3_synonym_magic_pairs=ctx["level3_synonym_magic_pairs"],
+        level3_synonym_magic_by_keyword=ctx["level3_synonym_magic_by_keyword"],
         keyword_meaning=keyword_meaning,
         source_sentences=source_sentences,
         current_level=level_used,
         max_level=20,
-        prompt_used=prompt,
+        prompt_used=ctx["prompt"],
         can_continue=can_continue,
+        continue_count=session.continue_count + 1,
         sentences_retrieved=len(source_sentences),
         buffer_applied=req.buffer_percentage if req.buffer_percentage else 0,
-        biblical_parallels=biblical_parallels,
-        biblical_sources=biblical_parallels_sentences
+        near_duplicate_window=settings.SESSION_SKETCH_LIMIT,
+        stage_timings=ctx["graph"].timings(),
     )
 
 
-# ============================================================
-# MODULE 7: Continue / Tell me more
-# ============================================================
-
 @app.post(
     "/continue",
     response_model=ContinueResponse,
@@ -851,173 +1260,196 @@ async def continue_conversation(req: ContinueRequest):
     logger.info(f"[API /continue] Session={req.session_id}, limit={req.limit}")
     
     # Get session
-    session = session_manager.get_session(req.session_id)
-    if not session:
-        logger.warning(f"[API /continue] Session not found: {req.session_id}")
-        raise HTTPException(
-            status_code=404,
-            detail="Session not found or expired (30 min timeout). Please ask a new question with POST /ask"
-        )
-    
-    # Check if can continue (unlimited now, relies on content availability)
-    # The get_next_batch function will return empty references if no more data is found
-    # and we can handle that via the return check below.
-    # if session.current_level > 3:
-    #    pass 
+    session = await _get_session_or_404(req.session_id)
 
-    
-    # Get session state for retriever
-    session_state = session.get_state_dict()
-    
-    # Use stored keywords from session
-    keywords = session.keywords if session.keywords else [w for w in session.original_query.lower().split() if len(w) > 3][:5]
+    ctx = await _prepare_continue(req, session)
+    if ctx["response"] is not None:
+        return ctx["response"]
 
-    # Prepare Level 2/3 synonym debug info for display
-    level2_synonyms = []
-    level3_synonym_magic_pairs = []
-    level2_synonyms_by_keyword = []
-    level3_synonym_magic_by_keyword = []
+    # Call LLM (timed as the last stage of the graph)
+    ctx["graph"].add("answer", call_llm, ctx["prompt"])
+    answer = (await ctx["graph"].run())["answer"]
+
+    return await asyncio.to_thread(_finalize_continue, req, ctx, answer)
+
+
+# ============================================================
+# Streaming variants (Server-Sent Events)
+# ============================================================
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Disable proxy buffering (nginx) so events flush immediately
+}
+
+
+def _sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+async def _sse_answer_stream(endpoint: str, prepare, sources_payload, finalize) -> AsyncIterator[str]:
+    """
+    Shared SSE flow for /ask/stream and /continue/stream.
+
+    Events:
+      sources : pushed as soon as retrieval is done (before the LLM answer)
+      token   : {"text": ...} answer chunks as the model produces them
+      done    : full AskResponse/ContinueResponse (session_id, metadata, answer)
+      error   : {"status_code": ..., "detail": ...}
+    """
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_stage_done(name: str, results: Dict[str, Any]):
+        payload = sources_payload(name, results)
+        if payload is not None:
+            events.put_nowait(_sse("sources", payload))
+
+    async def run_prepare():
+        try:
+            return await prepare(on_stage_done)
+        finally:
+            events.put_nowait(None)
+
+    task = asyncio.ensure_future(run_prepare())
     try:
-        display_retriever = MultiLevelRetriever(keywords)
-        level2_synonyms = display_retriever._get_all_synonym_terms()[:30]
-        magic_words_preview = get_magical_words_for_level3()[:5]
-        synonym_preview = level2_synonyms[:5]
-        level3_synonym_magic_pairs = [
-            f"{syn} + {magic}" for syn in synonym_preview for magic in magic_words_preview
-        ][:50]
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+        try:
+            ctx = task.result()
+        except HTTPException as e:
+            yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        except Exception as e:
+            logger.error(f"[API {endpoint}] Stream failed before answer: {e}")
+            yield _sse("error", {"status_code": 500, "detail": f"Internal error: {str(e)[:200]}"})
+            return
+
+        if ctx.get("response") is not None:
+            # Nothing left to answer (e.g. all levels explored)
+            yield _sse("done", ctx["response"])
+            return
+
+        # Stream the answer, then persist the session exactly like the non-streaming endpoint
+        graph = ctx["graph"]
+        started = time.perf_counter()
+        first_token_at = None
+        parts: List[str] = []
+        async for delta in iterate_in_thread(call_llm_stream, ctx["prompt"]):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(delta)
+            yield _sse("token", {"text": delta})
+        answer = "".join(parts).strip()
+        graph.record("answer", started, time.perf_counter(), result=answer)
+
+        response = await asyncio.to_thread(finalize, ctx, answer)  # session write
+        if first_token_at is not None:
+            response.stage_timings["answer_first_token_ms"] = round((first_token_at - started) * 1000, 1)
+        yield _sse("done", response)
+    finally:
+        if not task.done():
+            # Client went away while stages were still running
+            task.cancel()
+
+
+def _ask_sources_payload(name: str, results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if name != "sources" or not results["sources"]:
+        return None
+    return {
+        "keywords": results["keywords"],
+        "source_sentences": results["sources"],
+        "current_level": results["retrieval"][2],
+        "biblical_parallels": results["parallels"],
+        "biblical_sources": results["biblical_sources"][0],
+    }
 
-        for kw in keywords:
-            syns = generate_synonyms(kw)[:10]
-            level2_synonyms_by_keyword.append({"keyword": kw, "synonyms": syns})
-            syn_preview_kw = syns[:5]
-            pairs_kw = [f"{s} + {m}" for s in syn_preview_kw for m in magic_words_preview][:20]
-            level3_synonym_magic_by_keyword.append({"keyword": kw, "pairs": pairs_kw})
-    except Exception as e:
-        logger.warning(f"[API /continue] Unable to build synonym preview: {e}")
-    
-    # Get next batch using multi-level retriever
-    # DISABLE forced semantic results for "Tell Me More" to ensure clean level progression
-    source_sentences, updated_state, level_used = get_next_batch(
-        session_state=session_state,
-        keywords=keywords,
-        batch_size=req.limit if req.limit else 15,
-        original_query=session.original_query if session.original_query else " ".join(keywords),
-        semantic_count=5  # RESTORED: User wants 5 vector results always (blended)
-    )
-    
-    # FALLBACK: If levels 0-3 yielded nothing (or we skipped past them), 
-    # force a check on Level 4 (Vector) to ensure we don't return empty-handed prematurely.
-    if not source_sentences:
-        logger.info("[API /continue] No results from current level walk. Forcing Level 4 (Vector) fallback.")
-        # Temporarily force current_level to 4 in a copy of the state
-        fallback_state = session_state.copy()
-        fallback_state["current_level"] = 4
-        
-        # Call get_next_batch strictly for Level 4
-        # We use enabled_levels=[4] to be sure
-        fallback_sentences, fallback_updated_state, fallback_level_used = get_next_batch(
-            session_state=fallback_state,
-            keywords=keywords,
-            batch_size=req.limit if req.limit else 15,
-            original_query=session.original_query,
-            enabled_levels=[4],
-            semantic_count=0
-        )
-        
-        if fallback_sentences:
-            source_sentences = fallback_sentences
-            updated_state = fallback_updated_state
-            level_used = fallback_level_used
-            logger.info(f"[API /continue] Fallback successful! Found {len(source_sentences)} sentences.")
-    
-    # If no more sentences, return response with can_continue=False
-    if not source_sentences:
-        return ContinueResponse(
-            session_id=session.session_id,
-            answer="All available information has been explored. Please start a new conversation with a different question.",
-            question_variants=[],
-            keywords=session.keywords if hasattr(session, 'keywords') and session.keywords else [],
-            level2_synonyms=level2_synonyms,
-                level2_synonyms_by_keyword=level2_synonyms_by_keyword,
-            level3_synonym_magic_pairs=level3_synonym_magic_pairs,
-                level3_synonym_magic_by_keyword=level3_synonym_magic_by_keyword,
-            keyword_meaning="All keywords have been fully explored.",
-            source_sentences=[],
-            current_level=updated_state.get("current_level", 21),
-            max_level=20,
-            prompt_used="",
-            can_continue=False,
-            sentences_retrieved=0,
-            buffer_applied=0
-        )
-    
-    # Generate NEW question variants (deeper exploration)
-    question_variants = generate_question_variants(
-        session.original_query,
-        previous_variants=session.used_variants,
-        continue_mode=True
-    )
-    
-    # Generate deeper keyword meaning
-    keyword_meaning = extract_keywords(
-        session.original_query,
-        previous_keywords=session.previous_keywords,
-        continue_mode=True
-    )
-    
-    # Build new prompt for deeper exploration
-    prompt = build_final_prompt(
-        user_query=session.original_query,
-        question_variants=question_variants,
-        keyword_meaning=keyword_meaning,
-        source_sentences=source_sentences,
-        continue_mode=True,
-        continue_count=session.continue_count + 1,
-        custom_prompt=req.custom_prompt
-    )
-    
-    # Call LLM
-    answer = call_llm(prompt)
-    
-    # IMPORTANT: Sync all used sentences from state_dict
-    # This ensures no duplicates in future /continue calls
-    all_used_texts = set(updated_state.get("used_sentence_ids", []))
-    all_used_texts.update([s["text"] for s in source_sentences])
-    
-    # Update session with new state
-    session_manager.update_session(
-        session.session_id,
-        used_sentences=list(all_used_texts),  # Pass ALL used texts from state
-        question_variants=question_variants,
-        keywords=keyword_meaning,
-        increment_level=True,
-        state_dict=updated_state
+
+@app.post(
+    "/ask/stream",
+    tags=["❓ Q&A"],
+    summary="Ask a question (streaming)",
+    description="""
+## Same as POST /ask, streamed as Server-Sent Events
+
+### 📡 Events (`text/event-stream`):
+- `sources` - Source sentences + biblical parallels, sent as soon as retrieval finishes
+- `token` - `{"text": "..."}` answer chunks as the LLM produces them
+- `done` - Full `AskResponse` (session_id, answer, metadata, stage_timings)
+- `error` - `{"status_code": ..., "detail": ...}` if the request fails mid-stream
+    """,
+    response_class=StreamingResponse,
+    responses={
+        200: {"description": "Event stream", "content": {"text/event-stream": {}}},
+        404: {"description": "No documents indexed"}
+    }
+)
+async def ask_stream(req: AskRequest):
+    """Streaming /ask: sources first, then answer tokens, then session metadata."""
+    logger.info(f"[API /ask/stream] New request - query='{req.query}', limit={req.limit}")
+
+    # Fail with a real status code before the stream starts
+    _ensure_documents()
+
+    return StreamingResponse(
+        _sse_answer_stream(
+            "/ask/stream",
+            prepare=lambda on_stage_done: _prepare_ask(req, on_stage_done=on_stage_done),
+            sources_payload=_ask_sources_payload,
+            finalize=lambda ctx, answer: _finalize_ask(req, ctx, answer),
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
     )
-    
-    # Get current level from updated state
-    current_level = updated_state.get("current_level", level_used)
-    
-    # can_continue = True if there are still levels to explore
-    can_continue = current_level <= 20
-    
-    return ContinueResponse(
-        session_id=session.session_id,
-        answer=answer,
-        question_variants=question_variants,
-        keywords=session.keywords if hasattr(session, 'keywords') and session.keywords else [],
-        level2_synonyms=level2_synonyms,
-        level2_synonyms_by_keyword=level2_synonyms_by_keyword,
-        level3_synonym_magic_pairs=level3_synonym_magic_pairs,
-        level3_synonym_magic_by_keyword=level3_synonym_magic_by_keyword,
-        keyword_meaning=keyword_meaning,
-        source_sentences=source_sentences,
-        current_level=level_used,
-        max_level=20,
-        prompt_used=prompt,
-        can_continue=can_continue,
-        continue_count=session.continue_count + 1,
-        sentences_retrieved=len(source_sentences),
-        buffer_applied=req.buffer_percentage if req.buffer_percentage else 0
+
+
+@app.post(
+    "/continue/stream",
+    tags=["❓ Q&A"],
+    summary="Tell me more (streaming)",
+    description="""
+## Same as POST /continue, streamed as Server-Sent Events
+
+### 📡 Events (`text/event-stream`):
+- `sources` - New source sentences for this level, sent as soon as retrieval finishes
+- `token` - `{"text": "..."}` answer chunks as the LLM produces them
+- `done` - Full `ContinueResponse` (session_id, answer, metadata, stage_timings)
+- `error` - `{"status_code": ..., "detail": ...}` if the request fails mid-stream
+    """,
+    response_class=StreamingResponse,
+    responses={
+        200: {"description": "Event stream", "content": {"text/event-stream": {}}},
+        404: {"description": "Session not found or expired"}
+    }
+)
+async def continue_stream(req: ContinueRequest):
+    """Streaming /continue: sources first, then answer tokens, then session metadata."""
+    logger.info(f"[API /continue/stream] Session={req.session_id}, limit={req.limit}")
+
+    session = await _get_session_or_404(req.session_id)
+
+    def sources_payload(name: str, results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if name != "retrieval" or not results["retrieval"][0]:
+            return None
+        source_sentences, _, level_used = results["retrieval"]
+        return {
+            "session_id": session.session_id,
+            "source_sentences": source_sentences,
+            "current_level": level_used,
+        }
+
+    return StreamingResponse(
+        _sse_answer_stream(
+            "/continue/stream",
+            prepare=lambda on_stage_done: _prepare_continue(req, session, on_stage_done=on_stage_done),
+            sources_payload=sources_payload,
+            finalize=lambda ctx, answer: _finalize_continue(req, ctx, answer),
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
 
@@ -1056,7 +1488,9 @@ async def root():
             },
             "qa": {
                 "POST /ask": "Ask question → get session_id",
-                "POST /continue": "Tell me more with session_id"
+                "POST /continue": "Tell me more with session_id",
+                "POST /ask/stream": "Streaming /ask (Server-Sent Events)",
+                "POST /continue/stream": "Streaming /continue (Server-Sent Events)"
             }
         },
         "quick_start": [
@@ -1088,16 +1522,13 @@ async def root():
 )
 async def health():
     """Health check endpoint with ES and session details."""
-    try:
-        es_health = es.cluster.health()
-        es_status = es_health["status"]
-        es_connected = True
-    except Exception as e:
-        es_status = f"error: {str(e)}"
-        es_connected = False
+    # Cluster status and count come from the cached corpus snapshot (no ES round trip)
+    snapshot = corpus_stats.get()
+    es_status = snapshot.cluster_status
+    es_connected = snapshot.es_connected
     
-    doc_count = get_document_count()
-    active_sessions = session_manager.get_active_count()
+    doc_count = snapshot.document_count
+    active_sessions = await asyncio.to_thread(session_manager.get_active_count)
     
     if es_connected and doc_count > 0:
         status = "healthy"
@@ -1133,16 +1564,25 @@ async def debug_keywords(query: str):
         extract_keywords_raw,
         filter_magic_words,
         extract_keywords,
-        generate_keyword_combinations,
+        iter_keyword_combinations,
+        count_keyword_combinations,
         generate_synonyms,
         generate_keyword_magical_pairs,
         MAGIC_WORDS
     )
+    from services.term_stats import collect_term_stats, pruning_stats
+    from services.posting_accelerator import accelerator_stats
     
     raw = extract_keywords_raw(query)
     filtered = filter_magic_words(raw)
     final = extract_keywords(query)
-    combinations = generate_keyword_combinations(final)
+    combinations = [combo for _, combo in iter_keyword_combinations(final, max_combos=10)]
+
+    # Which Level 0 combos the corpus statistics let through
+    stats = collect_term_stats(final)
+    pruned = []
+    if stats is not None:
+        pruned = [list(c) for _, c in iter_keyword_combinations(final) if not stats.can_match(c)]
     
     # Get synonyms for each keyword
     synonyms = {}
@@ -1158,7 +1598,15 @@ async def debug_keywords(query: str):
         "filtered_keywords": filtered,
         "final_keywords": final,
         "magic_words_count": len(MAGIC_WORDS),
-        "combinations": [list(c) for c in combinations[:10]],
+        "combinations": [list(c) for c in combinations],
+        "combination_pruning": {
+            "total_combinations": count_keyword_combinations(len(final)),
+            "pruned_combinations": len(pruned),
+            "pruned_examples": pruned[:10],
+            "document_frequency": stats.doc_freq if stats is not None else None,
+            "searches_avoided": pruning_stats(),
+        },
+        "posting_accelerator": {"enabled": settings.POSTING_ACCELERATOR, **accelerator_stats()},
         "synonyms": synonyms,
         "magical_pairs": [list(p) for p in magical_pairs],
     }
@@ -1251,7 +1699,7 @@ async def debug_level(
 )
 async def debug_session(session_id: str):
     """Debug endpoint to inspect session state."""
-    session = session_manager.get_session(session_id)
+    session = await asyncio.to_thread(session_manager.get_session, session_id)
     
     if not session:
         return {"error": "Session not found or expired"}
@@ -1263,9 +1711,57 @@ async def debug_session(session_id: str):
         "max_level_available": session.max_level_available,
         "level_offsets": session.level_offsets,
         "keywords": session.keywords,
-        "used_sentences_count": len(session.used_sentences),
+        "used_sentences_count": len(session.used_ids),
         "used_variants_count": len(session.used_variants),
         "continue_count": session.continue_count,
         "created_at": session.created_at.isoformat(),
-        "last_accessed": session.last_accessed.isoformat()
+        "last_accessed": session.last_accessed.isoformat(),
+        "footprint": {
+            "used_ids_bytes": session.used_ids.nbytes,
+            "serialized_bytes": len(encode_session(session.to_dict())),
+            "backend": session_manager.store.name,
+        }
+    }
+
+
+@app.get(
+    "/debug/vector-compare",
+    tags=["🔧 Debug"],
+    summary="Debug: Compare knn vs exact vector search",
+    description="Run a query through approximate knn (HNSW) and exact script_score cosine, report recall@k and latency"
+)
+async def debug_vector_compare(query: str, top_k: int = Query(default=20, ge=1, le=1000)):
+    """Debug endpoint to measure knn relevance against brute-force cosine."""
+    from services.retriever import compare_vector_modes
+
+    return compare_vector_modes(query, top_k=top_k)
+
+@app.get(
+    "/debug/prefetch",
+    tags=["🔧 Debug"],
+    summary="Debug: Prefetch statistics",
+    description="Hit/miss counters of the speculative next-batch prefetch (per worker)"
+)
+async def debug_prefetch():
+    """Debug endpoint to check whether prefetching pays for its extra ES load."""
+    return prefetcher.stats()
+
+
+@app.get(
+    "/debug/cache",
+    tags=["🔧 Debug"],
+    summary="Debug: Cache statistics",
+    description="Hit/miss counters and size of the persistent caches (counters are per worker)"
+)
+async def debug_cache():
+    """Debug endpoint to inspect cache effectiveness."""
+    from services.embedder import get_embedding_cache_stats
+    from services.llm_cache import llm_cache
+    from services.retrieval_cache import retrieval_cache
+
+    return {
+        "embedding_cache": get_embedding_cache_stats(),
+        "llm_cache": llm_cache.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "corpus_stats": corpus_stats.stats(),
     }
@@ -129,6 +129,7 @@ class SourceSentence(BaseModel):
     text: str = Field(..., description="Sentence content")
     level: int = Field(..., description="Sentence level (0, 1, 2...)")
     score: float = Field(..., description="Similarity score with the query")
+    fused_score: Optional[float] = Field(None, description="Hybrid search only: RRF / weighted fusion value it was ranked by")
     sentence_index: Optional[int] = Field(None, description="Sentence index in original file")
     magic_word: Optional[str] = Field(None, description="Magic word used for retrieval")
     is_primary_source: Optional[bool] = Field(False, description="True if from vector/semantic search, False if from keyword search")
@@ -221,6 +222,10 @@ class AskResponse(BaseModel):
         default_factory=list,
         description="Source sentences from Level 0.0 (Biblical Parallels)"
     )
+    stage_timings: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Per-stage timings (ms) of the request graph: start/end/duration, critical path, total"
+    )
 
     class Config:
         json_schema_extra = {
@@ -273,6 +278,15 @@ class ContinueResponse(BaseModel):
     continue_count: int = Field(..., description="Number of times Continue was clicked")
     sentences_retrieved: int = Field(..., description="Number of sentences retrieved")
     buffer_applied: int = Field(..., description="Buffer percentage applied")
+    near_duplicate_window: Optional[int] = Field(
+        default=None,
+        description="How many of the most recent used sentences are also excluded as near duplicates (95%); "
+                    "older ones are excluded only when identical (SESSION_SKETCH_LIMIT)"
+    )
+    stage_timings: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Per-stage timings (ms) of the request graph: start/end/duration, critical path, total"
+    )
 
     class Config:
         json_schema_extra = {
@@ -290,7 +304,8 @@ class ContinueResponse(BaseModel):
                 "can_continue": True,
                 "continue_count": 1,
                 "sentences_retrieved": 17,
-                "buffer_applied": 15
+                "buffer_applied": 15,
+                "near_duplicate_window": 300
             }
         }
 
@@ -317,12 +332,70 @@ class UploadResponse(BaseModel):
         }
 
 
+class UploadJobResponse(BaseModel):
+    """Response of /upload: the file is stored and an ingest job is queued"""
+    job_id: str = Field(..., description="Ingest job ID (GET /jobs/{job_id} for progress)")
+    file_id: str = Field(..., description="Uploaded file ID")
+    filename: str = Field(..., description="Original filename")
+    status: str = Field(..., description="Job status: queued, running, done, failed, cancelled")
+    total_bytes: int = Field(..., description="Uploaded file size")
+    encoding: str = Field(..., description="Detected text encoding")
+    status_url: str = Field(..., description="Progress endpoint")
+    message: str = Field(..., description="Result message")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "job_id": "7f9c2ba4-e88f-4c6b-9d3a-1c2b3d4e5f60",
+                "file_id": "abc-123-def",
+                "filename": "bible.txt",
+                "status": "queued",
+                "total_bytes": 4452069,
+                "encoding": "utf-8",
+                "status_url": "/jobs/7f9c2ba4-e88f-4c6b-9d3a-1c2b3d4e5f60",
+                "message": "File received. Indexing runs in the background."
+            }
+        }
+
+
+class JobStatus(BaseModel):
+    """Progress of an ingest job"""
+    job_id: str = Field(..., description="Ingest job ID")
+    file_id: str = Field(..., description="File ID of the indexed sentences")
+    filename: Optional[str] = Field(None, description="Original filename")
+    mode: str = Field("upload", description="upload, or replace (diffed against the index)")
+    status: str = Field(..., description="queued, running, done, failed, cancelled")
+    attempts: int = Field(..., description="Runs started (more than 1 = resumed)")
+    sentences_split: int = Field(..., description="Sentences split from the file so far")
+    sentences_embedded: int = Field(..., description="Sentences embedded so far")
+    sentences_indexed: int = Field(..., description="Sentences written to Elasticsearch so far")
+    committed: int = Field(..., description="Every sentence below this index is indexed (resume point)")
+    sentences_reused: int = Field(0, description="Replace: unchanged sentences that kept their vector (when done)")
+    documents_deleted: int = Field(0, description="Replace: documents of removed sentences (when done)")
+    bytes_read: int = Field(..., description="Bytes of the file decoded so far")
+    total_bytes: int = Field(..., description="File size")
+    progress: float = Field(..., description="Share of the file processed (0-1)")
+    sentences_per_sec: Optional[float] = Field(None, description="Indexing throughput of the current run")
+    eta_seconds: Optional[float] = Field(None, description="Estimated time left")
+    max_level: Optional[int] = Field(None, description="Highest level (when done)")
+    report: Optional[Dict[str, Any]] = Field(
+        None, description="When done: throughput per stage, bulk-load index settings, force-merge segments and search latency"
+    )
+    error: Optional[str] = Field(None, description="Error message (failed jobs)")
+    created_at: float = Field(..., description="Unix time the job was queued")
+    started_at: Optional[float] = Field(None, description="Unix time the current run started")
+    finished_at: Optional[float] = Field(None, description="Unix time the job ended")
+
+
 class DocumentStats(BaseModel):
     """Document statistics in index"""
     total_documents: int = Field(..., description="Total documents")
     max_level: int = Field(..., description="Highest level")
     levels_available: int = Field(..., description="Number of levels available for Tell me more")
     ready: bool = Field(..., description="Ready to accept queries")
+    files: Dict[str, int] = Field(default_factory=dict, description="Sentences per file_id")
+    index_size_bytes: int = Field(0, description="Primary store size of the index")
+    stats_age_seconds: Optional[float] = Field(None, description="Age of the cached statistics")
 
     class Config:
         json_schema_extra = {
@@ -8,8 +8,8 @@ from typing import Dict, List, Optional, Set, Tuple
 from openai import OpenAI
 
 from config import settings
-from services.deduplicator import deduplicate_sentences, is_duplicate
-from services.deduplicator import deduplicate_sentences, is_duplicate
+from services.deduplicator import deduplicate_sentences, is_duplicate, NearDuplicateIndex
+from services.llm_cache import llm_cache
 # Moved local import to avoid circular dependency
 # from services.multi_level_retriever import MultiLevelRetriever, get_pure_semantic_search
 
@@ -83,8 +83,12 @@ def _filter_generic(items: List[str]) -> List[str]:
     return filtered
 
 
+# Bump when the prompt or its parsing changes (invalidates cached LLM answers)
+PARALLELS_PROMPT_VERSION = 1
+
+
 def analyze_biblical_parallels(query: str) -> Dict[str, List[str]]:
-    """Call LLM to extract concise biblical parallels before Level 0."""
+    """Call LLM to extract concise biblical parallels before Level 0 (cached per query)."""
     start_ts = time.time()
     prompt = f"""Analyze the following text and extract all Biblical parallels. Provide the output in four sections:
 
@@ -113,7 +117,7 @@ Output JSON format:
 
     logger.info(f"[BiblicalParallels] Analyzing query: {query[:100]}...")
     
-    try:
+    def call() -> Dict[str, List[str]]:
         response = client.chat.completions.create(
             model=settings.CHAT_MODEL,
             messages=[
@@ -129,6 +133,11 @@ Output JSON format:
         raw_content = response.choices[0].message.content.strip()
         logger.info(f"[BiblicalParallels] LLM raw response: {raw_content[:300]}...")
         parsed = _safe_parse_json(raw_content)
+        # Nothing extracted → {} so the answer is not cached
+        return parsed if any(parsed.values()) else {}
+
+    try:
+        parsed = llm_cache.get_or_call("biblical_parallels", PARALLELS_PROMPT_VERSION, query, call)
     except Exception as exc:
         logger.warning(f"[BiblicalParallels] LLM extraction failed: {exc}")
         parsed = {}
@@ -182,7 +191,7 @@ def gather_biblical_parallels_sentences(
     4. Fewer items per category
     """
     collected: List[Dict[str, str]] = []
-    used: Set[str] = set(existing_texts) if existing_texts else set()
+    used = NearDuplicateIndex(existing_texts)
     start_ts = time.time()
 
     # OPTIMIZED: Limit items per category to reduce API calls
@@ -0,0 +1,201 @@
+# services/corpus_stats.py
+"""
+Corpus Stats - Document count, max level, per-file counts and index size, in memory
+
+/ask, /documents/count, /health and get_sentences_by_level used to ask
+Elasticsearch (_count, a max aggregation, cluster health) on every call.
+These values only change when documents are ingested or deleted, so they
+are read once into a snapshot and served from memory:
+
+- refreshed right after an ingest/delete in this worker (services/retriever.py)
+- refreshed on the next read when another worker changed the index (the
+  index generation of services/retrieval_cache.py, a local SQLite read)
+- refreshed in the background every CORPUS_STATS_REFRESH_SECONDS
+  (catches changes made outside the API)
+"""
+import time
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Optional
+
+from vector.elastic_client import es
+from config import settings
+from services.retrieval_cache import retrieval_cache
+
+logger = logging.getLogger(__name__)
+INDEX = settings.ES_INDEX_NAME
+
+# Per-file counts kept in the snapshot (terms aggregation size)
+MAX_FILES = 1000
+# A failed snapshot (ES down, no index yet) is retried on read after this long
+ERROR_RETRY_SECONDS = 5
+# Tried in order for the per-file counts (keyword mapping, then the dynamic text mapping's subfield)
+FILE_ID_FIELDS = ("file_id", "file_id.keyword")
+
+
+@dataclass
+class CorpusSnapshot:
+    document_count: int = 0
+    max_level: int = 0
+    files: Dict[str, int] = field(default_factory=dict)  # file_id → sentences
+    index_size_bytes: int = 0
+    cluster_status: str = "unknown"
+    es_connected: bool = False
+    error: Optional[str] = None
+    partial_errors: Dict[str, str] = field(default_factory=dict)  # statistic → error, rest still valid
+    refreshed_at: float = 0.0
+    generation: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["age_seconds"] = round(time.time() - self.refreshed_at, 1) if self.refreshed_at else None
+        return data
+
+
+def _read_generation() -> Optional[int]:
+    if retrieval_cache.generation is None:
+        return None
+    try:
+        return retrieval_cache.generation.current()
+    except Exception:
+        return None
+
+
+def _file_counts() -> Dict[str, int]:
+    """
+    Sentences per file_id. Indices created before file_id was mapped as a
+    keyword have it as text (no fielddata): aggregate on file_id.keyword there.
+    """
+    error: Optional[Exception] = None
+    for name in FILE_ID_FIELDS:
+        try:
+            resp = es.search(index=INDEX, body={
+                "size": 0,
+                "aggs": {"files": {"terms": {"field": name, "size": MAX_FILES}}},
+            })
+        except Exception as e:
+            error = e
+            continue
+        return {b["key"]: b["doc_count"] for b in resp["aggregations"]["files"]["buckets"]}
+    raise error
+
+
+def fetch_snapshot() -> CorpusSnapshot:
+    """
+    Read every statistic from Elasticsearch: cluster health, one size-0
+    search (exact total + max level), the per-file counts and the store size.
+    Never raises: errors are recorded in the snapshot. Only a failed count
+    marks the snapshot as failed; the per-file counts and the store size
+    fail on their own (partial_errors) without zeroing the rest.
+    """
+    snapshot = CorpusSnapshot(generation=_read_generation())
+    try:
+        snapshot.cluster_status = es.cluster.health()["status"]
+        snapshot.es_connected = True
+    except Exception as e:
+        snapshot.cluster_status = f"error: {str(e)}"
+        snapshot.error = str(e)
+        snapshot.refreshed_at = time.time()
+        return snapshot
+
+    try:
+        resp = es.search(index=INDEX, body={
+            "size": 0,
+            "track_total_hits": True,
+            "aggs": {"max_level": {"max": {"field": "level"}}},
+        })
+        snapshot.document_count = resp["hits"]["total"]["value"]
+        max_val = resp["aggregations"]["max_level"]["value"]
+        snapshot.max_level = int(max_val) if max_val else 0
+    except Exception as e:
+        # No index yet (before the first upload) or a transient error
+        snapshot.error = str(e)
+        snapshot.refreshed_at = time.time()
+        logger.warning(f"[CorpusStats] Refresh failed: {e}")
+        return snapshot
+
+    try:
+        snapshot.files = _file_counts()
+    except Exception as e:
+        snapshot.partial_errors["files"] = str(e)
+        logger.warning(f"[CorpusStats] Per-file counts unavailable: {e}")
+    try:
+        stats = es.indices.stats(index=INDEX, metric="store")
+        snapshot.index_size_bytes = stats["_all"]["primaries"]["store"]["size_in_bytes"]
+    except Exception as e:
+        snapshot.partial_errors["index_size_bytes"] = str(e)
+        logger.warning(f"[CorpusStats] Index size unavailable: {e}")
+    snapshot.refreshed_at = time.time()
+    return snapshot
+
+
+class CorpusStats:
+    """Latest CorpusSnapshot of this worker plus the background refresher."""
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[CorpusSnapshot] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+
+    def refresh(self) -> CorpusSnapshot:
+        snapshot = fetch_snapshot()
+        with self._lock:
+            self._snapshot = snapshot
+            self.refreshes += 1
+        return snapshot
+
+    def get(self) -> CorpusSnapshot:
+        """The cached snapshot; refreshed first only when missing, failed, or the index generation moved."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        if snapshot.generation is not None and _read_generation() != snapshot.generation:
+            return self.refresh()
+        if snapshot.error and time.time() - snapshot.refreshed_at > ERROR_RETRY_SECONDS:
+            return self.refresh()
+        return snapshot
+
+    def document_count(self) -> int:
+        return self.get().document_count
+
+    def max_level(self) -> int:
+        return self.get().max_level
+
+    def start(self):
+        """Start the background refresh thread (no-op when the interval is 0)."""
+        if self.refresh_seconds <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="corpus-stats", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"[CorpusStats] Background refresh error: {e}")
+            self._stop.wait(self.refresh_seconds)
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "refresh_seconds": self.refresh_seconds,
+            "refreshes": self.refreshes,
+            "background": bool(self._thread and self._thread.is_alive()),
+            "snapshot": snapshot.to_dict() if snapshot else None,
+        }
+
+
+# Global corpus stats instance
+corpus_stats = CorpusStats(settings.CORPUS_STATS_REFRESH_SECONDS)
@@ -4,7 +4,14 @@ STRICT Deduplication Module with High-Similarity Detection
 - Removes 100% exact duplicates
 - Also removes near-duplicates (>95% similar) to catch variants like "waked" vs "wakened"
 """
-from typing import Set, List, Dict, Any, Tuple
+import sys
+import base64
+import hashlib
+import zlib
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Set, List, Dict, Any, Tuple, Callable, Iterable, Iterator, Optional, Union
 from difflib import SequenceMatcher
 
 
@@ -36,9 +43,252 @@ def calculate_similarity(text1: str, text2: str) -> float:
     return SequenceMatcher(None, text1, text2).ratio()
 
 
+def _length_compatible(len1: int, len2: int) -> bool:
+    """Skip pairs whose length differs by more than 15% (cannot reach 95% similarity anyway)."""
+    return abs(len1 - len2) / max(len1, len2, 1) <= 0.15
+
+
+# ---------- Near-duplicate index (MinHash + LSH) ----------
+
+SHINGLE_SIZE = 5      # character n-grams
+LSH_BANDS = 20        # 20 bands x 3 rows = 60 hash functions
+LSH_ROWS = 3
+LINEAR_SCAN_LIMIT = 32  # below this size a plain scan is faster than hashing
+SKETCH_LIMIT = 300      # default for the most recent session sentences kept with their band keys (SESSION_SKETCH_LIMIT)
+
+_MASK64 = (1 << 64) - 1
+_MASK32 = (1 << 32) - 1
+_NUM_HASHES = LSH_BANDS * LSH_ROWS
+_MIX_A = 0x9E3779B97F4A7C15  # odd 64-bit constant (golden ratio)
+_MIX_B = 0xD6E8FEB86659FD93
+
+
+def _shingle_hashes(text: str) -> Set[int]:
+    text = text.lower()
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {
+        zlib.crc32(text[i:i + SHINGLE_SIZE].encode("utf-8"))
+        for i in range(len(text) - SHINGLE_SIZE + 1)
+    }
+
+
+@lru_cache(maxsize=100_000)
+def _band_keys(text: str) -> Tuple[int, ...]:
+    """
+    MinHash signature folded into one key per LSH band.
+
+    Uses one-permutation hashing (each shingle hashed once, min kept per bin)
+    with rotation densification for empty bins: O(len(text)) instead of
+    O(len(text) * num_hashes). Cached: the same used sentences are re-indexed
+    on every /continue.
+    """
+    signature: List[Optional[int]] = [None] * _NUM_HASHES
+    for x in _shingle_hashes(text):
+        h = ((x + 1) * _MIX_A + _MIX_B) & _MASK64
+        h ^= h >> 29
+        slot, value = h % _NUM_HASHES, h // _NUM_HASHES
+        current = signature[slot]
+        if current is None or value < current:
+            signature[slot] = value
+
+    # Densify: an empty bin borrows the value of the next non-empty bin
+    for slot in range(_NUM_HASHES):
+        if signature[slot] is None:
+            for step in range(1, _NUM_HASHES):
+                borrowed = signature[(slot + step) % _NUM_HASHES]
+                if borrowed is not None:
+                    signature[slot] = borrowed + step * _MIX_B
+                    break
+
+    return tuple(
+        hash((band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])))
+        for band in range(LSH_BANDS)
+    )
+
+
+class NearDuplicateIndex:
+    """
+    Set of seen texts with sublinear near-duplicate lookup.
+
+    - Exact duplicates: hash-set lookup.
+    - Near duplicates: MinHash over character 5-grams, bucketed with LSH bands.
+      Only texts sharing a band bucket become candidates, and every candidate is
+      verified with the same length filter + SequenceMatcher ratio as
+      is_duplicate(), so the 95% threshold semantics are unchanged (no false
+      positives). Small indexes fall back to an exact linear scan.
+
+    Behaves like a set of strings (add, update, in, len, iter, copy, |) so it
+    can be passed anywhere a used_texts set was passed before.
+
+    Also tracks the sentence IDs of everything seen, plus IDs added without
+    their text (add_ids), for exact exclusion filters and session state.
+
+    Sessions keep only IDs plus a sketch (ID + band keys of the most recent
+    SKETCH_LIMIT sentences). A loaded sketch puts those sentences in the LSH
+    buckets without their text; a lookup that lands in such a bucket fetches
+    just those texts through `hydrate` before verifying.
+    """
+
+    def __init__(self, texts: Optional[Iterable[str]] = None):
+        self._texts: Set[str] = set()
+        self._ids: Set[int] = set()
+        self._buckets: List[Dict[int, List[str]]] = [dict() for _ in range(LSH_BANDS)]
+        self._recent: Dict[int, Tuple[int, ...]] = {}  # id -> 32-bit band keys, insertion order
+        self._pending: Set[int] = set()  # sketched ids whose text is not loaded yet
+        self._pending_buckets: List[Dict[int, List[int]]] = [dict() for _ in range(LSH_BANDS)]
+        self._hydrate: Optional[Callable[[List[int]], List[str]]] = None
+        self.comparisons = 0  # SequenceMatcher calls (for profiling)
+        self.hydrated = 0  # texts fetched for sketched ids (for profiling)
+        if texts:
+            self.update(texts)
+
+    # ---------- set protocol ----------
+    def add(self, text: str):
+        if not text or text in self._texts:
+            return
+        self._texts.add(text)
+        ident = sentence_id(text)
+        self._ids.add(ident)
+        self._pending.discard(ident)
+        keys = _band_keys(text)
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(text)
+        self._recent.pop(ident, None)
+        self._recent[ident] = tuple(key & _MASK32 for key in keys)
+
+    def update(self, texts: Iterable[str]):
+        for text in texts:
+            self.add(text)
+
+    def __contains__(self, text: object) -> bool:
+        return text in self._texts
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._texts)
+
+    def __bool__(self) -> bool:
+        return bool(self._texts or self._pending)
+
+    def __or__(self, other: Iterable[str]) -> "NearDuplicateIndex":
+        """Full copy (buckets and sketch state included): keep it out of per-query loops."""
+        merged = self.copy()
+        merged.update(other)
+        return merged
+
+    def copy(self) -> "NearDuplicateIndex":
+        clone = NearDuplicateIndex()
+        clone._texts = set(self._texts)
+        clone._ids = set(self._ids)
+        clone._buckets = [{k: list(v) for k, v in band.items()} for band in self._buckets]
+        clone._recent = dict(self._recent)
+        clone._pending = set(self._pending)
+        clone._pending_buckets = [{k: list(v) for k, v in band.items()} for band in self._pending_buckets]
+        clone._hydrate = self._hydrate
+        return clone
+
+    # ---------- sentence IDs ----------
+    def add_ids(self, ids: Iterable[int]):
+        """Exclude sentences known only by ID (texts not needed for exact exclusion)."""
+        self._ids.update(ids)
+
+    def ids(self) -> "SentenceIdSet":
+        return SentenceIdSet(self._ids)
+
+    def exclusion_hashes(self) -> List[str]:
+        """text_hash values of every seen sentence (sorted, for a terms filter)."""
+        return sorted(sentence_id_to_hash(v) for v in self._ids)
+
+    # ---------- session sketch ----------
+    def sketch(self, limit: int = SKETCH_LIMIT) -> str:
+        """Base64 of the last `limit` sentences: uint64 IDs, then LSH_BANDS uint32 band keys each."""
+        recent = list(self._recent.items())[-limit:] if limit > 0 else []
+        ids = array("Q", (ident for ident, _ in recent))
+        keys = array("I", (key for _, band_keys in recent for key in band_keys))
+        if sys.byteorder == "big":
+            ids.byteswap()
+            keys.byteswap()
+        return base64.b64encode(ids.tobytes() + keys.tobytes()).decode("ascii")
+
+    def load_sketch(self, encoded: str, hydrate: Optional[Callable[[List[int]], List[str]]] = None):
+        """
+        Register sentences known only by ID + band keys (from sketch()).
+        `hydrate(ids) -> texts` is called only for IDs whose bucket a lookup hits.
+        """
+        self._hydrate = hydrate
+        raw = base64.b64decode(encoded) if encoded else b""
+        count = len(raw) // (8 + 4 * LSH_BANDS)
+        ids, keys = array("Q"), array("I")
+        ids.frombytes(raw[:8 * count])
+        keys.frombytes(raw[8 * count:8 * count + 4 * LSH_BANDS * count])
+        if sys.byteorder == "big":
+            ids.byteswap()
+            keys.byteswap()
+        for pos, ident in enumerate(ids):
+            if ident in self._recent:
+                continue
+            band_keys = tuple(keys[pos * LSH_BANDS:(pos + 1) * LSH_BANDS])
+            self._recent[ident] = band_keys
+            self._ids.add(ident)
+            self._pending.add(ident)
+            for band, key in enumerate(band_keys):
+                self._pending_buckets[band].setdefault(key, []).append(ident)
+
+    def _hydrate_candidates(self, text: str):
+        """Fetch the texts of sketched sentences sharing a band bucket with `text`."""
+        wanted: Set[int] = set()
+        for band, key in enumerate(_band_keys(text)):
+            bucket = self._pending_buckets[band].get(key & _MASK32)
+            if bucket:
+                wanted.update(i for i in bucket if i in self._pending)
+        if not wanted:
+            return
+        texts = self._hydrate(sorted(wanted)) if self._hydrate else []
+        self.hydrated += len(texts)
+        self._pending -= wanted  # also drops IDs no longer in the corpus
+        self.update(texts)
+
+    # ---------- lookup ----------
+    def find_near_duplicate(self, text: str, similarity_threshold: float = 0.95) -> Optional[str]:
+        """Return a seen text that is an exact or near duplicate of `text`, else None."""
+        if not text:
+            return None
+        if self._pending:
+            self._hydrate_candidates(text)
+        if not self._texts:
+            return None
+        if text in self._texts:
+            return text
+
+        if len(self._texts) <= LINEAR_SCAN_LIMIT:
+            candidates: Iterable[str] = self._texts
+        else:
+            found: Set[str] = set()
+            for band, key in enumerate(_band_keys(text)):
+                bucket = self._buckets[band].get(key)
+                if bucket:
+                    found.update(bucket)
+            candidates = found
+
+        text_len = len(text)
+        for seen_text in candidates:
+            if not _length_compatible(text_len, len(seen_text)):
+                continue
+            self.comparisons += 1
+            if calculate_similarity(text, seen_text) >= similarity_threshold:
+                return seen_text
+        return None
+
+    def is_near_duplicate(self, text: str, similarity_threshold: float = 0.95) -> bool:
+        return self.find_near_duplicate(text, similarity_threshold) is not None
+
+
 def is_duplicate(
     text: str, 
-    seen_texts: Set[str],
+    seen_texts: Union[Set[str], NearDuplicateIndex],
     similarity_threshold: float = 0.95,  # Default 95% similarity
     fingerprint_match: bool = False  # STRICT: Disabled
 ) -> bool:
@@ -61,6 +311,10 @@ def is_duplicate(
     if not text or not seen_texts:
         return False
     
+    # Indexed path: LSH candidates + exact verification
+    if isinstance(seen_texts, NearDuplicateIndex):
+        return seen_texts.is_near_duplicate(text, similarity_threshold)
+    
     # Fast path: exact match
     if text in seen_texts:
         return True
@@ -79,7 +333,7 @@ def is_duplicate(
         
         # Skip if length difference > 15% (slightly relaxed from 10%)
         # This is the primary optimization to avoid O(N) slow text comparisons
-        if abs(text_len - seen_len) / max(text_len, seen_len) > 0.15:
+        if not _length_compatible(text_len, seen_len):
             continue
         
         # Check similarity only for close-length texts
@@ -96,10 +350,10 @@ def is_duplicate(
 
 def deduplicate_sentences(
     sentences: List[Dict[str, Any]],
-    existing_texts: Set[str] = None,
+    existing_texts: Iterable[str] = None,
     similarity_threshold: float = 0.95,  # Default 95% similarity
     use_fingerprint: bool = False  # STRICT: Disabled
-) -> Tuple[List[Dict[str, Any]], Set[str]]:
+) -> Tuple[List[Dict[str, Any]], NearDuplicateIndex]:
     """
     Remove duplicate and near-duplicate sentences.
     
@@ -113,12 +367,18 @@ def deduplicate_sentences(
         use_fingerprint: IGNORED (disabled)
         
     Returns:
-        Tuple of (List with exact and near-duplicates removed, Updated set of all seen texts)
+        Tuple of (List with exact and near-duplicates removed, Updated index of all seen texts)
     """
     if not sentences:
-        return [], existing_texts if existing_texts else set()
+        if isinstance(existing_texts, NearDuplicateIndex):
+            return [], existing_texts
+        return [], NearDuplicateIndex(existing_texts)
     
-    seen = set(existing_texts) if existing_texts else set()
+    # Copy so the caller's set/index is not modified
+    if isinstance(existing_texts, NearDuplicateIndex):
+        seen = existing_texts.copy()
+    else:
+        seen = NearDuplicateIndex(existing_texts)
     unique = []
     removed = []
     
@@ -151,3 +411,113 @@ def get_unique_key(text: str) -> str:
     Each character matters - even case and spaces.
     """
     return text
+
+
+def text_hash(text: str) -> str:
+    """
+    Compact content hash of a sentence (64-bit blake2b, hex).
+    Stored in the `text_hash` keyword field so exclusions can be a single terms filter.
+    STRICT MODE: hashes the text as-is, same identity as get_unique_key().
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def sentence_id(text: str) -> int:
+    """
+    64-bit integer identity of a sentence: the same value as text_hash(), as an int.
+    Sessions track used sentences by this ID instead of the full text.
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def sentence_id_to_hash(value: int) -> str:
+    """Inverse view of sentence_id(): the `text_hash` keyword stored in Elasticsearch."""
+    return f"{value:016x}"
+
+
+def _as_sentence_id(value: Union[int, str]) -> int:
+    # Legacy session state holds sentence texts; new state holds IDs
+    return value if isinstance(value, int) else sentence_id(value)
+
+
+class SentenceIdSet:
+    """
+    Compact set of sentence IDs: a sorted array of unsigned 64-bit ints
+    (8 bytes per sentence, binary-search membership, fast merge).
+
+    Accepts IDs or sentence texts (converted with sentence_id()).
+    """
+    __slots__ = ("_ids",)
+
+    def __init__(self, values: Optional[Iterable[Union[int, str]]] = None):
+        self._ids = array("Q")
+        if values:
+            self.update(values)
+
+    def add(self, value: Union[int, str]):
+        value = _as_sentence_id(value)
+        pos = bisect_left(self._ids, value)
+        if pos == len(self._ids) or self._ids[pos] != value:
+            self._ids.insert(pos, value)
+
+    def update(self, values: Iterable[Union[int, str]]):
+        if isinstance(values, SentenceIdSet):
+            new = values._ids
+        else:
+            new = sorted({_as_sentence_id(v) for v in values if v or v == 0})
+        if not new:
+            return
+        if not self._ids:
+            self._ids = array("Q", new)
+        else:
+            self._ids = array("Q", sorted(set(self._ids).union(new)))
+
+    def __contains__(self, value: object) -> bool:
+        if not isinstance(value, (int, str)):
+            return False
+        value = _as_sentence_id(value)
+        pos = bisect_left(self._ids, value)
+        return pos < len(self._ids) and self._ids[pos] == value
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __bool__(self) -> bool:
+        return len(self._ids) > 0
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, SentenceIdSet) and self._ids == other._ids
+
+    def copy(self) -> "SentenceIdSet":
+        clone = SentenceIdSet()
+        clone._ids = array("Q", self._ids)
+        return clone
+
+    def hashes(self) -> List[str]:
+        """text_hash values (for terms filters on the text_hash field)."""
+        return [sentence_id_to_hash(v) for v in self._ids]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._ids) * self._ids.itemsize
+
+    # ---------- serialization (little-endian, base64 for JSON) ----------
+    def to_base64(self) -> str:
+        ids = array("Q", self._ids)
+        if sys.byteorder == "big":
+            ids.byteswap()
+        return base64.b64encode(ids.tobytes()).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, encoded: str) -> "SentenceIdSet":
+        ids = array("Q")
+        if encoded:
+            ids.frombytes(base64.b64decode(encoded))
+            if sys.byteorder == "big":
+                ids.byteswap()
+        result = cls()
+        result._ids = array("Q", sorted(set(ids)))
+        return result
@@ -0,0 +1,221 @@
+# services/disk_cache.py
+"""
+Disk Cache - SQLite-backed LRU key/value store
+- Persistent across restarts
+- Shared safely by several uvicorn workers (SQLite WAL + busy timeout)
+- Size bound with least-recently-used eviction
+- Optional TTL per entry
+- Hit/miss counters (per process)
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+class DiskLRUCache:
+    """
+    Small persistent LRU cache on top of SQLite.
+
+    Every process (uvicorn worker) opens its own connection to the same file.
+    WAL mode lets readers proceed while one writer commits, and busy_timeout
+    makes concurrent writers wait instead of failing.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100_000,
+        ttl_seconds: Optional[int] = None,
+        evict_every: int = 200,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = max(1, evict_every)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    # ---------- Connection handling ----------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                expires_at REAL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)")
+
+    # ---------- Public API ----------
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached value or None (counts a hit or a miss)."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Look up several keys at once. Missing/expired keys are absent from the result."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        found: Dict[str, bytes] = {}
+        now = time.time()
+        try:
+            conn = self._conn()
+            for i in range(0, len(keys), _SQL_BATCH):
+                chunk = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value, expires_at FROM cache WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for key, value, expires_at in rows:
+                    if expires_at is not None and expires_at < now:
+                        continue
+                    found[key] = value
+            if found:
+                self._touch(list(found.keys()), now)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"[DiskCache] Read failed ({self.path}): {e}")
+            found = {}
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[int] = None):
+        """Store a value."""
+        self.set_many([(key, value)], ttl_seconds=ttl_seconds)
+
+    def set_many(self, items: List[Tuple[str, bytes]], ttl_seconds: Optional[int] = None):
+        """Store several values in one transaction."""
+        if not items:
+            return
+        now = time.time()
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = now + ttl if ttl else None
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, last_access, expires_at) VALUES (?, ?, ?, ?)",
+                    [(k, sqlite3.Binary(v), now, expires_at) for k, v in items],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"[DiskCache] Write failed ({self.path}): {e}")
+            return
+
+        with self._lock:
+            self._puts_since_evict += len(items)
+            should_evict = self._puts_since_evict >= self.evict_every
+            if should_evict:
+                self._puts_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least-recently-used ones above max_entries."""
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = conn.execute(
+                    "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+                    (time.time(),),
+                ).rowcount
+                total = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                overflow = total - self.max_entries
+                if overflow > 0:
+                    removed += conn.execute(
+                        "DELETE FROM cache WHERE key IN "
+                        "(SELECT key FROM cache ORDER BY last_access ASC LIMIT ?)",
+                        (overflow,),
+                    ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if removed:
+                logger.info(f"[DiskCache] Evicted {removed} entries from {self.path}")
+            return removed
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"[DiskCache] Eviction failed ({self.path}): {e}")
+            return 0
+
+    def clear(self):
+        """Remove every entry."""
+        try:
+            self._conn().execute("DELETE FROM cache")
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"[DiskCache] Clear failed ({self.path}): {e}")
+
+    def __len__(self) -> int:
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> Dict[str, object]:
+        """Counters for this process plus the shared entry count."""
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+        }
+
+    # ---------- Internal ----------
+    def _touch(self, keys: List[str], now: float):
+        conn = self._conn()
+        for i in range(0, len(keys), _SQL_BATCH):
+            chunk = keys[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(chunk))
+            conn.execute(
+                f"UPDATE cache SET last_access = ? WHERE key IN ({placeholders})",
+                [now, *chunk],
+            )
@@ -2,10 +2,19 @@
 """
 Embedder Module - OpenAI Embeddings API
 Sử dụng OPENAI_API_KEY để gọi OpenAI embedding API
+
+Embeddings are cached on disk, keyed by (EMBEDDING_MODEL, sha256(text)),
+so repeated queries and re-uploaded files cost no API round trips.
 """
-from typing import List
+import hashlib
+import logging
+from array import array
+from typing import Dict, List, Optional
 from openai import OpenAI
 from config import settings
+from services.disk_cache import DiskLRUCache
+
+logger = logging.getLogger(__name__)
 
 # Initialize OpenAI client with OPENAI_API_KEY
 print("Initializing OpenAI Embedding client...")
@@ -13,38 +22,104 @@ client = OpenAI(api_key=settings.OPENAI_API_KEY)
 EMBEDDING_MODEL = settings.EMBEDDING_MODEL  # text-embedding-3-small
 print(f"OpenAI Embedding ready! Model: {EMBEDDING_MODEL}")
 
+# Persistent embedding cache (shared by all workers through the same SQLite file)
+embedding_cache: Optional[DiskLRUCache] = None
+if settings.EMBEDDING_CACHE_ENABLED:
+    try:
+        embedding_cache = DiskLRUCache(
+            settings.EMBEDDING_CACHE_PATH,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        )
+        print(f"Embedding cache ready: {settings.EMBEDDING_CACHE_PATH}")
+    except Exception as e:
+        logger.warning(f"[Embedder] Embedding cache disabled: {e}")
+
+
+def _cache_key(text: str) -> str:
+    """Content address: model + text hash."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{EMBEDDING_MODEL}:{digest}"
+
+
+def _pack(embedding: List[float]) -> bytes:
+    # float32 is what Elasticsearch stores for dense_vector anyway
+    return array("f", embedding).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
 
 def get_embedding(text: str) -> List[float]:
     """
     Lấy embedding cho một text sử dụng OpenAI API.
     """
+    if embedding_cache is not None:
+        cached = embedding_cache.get(_cache_key(text))
+        if cached is not None:
+            return _unpack(cached)
+
     response = client.embeddings.create(
         model=EMBEDDING_MODEL,
         input=text
     )
-    return response.data[0].embedding
+    embedding = response.data[0].embedding
+
+    if embedding_cache is not None:
+        embedding_cache.set(_cache_key(text), _pack(embedding))
+    return embedding
 
 
 def get_embeddings_batch(texts: List[str]) -> List[List[float]]:
     """
     Lấy embeddings cho nhiều texts cùng lúc.
     OpenAI API hỗ trợ batch embedding.
-    
+    Only texts missing from the cache are sent to the API.
+
     Args:
         texts: Danh sách các text cần embedding
-        
+
     Returns:
         Danh sách các embeddings tương ứng
     """
     if not texts:
         return []
-    
-    # OpenAI supports batch embedding
-    response = client.embeddings.create(
-        model=EMBEDDING_MODEL,
-        input=texts
-    )
-    
-    # Sort by index to maintain order
-    sorted_data = sorted(response.data, key=lambda x: x.index)
-    return [item.embedding for item in sorted_data]
+
+    resolved: Dict[str, List[float]] = {}
+    if embedding_cache is not None:
+        keys = {text: _cache_key(text) for text in texts}
+        cached = embedding_cache.get_many(keys.values())
+        for text, key in keys.items():
+            if key in cached:
+                resolved[text] = _unpack(cached[key])
+
+    # Unique texts still to embed, in first-seen order
+    missing = [t for t in dict.fromkeys(texts) if t not in resolved]
+    if missing:
+        # OpenAI supports batch embedding
+        response = client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=missing
+        )
+
+        # Sort by index to maintain order
+        sorted_data = sorted(response.data, key=lambda x: x.index)
+        fresh = [item.embedding for item in sorted_data]
+        resolved.update(zip(missing, fresh))
+
+        if embedding_cache is not None:
+            embedding_cache.set_many([(_cache_key(t), _pack(e)) for t, e in zip(missing, fresh)])
+
+    if len(missing) < len(texts):
+        logger.info(f"[Embedder] Batch of {len(texts)}: {len(texts) - len(missing)} from cache, {len(missing)} from API")
+
+    return [resolved[t] for t in texts]
+
+
+def get_embedding_cache_stats() -> Dict[str, object]:
+    """Hit/miss counters and size of the embedding cache."""
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, "model": EMBEDDING_MODEL, **embedding_cache.stats()}
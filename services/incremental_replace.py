@@ -0,0 +1,163 @@
+# services/incremental_replace.py
+"""
+Incremental Replace - /replace builds the next index generation, embedding only new sentences
+
+ES_INDEX_NAME is an alias (vector/elastic_client.py). A replace never
+touches the live index:
+
+  1. load text_hash → document id for the live index (doc values only, no
+     text or vectors) through a point in time
+  2. stream the new file into a fresh versioned index: a sentence whose
+     hash is already indexed copies that document's vector (no embedding
+     call), any other sentence is embedded as usual
+  3. the load runs with refresh and replicas suspended, the index is then
+     force-merged (INGEST_FORCE_MERGE_SEGMENTS) while nobody searches it
+  4. flip the alias to the new index in one atomic call and drop the old one
+
+Searches keep seeing the complete old corpus until the flip, then the
+complete new one. A revision that changes a few hundred lines out of tens
+of thousands only pays for those embeddings. The new index starts empty and
+ids are deterministic, so a job resumed at its watermark just continues
+writing into the same index.
+"""
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set
+
+from config import settings
+from vector.elastic_client import es, current_indices, flip_alias
+from services.deduplicator import text_hash
+from services.ingest_pipeline import ReusedSentence, SentenceItem
+from services import retriever
+
+logger = logging.getLogger(__name__)
+
+SCAN_PAGE_SIZE = 5000
+PIT_KEEP_ALIVE = "2m"
+
+
+def load_indexed_hashes(index: str) -> Dict[str, Any]:
+    """
+    text_hash → [doc_id of one document with that text, number of documents with it].
+    Documents indexed before text_hash existed have no hash and are never reused.
+    """
+    by_hash: Dict[str, Any] = {}
+    pit_id = es.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE)["id"]
+    total = 0
+    try:
+        search_after = None
+        while True:
+            body: Dict[str, Any] = {
+                "size": SCAN_PAGE_SIZE,
+                "_source": False,
+                "docvalue_fields": ["text_hash"],
+                "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                "sort": ["_shard_doc"],
+            }
+            if search_after is not None:
+                body["search_after"] = search_after
+            resp = es.search(body=body)
+            pit_id = resp.get("pit_id", pit_id)
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+            for hit in hits:
+                values = hit.get("fields", {}).get("text_hash")
+                if not values:
+                    continue
+                entry = by_hash.setdefault(values[0], [hit["_id"], 0])
+                entry[1] += 1
+            total += len(hits)
+            search_after = hits[-1]["sort"]
+    finally:
+        try:
+            es.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"[Replace] Could not close point in time: {e}")
+    logger.info(f"[Replace] Loaded {total} indexed sentences ({len(by_hash)} distinct hashes) from {index}")
+    return by_hash
+
+
+class ReplacePlan:
+    """
+    Marks the sentences of a new file whose vector can be copied from the live index.
+
+    Usage:
+        plan = ReplacePlan(load_indexed_hashes(live_index))
+        index_sentences_pipelined(plan.assign(sentences), index=new_index, reuse_index=live_index)
+        plan.removed_documents()
+    """
+
+    def __init__(self, indexed: Dict[str, Any]):
+        self._indexed = indexed
+        self._seen: Set[str] = set()
+        self.reused = 0
+        self.new = 0
+
+    def assign(self, sentences: Iterable[str], skip: int = 0) -> Iterator[SentenceItem]:
+        """
+        Yield the new file's sentences, already indexed ones as ReusedSentence.
+        The first `skip` sentences (below a resumed job's watermark) are only hashed.
+        """
+        for position, sent in enumerate(sentences):
+            digest = text_hash(sent)
+            self._seen.add(digest)
+            if position < skip:
+                continue
+            entry = self._indexed.get(digest)
+            if entry is None:
+                self.new += 1
+                yield sent
+            else:
+                self.reused += 1
+                yield ReusedSentence(sent, entry[0])
+
+    def removed_documents(self) -> int:
+        """Documents of the live index whose text is not in the new file (valid once assign is exhausted)."""
+        return sum(count for digest, (_, count) in self._indexed.items() if digest not in self._seen)
+
+
+def replace_sentences(
+    sentences: Iterable[str],
+    file_id: str,
+    target_index: str,
+    start_index: int = 0,
+    on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    incremental: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    Index `sentences` into target_index (a fresh generation), then make it the live index.
+    Returns the ingest report plus reused_sentences, new_sentences, deleted_documents
+    and the dropped indices.
+    """
+    if incremental is None:
+        incremental = settings.INCREMENTAL_REPLACE
+    live = [name for name in current_indices() if name != target_index]
+    source = live[0] if live else None
+    plan = ReplacePlan(load_indexed_hashes(source) if incremental and source else {})
+
+    result = retriever.index_sentences_pipelined(
+        plan.assign(sentences, skip=start_index),
+        file_id=file_id,
+        start_index=start_index,
+        on_progress=on_progress,
+        index=target_index,
+        reuse_index=source,
+        # The generation is complete here: merge it while no search uses it yet
+        force_merge_segments=settings.INGEST_FORCE_MERGE_SEGMENTS,
+    )
+    try:
+        dropped = flip_alias(target_index)
+    finally:
+        retriever._index_changed()
+    result.update(
+        reused_sentences=plan.reused,
+        new_sentences=plan.new,
+        deleted_documents=plan.removed_documents(),
+        index=target_index,
+        dropped_indices=dropped,
+    )
+    logger.info(
+        f"[Replace] {result['total_sentences']} sentences into {target_index}: {plan.reused} reused, "
+        f"{plan.new} embedded, {result['deleted_documents']} removed"
+    )
+    return result
@@ -0,0 +1,533 @@
+# services/ingest_jobs.py
+"""
+Ingest Jobs - /upload returns a job id; a dedicated worker does the indexing
+
+The uploaded file is kept in INGEST_JOBS_DIR and a job row is stored in
+SQLite (shared by all uvicorn workers). Worker threads, separate from the
+request threads, claim queued jobs and run the streaming ingest
+(decode → split → embed → bulk) on them.
+
+Progress is written to the job row after every embedding batch and bulk
+request: sentences split / embedded / indexed, bytes read, and
+`committed`, the watermark below which every sentence is in Elasticsearch.
+While a job runs, a heartbeat thread stamps its row every HEARTBEAT_SECONDS,
+also through the long steps that report no progress (hash scan,
+force-merge, settings restore, alias flip). A job interrupted by a restart
+(or a crash: its heartbeat goes stale) is claimed again and resumes at the watermark: the first `committed`
+sentences are split but skipped, and the ones after are re-indexed under
+the same deterministic ids, so nothing is duplicated.
+
+/replace queues a job in "replace" mode: the file is written into a new
+index generation (its name is kept on the job row, so a resumed job goes on
+with the same index), reusing the vectors of sentences already indexed, and
+the alias flips to it at the end (services/incremental_replace.py). A
+cancelled or failed replace drops its unfinished index. Uploads queued
+after a replace are not claimed until it ends (they would be written into
+the generation the flip drops).
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+import itertools
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+from services.splitter import iter_sentences
+from services.text_decoder import iter_text_chunks
+from services.retriever import index_sentences_pipelined
+from services.incremental_replace import replace_sentences
+from vector.elastic_client import create_versioned_index, current_indices, drop_index, index_exists
+
+logger = logging.getLogger(__name__)
+
+# A running job whose heartbeat is older than this belongs to a dead worker
+STALE_SECONDS = 120.0
+# Running jobs stamp heartbeat_at this often (well below STALE_SECONDS)
+HEARTBEAT_SECONDS = 10.0
+# Idle workers look for claimable jobs this often
+POLL_SECONDS = 5.0
+# Progress rows are written at most this often (the watermark is always saved at the end)
+PROGRESS_INTERVAL = 1.0
+CHUNK_SIZE = 1024 * 1024
+
+_COLUMNS = {
+    "id": "TEXT PRIMARY KEY",
+    "file_id": "TEXT NOT NULL",
+    "filename": "TEXT",
+    "path": "TEXT NOT NULL",
+    "encoding": "TEXT NOT NULL",
+    "split_mode": "TEXT NOT NULL",
+    "mode": "TEXT NOT NULL DEFAULT 'upload'",  # "upload" or "replace"
+    "target_index": "TEXT",  # replace: index generation being built
+    "status": "TEXT NOT NULL",
+    "owner": "TEXT",
+    "heartbeat_at": "REAL",  # stamped by the running worker's heartbeat thread
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "total_bytes": "INTEGER NOT NULL DEFAULT 0",
+    "bytes_read": "INTEGER NOT NULL DEFAULT 0",
+    "sentences_split": "INTEGER NOT NULL DEFAULT 0",
+    "sentences_embedded": "INTEGER NOT NULL DEFAULT 0",
+    "sentences_indexed": "INTEGER NOT NULL DEFAULT 0",
+    "committed": "INTEGER NOT NULL DEFAULT 0",
+    "run_start_committed": "INTEGER NOT NULL DEFAULT 0",
+    "sentences_reused": "INTEGER NOT NULL DEFAULT 0",
+    "documents_deleted": "INTEGER NOT NULL DEFAULT 0",
+    "max_level": "INTEGER",
+    "report": "TEXT",  # JSON: stage throughput, index tuning, force-merge (done jobs)
+    "error": "TEXT",
+    "created_at": "REAL NOT NULL",
+    "started_at": "REAL",
+    "updated_at": "REAL NOT NULL",
+    "finished_at": "REAL",
+}
+
+
+class JobCancelled(Exception):
+    """Raised inside a running ingest when its job was cancelled (/replace, DELETE /documents)."""
+
+
+def _job_report(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Part of the ingest result kept on the job row (throughput, index settings, merge)."""
+    keys = ("elapsed_seconds", "sentences_per_sec", "bulk_requests", "failed_documents",
+            "stages", "index_tuning", "force_merge", "index")
+    return {key: result[key] for key in keys if key in result}
+
+
+class _CountingReader:
+    """File wrapper counting the bytes handed to the decoder (progress / ETA)."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class JobStore:
+    """Job rows in SQLite (WAL), one connection per thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        columns = ", ".join(f"{name} {spec}" for name, spec in _COLUMNS.items())
+        self._conn().execute(f"CREATE TABLE IF NOT EXISTS ingest_jobs ({columns})")
+        # Job databases created by an older version lack the newer columns
+        existing = {r["name"] for r in self._conn().execute("PRAGMA table_info(ingest_jobs)").fetchall()}
+        for name, spec in _COLUMNS.items():
+            if name not in existing:
+                self._conn().execute(f"ALTER TABLE ingest_jobs ADD COLUMN {name} {spec}")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS ingest_jobs_status ON ingest_jobs (status, created_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.time()
+        row = {"status": "queued", "created_at": now, "updated_at": now, **job}
+        names = ", ".join(row)
+        marks = ", ".join("?" for _ in row)
+        self._conn().execute(f"INSERT INTO ingest_jobs ({names}) VALUES ({marks})", list(row.values()))
+        return self.get(row["id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._conn().execute(f"UPDATE ingest_jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the oldest queued job, or a running one whose worker went silent.
+
+        An upload queued after a replace waits until that replace is finished:
+        uploads append to the live index, which the replace's alias flip drops.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM ingest_jobs AS job WHERE (status = 'queued' AND NOT ("
+                "  mode = 'upload' AND EXISTS (SELECT 1 FROM ingest_jobs AS replace_job "
+                "    WHERE replace_job.mode = 'replace' AND replace_job.status IN ('queued', 'running') "
+                "    AND replace_job.created_at <= job.created_at AND replace_job.id != job.id)"
+                ")) "
+                "OR (status = 'running' AND COALESCE(heartbeat_at, updated_at) < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - STALE_SECONDS,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE ingest_jobs SET status = 'running', owner = ?, attempts = attempts + 1, "
+                "started_at = ?, updated_at = ?, heartbeat_at = ?, run_start_committed = committed, "
+                "error = NULL WHERE id = ?",
+                (owner, now, now, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """Stamp a running job as alive; False once it is no longer ours (cancelled, requeued)."""
+        cursor = self._conn().execute(
+            "UPDATE ingest_jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+            (time.time(), job_id, owner),
+        )
+        return cursor.rowcount > 0
+
+    def release_owned(self, owner: str):
+        """Requeue the running jobs of a worker that is shutting down (they resume at their watermark)."""
+        self._conn().execute(
+            "UPDATE ingest_jobs SET status = 'queued', owner = NULL, updated_at = ? WHERE status = 'running' AND owner = ?",
+            (time.time(), owner),
+        )
+
+    def cancel_active(self) -> List[str]:
+        conn = self._conn()
+        ids = [r["id"] for r in conn.execute(
+            "SELECT id FROM ingest_jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()]
+        if ids:
+            conn.execute(
+                "UPDATE ingest_jobs SET status = 'cancelled', finished_at = ?, updated_at = ? "
+                "WHERE status IN ('queued', 'running')",
+                (time.time(), time.time()),
+            )
+        return ids
+
+    def active_target_indices(self) -> List[str]:
+        """Index generations still being built by queued or running replace jobs."""
+        rows = self._conn().execute(
+            "SELECT target_index FROM ingest_jobs WHERE status IN ('queued', 'running') AND target_index IS NOT NULL"
+        ).fetchall()
+        return [r["target_index"] for r in rows]
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT * FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+def describe_job(job: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """Public view of a job row, with throughput and ETA of the current run."""
+    now = now or time.time()
+    total_bytes = job["total_bytes"] or 0
+    fraction = min(1.0, job["bytes_read"] / total_bytes) if total_bytes else 0.0
+    if job["status"] == "done":
+        fraction = 1.0
+
+    rate = None
+    eta = None
+    if job["started_at"]:
+        end = job["finished_at"] or now
+        elapsed = end - job["started_at"]
+        indexed_this_run = job["sentences_indexed"] - job["run_start_committed"]
+        if elapsed > 0 and indexed_this_run > 0:
+            rate = indexed_this_run / elapsed
+    if job["status"] == "running" and rate and fraction > 0:
+        # Sentences in the whole file, extrapolated from the share of bytes split so far
+        estimated_total = job["sentences_split"] / fraction
+        eta = max(0.0, (estimated_total - job["sentences_indexed"]) / rate)
+
+    return {
+        "job_id": job["id"],
+        "file_id": job["file_id"],
+        "filename": job["filename"],
+        "mode": job["mode"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "sentences_split": job["sentences_split"],
+        "sentences_embedded": job["sentences_embedded"],
+        "sentences_indexed": job["sentences_indexed"],
+        "committed": job["committed"],
+        "sentences_reused": job["sentences_reused"],
+        "documents_deleted": job["documents_deleted"],
+        "bytes_read": job["bytes_read"],
+        "total_bytes": total_bytes,
+        "progress": round(fraction, 4),
+        "sentences_per_sec": round(rate, 1) if rate else None,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "max_level": job["max_level"],
+        "report": json.loads(job["report"]) if job["report"] else None,
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+class IngestJobRunner:
+    """Dedicated ingest worker threads pulling jobs from the JobStore."""
+
+    def __init__(self, store: JobStore, upload_dir: str, workers: int = 1):
+        self.store = store
+        self.upload_dir = upload_dir
+        self.workers = max(1, workers)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, threading.Event] = {}  # job_id -> cancel flag
+        self._lock = threading.Lock()
+        # Called after a replace job flipped the alias (main: drop prefetched batches of the old corpus)
+        self.on_corpus_replaced: Optional[Callable[[], None]] = None
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def upload_path(self, job_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{job_id}.upload")
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"ingest-job-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+        logger.info(f"[IngestJobs] {self.workers} worker(s) started ({self.owner})")
+
+    def close(self, timeout: float = 30.0):
+        """Stop the workers; a job in progress is interrupted and requeued at its watermark."""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            for cancel in self._running.values():
+                cancel.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+        self.store.release_owned(self.owner)
+
+    # ---------- Producer side ----------
+    def enqueue(
+        self, job_id: str, file_id: str, filename: str, encoding: str, split_mode: str, total_bytes: int,
+        mode: str = "upload",
+    ) -> Dict[str, Any]:
+        job = self.store.create({
+            "mode": mode,
+            "id": job_id,
+            "file_id": file_id,
+            "filename": filename,
+            "path": self.upload_path(job_id),
+            "encoding": encoding,
+            "split_mode": split_mode,
+            "total_bytes": total_bytes,
+        })
+        self._wake.set()
+        return job
+
+    def cancel_all(self, timeout: float = 30.0) -> List[str]:
+        """Cancel queued/running jobs (all workers) and wait for this process's running ones to stop."""
+        ids = self.store.cancel_active()
+        with self._lock:
+            running = list(self._running.values())
+        for cancel in running:
+            cancel.set()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                if not self._running:
+                    break
+            time.sleep(0.05)
+        if ids:
+            logger.info(f"[IngestJobs] Cancelled {len(ids)} job(s)")
+        return ids
+
+    # ---------- Worker side ----------
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.owner)
+            except sqlite3.Error as e:
+                logger.error(f"[IngestJobs] Claim failed: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        cancel = threading.Event()
+        with self._lock:
+            self._running[job_id] = cancel
+        start_index = job["committed"]
+        logger.info(f"[IngestJobs] Job {job_id[:8]} started (attempt {job['attempts']}, from sentence {start_index})")
+        last_write = 0.0
+        reader: Optional[_CountingReader] = None
+        latest = {"committed": start_index}
+        beating = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job_id, beating), name=f"ingest-heartbeat-{job_id[:8]}", daemon=True
+        )
+        heartbeat.start()
+
+        def on_progress(progress: Dict[str, int]):
+            nonlocal last_write
+            latest.update(progress)
+            if cancel.is_set():
+                raise JobCancelled(job_id)
+            now = time.time()
+            if now - last_write < PROGRESS_INTERVAL:
+                return
+            last_write = now
+            current = self.store.get(job_id)
+            if current is None or current["status"] == "cancelled":
+                raise JobCancelled(job_id)
+            self.store.update(
+                job_id,
+                sentences_split=progress["split"],
+                sentences_embedded=progress["embedded"],
+                sentences_indexed=progress["indexed"],
+                committed=progress["committed"],
+                bytes_read=reader.bytes_read if reader else 0,
+            )
+
+        try:
+            with open(job["path"], "rb") as f:
+                reader = _CountingReader(f)
+                sentences = iter_sentences(
+                    iter_text_chunks(reader, job["encoding"], CHUNK_SIZE), split_mode=job["split_mode"]
+                )
+                if job["mode"] == "replace":
+                    target, start_index = self._replace_target(job)
+                    latest["committed"] = start_index
+                    # The plan hashes the sentences below the watermark itself (skip)
+                    result = replace_sentences(
+                        sentences,
+                        file_id=job["file_id"],
+                        target_index=target,
+                        start_index=start_index,
+                        on_progress=on_progress,
+                    )
+                else:
+                    # Everything below the watermark is already indexed
+                    remaining = itertools.islice(sentences, start_index, None)
+                    result = index_sentences_pipelined(
+                        remaining,
+                        file_id=job["file_id"],
+                        batch_size=500,
+                        start_index=start_index,
+                        on_progress=on_progress,
+                    )
+            self.store.update(
+                job_id,
+                status="done",
+                sentences_split=result["total_sentences"],
+                sentences_embedded=result["total_sentences"],
+                sentences_indexed=result["total_sentences"],
+                committed=result["committed"],
+                bytes_read=reader.bytes_read,
+                max_level=result["max_level"],
+                sentences_reused=result.get("reused_sentences", 0),
+                documents_deleted=result.get("deleted_documents", 0),
+                report=json.dumps(_job_report(result)),
+                finished_at=time.time(),
+            )
+            self._remove_upload(job["path"])
+            if job["mode"] == "replace" and self.on_corpus_replaced is not None:
+                self.on_corpus_replaced()
+            logger.info(f"[IngestJobs] Job {job_id[:8]} done: {result['total_sentences']} sentences")
+        except JobCancelled:
+            current = self.store.get(job_id)
+            if current and current["status"] == "cancelled":
+                self._remove_upload(job["path"])
+                self._drop_target(job_id)
+                logger.info(f"[IngestJobs] Job {job_id[:8]} cancelled")
+            else:
+                # Worker shutdown: back to the queue, resumes at the watermark
+                self.store.update(job_id, status="queued", owner=None, committed=latest["committed"])
+                logger.info(f"[IngestJobs] Job {job_id[:8]} interrupted, requeued")
+        except Exception as e:
+            self.store.update(
+                job_id, status="failed", error=str(e), committed=latest["committed"], finished_at=time.time()
+            )
+            self._drop_target(job_id)
+            logger.error(f"[IngestJobs] Job {job_id[:8]} failed: {e}")
+        finally:
+            beating.set()
+            heartbeat.join()
+            with self._lock:
+                self._running.pop(job_id, None)
+
+    def _heartbeat(self, job_id: str, stop: threading.Event):
+        """Keep the job claimed for as long as run_job is active, whatever step it is in."""
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                self.store.heartbeat(job_id, self.owner)
+            except sqlite3.Error as e:
+                logger.warning(f"[IngestJobs] Heartbeat of job {job_id[:8]} failed: {e}")
+
+    def _replace_target(self, job: Dict[str, Any]):
+        """(index generation to write, start index): the job's own index when resuming, else a new one."""
+        target = job["target_index"]
+        if target and index_exists(target):
+            return target, job["committed"]
+        target = create_versioned_index()
+        self.store.update(job["id"], target_index=target, committed=0)
+        return target, 0
+
+    def _drop_target(self, job_id: str):
+        job = self.store.get(job_id)
+        if not job or job["mode"] != "replace" or not job["target_index"]:
+            return
+        try:
+            if job["target_index"] in current_indices():
+                return  # failed after the flip: it is the live index now
+        except Exception as e:
+            logger.warning(f"[IngestJobs] Keeping {job['target_index']}, alias unknown: {e}")
+            return
+        drop_index(job["target_index"])
+
+    @staticmethod
+    def _remove_upload(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = list(self._running)
+        return {"owner": self.owner, "workers": self.workers, "running": running}
+
+
+def _create_ingest_jobs() -> IngestJobRunner:
+    return IngestJobRunner(
+        JobStore(settings.INGEST_JOBS_DB_PATH),
+        upload_dir=settings.INGEST_JOBS_DIR,
+        workers=settings.INGEST_JOB_WORKERS,
+    )
+
+
+# Global ingest job runner
+ingest_jobs = _create_ingest_jobs()
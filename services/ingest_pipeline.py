@@ -0,0 +1,380 @@
+# services/ingest_pipeline.py
+"""
+Ingest Pipeline - Overlap embedding calls with Elasticsearch bulk writes
+
+Stages (connected by bounded queues for backpressure):
+  1. split    : caller thread groups sentences into embedding batches
+  2. embed    : N workers call the embedding API (cache-aware)
+  3. bulk     : M workers write byte-sized _bulk requests
+
+Memory stays flat: at most queue_size batches wait between two stages,
+so a slow stage blocks the one in front of it instead of piling up work.
+
+With a file_id, documents get deterministic ids ("file_id:sentence_index"),
+so re-running a range of sentences overwrites instead of duplicating.
+`committed` is the watermark below which every sentence is written (bulk
+requests finish out of order); an interrupted ingest restarts from it
+with start_index (see services/ingest_jobs.py).
+
+A ReusedSentence item is a sentence that is already indexed in
+reuse_index (/replace builds the next index generation, see
+services/incremental_replace.py): its vector is copied from that document
+instead of calling the embedding API.
+"""
+import json
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from config import settings
+from vector.elastic_client import es
+from services.embedder import get_embeddings_batch
+from services.deduplicator import text_hash
+
+logger = logging.getLogger(__name__)
+
+_SENTINEL = object()
+_POLL_SECONDS = 0.5
+
+
+@dataclass(frozen=True)
+class ReusedSentence:
+    """A sentence of the new file already indexed as document doc_id of reuse_index (vector copied)."""
+    text: str
+    doc_id: str
+
+
+SentenceItem = Union[str, ReusedSentence]
+
+
+@dataclass
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+    name: str
+    items: int = 0
+    busy_seconds: float = 0.0
+    first_start: Optional[float] = None
+    last_end: Optional[float] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, items: int, started: float, ended: float):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += ended - started
+            if self.first_start is None or started < self.first_start:
+                self.first_start = started
+            if self.last_end is None or ended > self.last_end:
+                self.last_end = ended
+
+    def as_dict(self) -> Dict[str, Any]:
+        wall = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wall_seconds": round(wall, 3),
+            "sentences_per_sec": round(self.items / wall, 1) if wall > 0 else 0.0,
+        }
+
+
+class IngestPipeline:
+    """
+    Staged ingest: sentences → embedding batches → byte-sized bulk requests.
+
+    Usage:
+        result = IngestPipeline(index=INDEX, file_id=file_id).run(sentences)
+        result["max_level"], result["total_sentences"], result["stages"]
+    """
+
+    def __init__(
+        self,
+        index: str,
+        file_id: Optional[str] = None,
+        sentences_per_level: int = 5,
+        batch_size: int = 500,
+        embed_workers: Optional[int] = None,
+        bulk_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        bulk_max_bytes: Optional[int] = None,
+        refresh: Any = True,
+        start_index: int = 0,
+        on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+        reuse_index: Optional[str] = None,
+    ):
+        self.index = index
+        self.file_id = file_id
+        self.sentences_per_level = sentences_per_level
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers or settings.INGEST_EMBED_WORKERS
+        self.bulk_workers = bulk_workers or settings.INGEST_BULK_WORKERS
+        self.queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+        self.bulk_max_bytes = bulk_max_bytes or settings.INGEST_BULK_MAX_BYTES
+        self.refresh = refresh
+        self.start_index = start_index  # sentence_index of the first sentence (resumed ingest)
+        self.on_progress = on_progress  # called with progress() after each embed batch / bulk request
+        self.reuse_index = reuse_index  # where ReusedSentence vectors are read from
+
+        self._embed_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        self._bulk_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+        self.stats = {
+            "split": StageStats("split"),
+            "embed": StageStats("embed"),
+            "bulk": StageStats("bulk"),
+        }
+        self.bulk_requests = 0
+        self.failed_documents = 0
+        self.reused = 0
+        self.committed = start_index
+        self._committed_ahead: Set[int] = set()  # written, but above a gap
+        self._counter_lock = threading.Lock()
+
+    # ---------- Public API ----------
+    def run(self, sentences: Iterable[SentenceItem]) -> Dict[str, Any]:
+        """Index all sentences; blocks until every bulk request is done."""
+        start = time.perf_counter()
+        embedders = [
+            threading.Thread(target=self._embed_worker, name=f"ingest-embed-{i}", daemon=True)
+            for i in range(self.embed_workers)
+        ]
+        writers = [
+            threading.Thread(target=self._bulk_worker, name=f"ingest-bulk-{i}", daemon=True)
+            for i in range(self.bulk_workers)
+        ]
+        for t in embedders + writers:
+            t.start()
+
+        total = 0
+        try:
+            total = self._produce(sentences)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in embedders:
+                self._put(self._embed_queue, _SENTINEL, force=True)
+            for t in embedders:
+                t.join()
+            for _ in writers:
+                self._put(self._bulk_queue, _SENTINEL, force=True)
+            for t in writers:
+                t.join()
+
+        if self._error is not None:
+            raise self._error
+
+        elapsed = time.perf_counter() - start
+        end_index = self.start_index + total
+        max_level = (end_index - 1) // self.sentences_per_level if end_index else 0
+        result = {
+            "total_sentences": end_index,
+            "max_level": max_level,
+            "committed": self.committed,
+            "elapsed_seconds": round(elapsed, 3),
+            "sentences_per_sec": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+            "reused_sentences": self.reused,
+            "bulk_requests": self.bulk_requests,
+            "failed_documents": self.failed_documents,
+            "stages": {name: s.as_dict() for name, s in self.stats.items()},
+        }
+        if self.start_index:
+            result["resumed_from"] = self.start_index
+        logger.info(
+            f"[Ingest] {total} sentences in {elapsed:.1f}s ({result['sentences_per_sec']}/s) | "
+            + " | ".join(f"{n}: {s['sentences_per_sec']}/s" for n, s in result["stages"].items())
+        )
+        return result
+
+    # ---------- Stages ----------
+    def _produce(self, sentences: Iterable[SentenceItem]) -> int:
+        total = 0
+        batch: List[SentenceItem] = []
+        batch_start = self.start_index
+        started = time.perf_counter()
+        for sent in sentences:
+            if self._stop.is_set():
+                break
+            batch.append(sent)
+            if len(batch) >= self.batch_size:
+                self.stats["split"].record(len(batch), started, time.perf_counter())
+                if not self._put(self._embed_queue, (batch_start, batch)):
+                    break
+                total += len(batch)
+                batch_start = self.start_index + total
+                batch = []
+                started = time.perf_counter()
+        if batch and not self._stop.is_set():
+            self.stats["split"].record(len(batch), started, time.perf_counter())
+            if self._put(self._embed_queue, (batch_start, batch)):
+                total += len(batch)
+        return total
+
+    def _embed_worker(self):
+        while True:
+            item = self._get(self._embed_queue)
+            if item is _SENTINEL:
+                return
+            if self._stop.is_set():
+                continue
+            batch_start, batch = item
+            try:
+                started = time.perf_counter()
+                vectors = self._reused_vectors(batch)
+                texts = [s if isinstance(s, str) else s.text for s in batch if self._needs_embedding(s, vectors)]
+                embeddings = iter(get_embeddings_batch(texts) if texts else [])
+                lines = self._build_lines(batch_start, batch, vectors, embeddings)
+                self.stats["embed"].record(len(batch), started, time.perf_counter())
+                logger.info(f"[Ingest] Embedded sentences {batch_start + 1}-{batch_start + len(batch)}")
+                self._report()
+                self._put(self._bulk_queue, lines)
+            except BaseException as e:
+                self._fail(e)
+
+    def _bulk_worker(self):
+        chunk: List[bytes] = []
+        chunk_bytes = 0
+        chunk_indices: List[int] = []
+        while True:
+            item = self._get(self._bulk_queue)
+            if item is _SENTINEL:
+                break
+            if self._stop.is_set():
+                continue
+            try:
+                for sentence_index, action_line, doc_line in item:
+                    pair_bytes = len(action_line) + len(doc_line) + 2
+                    if chunk and chunk_bytes + pair_bytes > self.bulk_max_bytes:
+                        self._send(chunk, chunk_indices)
+                        chunk, chunk_bytes, chunk_indices = [], 0, []
+                    chunk.append(action_line)
+                    chunk.append(doc_line)
+                    chunk_bytes += pair_bytes
+                    chunk_indices.append(sentence_index)
+            except BaseException as e:
+                self._fail(e)
+        if chunk and not self._stop.is_set():
+            try:
+                self._send(chunk, chunk_indices)
+            except BaseException as e:
+                self._fail(e)
+
+    # ---------- Helpers ----------
+    def _reused_vectors(self, batch: List[SentenceItem]) -> Dict[str, List[float]]:
+        """doc_id → vector for the batch's ReusedSentence items, in one mget."""
+        ids = list({s.doc_id for s in batch if isinstance(s, ReusedSentence)})
+        if not ids or not self.reuse_index:
+            return {}
+        resp = es.mget(index=self.reuse_index, body={"ids": ids}, _source=["embedding"])
+        return {
+            d["_id"]: d["_source"]["embedding"]
+            for d in resp.get("docs", [])
+            if d.get("found") and d.get("_source", {}).get("embedding")
+        }
+
+    @staticmethod
+    def _needs_embedding(sent: SentenceItem, vectors: Dict[str, List[float]]) -> bool:
+        # A reused document that vanished meanwhile is embedded like a new sentence
+        return not isinstance(sent, ReusedSentence) or sent.doc_id not in vectors
+
+    def _build_lines(
+        self,
+        batch_start: int,
+        batch: List[SentenceItem],
+        vectors: Dict[str, List[float]],
+        embeddings: Iterator[List[float]],
+    ) -> List[Tuple[int, bytes, bytes]]:
+        action = json.dumps({"index": {"_index": self.index}}).encode("utf-8")
+        lines = []
+        reused = 0
+        for i, item in enumerate(batch):
+            global_index = batch_start + i
+            if self._needs_embedding(item, vectors):
+                emb = next(embeddings)
+            else:
+                emb = vectors[item.doc_id]
+                reused += 1
+            sent = item if isinstance(item, str) else item.text
+            if self.file_id:
+                action = json.dumps(
+                    {"index": {"_index": self.index, "_id": f"{self.file_id}:{global_index}"}}
+                ).encode("utf-8")
+            doc = {
+                "text": sent,
+                "text_hash": text_hash(sent),
+                "level": global_index // self.sentences_per_level,
+                "embedding": emb,
+                "sentence_index": global_index,
+            }
+            if self.file_id:
+                doc["file_id"] = self.file_id
+            lines.append((global_index, action, json.dumps(doc, separators=(",", ":")).encode("utf-8")))
+        if reused:
+            with self._counter_lock:
+                self.reused += reused
+        return lines
+
+    def _send(self, chunk: List[bytes], indices: List[int]):
+        docs = len(indices)
+        started = time.perf_counter()
+        payload = b"\n".join(chunk) + b"\n"
+        resp = es.bulk(body=payload, refresh=self.refresh)
+        self.stats["bulk"].record(docs, started, time.perf_counter())
+        failed = 0
+        if resp.get("errors"):
+            errors = [op["error"] for item in resp.get("items", []) for op in item.values() if op.get("error")]
+            failed = len(errors)
+            if errors:
+                logger.warning(f"[Ingest] {failed} documents failed in bulk request: {errors[0]}")
+        with self._counter_lock:
+            self.bulk_requests += 1
+            self.failed_documents += failed
+            self._committed_ahead.update(indices)
+            while self.committed in self._committed_ahead:
+                self._committed_ahead.remove(self.committed)
+                self.committed += 1
+        self._report()
+
+    def progress(self) -> Dict[str, int]:
+        """Sentences split / embedded / indexed so far (absolute, start_index included) and the watermark."""
+        return {
+            "split": self.start_index + self.stats["split"].items,
+            "embedded": self.start_index + self.stats["embed"].items,
+            "indexed": self.start_index + self.stats["bulk"].items,
+            "committed": self.committed,
+        }
+
+    def _report(self):
+        if self.on_progress is None:
+            return
+        # A raising callback (e.g. job cancelled) stops the pipeline like any stage error
+        self.on_progress(self.progress())
+
+    def _put(self, q: "queue.Queue", item: Any, force: bool = False) -> bool:
+        """Blocking put that gives up once another stage failed (unless force)."""
+        while True:
+            if self._stop.is_set() and not force:
+                return False
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                # Consumers keep draining after a failure, so sentinels always arrive
+                continue
+
+    def _get(self, q: "queue.Queue") -> Any:
+        while True:
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+
+    def _fail(self, error: BaseException):
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+                logger.error(f"[Ingest] Pipeline failed: {error}")
+        self._stop.set()
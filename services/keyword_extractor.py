@@ -8,10 +8,13 @@ Keyword Extractor - Step 1 of Multi-Level Retrieval
 import os
 import json
 import re
-from typing import List, Set, Tuple
+from itertools import combinations
+from math import comb
+from typing import Iterator, List, Optional, Set, Tuple
 from openai import OpenAI
 from pathlib import Path
 from config import settings
+from services.llm_cache import llm_cache
 
 # Initialize OpenAI client for keyword extraction (uses chat model))
 if settings.DEEPSEEK_BASE_URL:
@@ -22,6 +25,10 @@ if settings.DEEPSEEK_BASE_URL:
 else:
     client = OpenAI(api_key=settings.DEEPSEEK_API_KEY)
 
+# Bump when a prompt or its parsing changes (invalidates cached LLM answers)
+KEYWORDS_PROMPT_VERSION = 1
+SYNONYMS_PROMPT_VERSION = 1
+
 # Load magic words from file
 MAGIC_WORDS_PATH = Path(__file__).parent.parent / "magic_words.txt"
 
@@ -47,9 +54,27 @@ MAGIC_WORDS = load_magic_words()
 
 def extract_keywords_raw(query: str) -> List[str]:
     """
-    Extract keywords from query using LLM.
+    Extract keywords from query using LLM (cached, see services/llm_cache.py).
     Returns raw keywords before filtering.
     """
+    try:
+        print(f"[KeywordExtractor] Extracting keywords from: {query}")
+        return llm_cache.get_or_call(
+            "keywords", KEYWORDS_PROMPT_VERSION, query, lambda: _extract_keywords_llm(query)
+        )
+    except Exception as e:
+        print(f"[KeywordExtractor] Error extracting keywords: {e}")
+        # Fallback: simple word extraction, filter magic words
+        words = query.lower().split()
+        # Filter out magic words and short words
+        filtered = [w for w in words if len(w) > 2 and w not in MAGIC_WORDS]
+        fallback = filtered if filtered else [w for w in words if len(w) > 3]
+        print(f"[KeywordExtractor] Using fallback extraction: {fallback}")
+        return fallback
+
+
+def _extract_keywords_llm(query: str) -> List[str]:
+    """LLM call behind extract_keywords_raw (raises on API errors)."""
     prompt = f"""Extract ALL important keywords and phrases from the following text.
 
 INSTRUCTIONS:
@@ -70,41 +95,30 @@ Text:
 
 Return ONLY a JSON array, nothing else:"""
     
-    try:
-        print(f"[KeywordExtractor] Extracting keywords from: {query}")
-        response = client.chat.completions.create(
-            model=settings.CHAT_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a precise keyword extractor. Extract ALL important keywords including proper names, compound phrases, and meaningful concepts. Return ONLY a JSON array."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0,  # Zero temperature for maximum consistency
-            max_tokens=300
-        )
-        
-        content = response.choices[0].message.content.strip()
-        print(f"[KeywordExtractor] LLM response: {content}")
-        
-        # Parse JSON - handle various formats
-        # Try to find JSON array in response
-        match = re.search(r'\[.*?\]', content, re.DOTALL)
-        if match:
-            keywords = json.loads(match.group())
-            result = [k.lower().strip() for k in keywords if isinstance(k, str)]
-            print(f"[KeywordExtractor] Extracted keywords: {result}")
-            return result
-        
-        print(f"[KeywordExtractor] No JSON array found in response")
-        return []
-    except Exception as e:
-        print(f"[KeywordExtractor] Error extracting keywords: {e}")
-        # Fallback: simple word extraction, filter magic words
-        words = query.lower().split()
-        # Filter out magic words and short words
-        filtered = [w for w in words if len(w) > 2 and w not in MAGIC_WORDS]
-        fallback = filtered if filtered else [w for w in words if len(w) > 3]
-        print(f"[KeywordExtractor] Using fallback extraction: {fallback}")
-        return fallback
+    response = client.chat.completions.create(
+        model=settings.CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": "You are a precise keyword extractor. Extract ALL important keywords including proper names, compound phrases, and meaningful concepts. Return ONLY a JSON array."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.0,  # Zero temperature for maximum consistency
+        max_tokens=300
+    )
+    
+    content = response.choices[0].message.content.strip()
+    print(f"[KeywordExtractor] LLM response: {content}")
+    
+    # Parse JSON - handle various formats
+    # Try to find JSON array in response
+    match = re.search(r'\[.*?\]', content, re.DOTALL)
+    if match:
+        keywords = json.loads(match.group())
+        result = [k.lower().strip() for k in keywords if isinstance(k, str)]
+        print(f"[KeywordExtractor] Extracted keywords: {result}")
+        return result
+    
+    print(f"[KeywordExtractor] No JSON array found in response")
+    return []
 
 
 def filter_magic_words(keywords: List[str]) -> List[str]:
@@ -136,7 +150,11 @@ def extract_keywords(query: str) -> List[str]:
     Main function: Extract and filter keywords from query.
     Returns clean keywords ready for search.
     """
-    raw_keywords = extract_keywords_raw(query)
+    return clean_raw_keywords(extract_keywords_raw(query))
+
+
+def clean_raw_keywords(raw_keywords: List[str]) -> List[str]:
+    """Filter magic words from LLM keywords (shared with the unified analysis call)."""
     print(f"[KeywordExtractor] Raw keywords before filtering: {raw_keywords}")
     
     clean_keywords = filter_magic_words(raw_keywords)
@@ -168,51 +186,80 @@ def generate_keyword_combinations(keywords: List[str]) -> List[Tuple[str, ...]]:
         ("salvation",)
     ]
     """
-    from itertools import combinations
-    
-    result = []
+    return [combo for _, combo in iter_keyword_combinations(keywords)]
+
+
+def count_keyword_combinations(num_keywords: int, max_combos: Optional[int] = None) -> int:
+    """Number of combinations generate_keyword_combinations would return (2^n - 1), capped."""
+    total = (1 << num_keywords) - 1 if num_keywords > 0 else 0
+    return min(total, max_combos) if max_combos is not None else total
+
+
+def iter_keyword_combinations(
+    keywords: List[str], start: int = 0, max_combos: Optional[int] = None
+) -> Iterator[Tuple[int, Tuple[str, ...]]]:
+    """
+    Lazy generate_keyword_combinations: yields (priority index, combo) in the
+    same order, beginning at index `start` and stopping after max_combos.
+    Whole size groups before `start` are skipped without being generated.
+    """
     n = len(keywords)
-    
-    # Start from full combination down to single
+    stop = count_keyword_combinations(n, max_combos)
+    index = 0
     for size in range(n, 0, -1):
+        if index >= stop:
+            return
+        group = comb(n, size)
+        if index + group <= start:
+            index += group
+            continue
         for combo in combinations(keywords, size):
-            result.append(combo)
-    
-    return result
+            if index >= stop:
+                return
+            if index >= start:
+                yield index, combo
+            index += 1
 
 
 def generate_synonyms(keyword: str) -> List[str]:
     """
-    Generate synonyms for a keyword using LLM.
+    Generate synonyms for a keyword using LLM (cached, see services/llm_cache.py).
     Used for Level 2 search.
     """
+    try:
+        return llm_cache.get_or_call(
+            "synonyms", SYNONYMS_PROMPT_VERSION, keyword, lambda: _generate_synonyms_llm(keyword)
+        )
+    except Exception as e:
+        print(f"Error generating synonyms for {keyword}: {e}")
+        return []
+
+
+def _generate_synonyms_llm(keyword: str) -> List[str]:
+    """LLM call behind generate_synonyms (raises on API errors)."""
     prompt = f"""Give 2-3 synonyms or related theological terms for the word "{keyword}".
 Return as JSON array only. Focus on spiritual/theological context.
 
 Example for "grace": ["mercy", "blessing", "favor"]
 """
     
-    try:
-        response = client.chat.completions.create(
-            model=settings.CHAT_MODEL,  # Use configured chat model
-            messages=[
-                {"role": "system", "content": "You are a thesaurus. Return only JSON array."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=100
-        )
-        
-        content = response.choices[0].message.content.strip()
-        match = re.search(r'\[.*?\]', content, re.DOTALL)
-        if match:
-            synonyms = json.loads(match.group())
-            return [s.lower().strip() for s in synonyms if isinstance(s, str)]
-        
-        return []
-    except Exception as e:
-        print(f"Error generating synonyms for {keyword}: {e}")
-        return []
+    response = client.chat.completions.create(
+        model=settings.CHAT_MODEL,  # Use configured chat model
+        messages=[
+            {"role": "system", "content": "You are a thesaurus. Return only JSON array."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.5,
+        max_tokens=100
+    )
+    
+    content = response.choices[0].message.content.strip()
+    match = re.search(r'\[.*?\]', content, re.DOTALL)
+    if match:
+        synonyms = json.loads(match.group())
+        return [s.lower().strip() for s in synonyms if isinstance(s, str)]
+    
+    return []
 
 
 def get_magical_words_for_level3() -> List[str]:
@@ -0,0 +1,108 @@
+# services/llm_cache.py
+"""
+LLM Cache - Persistent cache for auxiliary LLM calls
+(keyword extraction, synonyms, biblical parallels; the keyword meaning only
+with LLM_CACHE_MEANING, since it is sampled and /continue wants a fresh one)
+
+- Key: call kind + prompt template version + chat model + normalized input
+- Stored in a DiskLRUCache (SQLite, shared by all workers) with TTL and LRU bound
+- Empty results and failed calls are never stored
+- Per-kind hit/miss counters (per process)
+
+Bump the call site's *_PROMPT_VERSION whenever its prompt or parsing changes,
+so stale answers are not served.
+"""
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from config import settings
+from services.disk_cache import DiskLRUCache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def normalize_llm_input(text: str) -> str:
+    """Collapse whitespace and case so trivially different questions share an entry."""
+    return " ".join((text or "").split()).lower()
+
+
+class LLMResponseCache:
+    """get_or_call() wrapper around a DiskLRUCache for JSON-serializable LLM results."""
+
+    def __init__(self, store: Optional[DiskLRUCache], model: str):
+        self.store = store
+        self.model = model
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def key(self, kind: str, version: int, text: str) -> str:
+        digest = hashlib.sha256(normalize_llm_input(text).encode("utf-8")).hexdigest()
+        return f"{kind}:v{version}:{self.model}:{digest}"
+
+    def get_or_call(self, kind: str, version: int, text: str, compute: Callable[[], T]) -> T:
+        """
+        Return the cached result for (kind, version, text), else compute() and store it.
+        Exceptions from compute() propagate and nothing is stored.
+        """
+        if self.store is None:
+            return compute()
+
+        key = self.key(kind, version, text)
+        blob = self.store.get(key)
+        if blob is not None:
+            try:
+                value = json.loads(blob)
+                self._count(kind, "hits")
+                logger.info(f"[LLMCache] {kind} hit for '{text[:50]}'")
+                return value
+            except ValueError:
+                logger.warning(f"[LLMCache] Corrupt entry for {kind}, recomputing")
+
+        self._count(kind, "misses")
+        value = compute()
+        if value:
+            self.store.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        return value
+
+    def _count(self, kind: str, field: str):
+        with self._lock:
+            counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0})
+            counters[field] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-kind hit ratios for this process plus the shared store stats."""
+        if self.store is None:
+            return {"enabled": False}
+        with self._lock:
+            by_kind = {
+                kind: {
+                    **c,
+                    "hit_ratio": round(c["hits"] / (c["hits"] + c["misses"]), 4) if c["hits"] + c["misses"] else 0.0,
+                }
+                for kind, c in self._counters.items()
+            }
+        return {"enabled": True, "model": self.model, "by_kind": by_kind, **self.store.stats()}
+
+
+def _create_llm_cache() -> LLMResponseCache:
+    store: Optional[DiskLRUCache] = None
+    if settings.LLM_CACHE_ENABLED:
+        try:
+            store = DiskLRUCache(
+                settings.LLM_CACHE_PATH,
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.LLM_CACHE_TTL_HOURS * 3600,
+            )
+            print(f"LLM cache ready: {settings.LLM_CACHE_PATH}")
+        except Exception as e:
+            logger.warning(f"[LLMCache] LLM cache disabled: {e}")
+    return LLMResponseCache(store, model=settings.CHAT_MODEL)
+
+
+# Global LLM cache instance
+llm_cache = _create_llm_cache()
@@ -17,11 +17,13 @@ Multiple keywords:
 """
 from typing import List, Dict, Any, Set, Tuple, Optional
 import logging
-from services.embedder import get_embedding
-from vector.elastic_client import es
+from services.embedder import get_embedding, get_embeddings_batch
+from vector.elastic_client import es, build_vector_query, get_vector_search_mode
+from services.retriever import build_exclusion_filter, get_texts_by_ids
 from config import settings
 from services.keyword_extractor import (
-    generate_keyword_combinations,
+    iter_keyword_combinations,
+    count_keyword_combinations,
     generate_synonyms,
     generate_keyword_magical_pairs,
     get_magical_words_for_level3,
@@ -30,14 +32,22 @@ from services.deduplicator import (
     is_duplicate,
     normalize_text,
     get_text_fingerprint,
-    get_text_fingerprint,
-    deduplicate_sentences
+    deduplicate_sentences,
+    NearDuplicateIndex,
+    SentenceIdSet,
+    text_hash,
 )
 from services.biblical_parallels import fetch_paginated_parallels
+from services.term_stats import TermStats, collect_term_stats, record_pruning
+from services.posting_accelerator import PostingLists, fetch_posting_lists, hydrate_documents, record_local_walk
+from services.retrieval_cache import retrieval_cache
 
 logger = logging.getLogger(__name__)
 INDEX = settings.ES_INDEX_NAME
 
+# Fields search helpers read from _source (the embedding vector stays on the server)
+HIT_FIELDS = ["text", "level", "sentence_index"]
+
 # Minimum sentence length to filter out short/meaningless sentences
 MIN_SENTENCE_LENGTH = 20  # At least 20 characters
 
@@ -53,6 +63,34 @@ def is_valid_sentence(text: str) -> bool:
     return True
 
 
+def _vector_shape() -> Dict[str, Any]:
+    # Vector hits also depend on the search mode and the embedding model
+    return {"vector_mode": get_vector_search_mode(), "embedding_model": settings.EMBEDDING_MODEL}
+
+
+def _run_searches(bodies: List[Dict[str, Any]], label: str) -> List[Optional[List[Dict[str, Any]]]]:
+    """One search (one _msearch for several bodies): hits per body, None where it failed."""
+    try:
+        if len(bodies) == 1:
+            return [es.search(index=INDEX, body=bodies[0])["hits"]["hits"]]
+        searches: List[Dict[str, Any]] = []
+        for body in bodies:
+            searches.extend(({"index": INDEX}, body))
+        resp = es.msearch(searches=searches)
+    except Exception as e:
+        logger.error(f"{label} Search error: {e}")
+        return [None] * len(bodies)
+    all_hits: List[Optional[List[Dict[str, Any]]]] = []
+    for item in resp["responses"]:
+        if "error" in item:
+            # One failed query must not sink the others
+            logger.error(f"{label} Search error: {item['error']}")
+            all_hits.append(None)
+        else:
+            all_hits.append(item["hits"]["hits"])
+    return all_hits
+
+
 def get_pure_semantic_search(
     query: str,
     limit: int = 5,
@@ -75,40 +113,37 @@ def get_pure_semantic_search(
     """
     logger.info(f"[Pure Semantic Search] query='{query[:50]}...', limit={limit}")
     
-    # Get embedding for the full query
-    query_vec = get_embedding(query)
-    
-    # Build must_not clause for exclusions
-    must_not = []
-    if exclude_texts:
-        for text in list(exclude_texts)[:100]:  # Limit to avoid query too large
-            must_not.append({"match_phrase": {"text": text}})
-    
     # Pure vector search - NO text filtering, just cosine similarity
-    body = {
-        "size": limit * 5,  # Get more to account for filtering short sentences
-        "query": {
-            "script_score": {
-                "query": {
-                    "bool": {
-                        "must": [{"match_all": {}}],  # No keyword filter
-                        "must_not": must_not
-                    }
-                } if must_not else {"match_all": {}},
-                "script": {
-                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                    "params": {"query_vector": query_vec},
-                },
+    size = limit * 5  # Get more to account for filtering short sentences
+
+    def fetch(requests, exclude):
+        # Build must_not clause for exclusions (single terms filter on text_hash)
+        exclusion = build_exclusion_filter(exclude)
+        query_vec = get_embedding(query)
+        bodies = [
+            {
+                "size": n,
+                "_source": HIT_FIELDS,
+                "query": build_vector_query(
+                    query_vec,
+                    size=n,
+                    filter_query={"bool": {"must_not": [exclusion]}} if exclusion else None,
+                ),
             }
-        },
-    }
-    
+            for _, n in requests
+        ]
+        return _run_searches(bodies, "[Pure Semantic Search]")
+
     try:
-        resp = es.search(index=INDEX, body=body)
+        hits = retrieval_cache.search(
+            [{"kind": "vector", "query": query, **_vector_shape()}], [size], exclude_texts, fetch
+        )[0]
+        if hits is None:
+            return []
         results: List[Dict[str, Any]] = []
-        seen_texts: Set[str] = set()
+        seen_texts = NearDuplicateIndex()
         
-        for hit in resp["hits"]["hits"]:
+        for hit in hits:
             src = hit["_source"]
             text = src["text"]
             
@@ -143,14 +178,149 @@ def get_pure_semantic_search(
         return []
 
 
+def fuse_rankings(
+    rankings: List[List[Dict[str, Any]]],
+    method: str = "rrf",
+    weights: Optional[List[float]] = None,
+    rrf_k: int = 60,
+) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Fuse ranked hit lists (best first, ES hits with _id/_score) into one ranking.
+
+    - rrf: sum of weight / (rrf_k + rank) over the lists a document appears in.
+      Only ranks matter, so BM25 and vector scores need no calibration.
+    - weighted: sum of weight * min-max normalized score per list.
+    Ties keep the order of first appearance (earlier lists first).
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    hits: Dict[str, Dict[str, Any]] = {}
+    for ranking, weight in zip(rankings, weights):
+        if method == "weighted" and ranking:
+            scores = [h.get("_score") or 0.0 for h in ranking]
+            low, high = min(scores), max(scores)
+            spread = (high - low) or 1.0
+        for rank, hit in enumerate(ranking, start=1):
+            hits.setdefault(hit["_id"], hit)
+            if method == "weighted":
+                contribution = weight * ((hit.get("_score") or 0.0) - low) / spread
+            else:
+                contribution = weight / (rrf_k + rank)
+            fused[hit["_id"]] = fused.get(hit["_id"], 0.0) + contribution
+    order = sorted(fused, key=lambda doc_id: -fused[doc_id])  # stable: first appearance wins ties
+    return [(hits[doc_id], fused[doc_id]) for doc_id in order]
+
+
+def hybrid_search(
+    query: str,
+    limit: int = 5,
+    exclude_texts: Set[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Lexical (BM25 match) + vector (knn) retrieval in ONE _msearch, fused with
+    settings.HYBRID_FUSION ("rrf" or "weighted"); "vector" keeps the previous
+    vector-only ranking (get_pure_semantic_search).
+
+    Returns: list of {text, level, score, fused_score, sentence_index, _id,
+    source, lexical_rank, vector_rank} in fused order (ranks are None when a
+    sub-query missed it). `score` stays on the 0..2 vector similarity scale of
+    the other levels; a document only the lexical query found gets the lowest
+    vector score of the ranking (it was not among the vector hits, so its
+    similarity is at most that). The fusion value is `fused_score`.
+    """
+    method = settings.HYBRID_FUSION
+    if method == "vector":
+        return get_pure_semantic_search(query, limit=limit, exclude_texts=exclude_texts)
+    logger.info(f"[Hybrid Search] query='{query[:50]}...', limit={limit}, fusion={method}")
+
+    size = limit * 5  # Get more to account for filtering short sentences
+
+    def fetch(requests, exclude):
+        exclusion = build_exclusion_filter(exclude)
+        must_not = [exclusion] if exclusion else []
+        bodies = []
+        for i, n in requests:
+            if i == 0:
+                lexical = {"match": {"text": {"query": query}}}
+                bodies.append({"size": n, "_source": HIT_FIELDS, "query": {"bool": {"must": [lexical], "must_not": must_not}}})
+            else:
+                bodies.append({
+                    "size": n,
+                    "_source": HIT_FIELDS,
+                    "query": build_vector_query(
+                        get_embedding(query),
+                        size=n,
+                        filter_query={"bool": {"must_not": must_not}} if must_not else None,
+                    ),
+                })
+        return _run_searches(bodies, "[Hybrid Search]")
+
+    # Lexical and vector rankings are cached separately (the vector one is shared
+    # with get_pure_semantic_search); misses go out together in one _msearch
+    shapes = [{"kind": "lexical", "query": query}, {"kind": "vector", "query": query, **_vector_shape()}]
+    try:
+        fetched = retrieval_cache.search(shapes, [size, size], exclude_texts, fetch)
+    except Exception as e:
+        logger.error(f"[Hybrid Search] Error: {e}")
+        return []
+    # One failed sub-query leaves the other ranking
+    rankings: List[List[Dict[str, Any]]] = [hits or [] for hits in fetched]
+    ranks = [{hit["_id"]: rank for rank, hit in enumerate(ranking, start=1)} for ranking in rankings]
+    similarity = {hit["_id"]: hit.get("_score") or 0.0 for hit in rankings[1]}
+    similarity_floor = min(similarity.values(), default=0.0)
+
+    fused = fuse_rankings(
+        rankings,
+        method=method,
+        weights=[1.0 - settings.HYBRID_VECTOR_WEIGHT, settings.HYBRID_VECTOR_WEIGHT],
+        rrf_k=settings.HYBRID_RRF_K,
+    )
+    results: List[Dict[str, Any]] = []
+    seen_texts = NearDuplicateIndex()
+    for hit, fused_score in fused:
+        src = hit["_source"]
+        text = src["text"]
+        if not is_valid_sentence(text):
+            continue
+        # Check for exact or near-duplicate (95% similarity)
+        if is_duplicate(text, seen_texts, similarity_threshold=0.95):
+            continue
+        if exclude_texts and is_duplicate(text, exclude_texts, similarity_threshold=0.95):
+            continue
+        seen_texts.add(text)
+        results.append({
+            "text": text,
+            "level": 0,
+            "score": similarity.get(hit["_id"], similarity_floor),
+            "fused_score": fused_score,
+            "sentence_index": src.get("sentence_index", 0),
+            "_id": hit["_id"],
+            "source": "hybrid",
+            "lexical_rank": ranks[0].get(hit["_id"]),
+            "vector_rank": ranks[1].get(hit["_id"]),
+        })
+        if len(results) >= limit:
+            break
+
+    logger.info(
+        f"[Hybrid Search] {len(results)} results "
+        f"(lexical hits {len(rankings[0])}, vector hits {len(rankings[1])}, one _msearch)"
+    )
+    return results
+
+
 class MultiLevelRetriever:
-    def __init__(self, keywords: List[str]):
+    def __init__(self, keywords: List[str], synonyms: Optional[Dict[str, List[str]]] = None):
         self.keywords = keywords
-        self.level0_combinations = generate_keyword_combinations(keywords)
         self.level1_keywords = keywords
-        self.level2_synonyms: Dict[str, List[str]] = {}
+        # Synonyms already generated by the caller (keyword -> list) skip the LLM call;
+        # the ones Level 2/3 generate lazily are added to the caller's dict
+        self.level2_synonyms: Dict[str, List[str]] = synonyms if synonyms is not None else {}
         self.level3_pairs = generate_keyword_magical_pairs(keywords)
         self._synonym_terms: Optional[List[str]] = None  # cached flattened synonyms
+        self._term_stats: Dict[Tuple[str, ...], Optional[TermStats]] = {}
+        self._postings: Dict[Tuple[str, ...], Optional[PostingLists]] = {}
+        self.searches_avoided = 0  # combo searches skipped by term statistics
 
     # ---------- Low-level search helpers ----------
     def _exact_phrase_search(
@@ -160,72 +330,43 @@ class MultiLevelRetriever:
         exclude_texts: Set[str] = None,
         slop: int = 0,
     ) -> List[Dict[str, Any]]:
-        must_not = []
-        if exclude_texts:
-            for text in list(exclude_texts)[:50]:
-                must_not.append({"match_phrase": {"text": text}})
-
-        phrase_query = {
-            "match_phrase": {
-                "text": {
-                    "query": phrase,
-                    "slop": slop,
+        def fetch(requests, exclude):
+            exclusion = build_exclusion_filter(exclude)
+            phrase_query = {
+                "match_phrase": {
+                    "text": {
+                        "query": phrase,
+                        "slop": slop,
+                    }
                 }
             }
-        }
+            if exclusion:
+                query = {"bool": {"must": [phrase_query], "must_not": [exclusion]}}
+            else:
+                query = phrase_query
+            bodies = [{"size": n, "_source": HIT_FIELDS, "query": query} for _, n in requests]
+            return _run_searches(bodies, f"[Exact Phrase] '{phrase[:50]}'")
 
-        if must_not:
-            query = {"bool": {"must": [phrase_query], "must_not": must_not}}
-        else:
-            query = phrase_query
-
-        body = {"size": limit * 3, "query": query}  # Get more to filter
-
-        try:
-            resp = es.search(index=INDEX, body=body)
-            results: List[Dict[str, Any]] = []
-            seen_texts = set()
-            for hit in resp["hits"]["hits"]:
-                src = hit["_source"]
-                text = src["text"]
-                # Skip short/invalid sentences
-                if not is_valid_sentence(text):
-                    continue
-                # Check for exact or near-duplicate (95% similarity)
-                if is_duplicate(text, seen_texts, similarity_threshold=0.95):
-                    continue
-                if exclude_texts and is_duplicate(text, exclude_texts, similarity_threshold=0.95):
-                    continue
-                seen_texts.add(text)
-                results.append(
-                    {
-                        "text": text,
-                        "level": src.get("level", 0),
-                        "score": hit.get("_score", 1.0),
-                        "sentence_index": src.get("sentence_index", 0),
-                        "_id": hit["_id"],
-                    }
-                )
-                if len(results) >= limit:
-                    break
-            return results
-        except Exception as e:
-            logger.error(f"Phrase search error for '{phrase}': {e}")
+        shape = {"kind": "phrase", "query": phrase, "slop": slop}
+        hits = retrieval_cache.search([shape], [limit * 3], exclude_texts, fetch)[0]  # Get more to filter
+        if hits is None:
             return []
+        return self._parse_text_hits(hits, phrase, limit, exclude_texts)
 
-    def _text_search(
+    def _build_text_search_body(
         self,
         query_text: str,
-        limit: int = 15,
+        limit: int,
         exclude_texts: Set[str] = None,
         use_vector: bool = True,
         match_type: str = "match",
         require_all_words: bool = False,
-    ) -> List[Dict[str, Any]]:
-        must_not = []
-        if exclude_texts:
-            for text in list(exclude_texts)[:50]:
-                must_not.append({"match_phrase": {"text": text}})
+        query_vec: Optional[List[float]] = None,
+        size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        size = size or limit * 3
+        exclusion = build_exclusion_filter(exclude_texts)
+        must_not = [exclusion] if exclusion else []
 
         if match_type == "match_phrase":
             text_query = {"match_phrase": {"text": {"query": query_text, "slop": 0}}}
@@ -246,59 +387,315 @@ class MultiLevelRetriever:
         bool_query = {"bool": {"must": [text_query], "must_not": must_not}} if must_not else text_query
 
         if use_vector:
-            query_vec = get_embedding(query_text)
-            body = {
-                "size": limit * 3,
-                "query": {
-                    "script_score": {
-                        "query": bool_query,
-                        "script": {
-                            "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                            "params": {"query_vector": query_vec},
-                        },
-                    }
-                },
+            if query_vec is None:
+                query_vec = get_embedding(query_text)
+            return {
+                "size": size,
+                "_source": HIT_FIELDS,
+                "query": build_vector_query(query_vec, size=size, filter_query=bool_query),
             }
-        else:
-            body = {"size": limit * 3, "query": bool_query}
-
-        try:
-            resp = es.search(index=INDEX, body=body)
-            results: List[Dict[str, Any]] = []
-            seen_texts: Set[str] = set()
-            for hit in resp["hits"]["hits"]:
-                src = hit["_source"]
-                text = src["text"]
-                # Skip short/invalid sentences
-                if not is_valid_sentence(text):
-                    continue
-                # Check for exact or near-duplicate (95% similarity)
-                if is_duplicate(text, seen_texts, similarity_threshold=0.95):
+        return {"size": size, "_source": HIT_FIELDS, "query": bool_query}
+
+    def _parse_text_hits(
+        self,
+        hits: List[Dict[str, Any]],
+        query_text: str,
+        limit: int,
+        exclude_texts: Set[str] = None,
+        require_all_words: bool = False,
+    ) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = []
+        seen_texts = NearDuplicateIndex()
+        for hit in hits:
+            src = hit["_source"]
+            text = src["text"]
+            # Skip short/invalid sentences
+            if not is_valid_sentence(text):
+                continue
+            # Check for exact or near-duplicate (95% similarity)
+            if is_duplicate(text, seen_texts, similarity_threshold=0.95):
+                continue
+            if exclude_texts and is_duplicate(text, exclude_texts, similarity_threshold=0.95):
+                continue
+            if require_all_words:
+                query_words = query_text.lower().split()
+                text_lower = text.lower()
+                if not all(word in text_lower for word in query_words):
                     continue
-                if exclude_texts and is_duplicate(text, exclude_texts, similarity_threshold=0.95):
+            seen_texts.add(text)
+            results.append(
+                {
+                    "text": text,
+                    "level": src.get("level", 0),
+                    "score": hit.get("_score", 1.0),
+                    "sentence_index": src.get("sentence_index", 0),
+                    "_id": hit["_id"],
+                }
+            )
+            if len(results) >= limit:
+                break
+        return results
+
+    def _text_search_hits(
+        self,
+        query_texts: List[str],
+        limit: int,
+        exclude_texts: Set[str],
+        use_vector: bool,
+        match_type: str,
+        require_all_words: bool,
+    ) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        Raw hits (limit * 3 per query) through the retrieval cache: one batch
+        embedding call and one search/_msearch for the misses. None = failed.
+        """
+        shape: Dict[str, Any] = {
+            "kind": "text",
+            "match_type": match_type,
+            "use_vector": use_vector,
+            "require_all_words": require_all_words,
+        }
+        if use_vector:
+            shape.update(_vector_shape())
+
+        def fetch(requests, exclude):
+            texts = [query_texts[i] for i, _ in requests]
+            try:
+                vectors = get_embeddings_batch(texts) if use_vector else [None] * len(texts)
+            except Exception as e:
+                logger.error(f"Embedding error for {len(texts)} queries: {e}")
+                return [None] * len(texts)
+            bodies = [
+                self._build_text_search_body(
+                    query_text, limit, exclude, use_vector, match_type, require_all_words,
+                    query_vec=query_vec, size=n,
+                )
+                for (_, n), query_text, query_vec in zip(requests, texts, vectors)
+            ]
+            return _run_searches(bodies, f"[ES] '{texts[0][:50]}'" if len(texts) == 1 else f"[ES] {len(texts)} queries")
+
+        return retrieval_cache.search(
+            [dict(shape, query=q) for q in query_texts], [limit * 3] * len(query_texts), exclude_texts, fetch
+        )
+
+    def _text_search(
+        self,
+        query_text: str,
+        limit: int = 15,
+        exclude_texts: Set[str] = None,
+        use_vector: bool = True,
+        match_type: str = "match",
+        require_all_words: bool = False,
+    ) -> List[Dict[str, Any]]:
+        hits = self._text_search_hits([query_text], limit, exclude_texts, use_vector, match_type, require_all_words)[0]
+        if hits is None:
+            return []
+        results = self._parse_text_hits(hits, query_text, limit, exclude_texts, require_all_words)
+        logger.info(f"[ES Results] Found {len(results)} for '{query_text[:50]}...'")
+        return results
+
+    def _text_search_many(
+        self,
+        query_texts: List[str],
+        limit: int = 15,
+        exclude_texts: Set[str] = None,
+        use_vector: bool = True,
+        match_type: str = "match",
+        require_all_words: bool = False,
+        max_results: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        _text_search for several queries in one round trip: one batch embedding
+        call and one _msearch (cached queries are not searched again).
+        Returns one result list per query, in order.
+        max_results lets callers keep more than `limit` hits per query.
+        """
+        if not query_texts:
+            return []
+        all_hits = self._text_search_hits(query_texts, limit, exclude_texts, use_vector, match_type, require_all_words)
+        all_results = [
+            self._parse_text_hits(hits or [], query_text, max_results or limit, exclude_texts, require_all_words)
+            for query_text, hits in zip(query_texts, all_hits)
+        ]
+        logger.info(
+            f"[ES Results] {len(query_texts)} queries → "
+            f"{sum(len(r) for r in all_results)} results"
+        )
+        return all_results
+
+    def _term_stats_for(self, terms: List[str]) -> Optional[TermStats]:
+        """Corpus term / pair counts for one walk's terms (one aggregation per retriever)."""
+        key = tuple(terms)
+        if key not in self._term_stats:
+            self._term_stats[key] = collect_term_stats(terms)
+        return self._term_stats[key]
+
+    def _postings_for(self, terms: List[str]) -> Optional[PostingLists]:
+        """Posting lists of one walk's terms (fetched once per retriever)."""
+        key = tuple(terms)
+        if key not in self._postings:
+            self._postings[key] = fetch_posting_lists(terms)
+        return self._postings[key]
+
+    def _walk_combinations_local(
+        self,
+        postings: PostingLists,
+        terms: List[str],
+        offset: int,
+        limit: int,
+        used_texts: Set[str],
+        label: str,
+        tag: Optional[str] = None,
+        max_combos: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        _walk_combinations with intersections computed from posting lists.
+
+        Combos are consumed in the same order with the same offset semantics;
+        within a combo documents are ranked by summed BM25 term scores instead
+        of vector similarity. Candidates of the next few combos are hydrated
+        together in one search, enough for the rest of the batch.
+        """
+        sentences: List[Dict[str, Any]] = []
+        current_offset = offset
+        total = count_keyword_combinations(len(terms), max_combos)
+        if offset >= total:
+            return sentences, current_offset
+
+        if isinstance(used_texts, NearDuplicateIndex):
+            skip_hashes = set(used_texts.exclusion_hashes())
+        else:
+            skip_hashes = {text_hash(t) for t in used_texts}
+        combos = iter_keyword_combinations(terms, start=offset, max_combos=max_combos)
+        hydrated: Dict[str, Dict[str, Any]] = {}
+        while len(sentences) < limit:
+            remaining = limit - len(sentences)
+            # Plan: the next combos with matches, until they hold enough new candidates
+            pending: List[Tuple[int, Tuple[str, ...], List[Dict[str, Any]]]] = []
+            wanted: Set[str] = set()
+            for index, combo in combos:
+                ranked = postings.rank(combo, skip_hashes, limit=remaining * 3)
+                if not ranked:
                     continue
-                if require_all_words:
-                    query_words = query_text.lower().split()
-                    text_lower = text.lower()
-                    if not all(word in text_lower for word in query_words):
-                        continue
-                seen_texts.add(text)
-                results.append(
-                    {
-                        "text": text,
-                        "level": src.get("level", 0),
-                        "score": hit.get("_score", 1.0),
-                        "sentence_index": src.get("sentence_index", 0),
-                        "_id": hit["_id"],
-                    }
+                pending.append((index, combo, ranked))
+                wanted.update(d["_id"] for d in ranked if d["_id"] not in hydrated)
+                if len(wanted) >= remaining * 2:
+                    break
+            if not pending:
+                current_offset = total
+                break
+            hydrated.update(hydrate_documents(wanted))
+            logger.info(
+                f"[{label}] local combos {pending[0][0]}-{pending[-1][0]}: "
+                f"{len(pending)} with matches, {len(wanted)} documents hydrated"
+            )
+
+            for index, combo, ranked in pending:
+                hits = [dict(hydrated[d["_id"]], _score=d["_score"]) for d in ranked if d["_id"] in hydrated]
+                results = self._parse_text_hits(hits, " ".join(combo), len(hits), used_texts, require_all_words=True)
+                for r in results:
+                    if not is_duplicate(r["text"], used_texts, similarity_threshold=0.95):
+                        if tag:
+                            r[tag] = combo
+                        sentences.append(r)
+                        used_texts.add(r["text"])
+                    if len(sentences) >= limit:
+                        break
+                current_offset = index + 1
+                if len(sentences) >= limit:
+                    break
+
+        # Every combo consumed here would have been one ES search (not a pruning skip)
+        record_local_walk(current_offset - offset)
+        return sentences, current_offset
+
+    def _walk_combinations(
+        self,
+        terms: List[str],
+        offset: int,
+        limit: int,
+        used_texts: Set[str],
+        label: str,
+        tag: Optional[str] = None,
+        max_combos: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Walk keyword combinations of `terms` in priority order, a page at a time.
+
+        Combinations are generated lazily from `offset` (nothing beyond the
+        last page is built). With COMBINATION_PRUNING, combos that corpus term
+        statistics prove cannot match (a term or pair with no documents) are
+        skipped without a search.
+
+        Each page of combos is searched with one _msearch; results are then
+        consumed combo by combo exactly like one search per combo would be,
+        so the returned offset (index of the first combo not consumed) is the
+        same. Combos fetched but not reached are searched again next batch.
+        """
+        if settings.POSTING_ACCELERATOR:
+            postings = self._postings_for(terms)
+            if postings is not None:
+                return self._walk_combinations_local(
+                    postings, terms, offset, limit, used_texts, label, tag=tag, max_combos=max_combos
                 )
-                if len(results) >= limit:
+
+        sentences: List[Dict[str, Any]] = []
+        current_offset = offset
+        total = count_keyword_combinations(len(terms), max_combos)
+        if offset >= total:
+            return sentences, current_offset
+
+        stats = self._term_stats_for(terms) if settings.COMBINATION_PRUNING else None
+        combos = iter_keyword_combinations(terms, start=offset, max_combos=max_combos)
+        pruned: List[int] = []
+        page_size = max(1, settings.MSEARCH_PAGE_SIZE)
+        while len(sentences) < limit:
+            page: List[Tuple[int, Tuple[str, ...]]] = []
+            for index, combo in combos:
+                if stats is not None and not stats.can_match(combo):
+                    pruned.append(index)
+                    continue
+                page.append((index, combo))
+                if len(page) >= page_size:
                     break
-            logger.info(f"[ES Results] Found {len(results)} for '{query_text[:50]}...'")
-            return results
-        except Exception as e:
-            logger.error(f"Search error for '{query_text[:50]}...': {e}")
-            return []
+            if not page:
+                current_offset = total
+                break
+            remaining = limit - len(sentences)
+            page_results = self._text_search_many(
+                [" ".join(combo) for _, combo in page],
+                limit=remaining,
+                exclude_texts=used_texts,
+                use_vector=True,
+                match_type="multi_match",
+                require_all_words=True,
+                # Keep every hit: some may be taken by an earlier combo of this page
+                max_results=remaining * 3,
+            )
+            logger.info(f"[{label}] msearch combos {page[0][0]}-{page[-1][0]} ({len(page)} searched)")
+            for (index, combo), results in zip(page, page_results):
+                for r in results:
+                    # Later combos in the page were searched before earlier ones were
+                    # accepted, so this check also removes overlaps within the page
+                    if not is_duplicate(r["text"], used_texts, similarity_threshold=0.95):
+                        if tag:
+                            r[tag] = combo
+                        sentences.append(r)
+                        used_texts.add(r["text"])
+                    if len(sentences) >= limit:
+                        break
+                current_offset = index + 1
+                if len(sentences) >= limit:
+                    break
+
+        # Pruned combos past the returned offset are checked again next batch
+        avoided = sum(1 for index in pruned if index < current_offset)
+        if stats is not None:
+            record_pruning(current_offset - offset, avoided)
+            self.searches_avoided += avoided
+        if avoided:
+            logger.info(f"[{label}] Skipped {avoided} combos that cannot match the corpus")
+        return sentences, current_offset
 
     # ---------- Level fetchers ----------
     def _get_all_synonym_terms(self) -> List[str]:
@@ -319,27 +716,9 @@ class MultiLevelRetriever:
 
     def fetch_level0_sentences(self, offset: int, limit: int, used_texts: Set[str]) -> Tuple[List[Dict[str, Any]], int, bool, Set[str]]:
         logger.info(f"[Level 0] offset={offset} limit={limit} used={len(used_texts)}")
-        sentences: List[Dict[str, Any]] = []
-        current_offset = offset
-        while len(sentences) < limit and current_offset < len(self.level0_combinations):
-            combo = self.level0_combinations[current_offset]
-            query_text = " ".join(combo)
-            results = self._text_search(
-                query_text=query_text,
-                limit=limit - len(sentences),
-                exclude_texts=used_texts,
-                use_vector=True,
-                match_type="multi_match",
-                require_all_words=True,
-            )
-            for r in results:
-                # Use is_duplicate to catch near-duplicates (waked vs wakened)
-                if not is_duplicate(r["text"], used_texts, similarity_threshold=0.95):
-                    sentences.append(r)
-                    used_texts.add(r["text"])
-                if len(sentences) >= limit:
-                    break
-            current_offset += 1
+        sentences, current_offset = self._walk_combinations(
+            self.keywords, offset, limit, used_texts, label="Level 0"
+        )
         if len(sentences) < limit:
             query_text = " ".join(self.keywords)
             results = self._text_search(
@@ -356,11 +735,11 @@ class MultiLevelRetriever:
                     used_texts.add(r["text"])
                 if len(sentences) >= limit:
                     break
-        exhausted = current_offset >= len(self.level0_combinations) and len(sentences) < limit // 2
-        
-        # CRITICAL: Batch deduplicate at end (faster than checking each item)
-        sentences, used_texts = deduplicate_sentences(sentences, existing_texts=used_texts, similarity_threshold=0.95)
+        exhausted = current_offset >= count_keyword_combinations(len(self.keywords)) and len(sentences) < limit // 2
         
+        # NOTE: every hit was already checked with is_duplicate() against used_texts
+        # (which holds earlier batches AND the sentences accepted above), so no
+        # end-of-batch dedup is needed here.
         return sentences, current_offset, exhausted, used_texts
 
     def fetch_level1_keyword_magic(
@@ -419,14 +798,18 @@ class MultiLevelRetriever:
                         match_type="match_phrase",
                     )
                     if len(results) < sentences_per_pair:
+                        # The phrase hits are not in used_texts yet: over-fetch and drop
+                        # them here instead of excluding a copy of the whole index
+                        phrase_hits = NearDuplicateIndex(r["text"] for r in results)
                         more_results = self._text_search(
                             query_text=phrase,
-                            limit=sentences_per_pair - len(results),
-                            exclude_texts=used_texts | {r["text"] for r in results},
+                            limit=sentences_per_pair,
+                            exclude_texts=used_texts,
                             use_vector=True,
                             match_type="match",
                         )
-                        results.extend(more_results)
+                        more_results = [r for r in more_results if not phrase_hits.is_near_duplicate(r["text"])]
+                        results.extend(more_results[:sentences_per_pair - len(results)])
                     for r in results:
                         # Use is_duplicate to catch near-duplicates (waked vs wakened)
                         if not is_duplicate(r["text"], used_texts, similarity_threshold=0.95):
@@ -449,63 +832,36 @@ class MultiLevelRetriever:
             single_keyword_mode and current_offset >= len(magic_words)
         )
         
-        # CRITICAL: Batch deduplicate at end (faster than checking each item)
-        # Log before and after for debugging
-        logger.info(f"[Level 1] Before batch dedup: {len(sentences)} sentences, used_texts has {len(used_texts)} items")
-        for sent in sentences[:2]:
-            logger.info(f"[Level 1] Sentence before dedup: '{sent.get('text', '')[:80]}...'")
-        sentences, used_texts = deduplicate_sentences(sentences, existing_texts=used_texts, similarity_threshold=0.95)
-        logger.info(f"[Level 1] After batch dedup: {len(sentences)} sentences")
-        for sent in sentences[:2]:
-            logger.info(f"[Level 1] Sentence after dedup: '{sent.get('text', '')[:80]}...'")
-        
+        # NOTE: every hit was already checked with is_duplicate() against used_texts
+        # (which holds earlier batches AND the sentences accepted above), so no
+        # end-of-batch dedup is needed here.
+        logger.info(f"[Level 1] {len(sentences)} sentences, used_texts has {len(used_texts)} items")
         return sentences, current_offset, exhausted, current_magic_word, used_texts
 
     def fetch_level2_synonym_combinations(
         self, offset: int, limit: int, used_texts: Set[str]
     ) -> Tuple[List[Dict[str, Any]], int, bool, Set[str]]:
-        sentences: List[Dict[str, Any]] = []
-        current_offset = offset
         synonym_terms = self._get_all_synonym_terms()
         if not synonym_terms:
-            return [], current_offset, True
+            return [], offset, True, used_texts
         
         # OPTIMIZATION: Limit combinations to avoid exponential explosion
         # Use only top synonyms and smaller combo sizes
         max_terms = min(len(synonym_terms), 6)  # Max 6 terms instead of all
         synonym_terms = synonym_terms[:max_terms]
         
-        combos = generate_keyword_combinations(synonym_terms)
-        
         # OPTIMIZATION: Limit max combinations to search
-        max_combos = min(len(combos), 50)  # Only search first 50 combos
-        combos = combos[:max_combos]
-        
-        while len(sentences) < limit and current_offset < len(combos):
-            combo = combos[current_offset]
-            query_text = " ".join(combo)
-            results = self._text_search(
-                query_text=query_text,
-                limit=limit - len(sentences),
-                exclude_texts=used_texts,
-                use_vector=True,
-                match_type="multi_match",
-                require_all_words=True,
-            )
-            for r in results:
-                # Use is_duplicate to catch near-duplicates (waked vs wakened)
-                if not is_duplicate(r["text"], used_texts, similarity_threshold=0.95):
-                    r["synonym_combo"] = combo
-                    sentences.append(r)
-                    used_texts.add(r["text"])
-                if len(sentences) >= limit:
-                    break
-            current_offset += 1
-        exhausted = current_offset >= len(combos)
-        
-        # CRITICAL: Batch deduplicate at end (faster than checking each item)
-        sentences, used_texts = deduplicate_sentences(sentences, existing_texts=used_texts, similarity_threshold=0.95)
+        max_combos = 50  # Only search first 50 combos
+
+        sentences, current_offset = self._walk_combinations(
+            synonym_terms, offset, limit, used_texts,
+            label="Level 2", tag="synonym_combo", max_combos=max_combos,
+        )
+        exhausted = current_offset >= count_keyword_combinations(len(synonym_terms), max_combos)
         
+        # NOTE: every hit was already checked with is_duplicate() against used_texts
+        # (which holds earlier batches AND the sentences accepted above), so no
+        # end-of-batch dedup is needed here.
         return sentences, current_offset, exhausted, used_texts
 
     def fetch_level3_synonyms_with_magic(
@@ -516,7 +872,7 @@ class MultiLevelRetriever:
         magic_words = get_magical_words_for_level3()
         synonym_terms = self._get_all_synonym_terms()
         if not synonym_terms:
-            return [], current_offset, True
+            return [], current_offset, True, used_texts
         
         # OPTIMIZATION: Limit synonym terms and magic words
         max_synonyms = min(len(synonym_terms), 5)  # Max 5 synonym terms
@@ -550,9 +906,9 @@ class MultiLevelRetriever:
                 break
         exhausted = current_offset >= len(self.level3_pairs)
         
-        # CRITICAL: Batch deduplicate at end (faster than checking each item)
-        sentences, used_texts = deduplicate_sentences(sentences, existing_texts=used_texts, similarity_threshold=0.95)
-        
+        # NOTE: every hit was already checked with is_duplicate() against used_texts
+        # (which holds earlier batches AND the sentences accepted above), so no
+        # end-of-batch dedup is needed here.
         return sentences, current_offset, exhausted, used_texts
 
     def fetch_level1_sentences(
@@ -586,9 +942,9 @@ class MultiLevelRetriever:
             current_offset += 1
         exhausted = current_offset >= len(self.level1_synonyms)
         
-        # CRITICAL: Batch deduplicate at end (faster than checking each item)
-        sentences, used_texts = deduplicate_sentences(sentences, existing_texts=used_texts, similarity_threshold=0.95)
-        
+        # NOTE: every hit was already checked with is_duplicate() against used_texts
+        # (which holds earlier batches AND the sentences accepted above), so no
+        # end-of-batch dedup is needed here.
         return sentences, current_offset, exhausted, used_texts
 
 
@@ -599,6 +955,7 @@ def get_next_batch(
     enabled_levels: Optional[List[int]] = None,
     original_query: str = None,  # NEW: Original query for semantic search
     semantic_count: int = 5,  # NEW: Always get 5 semantic results
+    synonyms: Optional[Dict[str, List[str]]] = None,
 ) -> Tuple[List[Dict[str, Any]], Dict[str, Any], int]:
     """
     Get next batch of sentences using multi-level retrieval.
@@ -615,8 +972,10 @@ def get_next_batch(
         enabled_levels: Which levels to search (default all)
         original_query: Original user query for semantic search
         semantic_count: How many pure semantic results to include (default 5)
+        synonyms: Pre-generated synonyms per keyword (avoids repeating the LLM call);
+            synonyms the walk has to generate are added to it
     """
-    retriever = MultiLevelRetriever(keywords)
+    retriever = MultiLevelRetriever(keywords, synonyms=synonyms)
     is_single_keyword = len(keywords) == 1
     if enabled_levels is None:
         enabled_levels = [0, 1, 2, 3, 4]
@@ -632,7 +991,14 @@ def get_next_batch(
     level_offsets = session_state.get(
         "level_offsets", {"0": 0, "1": 0, "2": 0, "3": 0, "4": 0}
     )
-    used_texts = set(session_state.get("used_sentence_ids", []))
+    # Session tracks used sentences by ID: exclude them exactly by ID (text_hash
+    # filter); near-duplicate checks use the session sketch and fetch only the
+    # used texts that share an LSH bucket with a candidate
+    used_ids = SentenceIdSet(session_state.get("used_sentence_ids") or [])
+    used_texts = NearDuplicateIndex()
+    if used_ids:
+        used_texts.add_ids(used_ids)
+        used_texts.load_sketch(session_state.get("used_sketch") or "", hydrate=get_texts_by_ids)
     level_used = current_level
 
     # PART 1: Get keyword-based sentences (10 sentences)
@@ -721,14 +1087,18 @@ def get_next_batch(
 
         elif current_level == 4:
             query_text = " ".join(keywords)
-            new_sents = retriever._text_search(
-                query_text=query_text,
-                limit=remaining,
-                exclude_texts=used_texts,
-                use_vector=True,
-                match_type="match",
-                require_all_words=False,
-            )
+            if settings.HYBRID_FUSION == "vector":
+                new_sents = retriever._text_search(
+                    query_text=query_text,
+                    limit=remaining,
+                    exclude_texts=used_texts,
+                    use_vector=True,
+                    match_type="match",
+                    require_all_words=False,
+                )
+            else:
+                # Keywords matched lexically OR semantically, fused in one request
+                new_sents = hybrid_search(query_text, limit=remaining, exclude_texts=used_texts)
             exhausted = True
         else:
             break
@@ -751,11 +1121,11 @@ def get_next_batch(
     # PART 2: ALWAYS get semantic results (5 sentences)
     semantic_results = []
     if original_query and semantic_count > 0:
-        logger.info(f"[get_next_batch] Adding {semantic_count} pure semantic results")
-        semantic_results = get_pure_semantic_search(
+        logger.info(f"[get_next_batch] Adding {semantic_count} semantic results ({settings.HYBRID_FUSION})")
+        semantic_results = hybrid_search(
             query=original_query,
             limit=semantic_count,
-            exclude_texts=used_texts
+            exclude_texts=used_texts,
         )
         
         # Mark as semantic with clear labels
@@ -804,7 +1174,8 @@ def get_next_batch(
     updated_state = {
         "current_level": current_level,
         "level_offsets": level_offsets,
-        "used_sentence_ids": list(used_texts),
+        "used_sentence_ids": used_texts.ids(),  # SentenceIdSet (previous + this batch)
+        "used_sketch": used_texts.sketch(settings.SESSION_SKETCH_LIMIT),  # band keys of the most recent used sentences
     }
 
     return deduplicated_final, updated_state, level_used
@@ -0,0 +1,175 @@
+# services/posting_accelerator.py
+"""
+Posting Accelerator - Level 0/2 keyword combinations evaluated in-process
+
+Instead of one `operator: and` search per keyword combination (2^n - 1 of
+them), the matching documents of each term are fetched once (one _msearch,
+IDs + text_hash + BM25 score only) and kept as bitmaps over a dense local
+numbering of the documents. Any combination is then the AND of its terms'
+bitmaps, ranked by the summed per-term BM25 scores (what the combined
+`multi_match` AND query scores lexically). Only the documents a batch will
+actually return are hydrated, in one search per batch.
+
+Bitmaps are plain Python ints (arbitrary-precision bitsets): no extra
+dependency, and AND over a few thousand documents is a single operation.
+
+Terms matching more than POSTING_MAX_DOCS documents make the posting lists
+incomplete; fetch_posting_lists() then returns None and the caller falls
+back to searching each combination in Elasticsearch.
+"""
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from vector.elastic_client import es
+from config import settings
+
+logger = logging.getLogger(__name__)
+INDEX = settings.ES_INDEX_NAME
+
+HYDRATE_FIELDS = ["text", "level", "sentence_index"]
+
+_counters = {
+    "posting_fetches": 0, "fallbacks": 0, "hydrations": 0, "hydrated_docs": 0,
+    "combinations_evaluated": 0, "searches_replaced": 0,
+}
+_lock = threading.Lock()
+
+
+def _count(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+
+
+def _iter_bits(bitmap: int) -> Iterable[int]:
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
+
+
+class PostingLists:
+    """Per-term document bitmaps and BM25 scores for one combination walk."""
+
+    def __init__(self, terms: List[str]):
+        self.terms = terms
+        self.doc_ids: List[str] = []  # dense position -> ES _id
+        self.doc_hashes: List[str] = []  # dense position -> text_hash
+        self._positions: Dict[str, int] = {}
+        self.bitmaps: Dict[str, int] = {}
+        self.scores: Dict[str, Dict[int, float]] = {}
+
+    def add_term(self, term: str, hits: List[Dict[str, Any]]):
+        bitmap = 0
+        scores: Dict[int, float] = {}
+        for hit in hits:
+            pos = self._positions.get(hit["_id"])
+            if pos is None:
+                pos = self._positions[hit["_id"]] = len(self.doc_ids)
+                self.doc_ids.append(hit["_id"])
+                self.doc_hashes.append((hit.get("fields", {}).get("text_hash") or [""])[0])
+            bitmap |= 1 << pos
+            scores[pos] = hit.get("_score") or 0.0
+        self.bitmaps[term] = bitmap
+        self.scores[term] = scores
+
+    def intersect(self, combo: Iterable[str]) -> int:
+        result = -1  # all bits set
+        for term in combo:
+            result &= self.bitmaps.get(term, 0)
+            if not result:
+                break
+        return max(result, 0)
+
+    def rank(self, combo: Iterable[str], skip_hashes: Set[str] = frozenset(), limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Documents matching every term of combo, best first:
+        [{"_id", "_score"}], excluded text_hashes removed.
+        """
+        combo = list(combo)
+        _count("combinations_evaluated")
+        ranked = []
+        for pos in _iter_bits(self.intersect(combo)):
+            if self.doc_hashes[pos] in skip_hashes:
+                continue
+            score = sum(self.scores[term].get(pos, 0.0) for term in combo)
+            ranked.append((-score, pos))
+        ranked.sort()
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [{"_id": self.doc_ids[pos], "_score": -neg} for neg, pos in ranked]
+
+
+def _posting_query(term: str, max_docs: int) -> Dict[str, Any]:
+    return {
+        "query": {"match": {"text": {"query": term, "operator": "and"}}},
+        "size": max_docs,
+        "_source": False,
+        "docvalue_fields": ["text_hash"],
+        "track_total_hits": max_docs + 1,
+    }
+
+
+def fetch_posting_lists(terms: List[str], max_docs: Optional[int] = None) -> Optional[PostingLists]:
+    """
+    One _msearch for the postings of every term.
+    None when a term has more than max_docs matches or the request fails.
+    """
+    max_docs = max_docs or settings.POSTING_MAX_DOCS
+    terms = list(dict.fromkeys(t for t in terms if t))
+    if not terms:
+        return None
+    searches: List[Dict[str, Any]] = []
+    for term in terms:
+        searches.append({"index": INDEX})
+        searches.append(_posting_query(term, max_docs))
+    try:
+        resp = es.msearch(searches=searches)
+    except Exception as e:
+        logger.warning(f"[Postings] Could not fetch posting lists: {e}")
+        _count("fallbacks")
+        return None
+
+    postings = PostingLists(terms)
+    for term, item in zip(terms, resp["responses"]):
+        if "error" in item:
+            logger.warning(f"[Postings] '{term}': {item['error']}")
+            _count("fallbacks")
+            return None
+        if item["hits"]["total"]["value"] > max_docs:
+            logger.info(f"[Postings] '{term}' matches more than {max_docs} documents; searching combos in ES")
+            _count("fallbacks")
+            return None
+        postings.add_term(term, item["hits"]["hits"])
+    _count("posting_fetches")
+    logger.info(
+        f"[Postings] {len(terms)} terms → {len(postings.doc_ids)} documents "
+        f"({', '.join(f'{t}={len(postings.scores[t])}' for t in terms)})"
+    )
+    return postings
+
+
+def hydrate_documents(ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """_id -> hit with _source, for the documents a batch returns (one search)."""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+    try:
+        resp = es.search(index=INDEX, size=len(ids), query={"ids": {"values": ids}}, _source=HYDRATE_FIELDS)
+    except Exception as e:
+        logger.error(f"[Postings] Hydration of {len(ids)} documents failed: {e}")
+        return {}
+    _count("hydrations")
+    _count("hydrated_docs", len(ids))
+    return {hit["_id"]: hit for hit in resp["hits"]["hits"]}
+
+
+def record_local_walk(consumed: int):
+    """Combos consumed by an in-process walk: each would have been one ES search."""
+    _count("searches_replaced", consumed)
+
+
+def accelerator_stats() -> Dict[str, int]:
+    """Process-wide counters (ES requests made instead of per-combination searches)."""
+    with _lock:
+        return dict(_counters)
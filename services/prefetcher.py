@@ -0,0 +1,250 @@
+# services/prefetcher.py
+"""
+Prefetcher - Speculative retrieval of the next "Tell me more" batch
+
+Right after /ask or /continue answers, the next get_next_batch walk is
+computed in a background thread from the session's updated state and kept
+in the session backend (same memory / sqlite / redis store as the session,
+separate namespace). The next /continue takes it instantly when the
+session state still has the same fingerprint; otherwise it is discarded.
+The fingerprint includes the index generation, so a batch computed before
+an ingest job finished (upload, replace, delete) is never served after it.
+
+A /continue arriving while the prefetch for the same state is still running
+in this process waits for it instead of starting a second walk.
+
+Counters (per process) tell whether prefetching pays for its extra ES load:
+hits vs misses/stale, and the time spent computing batches nobody used.
+"""
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services.deduplicator import SentenceIdSet
+from services.retrieval_cache import retrieval_cache
+from services.session_store import SessionStore, create_session_store
+
+logger = logging.getLogger(__name__)
+
+# A /continue waits this long for a matching prefetch still running (it would
+# otherwise start the same walk from scratch)
+INFLIGHT_WAIT_SECONDS = 30.0
+
+# (source_sentences, updated_state, level_used), as returned by get_next_batch
+Batch = Tuple[List[Dict[str, Any]], Dict[str, Any], int]
+
+
+def _corpus_generation() -> int:
+    """Index generation (bumped by every upload, replace and delete), 0 when not tracked."""
+    generation = retrieval_cache.generation
+    return generation.current() if generation is not None else 0
+
+
+def state_fingerprint(state: Dict[str, Any], keywords: List[str], limit: int) -> str:
+    """
+    Identity of everything the next batch depends on: any session change alters
+    it, and so does any change of the indexed corpus (a batch prefetched before
+    an upload finished is never served after it).
+    """
+    used = state.get("used_sentence_ids") or []
+    used_ids = used if isinstance(used, SentenceIdSet) else SentenceIdSet(used)
+    payload = json.dumps(
+        {
+            "corpus": _corpus_generation(),
+            "current_level": state.get("current_level", 0),
+            "level_offsets": state.get("level_offsets", {}),
+            "biblical_parallels": state.get("biblical_parallels") or {},
+            "used": used_ids.to_base64(),
+            "keywords": keywords,
+            "limit": limit,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def snapshot_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Private copy for a background walk (get_next_batch mutates level_offsets in place)."""
+    snapshot = copy.deepcopy({k: v for k, v in state.items() if k != "used_sentence_ids"})
+    snapshot["used_sentence_ids"] = SentenceIdSet(state.get("used_sentence_ids") or [])
+    return snapshot
+
+
+def _encode_batch(fingerprint: str, batch: Batch, elapsed: float) -> Dict[str, Any]:
+    sentences, updated_state, level_used = batch
+    state = dict(updated_state)
+    state["used_sentence_ids"] = SentenceIdSet(state.get("used_sentence_ids") or []).to_base64()
+    return {
+        "fingerprint": fingerprint,
+        "sentences": sentences,
+        "updated_state": state,
+        "level_used": level_used,
+        "elapsed_seconds": round(elapsed, 3),
+        "created_at": time.time(),
+    }
+
+
+def _decode_batch(data: Dict[str, Any]) -> Batch:
+    state = dict(data["updated_state"])
+    state["used_sentence_ids"] = SentenceIdSet.from_base64(state.get("used_sentence_ids") or "")
+    return data["sentences"], state, data["level_used"]
+
+
+class RetrievalPrefetcher:
+    """Background next-batch computation with a bounded worker pool."""
+
+    def __init__(self, store: SessionStore, workers: int = 2, max_pending: int = 8, enabled: bool = True):
+        self.store = store
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self._inflight: Dict[str, Tuple[str, Future]] = {}  # session_id -> (fingerprint, future)
+        self._lock = threading.Lock()
+        self.counters = {
+            "scheduled": 0,
+            "completed": 0,
+            "failed": 0,
+            "skipped_busy": 0,
+            "hits": 0,
+            "hits_inflight": 0,
+            "misses": 0,
+            "stale": 0,
+        }
+        self.compute_seconds = 0.0  # ES/LLM time spent prefetching
+        self.used_seconds = 0.0  # ... of which consumed by a /continue
+
+    def _count(self, name: str, seconds: float = 0.0, used: bool = False):
+        with self._lock:
+            self.counters[name] += 1
+            if used:
+                self.used_seconds += seconds
+
+    # ---------- Producer ----------
+    def schedule(self, session_id: str, fingerprint: str, compute: Callable[[], Batch]):
+        """Start computing the next batch for this session state (no-op when disabled or busy)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            # Finished prefetches are already in the store
+            self._inflight = {sid: item for sid, item in self._inflight.items() if not item[1].done()}
+            if len(self._inflight) >= self.max_pending:
+                self.counters["skipped_busy"] += 1
+                return
+            self.counters["scheduled"] += 1
+            future = self._executor.submit(self._run, session_id, fingerprint, compute)
+            self._inflight[session_id] = (fingerprint, future)
+
+    def _run(self, session_id: str, fingerprint: str, compute: Callable[[], Batch]) -> Optional[Batch]:
+        started = time.perf_counter()
+        try:
+            batch = compute()
+        except Exception as e:
+            self._count("failed")
+            logger.warning(f"[Prefetch] Session {session_id[:8]}: next batch failed: {e}")
+            return None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.counters["completed"] += 1
+            self.compute_seconds += elapsed
+        try:
+            self.store.put(session_id, _encode_batch(fingerprint, batch, elapsed))
+        except Exception as e:
+            logger.warning(f"[Prefetch] Session {session_id[:8]}: could not store batch: {e}")
+        logger.info(f"[Prefetch] Session {session_id[:8]}: {len(batch[0])} sentences ready in {elapsed:.2f}s")
+        return batch
+
+    # ---------- Consumer ----------
+    def take(self, session_id: str, fingerprint: str, wait_seconds: float = INFLIGHT_WAIT_SECONDS) -> Optional[Batch]:
+        """
+        The prefetched batch for exactly this state, or None (then compute it normally).
+        A matching prefetch still running in this process is waited for up to wait_seconds.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            inflight = self._inflight.pop(session_id, None)
+        if inflight is not None and inflight[0] == fingerprint and not inflight[1].done() and wait_seconds > 0:
+            try:
+                batch = inflight[1].result(timeout=wait_seconds)
+            except Exception:
+                batch = None
+            if batch is not None:
+                self.store.delete(session_id)
+                self._count("hits_inflight")
+                logger.info(f"[Prefetch] Session {session_id[:8]}: waited for in-flight prefetch")
+                return batch
+
+        data = self.store.get(session_id)
+        if data is None:
+            self._count("misses")
+            return None
+        self.store.delete(session_id)
+        if data.get("fingerprint") != fingerprint:
+            # Session moved on (another request, different limit): computed for nothing
+            self._count("stale")
+            return None
+        self._count("hits", data.get("elapsed_seconds", 0.0), used=True)
+        logger.info(f"[Prefetch] Session {session_id[:8]}: using prefetched batch")
+        return _decode_batch(data)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._inflight.pop(session_id, None)
+        self.store.delete(session_id)
+
+    # ---------- Metrics ----------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            compute_seconds, used_seconds = self.compute_seconds, self.used_seconds
+            inflight = sum(1 for _, f in self._inflight.values() if not f.done())
+        hits = counters["hits"] + counters["hits_inflight"]
+        lookups = hits + counters["misses"] + counters["stale"]
+        return {
+            "enabled": self.enabled,
+            "backend": self.store.name,
+            **counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "compute_seconds": round(compute_seconds, 3),
+            # Prefetch work a /continue actually used (in-flight waits not included)
+            "used_compute_seconds": round(used_seconds, 3),
+            "inflight": inflight,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.store.close()
+
+
+def _create_prefetcher() -> RetrievalPrefetcher:
+    ttl_seconds = settings.SESSION_TTL_MINUTES * 60
+    try:
+        store = create_session_store(
+            settings.SESSION_BACKEND,
+            ttl_seconds,
+            sqlite_path=settings.SESSION_SQLITE_PATH,
+            redis_url=settings.SESSION_REDIS_URL,
+            table="prefetched_batches",
+            prefix="prefetch:",
+        )
+    except Exception as e:
+        logger.error(f"[Prefetch] Backend '{settings.SESSION_BACKEND}' unavailable: {e}")
+        raise
+    return RetrievalPrefetcher(
+        store,
+        workers=settings.PREFETCH_WORKERS,
+        max_pending=settings.PREFETCH_MAX_PENDING,
+        enabled=settings.PREFETCH_ENABLED,
+    )
+
+
+# Global prefetcher instance
+prefetcher = _create_prefetcher()
@@ -1,14 +1,18 @@
 # services/prompt_builder.py
 """Prompt Builder - Creates structured prompts for LLM"""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from config import settings
 from openai import OpenAI
+from services.llm_cache import llm_cache
 
 if settings.DEEPSEEK_BASE_URL:
     client = OpenAI(api_key=settings.DEEPSEEK_API_KEY, base_url=settings.DEEPSEEK_BASE_URL)
 else:
     client = OpenAI(api_key=settings.DEEPSEEK_API_KEY)
 
+# Bump when the meaning prompt changes (invalidates cached LLM answers)
+MEANING_PROMPT_VERSION = 1
+
 def generate_question_variants(query: str, previous_variants: List[str] = None, continue_mode: bool = False) -> str:
     return f"Variants of: {query}"
 
@@ -24,7 +28,7 @@ Provide a comprehensive explanation covering:
 
 Be thorough and spiritually insightful."""
     
-    try:
+    def call() -> str:
         response = client.chat.completions.create(
             model=settings.CHAT_MODEL,
             messages=[{"role": "user", "content": prompt}],
@@ -32,6 +36,12 @@ Be thorough and spiritually insightful."""
             max_tokens=2000  # Increased for longer, detailed responses
         )
         return response.choices[0].message.content.strip()
+
+    try:
+        if not settings.LLM_CACHE_MEANING:
+            return call()  # temperature 0.7: each call (e.g. every "Tell me more") may differ
+        # Errors are returned as text below, never cached
+        return llm_cache.get_or_call("meaning", MEANING_PROMPT_VERSION, query, call)
     except Exception as e:
         return f"Error generating meaning: {str(e)}"
 
@@ -155,3 +165,58 @@ def call_llm(prompt: str, max_retries: int = 3) -> str:
             return f"Error generating response: {str(e)[:200]}. Please try again with a simpler query."
     
     return "Error: Maximum retries reached. Please try again later."
+
+
+def call_llm_stream(prompt: str, max_retries: int = 3) -> Iterator[str]:
+    """
+    Streaming variant of call_llm: yields answer text chunks as the model produces them.
+
+    Retries (same policy as call_llm) only happen before the first chunk;
+    once text has been sent, an error ends the stream with an error note.
+    """
+    import time
+    from config import settings
+
+    for attempt in range(max_retries):
+        started = False
+        try:
+            stream = client.chat.completions.create(
+                model=settings.CHAT_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=settings.LLM_MAX_TOKENS,
+                timeout=settings.LLM_TIMEOUT,
+                stream=True,
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not started:
+                        # Same as call_llm's strip(): drop leading whitespace
+                        delta = delta.lstrip()
+                        if not delta:
+                            continue
+                    started = True
+                    yield delta
+            return
+        except Exception as e:
+            if started:
+                print(f"[LLM] Stream interrupted: {str(e)}")
+                yield f"\n\n[Error: response interrupted: {str(e)[:200]}]"
+                return
+
+            error_msg = str(e).lower()
+            if "timeout" in error_msg or "rate limit" in error_msg or "connection" in error_msg:
+                if attempt < max_retries - 1:
+                    wait_time = (attempt + 1) * 2
+                    print(f"[LLM] Retry {attempt + 1}/{max_retries} after {wait_time}s: {str(e)[:100]}")
+                    time.sleep(wait_time)
+                    continue
+
+            print(f"[LLM] Error after {attempt + 1} attempts: {str(e)}")
+            yield f"Error generating response: {str(e)[:200]}. Please try again with a simpler query."
+            return
+
+    yield "Error: Maximum retries reached. Please try again later."
@@ -0,0 +1,194 @@
+# services/query_analyzer.py
+"""
+Query Analyzer - One structured LLM call for the whole query analysis
+
+Replaces (when UNIFIED_ANALYSIS=true) the separate chat completions for:
+- keyword extraction        (keyword_extractor.extract_keywords_raw)
+- synonyms per keyword      (keyword_extractor.generate_synonyms)
+- biblical parallels        (biblical_parallels.analyze_biblical_parallels)
+- question variants         (prompt_builder.generate_question_variants)
+
+The reply is constrained by a JSON schema (json_object mode plus the schema
+in the prompt for DeepSeek) and validated here; any failure returns None so
+the caller falls back to the per-call path.
+"""
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from openai import OpenAI
+
+from config import settings
+from services.keyword_extractor import clean_raw_keywords
+from services.llm_cache import llm_cache
+
+logger = logging.getLogger(__name__)
+
+if settings.DEEPSEEK_BASE_URL:
+    client = OpenAI(api_key=settings.DEEPSEEK_API_KEY, base_url=settings.DEEPSEEK_BASE_URL)
+else:
+    client = OpenAI(api_key=settings.DEEPSEEK_API_KEY)
+
+# Bump when the prompt, schema or validation changes (invalidates cached LLM answers)
+ANALYSIS_PROMPT_VERSION = 1
+
+PARALLEL_SECTIONS = ("stories_characters", "scripture_references", "biblical_metaphors")
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "keywords": _STRING_LIST,
+        "synonyms": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"keyword": {"type": "string"}, "synonyms": _STRING_LIST},
+                "required": ["keyword", "synonyms"],
+                "additionalProperties": False,
+            },
+        },
+        "stories_characters": _STRING_LIST,
+        "scripture_references": _STRING_LIST,
+        "biblical_metaphors": _STRING_LIST,
+        "parallel_keywords": _STRING_LIST,
+        "question_variants": _STRING_LIST,
+    },
+    "required": [
+        "keywords", "synonyms", "stories_characters", "scripture_references",
+        "biblical_metaphors", "parallel_keywords", "question_variants",
+    ],
+    "additionalProperties": False,
+}
+
+
+@dataclass
+class QueryAnalysis:
+    """Everything the /ask graph needs from the query, in the shapes the per-call path returns."""
+    keywords: List[str]  # clean keywords (magic words filtered)
+    synonyms: Dict[str, List[str]] = field(default_factory=dict)  # keyword -> synonyms
+    parallels: Dict[str, List[str]] = field(default_factory=dict)  # same keys as analyze_biblical_parallels
+    question_variants: str = ""
+
+
+def _build_prompt(query: str) -> str:
+    return f"""Analyze the following question for a Bible / Ellen G. White search engine.
+
+Text:
+"{query}"
+
+Return ONE JSON object with these fields:
+- "keywords": ALL important keywords and phrases (nouns, proper names such as Lord, Jesus, God,
+  compound phrases such as "Master's table", "Holy Spirit"). Do not skip significant words.
+- "synonyms": for EACH keyword, 2-3 synonyms or related theological terms:
+  [{{"keyword": "grace", "synonyms": ["mercy", "blessing", "favor"]}}]
+- "stories_characters": people, groups or stories referenced or implied
+- "scripture_references": explicit or implicit verse locations (Book Chapter:Verse)
+- "biblical_metaphors": symbolic language or imagery connected to a Biblical narrative
+- "parallel_keywords": key terms to search for related Bible passages (include common ones like faith, prayer, God)
+- "question_variants": 3 rephrasings of the question
+
+Rules:
+- Only extract items that match the text's context; each parallel item 3-10 words maximum.
+- Use empty arrays when nothing applies.
+
+JSON schema:
+{json.dumps(ANALYSIS_SCHEMA, separators=(",", ":"))}"""
+
+
+def _response_format() -> Dict[str, Any]:
+    # DeepSeek only supports json_object; OpenAI models enforce the schema itself
+    if settings.DEEPSEEK_BASE_URL:
+        return {"type": "json_object"}
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "query_analysis", "strict": True, "schema": ANALYSIS_SCHEMA},
+    }
+
+
+def _string_list(data: Dict[str, Any], key: str) -> List[str]:
+    value = data.get(key)
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"'{key}' must be a list of strings")
+    return [v.strip() for v in value if v and v.strip()]
+
+
+def validate_analysis(data: Any) -> Dict[str, Any]:
+    """
+    Check the LLM reply against ANALYSIS_SCHEMA (raises ValueError) and
+    normalize it the way the per-call parsers do (lowercase keywords/synonyms).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("analysis must be a JSON object")
+    keywords = [k.lower() for k in _string_list(data, "keywords")]
+    if not keywords:
+        raise ValueError("no keywords extracted")
+
+    synonyms: Dict[str, List[str]] = {}
+    entries = data.get("synonyms")
+    if not isinstance(entries, list):
+        raise ValueError("'synonyms' must be a list")
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get("keyword"), str):
+            raise ValueError("each synonyms entry needs a 'keyword' string")
+        synonyms[entry["keyword"].lower().strip()] = [s.lower() for s in _string_list(entry, "synonyms")]
+
+    result = {
+        "keywords": keywords,
+        "synonyms": synonyms,
+        "question_variants": _string_list(data, "question_variants"),
+    }
+    for section in PARALLEL_SECTIONS + ("parallel_keywords",):
+        result[section] = _string_list(data, section)
+    return result
+
+
+def _call_unified(query: str) -> Dict[str, Any]:
+    """The single LLM call (raises on API, JSON or validation errors)."""
+    response = client.chat.completions.create(
+        model=settings.CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": "You analyze Bible study questions. Return ONLY a JSON object matching the given schema."},
+            {"role": "user", "content": _build_prompt(query)},
+        ],
+        temperature=0.0,
+        max_tokens=900,
+        response_format=_response_format(),
+    )
+    content = response.choices[0].message.content.strip()
+    logger.info(f"[QueryAnalyzer] LLM raw response: {content[:300]}...")
+    return validate_analysis(json.loads(content))
+
+
+def analyze_query(query: str) -> Optional[QueryAnalysis]:
+    """
+    Unified analysis of the query, or None when the call or its validation
+    fails (callers then use the per-call functions).
+    """
+    start_ts = time.time()
+    try:
+        data = llm_cache.get_or_call("unified_analysis", ANALYSIS_PROMPT_VERSION, query, lambda: _call_unified(query))
+    except Exception as e:
+        logger.warning(f"[QueryAnalyzer] Unified analysis failed, falling back to per-call path: {e}")
+        return None
+
+    keywords = clean_raw_keywords(data["keywords"])
+    analysis = QueryAnalysis(
+        keywords=keywords,
+        # Keywords the model gave no synonyms for are filled lazily by MultiLevelRetriever
+        synonyms={kw: data["synonyms"][kw] for kw in keywords if kw in data["synonyms"]},
+        parallels={
+            **{section: data[section] for section in PARALLEL_SECTIONS},
+            "keywords": data["parallel_keywords"],
+        },
+        question_variants="\n".join(data["question_variants"]),
+    )
+    logger.info(
+        f"[QueryAnalyzer] Unified analysis took {time.time() - start_ts:.2f}s: "
+        f"keywords={analysis.keywords}, synonyms for {len(analysis.synonyms)}, "
+        f"variants={len(data['question_variants'])}"
+    )
+    return analysis
@@ -0,0 +1,247 @@
+# services/retrieval_cache.py
+"""
+Retrieval Cache - Search results shared across levels, requests and users
+
+The same sub-search (query text, match type, vector or not, ...) recurs
+constantly: across Level 0/2 walks, /debug/level, every user asking about
+"grace". Raw hits are cached per query shape, WITHOUT session exclusions;
+each caller removes its own used sentences afterwards (same text_hash rule
+as the ES terms filter), so one entry serves every session. When too many
+cached hits are excluded, the entry is fetched again with a larger window.
+
+Entries are tied to an index generation counter, kept in a small SQLite
+file so every worker sees it. Anything that changes the documents
+(upload, replace, delete) bumps it, and entries of older generations are
+dropped on the next lookup.
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import settings
+from services.deduplicator import NearDuplicateIndex, text_hash
+
+logger = logging.getLogger(__name__)
+
+# Largest window ever requested for one query (ES index.max_result_window default)
+MAX_WINDOW = 10_000
+# Fetch rounds per lookup when exclusions keep eating the cached window
+MAX_ROUNDS = 4
+
+Hit = Dict[str, Any]
+# fetch([(request index, size)], exclude_texts) -> hits per request (None = search failed)
+Fetch = Callable[[List[Tuple[int, int]], Optional[Iterable[str]]], List[Optional[List[Hit]]]]
+
+
+class IndexGeneration:
+    """Monotonic counter of document changes, shared by all workers through SQLite."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL)"
+        )
+        self._conn().execute("INSERT OR IGNORE INTO generation (id, value) VALUES (1, 0)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def current(self) -> int:
+        return self._conn().execute("SELECT value FROM generation WHERE id = 1").fetchone()[0]
+
+    def bump(self) -> int:
+        conn = self._conn()
+        conn.execute("UPDATE generation SET value = value + 1 WHERE id = 1")
+        value = self.current()
+        logger.info(f"[RetrievalCache] Index generation → {value}")
+        return value
+
+
+@dataclass
+class CachedHits:
+    hits: List[Hit]  # best first, each with "_text_hash"
+    size: int  # window that was requested
+    generation: int
+
+    @property
+    def complete(self) -> bool:
+        # Fewer hits than requested: nothing more to fetch for this query
+        return len(self.hits) < self.size
+
+
+def exclusion_hash_set(exclude_texts: Optional[Iterable[str]]) -> Set[str]:
+    """text_hash values excluded by a session (same rule as build_exclusion_filter)."""
+    if isinstance(exclude_texts, NearDuplicateIndex):
+        return set(exclude_texts.exclusion_hashes())
+    return {text_hash(t) for t in exclude_texts or () if t}
+
+
+def _slim(hit: Hit) -> Hit:
+    return {
+        "_id": hit["_id"],
+        "_score": hit.get("_score"),
+        "_source": hit["_source"],
+        "_text_hash": text_hash(hit["_source"]["text"]),
+    }
+
+
+class RetrievalCache:
+    """Bounded in-process LRU of raw search hits, keyed by query shape + index generation."""
+
+    def __init__(self, generation: Optional[IndexGeneration], max_entries: int = 2048, enabled: bool = True):
+        self.generation = generation
+        self.max_entries = max_entries
+        self.enabled = enabled and generation is not None
+        self._entries: "OrderedDict[str, CachedHits]" = OrderedDict()
+        self._generation_seen: Optional[int] = None
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "refetches": 0, "invalidations": 0, "errors": 0}
+
+    @staticmethod
+    def key(shape: Dict[str, Any]) -> str:
+        return json.dumps(shape, sort_keys=True, ensure_ascii=False)
+
+    def _current_generation(self) -> int:
+        generation = self.generation.current()
+        with self._lock:
+            if generation != self._generation_seen:
+                if self._entries:
+                    self.counters["invalidations"] += 1
+                    logger.info(f"[RetrievalCache] Index changed (generation {generation}); dropping {len(self._entries)} entries")
+                self._entries.clear()
+                self._generation_seen = generation
+        return generation
+
+    def _get(self, key: str, generation: int) -> Optional[CachedHits]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.generation != generation:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key: str, entry: CachedHits):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def search(
+        self,
+        shapes: List[Dict[str, Any]],
+        needed: List[int],
+        exclude_texts: Optional[Iterable[str]],
+        fetch: Fetch,
+    ) -> List[Optional[List[Hit]]]:
+        """
+        Top needed[i] hits of query shapes[i] with exclude_texts removed,
+        from the cache where possible; all misses go to ONE fetch() call per round.
+        None for a search that failed.
+        """
+        if not self.enabled:
+            return fetch([(i, n) for i, n in enumerate(needed)], exclude_texts)
+
+        try:
+            generation = self._current_generation()
+        except sqlite3.Error as e:
+            logger.warning(f"[RetrievalCache] Generation unavailable ({e}); searching without cache")
+            self._count("errors")
+            return fetch([(i, n) for i, n in enumerate(needed)], exclude_texts)
+
+        excluded = exclusion_hash_set(exclude_texts)
+        keys = [self.key(shape) for shape in shapes]
+        results: List[Optional[List[Hit]]] = [None] * len(shapes)
+        pending = list(range(len(shapes)))
+        for round_number in range(MAX_ROUNDS + 1):
+            requests: List[Tuple[int, int]] = []
+            for i in pending:
+                entry = self._get(keys[i], generation)
+                if entry is not None:
+                    usable = [h for h in entry.hits if h["_text_hash"] not in excluded]
+                    if len(usable) >= needed[i] or entry.complete or entry.size >= MAX_WINDOW or round_number == MAX_ROUNDS:
+                        results[i] = usable[:needed[i]]
+                        if round_number == 0:
+                            self._count("hits")
+                        continue
+                    self._count("refetches")
+                    hidden = len(entry.hits) - len(usable)
+                    size = max(entry.size * 2, needed[i] + hidden * 2)
+                else:
+                    self._count("misses")
+                    # Room for a few excluded hits, and for callers asking for more later
+                    size = max(needed[i] * 2, 30)
+                requests.append((i, min(size, MAX_WINDOW)))
+            if not requests:
+                break
+
+            fetched = fetch(requests, None)
+            pending = []
+            for (i, size), hits in zip(requests, fetched):
+                if hits is None:
+                    results[i] = None  # failed search: nothing cached, caller handles it
+                    continue
+                self._put(keys[i], CachedHits([_slim(h) for h in hits], size, generation))
+                pending.append(i)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            entries = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "generation": self._generation_seen,
+            **counters,
+            "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _create_retrieval_cache() -> RetrievalCache:
+    generation = None
+    try:
+        generation = IndexGeneration(settings.INDEX_GENERATION_PATH)
+    except Exception as e:
+        logger.error(f"[RetrievalCache] Could not open {settings.INDEX_GENERATION_PATH} ({e}); cache disabled")
+    return RetrievalCache(generation, settings.RETRIEVAL_CACHE_MAX_ENTRIES, settings.RETRIEVAL_CACHE_ENABLED)
+
+
+def bump_index_generation():
+    """Call after any change to the indexed documents (invalidates every worker's cache)."""
+    if retrieval_cache.generation is None:
+        return
+    try:
+        retrieval_cache.generation.bump()
+    except sqlite3.Error as e:
+        logger.error(f"[RetrievalCache] Could not bump index generation: {e}")
+    retrieval_cache.clear()
+
+
+# Global retrieval cache instance
+retrieval_cache = _create_retrieval_cache()
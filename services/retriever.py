@@ -8,11 +8,20 @@ Supports:
 - Deduplicate
 - Batch processing to prevent RAM overflow
 """
-from typing import List, Dict, Any, Set, Optional, Generator
-from vector.elastic_client import es
+from typing import List, Dict, Any, Set, Optional, Generator, Iterable, Tuple, Callable
+import re
+import time
+from functools import lru_cache
+from vector.elastic_client import (
+    es, build_vector_query, get_vector_search_mode, create_versioned_index, flip_alias,
+    bulk_load_settings, force_merge,
+)
 from config import settings
 from services.embedder import get_embedding, get_embeddings_batch
-from services.deduplicator import is_duplicate, deduplicate_sentences
+from services.deduplicator import is_duplicate, deduplicate_sentences, text_hash, sentence_id_to_hash, NearDuplicateIndex
+from services.ingest_pipeline import IngestPipeline
+from services.retrieval_cache import bump_index_generation
+from services.corpus_stats import corpus_stats
 
 INDEX = settings.ES_INDEX_NAME
 
@@ -21,8 +30,14 @@ DEFAULT_SENTENCES_PER_LEVEL = 5
 MAX_BATCH_SIZE = 500  # Batch size for embedding (OpenAI supports up to 2048)
 
 
+def _index_changed():
+    """After any ingest/delete: drop cached search hits and re-read the corpus stats."""
+    bump_index_generation()
+    corpus_stats.refresh()
+
+
 def index_sentences_batch(
-    sentences: List[str], 
+    sentences: Iterable[str], 
     file_id: str = None,
     sentences_per_level: int = DEFAULT_SENTENCES_PER_LEVEL,
     batch_size: int = MAX_BATCH_SIZE
@@ -31,53 +46,79 @@ def index_sentences_batch(
     Index list of sentences into Elasticsearch with batch processing.
     Prevents RAM overflow by processing in batches.
     
+    Embedding and bulk writes run as a pipeline (see services/ingest_pipeline.py):
+    the next batch is embedded while the previous one is being written.
+    
     Args:
-        sentences: List of sentences
+        sentences: List (or any iterable) of sentences
         file_id: File ID
         sentences_per_level: Number of sentences per level
-        batch_size: Batch size for processing
+        batch_size: Batch size for embedding requests
     
     Returns: max_level created
     """
-    max_level = 0
-    total_sentences = len(sentences)
-    total_batches = (total_sentences + batch_size - 1) // batch_size
-    
-    print(f"[Indexer] Starting to index {total_sentences} sentences in {total_batches} batches (batch_size={batch_size})")
-    
-    # Xử lý từng batch
-    for batch_start in range(0, total_sentences, batch_size):
-        batch_end = min(batch_start + batch_size, total_sentences)
-        batch_sentences = sentences[batch_start:batch_end]
-        batch_num = batch_start // batch_size + 1
-        print(f"[Indexer] Processing batch {batch_num}/{total_batches} ({batch_start+1}-{batch_end} of {total_sentences})")
-        
-        # Lấy embeddings cho cả batch (tối ưu hơn gọi từng câu)
-        embeddings = get_embeddings_batch(batch_sentences)
-        
-        actions = []
-        for i, (sent, emb) in enumerate(zip(batch_sentences, embeddings)):
-            global_index = batch_start + i
-            level = global_index // sentences_per_level
-            max_level = max(max_level, level)
-            
-            doc = {
-                "text": sent,
-                "level": level,
-                "embedding": emb,
-                "sentence_index": global_index,
-            }
-            
-            if file_id:
-                doc["file_id"] = file_id
-            
-            actions.append({"index": {"_index": INDEX}})
-            actions.append(doc)
-        
-        if actions:
-            es.bulk(body=actions, refresh=True)
-    
-    return max_level
+    result = index_sentences_pipelined(
+        sentences,
+        file_id=file_id,
+        sentences_per_level=sentences_per_level,
+        batch_size=batch_size,
+    )
+    return result["max_level"]
+
+
+def index_sentences_pipelined(
+    sentences: Iterable[str],
+    file_id: str = None,
+    sentences_per_level: int = DEFAULT_SENTENCES_PER_LEVEL,
+    batch_size: int = MAX_BATCH_SIZE,
+    start_index: int = 0,
+    on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    index: Optional[str] = None,
+    reuse_index: Optional[str] = None,
+    force_merge_segments: int = 0,
+) -> Dict[str, Any]:
+    """
+    Same as index_sentences_batch but returns the full ingest report:
+    total_sentences, max_level and sentences/sec per stage (split, embed, bulk).
+    start_index / on_progress: resumed ingest jobs (see services/ingest_jobs.py).
+    index / reuse_index: /replace writes the next generation (not searchable yet),
+    copying vectors of ReusedSentence items from the live one.
+    
+    Refresh is suspended for the load (replicas too on a new generation) and
+    restored afterwards with one final refresh; force_merge_segments > 0 merges
+    the index at the end (only for an index nobody writes to afterwards).
+    The report gets "index_tuning" and "force_merge" (segments, search latency
+    before/after the merge).
+    """
+    target = index or INDEX
+    print(f"[Indexer] Starting pipelined ingest (batch_size={batch_size}, "
+          f"embed_workers={settings.INGEST_EMBED_WORKERS}, bulk_workers={settings.INGEST_BULK_WORKERS})")
+    try:
+        with bulk_load_settings(target, defer_replicas=target != INDEX) as tuning:
+            pipeline = IngestPipeline(
+                index=target,
+                file_id=file_id,
+                sentences_per_level=sentences_per_level,
+                batch_size=batch_size,
+                refresh=not tuning["refresh_disabled"],
+                start_index=start_index,
+                on_progress=on_progress,
+                reuse_index=reuse_index,
+            )
+            result = pipeline.run(sentences)
+        result["index_tuning"] = tuning
+        if force_merge_segments > 0:
+            try:
+                result["force_merge"] = force_merge(target, force_merge_segments)
+            except Exception as e:
+                # Every document is indexed and visible: a slow/failed merge only costs search speed
+                print(f"[Indexer] Force-merge of {target} failed: {e}")
+                result["force_merge"] = {"error": str(e)}
+        return result
+    finally:
+        if target == INDEX:
+            # Even a failed ingest may have written some batches
+            _index_changed()
 
 
 def index_sentences(
@@ -97,8 +138,55 @@ def index_sentences(
     )
 
 
+def build_exclusion_filter(exclude_texts: Optional[Iterable[str]]) -> Optional[Dict[str, Any]]:
+    """
+    Build ONE terms filter on text_hash for all excluded sentences.
+    Replaces one match_phrase clause per used sentence: cost stays near-constant
+    and nothing is truncated, however many /continue calls the session made.
+    Use inside bool.must_not.
+    """
+    if isinstance(exclude_texts, NearDuplicateIndex):
+        # Includes sentences the session only knows by ID
+        hashes = exclude_texts.exclusion_hashes()
+    elif exclude_texts:
+        hashes = sorted({text_hash(t) for t in exclude_texts if t})
+    else:
+        return None
+    if not hashes:
+        return None
+    return {"terms": {"text_hash": hashes}}
+
+
+# Terms per hydration request (ES default index.max_terms_count is 65536)
+_HYDRATE_BATCH = 5000
+
+
+def get_texts_by_ids(ids: Iterable[int]) -> List[str]:
+    """
+    Look up sentence texts for session sentence IDs (text_hash as int).
+    Sessions store only IDs; texts are fetched when near-duplicate checks need them.
+    """
+    hashes = [sentence_id_to_hash(i) for i in ids]
+    texts: List[str] = []
+    for i in range(0, len(hashes), _HYDRATE_BATCH):
+        chunk = hashes[i:i + _HYDRATE_BATCH]
+        try:
+            res = es.search(
+                index=INDEX,
+                size=len(chunk),
+                query={"terms": {"text_hash": chunk}},
+                collapse={"field": "text_hash"},  # one doc per sentence even if indexed twice
+                _source=["text"],
+            )
+        except Exception as e:
+            print(f"[get_texts_by_ids] Error: {e}")
+            continue
+        texts.extend(hit["_source"]["text"] for hit in res["hits"]["hits"])
+    return texts
+
+
 def get_max_level() -> int:
-    """Lấy level cao nhất có trong index"""
+    """Lấy level cao nhất có trong index (live query; hot paths use corpus_stats)"""
     try:
         body = {
             "size": 0,
@@ -117,7 +205,8 @@ def knn_search(
     query: str, 
     top_k: int = 30,
     target_levels: List[int] = None,
-    exclude_texts: Set[str] = None
+    exclude_texts: Set[str] = None,
+    mode: str = None
 ) -> List[Dict[str, Any]]:
     """
     Tìm các câu gần nhất bằng cosineSimilarity + phrase proximity boost.
@@ -127,6 +216,7 @@ def knn_search(
         top_k: Số kết quả tối đa
         target_levels: Chỉ lấy từ các level này (None = tất cả)
         exclude_texts: Các câu đã dùng, cần loại bỏ
+        mode: "knn" / "exact" (None = settings.VECTOR_SEARCH_MODE)
     
     Returns: list [{text, level, score}, ...]
     """
@@ -141,11 +231,9 @@ def knn_search(
             "terms": {"level": target_levels}
         })
     
-    if exclude_texts:
-        for text in exclude_texts:
-            must_not_clauses.append({
-                "match_phrase": {"text": text}
-            })
+    exclusion = build_exclusion_filter(exclude_texts)
+    if exclusion:
+        must_not_clauses.append(exclusion)
     
     # Build bool query
     if must_clauses or must_not_clauses:
@@ -156,24 +244,41 @@ def knn_search(
             bool_query["bool"]["must_not"] = must_not_clauses
         inner_query = bool_query
     else:
-        inner_query = {"match_all": {}}
+        inner_query = None
 
     # Main query: Vector similarity + Phrase matching boost
-    body = {
-        "size": top_k * 2,  # Lấy nhiều hơn để re-rank
-        "query": {
-            "script_score": {
-                "query": inner_query,
-                "script": {
-                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                    "params": {"query_vector": query_vec}
-                }
-            }
+    rescore = build_proximity_rescore(query) if settings.PROXIMITY_RESCORE else None
+    if rescore is not None:
+        # Proximity re-rank runs in Elasticsearch over a window larger than what is returned
+        window = max(rescore["window_size"], top_k)
+        rescore["window_size"] = window  # every returned hit must be re-ranked
+        body = {
+            "size": top_k,
+            "_source": RESULT_FIELDS,
+            "query": build_vector_query(query_vec, size=window, filter_query=inner_query, mode=mode),
+            "rescore": rescore,
+        }
+    else:
+        body = {
+            "size": top_k * 2,  # Lấy nhiều hơn để re-rank
+            "_source": RESULT_FIELDS,
+            "query": build_vector_query(query_vec, size=top_k * 2, filter_query=inner_query, mode=mode)
         }
-    }
 
     resp = es.search(index=INDEX, body=body)
 
+    if rescore is not None:
+        # _score already = vector score * (1 + proximity boost), in rank order
+        return [
+            {
+                "text": hit["_source"]["text"],
+                "level": hit["_source"].get("level", 0),
+                "score": hit["_score"],
+                "sentence_index": hit["_source"].get("sentence_index", 0),
+            }
+            for hit in resp["hits"]["hits"]
+        ]
+
     # Collect results and calculate phrase proximity boost
     results = []
     for hit in resp["hits"]["hits"]:
@@ -203,6 +308,157 @@ def knn_search(
     return results[:top_k]
 
 
+def compare_vector_modes(query: str, top_k: int = 20) -> Dict[str, Any]:
+    """
+    Run the same vector query in knn and exact mode and report the overlap.
+    recall = fraction of the exact top_k that the approximate search also found.
+    """
+    query_vec = get_embedding(query)
+    report: Dict[str, Any] = {"query": query, "top_k": top_k, "active_mode": get_vector_search_mode()}
+    ids_by_mode: Dict[str, List[str]] = {}
+
+    for mode in ("exact", "knn"):
+        body = {
+            "size": top_k,
+            "_source": ["text"],
+            "query": build_vector_query(query_vec, size=top_k, mode=mode),
+        }
+        start = time.perf_counter()
+        try:
+            resp = es.search(index=INDEX, body=body)
+        except Exception as e:
+            report[mode] = {"error": str(e)}
+            continue
+        ids_by_mode[mode] = [hit["_id"] for hit in resp["hits"]["hits"]]
+        report[mode] = {
+            "took_ms": resp.get("took"),
+            "wall_ms": round((time.perf_counter() - start) * 1000, 1),
+            "top_texts": [hit["_source"]["text"][:80] for hit in resp["hits"]["hits"][:5]],
+        }
+
+    if "exact" in ids_by_mode and "knn" in ids_by_mode and ids_by_mode["exact"]:
+        exact_ids = set(ids_by_mode["exact"])
+        report["recall_at_k"] = round(len(exact_ids & set(ids_by_mode["knn"])) / len(exact_ids), 4)
+    return report
+
+
+# Fields knn_search returns (the embedding vector stays on the server)
+RESULT_FIELDS = ["text", "level", "sentence_index"]
+
+
+@lru_cache(maxsize=8)
+def parse_proximity_tiers(spec: str) -> Tuple[Tuple[Optional[float], float], ...]:
+    """
+    "0:2.0,1:1.5,...,*:0.1" → ((0.0, 2.0), (1.0, 1.5), ..., (None, 0.1)).
+    Each tier: max average words between consecutive query words → boost;
+    "*" = any distance. Tighter tiers must not boost less than looser ones.
+    """
+    tiers: List[Tuple[Optional[float], float]] = []
+    for item in spec.split(","):
+        gap, _, boost = item.strip().partition(":")
+        tiers.append((None if gap.strip() == "*" else float(gap), float(boost)))
+    tiers.sort(key=lambda t: float("inf") if t[0] is None else t[0])
+    boosts = [b for _, b in tiers]
+    if boosts != sorted(boosts, reverse=True) or boosts[-1] < 0:
+        raise ValueError(f"PROXIMITY_BOOST_TIERS must boost closer words at least as much: {spec!r}")
+    return tuple(tiers)
+
+
+def proximity_boost_for_distance(avg_distance: float) -> float:
+    """Boost for an average in-order distance, from settings.PROXIMITY_BOOST_TIERS."""
+    for max_gap, boost in parse_proximity_tiers(settings.PROXIMITY_BOOST_TIERS):
+        if max_gap is None or avg_distance <= max_gap:
+            return boost
+    return 0.0
+
+
+def build_proximity_rescore(query: str, window_size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    The proximity boost as an Elasticsearch rescore phase.
+
+    Each tier is an ordered `intervals` match whose max_gaps is the tier's
+    average distance times (words - 1), i.e. the total words allowed in
+    between. Tiers are nested (a tighter match also matches every looser
+    tier), so each gets the boost increment over the next looser one and a
+    document scores 1 + the boost of its tightest tier. score_mode=multiply
+    gives vector score * (1 + boost), as the Python re-rank did.
+    None for single-word queries (no proximity boost).
+    """
+    gaps = len(_tokenize(query)) - 1
+    if gaps < 1:
+        return None
+    should: List[Dict[str, Any]] = [{"constant_score": {"filter": {"match_all": {}}, "boost": 1.0}}]
+    looser_boost = 0.0
+    for max_gap, boost in reversed(parse_proximity_tiers(settings.PROXIMITY_BOOST_TIERS)):
+        increment = boost - looser_boost
+        looser_boost = boost
+        if increment <= 0:
+            continue
+        interval: Dict[str, Any] = {"query": query, "ordered": True}
+        if max_gap is not None:
+            interval["max_gaps"] = int(max_gap * gaps)
+        should.append({
+            "constant_score": {
+                "filter": {"intervals": {"text": {"match": interval}}},
+                "boost": round(increment, 6),
+            }
+        })
+    return {
+        "window_size": window_size or settings.PROXIMITY_RESCORE_WINDOW,
+        "query": {
+            "rescore_query": {"bool": {"should": should}},
+            "query_weight": 1.0,
+            "rescore_query_weight": 1.0,
+            "score_mode": "multiply",
+        },
+    }
+
+
+_WORD_RE = re.compile(r"\b\w+\b")
+
+
+@lru_cache(maxsize=8192)
+def _tokenize(text: str) -> Tuple[str, ...]:
+    """Lower-cased word tokens, computed once per sentence (hits repeat across queries)."""
+    return tuple(_WORD_RE.findall(text.lower()))
+
+
+@lru_cache(maxsize=1024)
+def _query_plan(query: str) -> Tuple[Tuple[str, ...], Dict[str, Tuple[int, ...]], "re.Pattern"]:
+    """Query words, per word its positions in the query (descending), and the exact-phrase regex."""
+    words = _tokenize(query)
+    slots: Dict[str, List[int]] = {}
+    for j, word in enumerate(words):
+        slots.setdefault(word, []).append(j)
+    phrase = re.compile(r"\b" + r"\s+".join(re.escape(w) for w in words) + r"\b")
+    return words, {word: tuple(reversed(js)) for word, js in slots.items()}, phrase
+
+
+def min_in_order_span(query_words: Tuple[str, ...], slots: Dict[str, Tuple[int, ...]], text_words: Tuple[str, ...]) -> Optional[int]:
+    """
+    Smallest (last - first) position span over occurrences of all query words
+    in query order (strictly increasing positions), or None if there is none.
+
+    One pass over the text: start[j] is the latest start of an in-order match
+    of query words 0..j ending at the current token. Slots are updated from the
+    last query word backwards so one token never fills two slots.
+    """
+    k = len(query_words)
+    start: List[Optional[int]] = [None] * k
+    best: Optional[int] = None
+    for i, word in enumerate(text_words):
+        for j in slots.get(word, ()):
+            if j == 0:
+                start[0] = i
+            elif start[j - 1] is not None:
+                start[j] = start[j - 1]
+                if j == k - 1 and (best is None or i - start[j] < best):
+                    best = i - start[j]
+                    if best == k - 1:
+                        return best  # consecutive: cannot get closer
+    return best
+
+
 def calculate_phrase_proximity_boost(query: str, text: str) -> float:
     """
     Tính boost dựa trên độ gần nhau của các từ trong query.
@@ -210,87 +466,35 @@ def calculate_phrase_proximity_boost(query: str, text: str) -> float:
     Nếu các từ xuất hiện gần nhau trong text thì boost cao hơn.
     Ví dụ: query="heaven is" -> "heaven is" (liền kề) được boost cao nhất
     
+    Khoảng cách = trung bình số từ chen giữa các từ query liên tiếp, theo
+    đúng thứ tự, ở cửa sổ ngắn nhất (min-window, O(len(text)) thay vì
+    tích Descartes của mọi vị trí).
+    
     Returns: boost value (0.0 to 2.0)
     """
-    import re
-    
-    query_lower = query.lower().strip()
-    text_lower = text.lower()
-    
-    # Split query into words (remove punctuation)
-    query_words = re.findall(r'\b\w+\b', query_lower)
+    query_words, slots, phrase = _query_plan(query)
     
     if len(query_words) <= 1:
         # Single word query, no proximity boost needed
         return 0.0
     
-    # Check if exact phrase exists (with flexible whitespace/punctuation)
-    # Build regex pattern: word1\s+word2 or word1[^\w]+word2
-    pattern = r'\b' + r'\s+'.join(re.escape(w) for w in query_words) + r'\b'
-    if re.search(pattern, text_lower):
-        return 2.0  # Maximum boost for exact consecutive phrase
+    # Exact phrase (words separated by whitespace only)
+    if phrase.search(text.lower()):
+        return proximity_boost_for_distance(0)  # Maximum boost for exact consecutive phrase
     
-    # Tokenize text into words
-    text_words = re.findall(r'\b\w+\b', text_lower)
-    
-    # Find all positions of each query word in text
-    word_positions = {}
-    for query_word in query_words:
-        positions = []
-        for i, text_word in enumerate(text_words):
-            if text_word == query_word:  # Exact match only
-                positions.append(i)
-        if positions:
-            word_positions[query_word] = positions
-    
-    # If not all query words are found, no boost
-    if len(word_positions) < len(query_words):
+    # A repeated query word needs that many occurrences at increasing positions,
+    # as the ordered intervals match of the rescore phase does
+    span = min_in_order_span(query_words, slots, _tokenize(text))
+    if span is None:
+        # Not all query words found in order
         return 0.0
     
-    # Calculate minimum distance between consecutive query words in order
-    # Try all combinations of positions
-    from itertools import product
-    
-    position_combinations = [word_positions[w] for w in query_words]
-    min_avg_distance = float('inf')
+    # Average words in between per consecutive pair (consecutive = 0)
+    gaps = len(query_words) - 1
+    min_avg_distance = (span - gaps) / gaps
     
-    for combo in product(*position_combinations):
-        # combo is a tuple of positions for each query word
-        # Check if words appear in correct order
-        in_order = all(combo[i] < combo[i+1] for i in range(len(combo) - 1))
-        
-        if not in_order:
-            continue
-        
-        # Calculate total distance
-        total_distance = 0
-        for i in range(len(combo) - 1):
-            distance = combo[i+1] - combo[i] - 1  # -1 because consecutive = distance 0
-            total_distance += distance
-        
-        # Average distance per word pair
-        avg_distance = total_distance / (len(combo) - 1) if len(combo) > 1 else 0
-        min_avg_distance = min(min_avg_distance, avg_distance)
-    
-    if min_avg_distance == float('inf'):
-        return 0.0
-    
-    # Boost calculation: closer = higher boost
-    # Consecutive words (distance=0) get highest boost
-    if min_avg_distance == 0:
-        boost = 2.0  # Consecutive words
-    elif min_avg_distance <= 1:
-        boost = 1.5  # 1 word in between
-    elif min_avg_distance <= 2:
-        boost = 1.0  # 2 words in between
-    elif min_avg_distance <= 3:
-        boost = 0.6  # 3 words in between
-    elif min_avg_distance <= 5:
-        boost = 0.3  # 4-5 words in between
-    else:
-        boost = 0.1  # Far apart
-    
-    return boost
+    # Boost calculation: closer = higher boost (PROXIMITY_BOOST_TIERS)
+    return proximity_boost_for_distance(min_avg_distance)
 
 
 def get_sentences_by_level(
@@ -319,7 +523,7 @@ def get_sentences_by_level(
     buffer_pct = max(10, min(20, buffer_percentage))  # Clamp 10-20%
     buffered_limit = int(limit * (1 + buffer_pct / 100))
     
-    max_level = get_max_level()
+    max_level = corpus_stats.max_level()
     
     if end_level is None:
         end_level = max_level
@@ -339,7 +543,9 @@ def get_sentences_by_level(
     )
     
     # Deduplicate with advanced similarity checking
-    seen = set()
+    seen = NearDuplicateIndex()
+    if exclude_texts and not isinstance(exclude_texts, NearDuplicateIndex):
+        exclude_texts = NearDuplicateIndex(exclude_texts)
     unique = []
     for h in hits:
         t = h["text"]
@@ -384,15 +590,14 @@ def get_top_unique_sentences_grouped(
 
 
 def delete_all_documents():
-    """Xóa tất cả documents trong index"""
+    """Xóa tất cả documents: alias trỏ sang một index rỗng, index cũ bị drop (không delete_by_query)"""
     try:
-        es.delete_by_query(
-            index=INDEX,
-            body={"query": {"match_all": {}}}
-        )
+        flip_alias(create_versioned_index())
         return True
     except Exception:
         return False
+    finally:
+        _index_changed()
 
 
 def delete_documents_by_file(file_id: str):
@@ -400,15 +605,18 @@ def delete_documents_by_file(file_id: str):
     try:
         es.delete_by_query(
             index=INDEX,
-            body={"query": {"term": {"file_id": file_id}}}
+            body={"query": {"term": {"file_id": file_id}}},
+            refresh=True,
         )
         return True
     except Exception:
         return False
+    finally:
+        _index_changed()
 
 
 def get_document_count() -> int:
-    """Đếm số documents trong index"""
+    """Đếm số documents trong index (live query; hot paths use corpus_stats)"""
     try:
         resp = es.count(index=INDEX)
         return resp["count"]
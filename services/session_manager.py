@@ -3,17 +3,29 @@
 Session Manager - Manage conversation state for "Tell me more"
 Stores:
 - User's original question
-- Used source sentences
+- Used source sentences (as compact 64-bit IDs, see SentenceIdSet, plus a
+  near-duplicate sketch of the most recent ones)
 - Current level (0 → 1 → 2 → 3)
 - Level offsets for pagination
 - Extracted keywords
 - History of used question variants (to avoid repetition)
+
+Sessions live in a pluggable SessionStore (memory / sqlite / redis, see
+services/session_store.py). With a shared backend any uvicorn worker can
+serve /continue for a session created by another worker.
 """
 import uuid
-from datetime import datetime, timedelta
-from typing import Dict, List, Set, Optional, Any
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, field
 
+from config import settings
+from services.deduplicator import NearDuplicateIndex, SentenceIdSet
+from services.session_store import SessionStore, InMemorySessionStore, create_session_store
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class ConversationSession:
@@ -37,8 +49,8 @@ class ConversationSession:
     
     # Keywords and sentences
     keywords: List[str] = field(default_factory=list)  # Extracted clean keywords
-    used_sentences: Set[str] = field(default_factory=set)  # Sentences already used
-    used_sentence_ids: List[str] = field(default_factory=list)  # For JSON serialization
+    used_ids: SentenceIdSet = field(default_factory=SentenceIdSet)  # IDs of sentences already used (8 bytes each)
+    used_sketch: str = ""  # Band keys of the most recent used sentences (NearDuplicateIndex.sketch)
     
     # Question variants and meanings
     used_variants: List[str] = field(default_factory=list)  # Question variants already used
@@ -56,7 +68,8 @@ class ConversationSession:
             "current_level": self.current_level,
             "level_offsets": self.level_offsets,
             "biblical_parallels": self.biblical_parallels,
-            "used_sentence_ids": list(self.used_sentences)
+            "used_sentence_ids": self.used_ids,
+            "used_sketch": self.used_sketch,
         }
     
     def update_from_state(self, state: Dict[str, Any]):
@@ -64,20 +77,70 @@ class ConversationSession:
         self.current_level = state.get("current_level", self.current_level)
         self.level_offsets = state.get("level_offsets", self.level_offsets)
         self.biblical_parallels = state.get("biblical_parallels", self.biblical_parallels)
-        new_used = state.get("used_sentence_ids", [])
-        self.used_sentences.update(new_used)
-        self.used_sentence_ids = list(self.used_sentences)
+        new_used = state.get("used_sentence_ids")
+        if new_used and new_used is not self.used_ids:
+            self.used_ids.update(new_used)
+        self.used_sketch = state.get("used_sketch", self.used_sketch)
+
+    def add_used(self, texts: List[str]):
+        """Record sentences shown to the user (IDs + near-duplicate sketch)."""
+        self.used_ids.update(texts)
+        recent = NearDuplicateIndex()
+        recent.load_sketch(self.used_sketch)
+        recent.update(texts)
+        self.used_sketch = recent.sketch(settings.SESSION_SKETCH_LIMIT)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact serializable form (used IDs as base64 of little-endian uint64)."""
+        return {
+            "session_id": self.session_id,
+            "original_query": self.original_query,
+            "current_level": self.current_level,
+            "level_offsets": self.level_offsets,
+            "biblical_parallels": self.biblical_parallels,
+            "keywords": self.keywords,
+            "used_ids": self.used_ids.to_base64(),
+            "used_sketch": self.used_sketch,
+            "used_variants": self.used_variants,
+            "previous_keywords": self.previous_keywords,
+            "created_at": self.created_at.timestamp(),
+            "last_accessed": self.last_accessed.timestamp(),
+            "max_level_available": self.max_level_available,
+            "continue_count": self.continue_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationSession":
+        used = SentenceIdSet.from_base64(data.get("used_ids", ""))
+        # Sessions written before IDs were introduced stored the full texts
+        used.update(data.get("used_sentences", []))
+        return cls(
+            session_id=data["session_id"],
+            original_query=data["original_query"],
+            current_level=data.get("current_level", 0),
+            level_offsets=data.get("level_offsets") or {"0.0": 0, "0": 0, "1": 0, "2": 0, "3": 0, "4": 0},
+            biblical_parallels=data.get("biblical_parallels", {}),
+            keywords=data.get("keywords", []),
+            used_ids=used,
+            used_sketch=data.get("used_sketch", ""),
+            used_variants=data.get("used_variants", []),
+            previous_keywords=data.get("previous_keywords", []),
+            created_at=datetime.fromtimestamp(data["created_at"]),
+            last_accessed=datetime.fromtimestamp(data["last_accessed"]),
+            max_level_available=data.get("max_level_available", 20),
+            continue_count=data.get("continue_count", 0),
+        )
 
 
 class SessionManager:
     """
-    Manage sessions in memory.
-    For production, use Redis/DB.
+    Manage sessions on top of a SessionStore.
+    Sessions are loaded on get_session() and written back by update_session().
     """
     
-    def __init__(self, session_timeout_minutes: int = 30):
-        self._sessions: Dict[str, ConversationSession] = {}
-        self._timeout = timedelta(minutes=session_timeout_minutes)
+    def __init__(self, session_timeout_minutes: int = 30, store: Optional[SessionStore] = None):
+        self._timeout_seconds = session_timeout_minutes * 60
+        self.store = store or InMemorySessionStore(self._timeout_seconds)
     
     def create_session(
         self, 
@@ -93,19 +156,18 @@ class SessionManager:
             max_level_available=max_level,
             keywords=keywords or []
         )
-        self._sessions[session_id] = session
-        self._cleanup_expired()
+        self._save(session)
         return session
     
     def get_session(self, session_id: str) -> Optional[ConversationSession]:
-        """Get session by ID"""
-        session = self._sessions.get(session_id)
-        if session:
-            # Check if expired
-            if datetime.now() - session.last_accessed > self._timeout:
-                del self._sessions[session_id]
-                return None
-            session.last_accessed = datetime.now()
+        """Get session by ID (None if missing or expired)"""
+        data = self.store.get(session_id)
+        if data is None:
+            return None
+        # Memory store hands back the live object; shared stores hand back a dict
+        session = data if isinstance(data, ConversationSession) else ConversationSession.from_dict(data)
+        session.last_accessed = datetime.now()
+        self.store.touch(session_id)
         return session
     
     def update_session(
@@ -122,14 +184,13 @@ class SessionManager:
         if not session:
             return
         
-        # Update from state dict FIRST (contains complete used_sentence_ids)
+        # Update from state dict FIRST (contains the complete used_sentence_ids)
         if state_dict:
             session.update_from_state(state_dict)
         
         # Then add any new sentences from current response
         if used_sentences:
-            session.used_sentences.update(used_sentences)
-            session.used_sentence_ids = list(session.used_sentences)
+            session.add_used(used_sentences)
         
         if question_variants:
             session.used_variants.append(question_variants)
@@ -139,6 +200,8 @@ class SessionManager:
         
         if increment_level:
             session.continue_count += 1
+
+        self._save(session)
     
     def can_continue(self, session_id: str) -> bool:
         """Check if can continue exploring deeper"""
@@ -149,38 +212,43 @@ class SessionManager:
     
     def delete_session(self, session_id: str):
         """Delete session"""
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        self.store.delete(session_id)
     
     def get_active_count(self) -> int:
         """Count active sessions"""
-        self._cleanup_expired()
-        return len(self._sessions)
+        return self.store.count()
     
     def clear_all_sessions(self):
-        """Clear all sessions (for shutdown/cleanup)"""
-        self._sessions.clear()
-    
-    def _cleanup_expired(self):
-        """Remove expired sessions"""
-        now = datetime.now()
-        expired = [
-            sid for sid, session in self._sessions.items()
-            if now - session.last_accessed > self._timeout
-        ]
-        for sid in expired:
-            del self._sessions[sid]
-    
-    def _cleanup_expired(self):
-        """Clean up expired sessions"""
-        now = datetime.now()
-        expired = [
-            sid for sid, sess in self._sessions.items()
-            if now - sess.last_accessed > self._timeout
-        ]
-        for sid in expired:
-            del self._sessions[sid]
+        """Clear all sessions (e.g. after the indexed data was replaced)"""
+        self.store.clear()
+
+    def close(self):
+        """Release backend connections (shutdown)"""
+        self.store.close()
+    
+    def _save(self, session: ConversationSession):
+        if isinstance(self.store, InMemorySessionStore):
+            self.store.put(session.session_id, session)
+        else:
+            self.store.put(session.session_id, session.to_dict())
+
+
+def _create_session_manager() -> SessionManager:
+    ttl_seconds = settings.SESSION_TTL_MINUTES * 60
+    try:
+        store = create_session_store(
+            settings.SESSION_BACKEND,
+            ttl_seconds,
+            sqlite_path=settings.SESSION_SQLITE_PATH,
+            redis_url=settings.SESSION_REDIS_URL,
+        )
+    except Exception as e:
+        # No silent fallback: per-worker memory sessions would break /continue across workers
+        logger.error(f"[SessionManager] Session backend '{settings.SESSION_BACKEND}' unavailable: {e}")
+        raise
+    print(f"Session store ready: {store.name}")
+    return SessionManager(session_timeout_minutes=settings.SESSION_TTL_MINUTES, store=store)
 
 
 # Global session manager instance
-session_manager = SessionManager()
+session_manager = _create_session_manager()
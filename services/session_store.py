@@ -0,0 +1,302 @@
+# services/session_store.py
+"""
+Session Store - Where ConversationSession state lives
+
+Backends (SESSION_BACKEND):
+- memory : process-local dict (single uvicorn worker only)
+- sqlite : one SQLite file shared by every worker on the host
+- redis  : any Redis-protocol server, shared across hosts (native key TTL)
+
+Shared backends store sessions as compact bytes (see encode_session) and
+expire them after `ttl_seconds` without access (sliding expiry).
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Payloads above this size are zlib-compressed (used sentence lists grow quickly)
+_COMPRESS_MIN_BYTES = 512
+_RAW, _ZLIB = b"j", b"z"
+
+
+def encode_session(data: Dict[str, Any]) -> bytes:
+    """Compact JSON, zlib-compressed when large. First byte tells which."""
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) >= _COMPRESS_MIN_BYTES:
+        return _ZLIB + zlib.compress(raw, 6)
+    return _RAW + raw
+
+
+def decode_session(blob: bytes) -> Dict[str, Any]:
+    if blob[:1] == _ZLIB:
+        return json.loads(zlib.decompress(blob[1:]))
+    return json.loads(blob[1:])
+
+
+class SessionStore(ABC):
+    """
+    Interface for session backends. Shared backends take plain dicts
+    (ConversationSession.to_dict()) and serialize them; expiry is measured
+    from the last put/touch.
+    """
+    name = "base"
+    shared = False  # True when several processes see the same sessions
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def put(self, session_id: str, data: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def touch(self, session_id: str):
+        """Extend the expiry of an existing session."""
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    def close(self):
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store (the original behaviour). Keeps the objects as-is, no serialization."""
+    name = "memory"
+
+    def __init__(self, ttl_seconds: int):
+        super().__init__(ttl_seconds)
+        self._items: Dict[str, tuple] = {}  # session_id -> (expires_at, session)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._items[session_id]
+                return None
+            return item[1]
+
+    def put(self, session_id: str, data: Any):
+        with self._lock:
+            self._items[session_id] = (time.time() + self.ttl_seconds, data)
+            self._purge_expired()
+
+    def touch(self, session_id: str):
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is not None:
+                self._items[session_id] = (time.time() + self.ttl_seconds, item[1])
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._items.pop(session_id, None)
+
+    def count(self) -> int:
+        with self._lock:
+            self._purge_expired()
+            return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [sid for sid, (expires_at, _) in self._items.items() if expires_at < now]
+        for sid in expired:
+            del self._items[sid]
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    File-backed store shared by all workers on one host.
+    Same connection setup as DiskLRUCache: WAL + busy timeout, one connection per thread.
+    """
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str, ttl_seconds: int, purge_every: int = 200, table: str = "sessions"):
+        super().__init__(ttl_seconds)
+        self.path = path
+        self.table = table  # several stores (sessions, prefetched batches) can share one file
+        self.purge_every = max(1, purge_every)
+        self._local = threading.local()
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                session_id TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_expires_at ON {self.table}(expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT data FROM {self.table} WHERE session_id = ? AND expires_at >= ?",
+            (session_id, time.time()),
+        ).fetchone()
+        return decode_session(row[0]) if row else None
+
+    def put(self, session_id: str, data: Dict[str, Any]):
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} (session_id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, sqlite3.Binary(encode_session(data)), time.time() + self.ttl_seconds),
+        )
+        with self._lock:
+            self._puts += 1
+            should_purge = self._puts % self.purge_every == 0
+        if should_purge:
+            self.purge_expired()
+
+    def touch(self, session_id: str):
+        self._conn().execute(
+            f"UPDATE {self.table} SET expires_at = ? WHERE session_id = ?",
+            (time.time() + self.ttl_seconds, session_id),
+        )
+
+    def delete(self, session_id: str):
+        self._conn().execute(f"DELETE FROM {self.table} WHERE session_id = ?", (session_id,))
+
+    def count(self) -> int:
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM {self.table} WHERE expires_at >= ?", (time.time(),)
+        ).fetchone()[0]
+
+    def clear(self):
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def purge_expired(self) -> int:
+        removed = self._conn().execute(
+            f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),)
+        ).rowcount
+        if removed:
+            logger.info(f"[SessionStore] Purged {removed} expired {self.table} from {self.path}")
+        return removed
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store for any Redis-protocol server (Redis, Valkey, KeyDB, ...).
+    Expiry uses the server's own key TTL (SET EX / EXPIRE).
+    Requires the optional `redis` package; the server is pinged on creation
+    so an unreachable backend fails at startup, not on the first /ask.
+
+    A sorted set (session id → expiry time) is kept next to the sessions so
+    count() (/health) is two cheap commands instead of a SCAN of the keyspace.
+    """
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "session:", client: Any = None):
+        super().__init__(ttl_seconds)
+        self.prefix = prefix
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+            client = redis.Redis.from_url(url)
+        client.ping()
+        self._client = client
+        self._index = f"{prefix}index"
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        blob = self._client.get(self._key(session_id))
+        return decode_session(blob) if blob is not None else None
+
+    def put(self, session_id: str, data: Dict[str, Any]):
+        self._client.set(self._key(session_id), encode_session(data), ex=self.ttl_seconds)
+        self._client.zadd(self._index, {session_id: time.time() + self.ttl_seconds})
+
+    def touch(self, session_id: str):
+        if self._client.expire(self._key(session_id), self.ttl_seconds):
+            self._client.zadd(self._index, {session_id: time.time() + self.ttl_seconds})
+
+    def delete(self, session_id: str):
+        self._client.delete(self._key(session_id))
+        self._client.zrem(self._index, session_id)
+
+    def count(self) -> int:
+        self._client.zremrangebyscore(self._index, "-inf", time.time())
+        return self._client.zcard(self._index)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f"{self.prefix}*", count=500))
+        for i in range(0, len(keys), 500):
+            self._client.delete(*keys[i:i + 500])
+
+    def close(self):
+        close = getattr(self._client, "close", None)
+        if close is not None:
+            close()
+
+
+def create_session_store(
+    backend: str,
+    ttl_seconds: int,
+    sqlite_path: str = None,
+    redis_url: str = None,
+    table: str = "sessions",
+    prefix: str = "session:",
+) -> SessionStore:
+    """Build the store selected by SESSION_BACKEND (table/prefix select the namespace)."""
+    backend = (backend or "memory").lower()
+    if backend == "memory":
+        return InMemorySessionStore(ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteSessionStore(sqlite_path, ttl_seconds, table=table)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, ttl_seconds, prefix=prefix)
+    raise ValueError(f"Unknown SESSION_BACKEND '{backend}'. Valid: memory, sqlite, redis")
@@ -1,7 +1,13 @@
 # services/splitter.py
+from typing import Iterable, Iterator, List, Tuple
 from nltk.tokenize import sent_tokenize
 import re
 
+# Streaming split: "auto" picks line or NLTK mode from this much leading text
+AUTO_SAMPLE_CHARS = 256 * 1024
+# An unterminated sentence/line longer than this is emitted as is (bounds memory)
+MAX_PENDING_CHARS = 1024 * 1024
+
 
 def clean_text(text: str) -> str:
     """Clean raw text before processing"""
@@ -45,6 +51,16 @@ def clean_sentence(text: str) -> str:
     return text.strip()
 
 
+def _keep_sentences(sentences: Iterable[str]) -> List[str]:
+    """Clean sentences, keeping those with at least 3 chars and some letters."""
+    cleaned = []
+    for s in sentences:
+        s = clean_sentence(s)
+        if s and len(s) >= 3 and re.search(r'[a-zA-Z]', s):
+            cleaned.append(s)
+    return cleaned
+
+
 def split_into_sentences(text: str, split_mode: str = "auto") -> list[str]:
     """
     Split text into sentences.
@@ -101,17 +117,98 @@ def split_into_sentences(text: str, split_mode: str = "auto") -> list[str]:
                     sentences = text.split('\n')
         
         # Clean and filter sentences
-        cleaned = []
-        for s in sentences:
-            s = clean_sentence(s)
-            # Only include sentences with at least 3 chars and some letters
-            if s and len(s) >= 3 and re.search(r'[a-zA-Z]', s):
-                cleaned.append(s)
-        
-        return cleaned
+        return _keep_sentences(sentences)
         
     except Exception as e:
         print(f"[Splitter] Error: {e}, using simple line split")
         # Ultimate fallback
         lines = text.split('\n')
         return [l.strip() for l in lines if l.strip() and len(l.strip()) >= 3]
+
+
+# ============================================================
+# Streaming split (upload → ingest without holding the whole text)
+# ============================================================
+
+def _detect_split_mode(sample: str) -> str:
+    """Auto mode decision of split_into_sentences, made on a sample: "line" or "nltk"."""
+    non_empty_lines = [l.strip() for l in sample.split('\n') if l.strip()]
+    if non_empty_lines:
+        avg_line_len = sum(len(l) for l in non_empty_lines) / len(non_empty_lines)
+        if len(non_empty_lines) > 100 and avg_line_len < 200:
+            print(f"[Splitter] Auto-detected line-per-sentence format ({len(non_empty_lines)} lines in sample, avg {avg_line_len:.0f} chars)")
+            return "line"
+    print(f"[Splitter] Using NLTK sentence tokenizer")
+    return "nltk"
+
+
+def _tokenize(text: str) -> List[str]:
+    try:
+        return sent_tokenize(text)
+    except Exception as e:
+        print(f"[Splitter] NLTK failed: {e}, falling back to line mode")
+        return [l for l in text.split('\n') if l.strip()]
+
+
+def _split_pending(pending: str, mode: str, final: bool) -> Tuple[str, List[str]]:
+    """
+    Split off the sentences of `pending` that are complete.
+    Returns (text still pending, sentences); with final=True nothing stays pending.
+    """
+    if final:
+        parts = pending.split('\n') if mode == "line" else _tokenize(pending)
+        return "", _keep_sentences(parts)
+    if mode == "line":
+        head, sep, tail = pending.rpartition('\n')
+        if sep:
+            return tail, _keep_sentences(head.split('\n'))
+    else:
+        parts = _tokenize(pending)
+        # The last sentence may continue in the next chunk; everything before it is final
+        cut = pending.rfind(parts[-1]) if len(parts) > 1 else -1
+        if cut > 0:
+            return pending[cut:], _keep_sentences(parts[:-1])
+    if len(pending) > MAX_PENDING_CHARS:
+        return "", _keep_sentences([pending])
+    return pending, []
+
+
+def _clean_chunks(chunks: Iterable[str]) -> Iterator[str]:
+    """clean_text per chunk; a trailing CR waits for the next chunk (CRLF split across chunks)."""
+    held = ""
+    for chunk in chunks:
+        chunk = held + chunk
+        held = ""
+        if chunk.endswith('\r'):
+            chunk, held = chunk[:-1], '\r'
+        if chunk:
+            yield clean_text(chunk)
+    if held:
+        yield clean_text(held)
+
+
+def iter_sentences(chunks: Iterable[str], split_mode: str = "auto") -> Iterator[str]:
+    """
+    Generator variant of split_into_sentences for text arriving in chunks.
+
+    Sentences are yielded as soon as they are complete, including sentences
+    spanning chunk boundaries, so memory stays around one chunk whatever the
+    text size. "auto" decides line vs NLTK mode from the first
+    AUTO_SAMPLE_CHARS characters (the whole text when shorter).
+    """
+    mode = split_mode if split_mode in ("line", "nltk") else None
+    pending = ""
+    for chunk in _clean_chunks(chunks):
+        pending += chunk
+        if mode is None:
+            if len(pending) < AUTO_SAMPLE_CHARS:
+                continue
+            mode = _detect_split_mode(pending)
+        pending, sentences = _split_pending(pending, mode, final=False)
+        yield from sentences
+    if not pending.strip():
+        return
+    if mode is None:
+        mode = _detect_split_mode(pending)
+    _, sentences = _split_pending(pending, mode, final=True)
+    yield from sentences
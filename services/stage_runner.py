@@ -0,0 +1,211 @@
+# services/stage_runner.py
+"""
+Stage Runner - Run request stages as a dependency graph
+
+Each stage declares the stages it needs. Stages whose dependencies are done
+start immediately, so independent LLM/ES calls overlap and a request takes
+roughly its critical path instead of the sum of all calls.
+
+Blocking functions run in worker threads (asyncio.to_thread); coroutine
+functions are awaited directly (useful for fan-out inside a stage).
+iterate_in_thread() bridges a blocking iterator (streamed LLM tokens) to
+an async generator.
+
+Usage:
+    graph = StageGraph()
+    graph.add("keywords", extract_keywords, query)
+    graph.add("synonyms", lambda r: synonyms_for(r["keywords"]), deps=["keywords"])
+    results = await graph.run()
+    graph.add("answer", call_llm, build_prompt(results))
+    await graph.run()  # later calls only run stages added since the last run
+    graph.timings()  # per-stage start/end/duration in ms
+"""
+import time
+import asyncio
+import inspect
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """One node of the graph. fn receives the results dict when it has deps."""
+    name: str
+    fn: Callable[..., Any]
+    args: tuple = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    deps: List[str] = field(default_factory=list)
+    started: Optional[float] = None
+    ended: Optional[float] = None
+
+
+class StageGraph:
+    """Small async DAG executor with per-stage timing."""
+
+    def __init__(self, label: str = "stages", on_stage_done: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.label = label
+        # Called on the event loop as on_stage_done(name, results) after each stage
+        self.on_stage_done = on_stage_done
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self._origin: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[..., Any], *args, deps: Sequence[str] = (), **kwargs) -> "StageGraph":
+        """
+        Register a stage.
+
+        Without deps, fn(*args, **kwargs) is called.
+        With deps, fn(results, *args, **kwargs) is called once every dep is done.
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' already registered")
+        missing = [d for d in deps if d not in self.stages]
+        if missing:
+            # Deps must be registered first, which also rules out cycles
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {missing}")
+        self.stages[name] = Stage(name=name, fn=fn, args=args, kwargs=kwargs, deps=list(deps))
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        """Execute every pending stage; the first failure cancels the rest and is re-raised."""
+        if self._origin is None:
+            self._origin = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        for name, stage in self.stages.items():
+            if name not in self.results:
+                tasks[name] = asyncio.ensure_future(self._run_stage(stage, tasks))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            self._finished = time.perf_counter()
+        logger.info(f"[StageGraph] {self.label}: {self.summary()}")
+        return self.results
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task]):
+        pending = [tasks[d] for d in stage.deps if d in tasks]
+        if pending:
+            await asyncio.gather(*pending)
+        args = ((self.results,) if stage.deps else ()) + stage.args
+        stage.started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(stage.fn):
+                result = await stage.fn(*args, **stage.kwargs)
+            else:
+                result = await asyncio.to_thread(stage.fn, *args, **stage.kwargs)
+        finally:
+            stage.ended = time.perf_counter()
+        self.results[stage.name] = result
+        if self.on_stage_done is not None:
+            self.on_stage_done(stage.name, self.results)
+        return result
+
+    def record(self, name: str, started: float, ended: float, result: Any = None, deps: Sequence[str] = ()):
+        """Add timing for work done outside run() (e.g. a streamed LLM answer)."""
+        if self._origin is None:
+            self._origin = started
+        self.stages[name] = Stage(name=name, fn=lambda: result, deps=list(deps), started=started, ended=ended)
+        self.results[name] = result
+        self._finished = max(self._finished or ended, ended)
+
+    # ---------- Timing report ----------
+    def timings(self) -> Dict[str, Any]:
+        """Per-stage timings (ms since graph start), plus total and critical path."""
+        stages = {}
+        for name, stage in self.stages.items():
+            if stage.started is None:
+                continue
+            end = stage.ended if stage.ended is not None else stage.started
+            stages[name] = {
+                "start_ms": round((stage.started - self._origin) * 1000, 1),
+                "end_ms": round((end - self._origin) * 1000, 1),
+                "duration_ms": round((end - stage.started) * 1000, 1),
+                "deps": stage.deps,
+            }
+        sequential = sum(s["duration_ms"] for s in stages.values())
+        total = round((self._finished - self._origin) * 1000, 1) if self._finished and self._origin else 0.0
+        return {
+            "stages": stages,
+            "critical_path": self.critical_path(),
+            "total_ms": total,
+            "sequential_ms": round(sequential, 1),
+        }
+
+    def critical_path(self) -> List[str]:
+        """
+        Chain of stages that determined the finish time.
+
+        Each step follows the latest-finishing dependency; a stage added for a
+        later run() follows the last stage that finished before it started.
+        """
+        done = [s for s in self.stages.values() if s.ended is not None]
+        if not done:
+            return []
+        current = max(done, key=lambda s: s.ended)
+        path = [current.name]
+        while True:
+            if current.deps:
+                previous = [self.stages[d] for d in current.deps]
+            else:
+                previous = [s for s in done if s.ended <= current.started]
+            if not previous:
+                break
+            current = max(previous, key=lambda s: s.ended)
+            path.append(current.name)
+        return list(reversed(path))
+
+    def summary(self) -> str:
+        report = self.timings()
+        parts = [f"{n}={s['duration_ms']:.0f}ms" for n, s in report["stages"].items()]
+        return (
+            f"total {report['total_ms']:.0f}ms (sequential {report['sequential_ms']:.0f}ms), "
+            f"critical path {' → '.join(report['critical_path'])} | " + ", ".join(parts)
+        )
+
+
+async def iterate_in_thread(fn: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+    """
+    Consume a blocking iterator (e.g. a streaming LLM response) in a worker
+    thread and yield its items on the event loop as they arrive.
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def pump():
+        iterator = fn(*args, **kwargs)
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    # Consumer went away (e.g. client disconnected)
+                    break
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        except BaseException as e:
+            loop.call_soon_threadsafe(items.put_nowait, e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            loop.call_soon_threadsafe(items.put_nowait, done)
+
+    worker = asyncio.ensure_future(asyncio.to_thread(pump))
+    try:
+        while True:
+            item = await items.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        await worker
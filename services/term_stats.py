@@ -0,0 +1,99 @@
+# services/term_stats.py
+"""
+Term Stats - Corpus statistics that prove keyword combinations cannot match
+
+Level 0/2 search every combination of keywords/synonyms with an AND query.
+One size-0 search with a `filters` aggregation counts, for the terms of a
+walk, the documents containing each term and each pair of terms. A
+combination containing a term with no documents, or a pair that never
+co-occurs, cannot match any document (AND over a superset of tokens), so
+its search is skipped. Nothing that could match is ever pruned.
+"""
+import logging
+import threading
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from vector.elastic_client import es
+from config import settings
+
+logger = logging.getLogger(__name__)
+INDEX = settings.ES_INDEX_NAME
+
+# Pair buckets grow quadratically; beyond this many terms only single-term stats are collected
+MAX_PAIR_TERMS = 12
+
+_counters = {"stats_requests": 0, "combinations_checked": 0, "searches_avoided": 0}
+_lock = threading.Lock()
+
+
+def _term_query(term: str) -> Dict:
+    # Same semantics as the walk's multi_match with operator "and"
+    return {"match": {"text": {"query": term, "operator": "and"}}}
+
+
+class TermStats:
+    """Document counts for single terms and term pairs of one walk."""
+
+    def __init__(self, doc_freq: Dict[str, int], pair_counts: Dict[Tuple[str, str], int]):
+        self.doc_freq = doc_freq
+        self.pair_counts = pair_counts
+
+    def can_match(self, combo: Iterable[str]) -> bool:
+        combo = list(combo)
+        if any(self.doc_freq.get(term, 1) == 0 for term in combo):
+            return False
+        for a, b in combinations(sorted(set(combo)), 2):
+            if self.pair_counts.get((a, b), 1) == 0:
+                return False
+        return True
+
+
+def collect_term_stats(terms: List[str]) -> Optional[TermStats]:
+    """
+    One aggregation request for all term / pair counts.
+    Returns None on errors (callers then search every combination).
+    """
+    terms = list(dict.fromkeys(t for t in terms if t))
+    if not terms:
+        return None
+    filters: Dict[str, Dict] = {f"t{i}": _term_query(t) for i, t in enumerate(terms)}
+    pairs: Dict[str, Tuple[str, str]] = {}
+    if len(terms) <= MAX_PAIR_TERMS:
+        for i, j in combinations(range(len(terms)), 2):
+            key = f"p{i}_{j}"
+            pairs[key] = tuple(sorted((terms[i], terms[j])))
+            filters[key] = {"bool": {"filter": [_term_query(terms[i]), _term_query(terms[j])]}}
+    try:
+        resp = es.search(
+            index=INDEX,
+            size=0,
+            track_total_hits=False,
+            aggs={"terms_stats": {"filters": {"filters": filters}}},
+        )
+    except Exception as e:
+        logger.warning(f"[TermStats] Could not collect term statistics: {e}")
+        return None
+    with _lock:
+        _counters["stats_requests"] += 1
+
+    buckets = resp["aggregations"]["terms_stats"]["buckets"]
+    doc_freq = {t: buckets[f"t{i}"]["doc_count"] for i, t in enumerate(terms)}
+    pair_counts = {pair: buckets[key]["doc_count"] for key, pair in pairs.items()}
+    logger.info(
+        f"[TermStats] {len(terms)} terms: df={doc_freq}, "
+        f"{sum(1 for c in pair_counts.values() if c == 0)}/{len(pair_counts)} pairs never co-occur"
+    )
+    return TermStats(doc_freq, pair_counts)
+
+
+def record_pruning(checked: int, avoided: int):
+    with _lock:
+        _counters["combinations_checked"] += checked
+        _counters["searches_avoided"] += avoided
+
+
+def pruning_stats() -> Dict[str, int]:
+    """Process-wide counters: how many combination searches the statistics avoided."""
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,78 @@
+# services/text_decoder.py
+"""
+Text Decoder - Encoding detection on a sample + incremental decoding of uploads
+
+The encoding is chosen from the first SAMPLE_BYTES of the (spooled) upload
+with the same rules /upload always used: strict UTF-8 when it decodes to
+mostly printable text, else the first Windows/legacy encoding that does.
+The file is then decoded chunk by chunk with an incremental decoder, so
+multi-byte characters split across chunks are handled and the whole text
+never exists as one string.
+"""
+import codecs
+from typing import BinaryIO, Iterator
+
+# Bytes examined to pick the encoding
+SAMPLE_BYTES = 64 * 1024
+# Tried in order when UTF-8 fails - cp1252 first for Windows files with smart quotes
+FALLBACK_ENCODINGS = ["cp1252", "utf-8-sig", "utf-16", "iso-8859-1", "latin-1"]
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def _printable_ratio(text: str) -> float:
+    head = text[:1000]
+    if not head:
+        return 0.0
+    return sum(1 for c in head if c.isprintable() or c in '\n\r\t') / len(head)
+
+
+def _decode_sample(sample: bytes, encoding: str) -> str:
+    # final=False: the sample may end in the middle of a character
+    return codecs.getincrementaldecoder(encoding)(errors="strict").decode(sample, final=False)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Encoding for an upload, judged on its first bytes (UTF-8 with replacement as last resort)."""
+    try:
+        text = _decode_sample(sample, "utf-8")
+        ratio = _printable_ratio(text)
+        if ratio > 0.95:
+            print(f"[Upload] Detected UTF-8 (printable ratio: {ratio:.2%})")
+            return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            ratio = _printable_ratio(_decode_sample(sample, encoding))
+        except (UnicodeDecodeError, LookupError):
+            continue
+        if ratio > 0.90:
+            print(f"[Upload] Detected {encoding} (printable ratio: {ratio:.2%})")
+            return encoding
+
+    print(f"[Upload] Warning: Using fallback decoding with character replacement")
+    return "utf-8"
+
+
+def iter_text_chunks(
+    fileobj: BinaryIO,
+    encoding: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[str]:
+    """
+    Decode a binary file chunk by chunk. Bytes that are invalid in `encoding`
+    (past the detection sample) become U+FFFD instead of failing the upload.
+    Null bytes are removed.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        data = fileobj.read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data).replace("\x00", "")
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True).replace("\x00", "")
+    if tail:
+        yield tail
@@ -9,6 +9,7 @@ import requests
 import json
 import os
 import io
+import time
 from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -106,6 +107,31 @@ def upload_file(file, split_mode: str = "auto"):
         return {"detail": f"Unexpected error: {str(e)[:200]}"}, 500
 
 
+def get_job_status(job_id: str):
+    """Progress of an ingest job queued by /upload"""
+    try:
+        response = requests.get(f"{API_BASE_URL}/jobs/{job_id}", timeout=10)
+        return response.json(), response.status_code
+    except requests.exceptions.RequestException as e:
+        return {"detail": f"Job status error: {str(e)[:200]}"}, 500
+
+
+def wait_for_job(job_id: str, progress_bar, poll_seconds: float = 1.0):
+    """Poll /jobs/{job_id} until the ingest ends; returns the last status."""
+    while True:
+        job, status_code = get_job_status(job_id)
+        if status_code != 200:
+            return job
+        eta = f", ~{int(job['eta_seconds'])}s left" if job.get("eta_seconds") is not None else ""
+        progress_bar.progress(
+            min(1.0, job.get("progress", 0.0)),
+            text=f"{job['sentences_indexed']} sentences indexed ({job['status']}{eta})",
+        )
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        time.sleep(poll_seconds)
+
+
 def ask_question(query: str, custom_prompt: Optional[str] = None, 
                  limit: int = 15, buffer_percentage: int = 15, enabled_levels: Optional[List[int]] = None):
     """Send a question to the API"""
@@ -329,12 +355,17 @@ with st.sidebar:
         if st.button("📤 Upload", disabled=uploaded_file is None):
             with st.spinner("Uploading and processing..."):
                 result, status_code = upload_file(uploaded_file)
-                if status_code == 200:
-                    st.success(f"✅ Uploaded! {result.get('total_sentences', 0)} sentences indexed.")
+            if status_code == 202:
+                # Indexing runs as a background job on the API
+                job = wait_for_job(result["job_id"], st.progress(0.0, text="Indexing..."))
+                if job.get("status") == "done":
+                    st.success(f"✅ Uploaded! {job.get('sentences_indexed', 0)} sentences indexed.")
                     st.session_state.conversation_history = []
                     st.session_state.session_id = None
                 else:
-                    st.error(f"❌ Error: {result.get('detail', 'Unknown error')}")
+                    st.error(f"❌ Indexing {job.get('status', 'failed')}: {job.get('error') or job.get('detail', 'Unknown error')}")
+            else:
+                st.error(f"❌ Error: {result.get('detail', 'Unknown error')}")
     
     with col2:
         if st.button("🗑️ Delete All"):
@@ -0,0 +1,253 @@
+"""
+Shared test doubles for the ingest / index tests: an in-memory Elasticsearch
+and pytest fixtures that patch it (and the embedding call) in with monkeypatch.
+No Elasticsearch or API key needed.
+
+    def test_something(fake_es, embedded):
+        fake_es.add_index(ALIAS)
+        IngestPipeline(index=ALIAS, file_id="f").run(["In the beginning."])
+        assert embedded == ["In the beginning."] and fake_es.docs()["f:0"]["level"] == 0
+"""
+import sys
+import json
+import time
+import random
+import fnmatch
+import threading
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import settings
+from services import corpus_stats, ingest_pipeline, incremental_replace, retriever
+from services.deduplicator import text_hash
+from vector import elastic_client
+
+ALIAS = settings.ES_INDEX_NAME
+
+
+class FakeES:
+    """
+    Indices, aliases, settings, _bulk, mget, point-in-time scans, segment
+    stats, force-merge and cluster health, all in memory. Also usable as
+    es.indices / es.cluster / es.options(...).
+
+    Failure injection: fail_after_requests (bulk), jitter (slow, out-of-order
+    bulk responses), down (cluster health), text_fields (terms aggregations
+    rejected as on a text field; the .keyword subfield works).
+    """
+
+    def __init__(self):
+        self.data = {}  # physical index -> {_id: doc}
+        self.index_settings = {}  # physical index -> {name: value}
+        self.aliases = {}  # alias -> set of indices
+        self.merged = []
+        self.calls = []  # ("put_settings", index, values) / ("refresh", index) / ("forcemerge", index, segments)
+        self.bulks = []  # (refresh param, settings of the index during the request)
+        self.requests = 0
+        self.fail_after_requests = None
+        self.jitter = 0.0
+        self.down = False
+        self.round_trips = 0  # health / search / stats calls
+        self.open_pits = 0
+        self.text_fields = set()  # fields mapped as text (dynamic mapping): no terms aggregation
+        self.indices = self
+        self.cluster = self
+        self._auto_ids = 0
+        self._lock = threading.Lock()
+
+    def add_index(self, name, index_settings=None, docs=None):
+        """Create a physical index directly (no alias); docs without _id get generated ids."""
+        self.data[name] = {}
+        self.index_settings[name] = {k: str(v) for k, v in (index_settings or {}).items()}
+        for doc in docs or []:
+            self.data[name][self._next_id()] = dict(doc)
+        return name
+
+    def _next_id(self):
+        self._auto_ids += 1
+        return f"auto-{self._auto_ids}"
+
+    def _resolve(self, name):
+        names = self.aliases.get(name) or {name}
+        assert len(names) == 1 and next(iter(names)) in self.data, f"no single index behind {name}"
+        return next(iter(names))
+
+    def docs(self, name=ALIAS):
+        return self.data[self._resolve(name)]
+
+    def settings_of(self, name=ALIAS):
+        return self.index_settings.setdefault(self._resolve(name), {})
+
+    # ---- es.cluster ----
+    def health(self):
+        self.round_trips += 1
+        if self.down:
+            raise ConnectionError("connection refused")
+        return {"status": "green"}
+
+    # ---- es.indices ----
+    def exists(self, index):
+        return index in self.data or index in self.aliases
+
+    def exists_alias(self, name):
+        return name in self.aliases
+
+    def get_alias(self, name):
+        return {index: {"aliases": {name: {}}} for index in self.aliases[name]}
+
+    def create(self, index, body):
+        assert index not in self.data and index not in self.aliases
+        self.add_index(index)
+
+    def delete(self, index, ignore_unavailable=False):
+        self.data.pop(index, None)
+        for names in self.aliases.values():
+            names.discard(index)
+
+    def get(self, index, ignore_unavailable=False):
+        return {name: {} for name in self.data if fnmatch.fnmatch(name, index)}
+
+    def update_aliases(self, body):
+        for action in body["actions"]:
+            op, spec = next(iter(action.items()))
+            if op == "add":
+                assert spec["index"] in self.data and spec["alias"] not in self.data
+                self.aliases.setdefault(spec["alias"], set()).add(spec["index"])
+            elif op == "remove":
+                self.aliases[spec["alias"]].discard(spec["index"])
+            else:
+                self.data.pop(spec["index"])
+
+    def refresh(self, index):
+        self.calls.append(("refresh", index))
+
+    def get_settings(self, index):
+        name = self._resolve(index)
+        return {name: {"settings": {"index": dict(self.settings_of(name))}}}
+
+    def put_settings(self, index, body):
+        values = self.settings_of(index)
+        self.calls.append(("put_settings", index, dict(body["index"])))
+        for name, value in body["index"].items():
+            if value is None:
+                values.pop(name, None)
+            else:
+                values[name] = str(value)
+
+    def stats(self, index, metric):
+        self.round_trips += 1
+        name = self._resolve(index)
+        return {"_all": {"primaries": {
+            "segments": {"count": 1 if name in self.merged else 9},
+            "store": {"size_in_bytes": 1000 * len(self.data[name])},
+        }}}
+
+    def options(self, **kwargs):
+        return self
+
+    def forcemerge(self, index, max_num_segments):
+        self.calls.append(("forcemerge", index, max_num_segments))
+        self.merged.append(self._resolve(index))
+
+    # ---- documents ----
+    def bulk(self, body, refresh=None):
+        lines = [json.loads(line) for line in body.decode("utf-8").strip().split("\n")]
+        target = lines[0]["index"]["_index"]
+        with self._lock:
+            self.requests += 1
+            if self.fail_after_requests is not None and self.requests > self.fail_after_requests:
+                raise ConnectionError("elasticsearch went away")
+            self.bulks.append((refresh, dict(self.settings_of(target))))
+        if self.jitter:
+            time.sleep(random.random() * self.jitter)
+        with self._lock:
+            for meta, doc in zip(lines[::2], lines[1::2]):
+                self.docs(meta["index"]["_index"])[meta["index"].get("_id") or self._next_id()] = doc
+        return {"errors": False, "items": []}
+
+    def mget(self, index, body, _source):
+        docs = self.docs(index)
+        return {"docs": [
+            {"_id": i, "found": True, "_source": {f: docs[i][f] for f in _source}} if i in docs
+            else {"_id": i, "found": False}
+            for i in body["ids"]
+        ]}
+
+    def open_point_in_time(self, index, keep_alive):
+        self.open_pits += 1
+        self._snapshot = sorted(self.docs(index).items())
+        return {"id": "pit-1"}
+
+    def close_point_in_time(self, id):
+        self.open_pits -= 1
+
+    def search(self, body, index=None):
+        self.round_trips += 1
+        if "pit" in body:
+            return self._pit_page(body)
+        docs = list(self.docs(index).values())
+        if "aggs" in body:  # corpus statistics
+            return {
+                "hits": {"total": {"value": len(docs), "relation": "eq"}, "hits": []},
+                "aggregations": {name: self._aggregate(agg, docs) for name, agg in body["aggs"].items()},
+            }
+        if "query" in body or "knn" in body:  # latency probes of the force-merge report
+            return {"took": 2 if self._resolve(index) in self.merged else 7, "hits": {"hits": []}}
+        return {"took": 1, "hits": {"hits": [{"_source": doc} for doc in docs[:body.get("size", 10)]]}}
+
+    def _aggregate(self, agg, docs):
+        if "max" in agg:
+            values = [doc[agg["max"]["field"]] for doc in docs]
+            return {"value": float(max(values)) if values else None}
+        name = agg["terms"]["field"]
+        if name in self.text_fields:
+            raise ValueError(f"illegal_argument_exception: Fielddata is disabled on text fields by default [{name}]")
+        name = name[:-len(".keyword")] if name.endswith(".keyword") else name
+        counts = {}
+        for doc in docs:
+            counts[doc[name]] = counts.get(doc[name], 0) + 1
+        return {"buckets": [{"key": k, "doc_count": v} for k, v in counts.items()]}
+
+    def _pit_page(self, body):
+        start = body["search_after"][0] + 1 if "search_after" in body else 0
+        page = self._snapshot[start:start + body["size"]]
+        hits = []
+        for offset, (doc_id, doc) in enumerate(page):
+            fields = {name: [doc[name]] for name in body["docvalue_fields"] if name in doc}
+            hits.append({"_id": doc_id, "fields": fields, "sort": [start + offset]})
+        return {"pit_id": "pit-1", "hits": {"hits": hits}}
+
+
+@pytest.fixture
+def fake_es(monkeypatch):
+    """FakeES as the client of every ingest / index module; no cache or stats side effects."""
+    fake = FakeES()
+    for module in (ingest_pipeline, incremental_replace, elastic_client, corpus_stats):
+        monkeypatch.setattr(module, "es", fake)
+    monkeypatch.setattr(retriever, "_index_changed", lambda: None)
+    return fake
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Texts sent to the embedding API, in call order (vector derived from the text)."""
+    texts = []
+
+    def embed(batch):
+        texts.extend(batch)
+        return [[float(int(text_hash(t)[:6], 16))] for t in batch]
+
+    monkeypatch.setattr(ingest_pipeline, "get_embeddings_batch", embed)
+    return texts
+
+
+@pytest.fixture
+def small_bulks(monkeypatch):
+    """One worker per stage and ~5 documents per bulk request: writes land in order."""
+    monkeypatch.setattr(settings, "INGEST_EMBED_WORKERS", 1)
+    monkeypatch.setattr(settings, "INGEST_BULK_WORKERS", 1)
+    monkeypatch.setattr(settings, "INGEST_BULK_MAX_BYTES", 1200)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Local tests for ingest-time index tuning (vector/elastic_client.py
+bulk_load_settings / force_merge, used by index_sentences_pipelined):
+refresh (and replicas on a new generation) suspended during the load,
+original settings restored, one final refresh, optional force-merge report.
+No Elasticsearch or API key needed.
+
+Run: python tests/test_bulk_load_tuning.py
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import settings
+from services import ingest_pipeline, retriever
+from vector import elastic_client
+from vector.elastic_client import bulk_load_settings
+
+ALIAS = settings.ES_INDEX_NAME
+LINES = [f"Verse {i}: the word of the Lord." for i in range(60)]
+
+
+@pytest.fixture(autouse=True)
+def several_bulk_requests(monkeypatch, embedded):
+    monkeypatch.setattr(settings, "INGEST_BULK_MAX_BYTES", 800)
+
+
+def test_load_suspends_refresh_and_restores_with_one_refresh(fake_es):
+    fake_es.add_index(ALIAS, {"refresh_interval": "5s", "number_of_replicas": "1"})
+    result = retriever.index_sentences_pipelined(LINES, file_id="f")  # appends to the live index
+    assert len(fake_es.bulks) > 1 and all(refresh is False for refresh, _ in fake_es.bulks)
+    assert all(seen["refresh_interval"] == "-1" and seen["number_of_replicas"] == "1" for _, seen in fake_es.bulks)
+    assert fake_es.settings_of(ALIAS) == {"refresh_interval": "5s", "number_of_replicas": "1"}
+    assert [c for c in fake_es.calls if c[0] == "refresh"] == [("refresh", ALIAS)]
+    assert result["index_tuning"]["refresh_disabled"] and not result["index_tuning"]["replicas_deferred"]
+    assert "force_merge" not in result
+
+
+def test_new_generation_defers_replicas_and_force_merges(fake_es):
+    fake_es.add_index("gen-2", {"number_of_replicas": "2"})
+    result = retriever.index_sentences_pipelined(LINES, file_id="f", index="gen-2", force_merge_segments=1)
+    assert all(seen == {"refresh_interval": "-1", "number_of_replicas": "0"} for _, seen in fake_es.bulks)
+    assert fake_es.settings_of("gen-2") == {"number_of_replicas": "2"}  # refresh_interval back to the default
+    merge = result["force_merge"]
+    assert merge["segments_before"] == 9 and merge["segments_after"] == 1
+    assert merge["latency_before"]["vector_ms"] == 7 and merge["latency_after"]["vector_ms"] == 2
+    # Merge after the settings are restored and the documents refreshed
+    order = [c[0] for c in fake_es.calls]
+    assert order.index("forcemerge") > order.index("refresh") > max(
+        i for i, c in enumerate(fake_es.calls) if c[0] == "put_settings"
+    )
+
+
+def test_settings_are_restored_when_the_load_fails(fake_es, monkeypatch):
+    fake_es.add_index(ALIAS, {"refresh_interval": "1s"})
+    monkeypatch.setattr(ingest_pipeline, "get_embeddings_batch",
+                        lambda texts: (_ for _ in ()).throw(RuntimeError("api down")))
+    with pytest.raises(RuntimeError):
+        retriever.index_sentences_pipelined(LINES, file_id="f")
+    assert fake_es.settings_of(ALIAS) == {"refresh_interval": "1s"}
+
+
+def test_overlapping_loads_restore_after_the_last_one(fake_es):
+    fake_es.add_index("idx", {"refresh_interval": "1s"})
+    with bulk_load_settings("idx") as first:
+        with bulk_load_settings("idx") as second:
+            assert fake_es.settings_of("idx")["refresh_interval"] == "-1"
+        assert fake_es.settings_of("idx")["refresh_interval"] == "-1"  # first load still running
+    assert first["refresh_disabled"] and second["refresh_disabled"]
+    assert fake_es.settings_of("idx") == {"refresh_interval": "1s"}
+    assert len([c for c in fake_es.calls if c[0] == "put_settings"]) == 2
+
+
+def test_leftover_loading_settings_are_not_restored(fake_es):
+    # A crashed load left refresh disabled: never put -1 / 0 replicas back
+    fake_es.add_index("gen-3", {"refresh_interval": "-1", "number_of_replicas": "0"})
+    with bulk_load_settings("gen-3", defer_replicas=True):
+        pass
+    assert fake_es.settings_of("gen-3") == {}
+    fake_es.add_index("idx", {"refresh_interval": "-1"})
+    elastic_client._reset_abandoned_bulk_load("idx")
+    assert fake_es.settings_of("idx") == {}
+
+
+def test_tuning_can_be_disabled(fake_es, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_BULK_TUNING", False)
+    fake_es.add_index(ALIAS, {"refresh_interval": "1s"})
+    result = retriever.index_sentences_pipelined(LINES, file_id="f")
+    assert all(refresh is True for refresh, _ in fake_es.bulks) and not fake_es.calls
+    assert not result["index_tuning"]["refresh_disabled"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Local tests for the in-memory corpus statistics (services/corpus_stats.py).
+No Elasticsearch or API key needed.
+
+Run: python tests/test_corpus_stats.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services import corpus_stats as cs
+from services.retrieval_cache import IndexGeneration, RetrievalCache
+
+
+@pytest.fixture
+def generation(monkeypatch, tmp_path):
+    """A private index generation, so bumps here do not touch the shared cache file."""
+    generation = IndexGeneration(str(tmp_path / "generation.sqlite3"))
+    monkeypatch.setattr(cs, "retrieval_cache", RetrievalCache(generation))
+    return generation
+
+
+@pytest.fixture
+def corpus(fake_es, generation):
+    """The live index with (file_id, level) documents; returns add(file_id, level)."""
+    docs = fake_es.data[fake_es.add_index(cs.INDEX)]
+
+    def add(file_id, level):
+        docs[f"{file_id}:{len(docs)}"] = {"file_id": file_id, "level": level}
+
+    return add
+
+
+def test_snapshot_holds_every_statistic(corpus):
+    for file_id, level in (("f1", 0), ("f1", 1), ("f2", 3)):
+        corpus(file_id, level)
+    snapshot = cs.CorpusStats(refresh_seconds=0).get()
+    assert snapshot.document_count == 3 and snapshot.max_level == 3
+    assert snapshot.files == {"f1": 2, "f2": 1} and snapshot.index_size_bytes == 3000
+    assert snapshot.cluster_status == "green" and snapshot.es_connected and snapshot.error is None
+
+
+def test_reads_are_served_from_memory(fake_es, corpus):
+    corpus("f1", 0)
+    corpus("f1", 2)
+    stats = cs.CorpusStats(refresh_seconds=0)
+    stats.get()
+    trips = fake_es.round_trips
+    for _ in range(50):
+        assert stats.document_count() == 2 and stats.max_level() == 2
+    assert fake_es.round_trips == trips
+
+
+def test_generation_bump_from_another_worker_refreshes(corpus, generation):
+    corpus("f1", 0)
+    stats = cs.CorpusStats(refresh_seconds=0)
+    assert stats.document_count() == 1
+    corpus("f2", 1)
+    assert stats.document_count() == 1  # unchanged generation: cached value
+    generation.bump()  # e.g. /upload served by another worker
+    assert stats.document_count() == 2 and stats.max_level() == 1
+
+
+def test_text_mapped_file_id_keeps_the_count(fake_es, corpus):
+    # Index from before file_id was mapped as keyword: dynamic text + .keyword subfield
+    fake_es.text_fields.add("file_id")
+    corpus("f1", 0)
+    corpus("f2", 4)
+    snapshot = cs.CorpusStats(refresh_seconds=0).get()
+    assert snapshot.document_count == 2 and snapshot.max_level == 4 and snapshot.error is None
+    assert snapshot.files == {"f1": 1, "f2": 1} and not snapshot.partial_errors
+    # No usable field at all: only the per-file counts are missing
+    fake_es.text_fields.add("file_id.keyword")
+    snapshot = cs.fetch_snapshot()
+    assert snapshot.document_count == 2 and snapshot.max_level == 4 and snapshot.error is None
+    assert snapshot.files == {} and "Fielddata" in snapshot.partial_errors["files"]
+
+
+def test_failed_snapshot_is_retried_after_a_delay(fake_es, corpus):
+    corpus("f1", 0)
+    fake_es.down = True
+    stats = cs.CorpusStats(refresh_seconds=0)
+    snapshot = stats.get()
+    assert not snapshot.es_connected and snapshot.cluster_status.startswith("error")
+    fake_es.down = False
+    assert stats.get() is snapshot  # within ERROR_RETRY_SECONDS
+    snapshot.refreshed_at -= cs.ERROR_RETRY_SECONDS + 1
+    assert stats.get().es_connected and stats.document_count() == 1
+
+
+def test_background_refresh_picks_up_outside_changes(corpus):
+    corpus("f1", 0)
+    stats = cs.CorpusStats(refresh_seconds=0.05)
+    stats.start()
+    try:
+        corpus("f1", 1)  # written outside the API: no generation bump
+        deadline = time.time() + 5
+        while stats.document_count() != 2 and time.time() < deadline:
+            time.sleep(0.02)
+        assert stats.document_count() == 2 and stats.stats()["background"]
+    finally:
+        stats.close()
+    assert not stats.stats()["background"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
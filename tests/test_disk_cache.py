@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Local tests for the SQLite LRU cache used by the embedding cache.
+No Elasticsearch or API key needed.
+
+Run: python tests/test_disk_cache.py
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.disk_cache import DiskLRUCache
+
+
+def _cache(**kwargs) -> DiskLRUCache:
+    tmp = tempfile.mkdtemp()
+    return DiskLRUCache(str(Path(tmp) / "cache.sqlite3"), **kwargs)
+
+
+def test_roundtrip_and_counters():
+    cache = _cache()
+    assert cache.get("a") is None
+    cache.set("a", b"\x01\x02")
+    assert cache.get("a") == b"\x01\x02"
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_get_many_skips_missing():
+    cache = _cache()
+    cache.set_many([("a", b"1"), ("b", b"2")])
+    found = cache.get_many(["a", "b", "c"])
+    assert found == {"a": b"1", "b": b"2"}
+    assert cache.stats()["hit_ratio"] == round(2 / 3, 4)
+
+
+def test_lru_eviction_keeps_recent():
+    cache = _cache(max_entries=3, evict_every=1000)
+    for key in ["a", "b", "c"]:
+        cache.set(key, key.encode())
+        time.sleep(0.01)
+    cache.get("a")  # "a" becomes most recently used
+    cache.set("d", b"d")
+    cache.evict()
+    assert len(cache) == 3
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a"
+
+
+def test_ttl_expiry():
+    cache = _cache(ttl_seconds=1)
+    cache.set("a", b"1", ttl_seconds=-1)  # already expired
+    assert cache.get("a") is None
+    cache.evict()
+    assert len(cache) == 0
+
+
+def test_two_handles_share_file():
+    tmp = tempfile.mkdtemp()
+    path = str(Path(tmp) / "shared.sqlite3")
+    writer = DiskLRUCache(path)
+    reader = DiskLRUCache(path)
+    writer.set("k", b"v")
+    assert reader.get("k") == b"v"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
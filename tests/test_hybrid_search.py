@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Local tests for hybrid (lexical + vector) retrieval, rank fusion and the
+text_hash exclusion filter.
+Elasticsearch and the embedding API are replaced by stand-ins.
+
+Run: python tests/test_hybrid_search.py
+"""
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import services.multi_level_retriever as mlr
+from config import settings
+from services.deduplicator import NearDuplicateIndex, SentenceIdSet, text_hash
+from services.retriever import build_exclusion_filter
+
+DOCS = {
+    "a": "The Lord is my shepherd, I shall not want.",
+    "b": "He maketh me to lie down in green pastures.",
+    "c": "He leadeth me beside the still waters of rest.",
+    "d": "Surely goodness and mercy shall follow me always.",
+}
+
+
+def _hit(doc_id, score):
+    return {"_id": doc_id, "_score": score, "_source": {"text": DOCS[doc_id], "sentence_index": ord(doc_id)}}
+
+
+class FakeES:
+    def __init__(self, lexical, vector, fail=None):
+        self.rankings = {"lexical": lexical, "vector": vector}
+        self.fail = fail
+        self.requests = []
+
+    def msearch(self, searches):
+        self.requests.append(searches)
+        responses = []
+        for name, body in zip(("lexical", "vector"), searches[1::2]):
+            if name == self.fail:
+                responses.append({"error": {"type": "search_phase_execution_exception"}})
+                continue
+            excluded = set()
+            filters = body["query"]["bool"]["must_not"] if "bool" in body["query"] else (
+                (body["query"]["knn"].get("filter") or {}).get("bool", {}).get("must_not", []))
+            for clause in filters:
+                excluded.update(clause["terms"]["text_hash"])
+            hits = [_hit(d, s) for d, s in self.rankings[name] if text_hash(DOCS[d]) not in excluded]
+            responses.append({"hits": {"hits": hits}})
+        return {"responses": responses}
+
+
+def _search(fake, fusion="rrf", **kwargs):
+    originals = (mlr.es, mlr.get_embedding, settings.HYBRID_FUSION)
+    mlr.es, mlr.get_embedding, settings.HYBRID_FUSION = fake, lambda text: [0.1] * 8, fusion
+    mlr.retrieval_cache.clear()
+    try:
+        return mlr.hybrid_search("the lord my shepherd", limit=3, **kwargs)
+    finally:
+        mlr.es, mlr.get_embedding, settings.HYBRID_FUSION = originals
+
+
+def test_rrf_rewards_documents_both_rankings_agree_on():
+    lexical = [_hit("a", 9.0), _hit("b", 5.0), _hit("c", 1.0)]
+    vector = [_hit("c", 1.9), _hit("a", 1.8), _hit("d", 1.7)]
+    fused = mlr.fuse_rankings([lexical, vector], method="rrf", rrf_k=60)
+    assert [h["_id"] for h, _ in fused] == ["a", "c", "b", "d"]
+    assert abs(fused[0][1] - (1 / 61 + 1 / 62)) < 1e-12
+
+
+def test_weighted_fusion_normalizes_each_list():
+    lexical = [_hit("a", 20.0), _hit("b", 10.0)]
+    vector = [_hit("b", 1.9), _hit("a", 1.1)]
+    by_vector = mlr.fuse_rankings([lexical, vector], method="weighted", weights=[0.3, 0.7])
+    by_lexical = mlr.fuse_rankings([lexical, vector], method="weighted", weights=[0.7, 0.3])
+    assert by_vector[0][0]["_id"] == "b" and by_lexical[0][0]["_id"] == "a"
+
+
+def test_hybrid_search_is_one_round_trip_and_excludes_used():
+    fake = FakeES(lexical=[("a", 9.0), ("b", 5.0), ("c", 1.0)], vector=[("c", 1.9), ("a", 1.8), ("d", 1.7)])
+    used = NearDuplicateIndex([DOCS["a"]])
+    results = _search(fake, exclude_texts=used)
+    assert len(fake.requests) == 1 and len(fake.requests[0]) == 4
+    assert [r["_id"] for r in results] == ["c", "b", "d"]
+    assert results[0]["lexical_rank"] == 2 and results[0]["vector_rank"] == 1
+    assert results[2]["lexical_rank"] is None
+
+
+def test_hybrid_score_keeps_the_similarity_scale():
+    fake = FakeES(lexical=[("a", 9.0), ("b", 5.0)], vector=[("c", 1.9), ("a", 1.8), ("d", 1.7)])
+    ranked = _search(fake)
+    results = {r["_id"]: r for r in ranked}
+    # Fused order (by fused_score), similarity kept in score
+    assert [r["_id"] for r in ranked] == ["a", "c", "b"] and results["a"]["fused_score"] > results["c"]["fused_score"]
+    assert results["a"]["score"] == 1.8 and results["c"]["score"] == 1.9
+    # Lexical only: at most the lowest similarity of the vector hits
+    assert results["b"]["score"] == 1.7 and results["b"]["vector_rank"] is None
+
+
+def test_exclusion_filter_is_one_terms_clause():
+    # Plain collection: one hash per distinct non-empty text, sorted
+    assert build_exclusion_filter([DOCS["b"], DOCS["a"], "", DOCS["b"]]) == {
+        "terms": {"text_hash": sorted({text_hash(DOCS["a"]), text_hash(DOCS["b"])})}
+    }
+    # NearDuplicateIndex: also the sentences known only by ID
+    used = NearDuplicateIndex([DOCS["a"]])
+    used.add_ids(SentenceIdSet([DOCS["c"]]))
+    assert build_exclusion_filter(used) == {
+        "terms": {"text_hash": sorted({text_hash(DOCS["a"]), text_hash(DOCS["c"])})}
+    }
+    # Nothing to exclude: no clause at all
+    for empty in (None, set(), [""], NearDuplicateIndex()):
+        assert build_exclusion_filter(empty) is None
+
+
+def test_level1_fallback_drops_phrase_hits_without_copying_used_texts():
+    searches = []
+
+    def text_search(query_text, limit, exclude_texts, use_vector, match_type):
+        searches.append((match_type, limit, exclude_texts))
+        if match_type == "match_phrase":
+            return [{"text": DOCS["b"]}]
+        return [{"text": t} for t in (DOCS["a"], DOCS["b"], DOCS["c"], DOCS["d"]) if t not in exclude_texts][:limit]
+
+    def no_copy(self):
+        raise AssertionError("used_texts copied")
+
+    retriever = mlr.MultiLevelRetriever(["lord", "shepherd"], synonyms={})
+    retriever._text_search = text_search
+    used = NearDuplicateIndex([DOCS["a"]])
+    original = NearDuplicateIndex.copy
+    NearDuplicateIndex.copy = no_copy
+    try:
+        sentences, offset, _, _, _ = retriever.fetch_level1_keyword_magic(0, 3, used, sentences_per_pair=3)
+    finally:
+        NearDuplicateIndex.copy = original
+    assert [s["text"] for s in sentences] == [DOCS["b"], DOCS["c"], DOCS["d"]] and offset == 1
+    assert searches[1][0] == "match" and searches[1][1] == 3 and searches[1][2] is used
+
+
+def test_failed_sub_query_keeps_the_other_ranking():
+    fake = FakeES(lexical=[("a", 9.0)], vector=[("c", 1.9), ("d", 1.7)], fail="lexical")
+    assert [r["_id"] for r in _search(fake)] == ["c", "d"]
+
+
+def test_vector_mode_keeps_vector_only_search():
+    calls = []
+    original = mlr.get_pure_semantic_search
+    mlr.get_pure_semantic_search = lambda query, limit, exclude_texts: calls.append(query) or []
+    try:
+        assert _search(FakeES([], []), fusion="vector") == [] and calls == ["the lord my shepherd"]
+    finally:
+        mlr.get_pure_semantic_search = original
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Local tests for /replace and DELETE /documents over versioned indices behind
+the ES_INDEX_NAME alias (vector/elastic_client.py, services/incremental_replace.py):
+the new generation reuses vectors of unchanged sentences, only new ones are
+embedded, searches see the old corpus until the atomic flip, old generations
+are dropped.
+No Elasticsearch or API key needed (ES and embeddings are faked).
+
+Run: python tests/test_incremental_replace.py
+"""
+import sys
+import sqlite3
+import time
+import threading
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import settings
+from services import retriever
+from services.ingest_pipeline import IngestPipeline
+from services.incremental_replace import ReplacePlan, replace_sentences
+from services.ingest_jobs import IngestJobRunner, JobStore
+from services.deduplicator import text_hash
+from vector import elastic_client
+
+ALIAS = settings.ES_INDEX_NAME
+OLD = [f"Verse {i}: and the word of the Lord came unto the prophet." for i in range(200)]
+
+
+def _revised():
+    """Drop 10 verses, reword 3, insert 5 new ones: 18 changes out of 200."""
+    new = [s for i, s in enumerate(OLD) if i not in range(50, 60)]
+    new[0] = "Verse 0: in the beginning was the word."
+    new[100] = new[100].replace("prophet", "seer")
+    new[150] = new[150].replace("Lord", "LORD")
+    return new[:120] + [f"Inserted verse {k}." for k in range(5)] + new[120:]
+
+
+@pytest.fixture
+def old_index(fake_es, embedded):
+    """First generation behind the alias, holding OLD."""
+    elastic_client.init_index()
+    IngestPipeline(index=ALIAS, file_id="old", batch_size=50).run(OLD)
+    embedded.clear()
+    return elastic_client.current_indices()[0]
+
+
+def _ordered_texts(docs):
+    docs = sorted(docs.values(), key=lambda d: d["sentence_index"])
+    assert [d["sentence_index"] for d in docs] == list(range(len(docs)))
+    return [d["text"] for d in docs]
+
+
+def _replace_job(tmp, job_id="job-1"):
+    runner = IngestJobRunner(JobStore(f"{tmp}/jobs.sqlite3"), upload_dir=f"{tmp}/uploads")
+    data = ("\n".join(_revised()) + "\n").encode("utf-8")
+    Path(runner.upload_path(job_id)).write_bytes(data)
+    runner.enqueue(job_id, "new", "v2.txt", "utf-8", "line", len(data), mode="replace")
+    return runner
+
+
+def test_revision_embeds_only_new_sentences_and_flips(fake_es, embedded, old_index):
+    new = _revised()
+    old_vector = fake_es.docs()["old:199"]["embedding"]
+    target = elastic_client.create_versioned_index()
+    result = replace_sentences(new, file_id="new", target_index=target)
+    changed = [s for s in new if s not in OLD]
+    assert sorted(embedded) == sorted(changed) and len(changed) == 8
+    assert fake_es.aliases[ALIAS] == {target} and old_index not in fake_es.data
+    assert _ordered_texts(fake_es.docs()) == new and result["dropped_indices"] == [old_index]
+    assert result["reused_sentences"] == len(new) - 8 and result["new_sentences"] == 8
+    assert result["deleted_documents"] == 13 and fake_es.open_pits == 0  # 10 removed + 3 reworded
+    # Unchanged sentences carry their vector over, under the new file's ids and positions
+    position = new.index(OLD[199])
+    moved = fake_es.docs()[f"new:{position}"]
+    assert moved["embedding"] == old_vector and moved["level"] == position // 5 and moved["file_id"] == "new"
+
+
+def test_searches_see_the_old_corpus_until_the_flip(fake_es, old_index):
+    seen = []
+    target = elastic_client.create_versioned_index()
+
+    def on_progress(progress):
+        seen.append(_ordered_texts(fake_es.docs()))
+
+    replace_sentences(_revised(), file_id="new", target_index=target, on_progress=on_progress)
+    assert seen and all(texts == OLD for texts in seen)
+
+
+def test_repeated_sentences_reuse_the_same_vector(fake_es, embedded, old_index):
+    new = OLD[:3] + [OLD[1], "A brand new verse."] + OLD[3:]
+    replace_sentences(new, file_id="new", target_index=elastic_client.create_versioned_index())
+    docs = fake_es.docs()
+    assert embedded == ["A brand new verse."] and _ordered_texts(docs) == new
+    assert docs["new:1"]["embedding"] == docs["new:3"]["embedding"]
+
+
+def test_plan_counts_removed_documents_after_a_resume():
+    indexed = {text_hash("a"): ["d1", 2], text_hash("b"): ["d3", 1], text_hash("c"): ["d4", 1]}
+    plan = ReplacePlan(indexed)
+    items = list(plan.assign(["a", "x", "b", "a"], skip=2))
+    assert [getattr(i, "doc_id", i) for i in items] == ["d3", "d1"]
+    assert plan.reused == 2 and plan.new == 0 and plan.removed_documents() == 1  # only "c" is gone
+
+
+def test_interrupted_replace_resumes_into_the_same_index(fake_es, embedded, small_bulks, old_index):
+    new = _revised()
+    latest = {}
+    target = elastic_client.create_versioned_index()
+    fake_es.requests, fake_es.fail_after_requests = 0, 6
+    with pytest.raises(ConnectionError):
+        replace_sentences(new, file_id="new", target_index=target, on_progress=latest.update)
+    committed = latest["committed"]
+    assert 0 < committed < len(new) and fake_es.aliases[ALIAS] == {old_index}
+    fake_es.fail_after_requests = None
+    embedded.clear()
+    result = replace_sentences(new, file_id="new", target_index=target, start_index=committed)
+    assert _ordered_texts(fake_es.docs()) == new and result["committed"] == len(new)
+    # Only the new sentences above the watermark were embedded again
+    assert sorted(embedded) == sorted(s for s in new[committed:] if s not in OLD)
+
+
+def test_failed_replace_job_drops_its_index_and_keeps_the_corpus(fake_es, old_index, tmp_path):
+    runner = _replace_job(tmp_path)
+    fake_es.requests, fake_es.fail_after_requests = 0, 0
+    runner.run_job(runner.store.claim(runner.owner))
+    job = runner.store.get("job-1")
+    assert job["status"] == "failed" and job["target_index"] not in fake_es.data
+    assert fake_es.aliases[ALIAS] == {old_index} and _ordered_texts(fake_es.docs()) == OLD
+
+
+def test_slow_force_merge_is_not_reclaimed_as_stale(fake_es, old_index, tmp_path, monkeypatch):
+    from services import ingest_jobs as jobs_module
+
+    merging, release = threading.Event(), threading.Event()
+    forcemerge = fake_es.forcemerge
+
+    def slow_forcemerge(index, max_num_segments):
+        merging.set()
+        assert release.wait(10)
+        forcemerge(index, max_num_segments)
+
+    monkeypatch.setattr(fake_es, "forcemerge", slow_forcemerge)
+    monkeypatch.setattr(jobs_module, "STALE_SECONDS", 0.3)
+    monkeypatch.setattr(jobs_module, "HEARTBEAT_SECONDS", 0.05)
+    runner = _replace_job(tmp_path)
+    worker = threading.Thread(target=runner.run_job, args=(runner.store.claim(runner.owner),))
+    worker.start()
+    try:
+        assert merging.wait(10)
+        # No progress is reported during the merge, for longer than STALE_SECONDS
+        time.sleep(1.0)
+        other = JobStore(f"{tmp_path}/jobs.sqlite3").claim("another-worker")
+    finally:
+        release.set()
+        worker.join(10)
+    job = runner.store.get("job-1")
+    assert other is None
+    assert job["status"] == "done" and job["attempts"] == 1 and len(fake_es.merged) == 1
+
+
+def test_resumed_job_reuses_its_index(fake_es, old_index, tmp_path):
+    runner = IngestJobRunner(JobStore(f"{tmp_path}/jobs.sqlite3"), upload_dir=f"{tmp_path}/uploads")
+    job = runner.enqueue("job-1", "new", "v2.txt", "utf-8", "line", 10, mode="replace")
+    target, start = runner._replace_target(job)
+    assert start == 0 and runner.store.get("job-1")["target_index"] == target
+    runner.store.update("job-1", committed=40)
+    assert runner._replace_target(runner.store.get("job-1")) == (target, 40)
+    # The half-built index is gone (e.g. pruned): start over in a new one
+    elastic_client.drop_index(target)
+    other, start = runner._replace_target(runner.store.get("job-1"))
+    assert other != target and start == 0 and runner.store.get("job-1")["committed"] == 0
+
+
+def test_replace_endpoint_builds_a_new_generation(fake_es, embedded, old_index, tmp_path, monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+
+    new = _revised()
+    replaced = []
+    runner = IngestJobRunner(JobStore(f"{tmp_path}/jobs.sqlite3"), upload_dir=f"{tmp_path}/uploads")
+    runner.on_corpus_replaced = lambda: replaced.append(True)
+    monkeypatch.setattr(main, "ingest_jobs", runner)
+    client = TestClient(main.app)
+    body = ("\n".join(new) + "\n").encode("utf-8")
+    resp = client.post("/replace", files={"file": ("bible.txt", body, "text/plain")})
+    assert resp.status_code == 202, resp.text
+    assert _ordered_texts(fake_es.docs()) == OLD  # nothing changes until the job runs
+    runner.run_job(runner.store.claim(runner.owner))
+    job = client.get(f"/jobs/{resp.json()['job_id']}").json()
+    target = runner.store.get(job["job_id"])["target_index"]
+    assert job["mode"] == "replace" and job["status"] == "done", job
+    assert job["sentences_reused"] == len(new) - 8 and job["documents_deleted"] == 13
+    assert fake_es.aliases[ALIAS] == {target} and old_index not in fake_es.data and replaced == [True]
+    assert _ordered_texts(fake_es.docs()) == new and len(embedded) == 8
+    # Loaded with refresh/replicas suspended, restored (to the defaults) and merged before the flip
+    assert fake_es.merged == [target] and job["report"]["force_merge"]["segments_after"] == 1
+    assert job["report"]["index_tuning"]["replicas_deferred"]
+    assert fake_es.settings_of(target) == {}
+    assert ("put_settings", target, {"refresh_interval": "-1", "number_of_replicas": 0}) in fake_es.calls
+
+
+def test_delete_all_flips_to_an_empty_index(fake_es, old_index):
+    assert retriever.delete_all_documents()
+    assert old_index not in fake_es.data and fake_es.docs() == {} and len(fake_es.aliases[ALIAS]) == 1
+
+
+def test_legacy_concrete_index_is_swapped_for_the_alias(fake_es):
+    fake_es.add_index(ALIAS, docs=[{"text": "old"}])
+    elastic_client.init_index()  # served as is
+    assert elastic_client.current_indices() == [ALIAS] and not fake_es.aliases
+    new_index = elastic_client.create_versioned_index()
+    assert elastic_client.flip_alias(new_index) == [ALIAS]
+    assert ALIAS not in fake_es.data and fake_es.aliases[ALIAS] == {new_index}
+
+
+def test_prune_drops_only_orphaned_generations(fake_es, old_index):
+    building = elastic_client.create_versioned_index()
+    orphan = elastic_client.create_versioned_index()
+    fake_es.add_index(f"{ALIAS}-archive")
+    dropped = elastic_client.prune_indices(keep=[building])
+    assert dropped == [orphan] and set(fake_es.data) == {old_index, building, f"{ALIAS}-archive"}
+
+
+def test_job_store_adds_missing_columns(tmp_path):
+    path = f"{tmp_path}/jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ingest_jobs (id TEXT PRIMARY KEY, file_id TEXT NOT NULL, filename TEXT, "
+                 "path TEXT NOT NULL, encoding TEXT NOT NULL, split_mode TEXT NOT NULL, status TEXT NOT NULL, "
+                 "created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+    store = JobStore(path)
+    job = store.create({"id": "j", "file_id": "f", "path": "p", "encoding": "utf-8", "split_mode": "line"})
+    assert job["mode"] == "upload" and job["sentences_reused"] == 0 and job["target_index"] is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Local tests for background ingest jobs (services/ingest_jobs.py) and the
+pipeline features they rely on: deterministic document ids, the committed
+watermark and resuming from it.
+No Elasticsearch or API key needed (bulk and embeddings are faked).
+
+Run: python tests/test_ingest_jobs.py
+"""
+import sys
+import time
+import threading
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import settings
+from services.ingest_pipeline import IngestPipeline
+from services.ingest_jobs import IngestJobRunner, JobStore, describe_job
+
+ALIAS = settings.ES_INDEX_NAME
+LINES = [f"Verse {i}: and the word of the Lord came unto the prophet." for i in range(1, 241)]
+
+
+def _runner(tmp, workers=1):
+    return IngestJobRunner(JobStore(str(Path(tmp) / "jobs.sqlite3")), upload_dir=str(Path(tmp) / "uploads"), workers=workers)
+
+
+def _enqueue(runner, job_id="job-1", text="\n".join(LINES) + "\n"):
+    data = text.encode("utf-8")
+    Path(runner.upload_path(job_id)).write_bytes(data)
+    return runner.enqueue(job_id, "file-1", "verses.txt", "utf-8", "line", len(data))
+
+
+def test_pipeline_ids_watermark_and_start_index(fake_es, embedded):
+    fake_es.add_index("test")
+    fake_es.jitter = 0.01  # bulk responses come back out of order
+    pipeline = IngestPipeline(index="test", file_id="f", batch_size=7, bulk_workers=3,
+                              bulk_max_bytes=600, start_index=10)
+    result = pipeline.run(LINES[:50])
+    docs = fake_es.docs("test")
+    assert sorted(docs) == sorted(f"f:{i}" for i in range(10, 60))
+    assert docs["f:10"]["text"] == LINES[0] and docs["f:10"]["level"] == 2
+    assert result["committed"] == 60 and result["total_sentences"] == 60 and result["max_level"] == 11
+
+
+def test_job_runs_to_done_with_progress(fake_es, embedded, tmp_path):
+    fake_es.add_index(ALIAS)
+    runner = _runner(tmp_path)
+    _enqueue(runner)
+    runner.run_job(runner.store.claim(runner.owner))
+    job = runner.store.get("job-1")
+    view = describe_job(job)
+    assert job["status"] == "done" and job["committed"] == len(LINES) and job["attempts"] == 1
+    assert view["sentences_indexed"] == len(LINES) and view["progress"] == 1.0
+    assert view["eta_seconds"] is None and embedded == LINES
+    assert sorted(fake_es.docs(), key=lambda k: int(k.split(":")[1]))[-1] == f"file-1:{len(LINES) - 1}"
+    assert not Path(job["path"]).exists()
+
+
+def test_crashed_job_resumes_at_the_watermark_without_duplicates(fake_es, embedded, small_bulks, tmp_path, monkeypatch):
+    from services import ingest_jobs as jobs_module
+
+    real = jobs_module.index_sentences_pipelined
+    # Small batches, ~5 documents per bulk request, written in order (one worker per stage)
+    monkeypatch.setattr(jobs_module, "index_sentences_pipelined", lambda s, **kw: real(s, **{**kw, "batch_size": 10}))
+    fake_es.add_index(ALIAS)
+    runner = _runner(tmp_path)
+    _enqueue(runner)
+    # First run: Elasticsearch goes away after 2 bulk requests
+    fake_es.fail_after_requests = 2
+    runner.run_job(runner.store.claim(runner.owner))
+    failed = runner.store.get("job-1")
+    assert failed["status"] == "failed" and 0 < failed["committed"] < len(LINES)
+
+    # Process died while running: the row stays "running" until its heartbeat is stale
+    runner.store.update("job-1", status="running")
+    runner.store._conn().execute("UPDATE ingest_jobs SET heartbeat_at = 0 WHERE id = 'job-1'")
+    fake_es.fail_after_requests = None
+    embedded.clear()
+    job = runner.store.claim("another-worker")
+    assert job["attempts"] == 2 and job["run_start_committed"] == failed["committed"]
+    runner.run_job(job)
+    done = runner.store.get("job-1")
+    assert done["status"] == "done" and done["committed"] == len(LINES)
+    # Only sentences from the watermark on were embedded/written again, under the same ids
+    assert embedded == LINES[failed["committed"]:]
+    assert sorted(fake_es.docs()) == sorted(f"file-1:{i}" for i in range(len(LINES)))
+
+
+def test_cancel_all_stops_queued_jobs(tmp_path):
+    runner = _runner(tmp_path)
+    _enqueue(runner, "job-a")
+    _enqueue(runner, "job-b")
+    assert sorted(runner.cancel_all(timeout=1)) == ["job-a", "job-b"]
+    assert runner.store.get("job-a")["status"] == "cancelled"
+    assert runner.store.claim(runner.owner) is None
+
+
+def test_upload_queued_after_a_replace_waits_for_the_flip(fake_es, embedded, tmp_path):
+    from vector import elastic_client
+
+    elastic_client.init_index()
+    runner = _runner(tmp_path)
+    replace_body = ("\n".join(LINES[:50]) + "\n").encode("utf-8")
+    Path(runner.upload_path("replace-1")).write_bytes(replace_body)
+    runner.enqueue("replace-1", "new", "v2.txt", "utf-8", "line", len(replace_body), mode="replace")
+    replace_job = runner.store.claim(runner.owner)
+    _enqueue(runner, "upload-1", "Appended after the replace was queued.\n")
+    other = JobStore(str(tmp_path / "jobs.sqlite3"))  # another uvicorn worker
+    assert replace_job["id"] == "replace-1" and other.claim("another-worker") is None
+    runner.run_job(replace_job)
+    upload_job = other.claim("another-worker")
+    assert upload_job["id"] == "upload-1"
+    runner.run_job(upload_job)
+    # Written into the generation the alias serves now, not the dropped one
+    texts = {doc["text"] for doc in fake_es.docs().values()}
+    assert "Appended after the replace was queued." in texts and len(texts) == 51
+    assert runner.store.get("upload-1")["status"] == "done"
+
+
+def test_worker_thread_picks_up_jobs_and_shutdown_requeues(fake_es, embedded, tmp_path):
+    fake_es.add_index(ALIAS)
+    runner = _runner(tmp_path)
+    runner.start()
+    try:
+        _enqueue(runner)
+        deadline = time.time() + 10
+        while runner.store.get("job-1")["status"] != "done" and time.time() < deadline:
+            time.sleep(0.05)
+        assert runner.store.get("job-1")["status"] == "done"
+    finally:
+        runner.close(timeout=5)
+    # A job left "running" by this process is requeued on close
+    runner.store.create({"id": "job-2", "file_id": "f2", "filename": "x.txt", "path": "missing",
+                         "encoding": "utf-8", "split_mode": "line", "status": "running", "owner": runner.owner})
+    runner.store.release_owned(runner.owner)
+    assert runner.store.get("job-2")["status"] == "queued"
+
+
+def test_upload_queues_a_job_and_reports_progress(fake_es, embedded, tmp_path, monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+
+    fake_es.add_index(ALIAS)
+    runner = _runner(tmp_path)
+    monkeypatch.setattr(main, "ingest_jobs", runner)
+    runner.start()
+    try:
+        client = TestClient(main.app)
+        body = ("\r\n".join(LINES) + "\r\n").encode("cp1252")
+        resp = client.post("/upload?split_mode=line", files={"file": ("bible.txt", body, "text/plain")})
+        assert resp.status_code == 202, resp.text
+        job_id = resp.json()["job_id"]
+        deadline = time.time() + 10
+        status = client.get(f"/jobs/{job_id}").json()
+        while status["status"] != "done" and time.time() < deadline:
+            time.sleep(0.05)
+            status = client.get(f"/jobs/{job_id}").json()
+        missing = client.get("/jobs/unknown")
+    finally:
+        runner.close(timeout=5)
+    assert status["status"] == "done" and status["sentences_indexed"] == len(LINES)
+    assert status["total_bytes"] == len(body) and status["progress"] == 1.0
+    assert embedded == LINES and missing.status_code == 404
+
+
+def test_replace_waiting_for_old_jobs_does_not_block_other_requests(tmp_path, monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+
+    runner = _runner(tmp_path)
+    cancelling, release = threading.Event(), threading.Event()
+
+    def slow_cancel_all():
+        cancelling.set()
+        release.wait(5)  # a running job still finishing its step
+
+    runner.cancel_all = slow_cancel_all
+    monkeypatch.setattr(main, "ingest_jobs", runner)
+    replaced = {}
+    try:
+        with TestClient(main.app) as client:
+            body = ("\n".join(LINES) + "\n").encode("utf-8")
+            worker = threading.Thread(target=lambda: replaced.update(
+                resp=client.post("/replace", files={"file": ("bible.txt", body, "text/plain")})
+            ))
+            worker.start()
+            assert cancelling.wait(5)
+            started = time.perf_counter()
+            missing = client.get("/jobs/unknown")  # served while /replace waits
+            waited = time.perf_counter() - started
+            release.set()
+            worker.join(5)
+    finally:
+        release.set()
+    assert missing.status_code == 404 and waited < 2
+    assert replaced["resp"].status_code == 202, replaced["resp"].text
+    assert runner.store.get(replaced["resp"].json()["job_id"])["mode"] == "replace"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
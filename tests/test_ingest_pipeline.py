@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Local tests for the staged ingest pipeline (services/ingest_pipeline.py):
+bounded queues hold the producer back while a stage is slow, bulk requests
+are cut by bytes, and a failing worker stops every stage.
+No Elasticsearch or API key needed (ES and embeddings are faked, see conftest.py).
+
+Run: python tests/test_ingest_pipeline.py
+"""
+import sys
+import time
+import threading
+from itertools import count
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services import ingest_pipeline
+from services.ingest_pipeline import IngestPipeline
+
+LINES = [f"Verse {i}: and the word of the Lord came unto the prophet." for i in range(200)]
+
+
+class _Counting:
+    """Sentence source that records how far the producer has read."""
+
+    def __init__(self, sentences):
+        self.sentences = sentences
+        self.consumed = 0
+
+    def __iter__(self):
+        for sent in self.sentences:
+            self.consumed += 1
+            yield sent
+
+
+def test_slow_bulk_stage_holds_the_producer_back(fake_es, embedded, monkeypatch):
+    fake_es.add_index("test")
+    release = threading.Event()
+    bulk = fake_es.bulk
+
+    def blocked_bulk(body, refresh=None):
+        assert release.wait(10)
+        return bulk(body, refresh=refresh)
+
+    monkeypatch.setattr(fake_es, "bulk", blocked_bulk)
+    source = _Counting(LINES)
+    pipeline = IngestPipeline(index="test", file_id="f", batch_size=5, embed_workers=1, bulk_workers=1,
+                              queue_size=1, bulk_max_bytes=1)
+    runner = threading.Thread(target=pipeline.run, args=(source,))
+    runner.start()
+    try:
+        time.sleep(0.5)
+        # In flight at most: the batch being sent, one per queue, the one being embedded, the one being split
+        assert source.consumed <= 5 * 5
+        assert pipeline.progress()["indexed"] == 0
+    finally:
+        release.set()
+        runner.join(10)
+    assert source.consumed == len(LINES) and len(fake_es.docs("test")) == len(LINES)
+
+
+def test_bulk_requests_are_cut_by_bytes(fake_es, embedded, monkeypatch):
+    fake_es.add_index("test")
+    sizes = []
+    bulk = fake_es.bulk
+
+    def sized_bulk(body, refresh=None):
+        sizes.append(len(body))
+        return bulk(body, refresh=refresh)
+
+    monkeypatch.setattr(fake_es, "bulk", sized_bulk)
+    huge = "Long verse " + "and the Lord spake " * 200
+    result = IngestPipeline(index="test", file_id="f", batch_size=50, bulk_workers=1,
+                            bulk_max_bytes=2000).run(LINES[:60] + [huge] + LINES[60:80])
+    assert result["bulk_requests"] == len(sizes) > 5
+    # Every request fits the limit, except one holding a single document larger than it
+    oversized = [size for size in sizes if size > 2000]
+    assert len(oversized) == 1 and oversized[0] > len(huge)
+    assert len(fake_es.docs("test")) == 81 and result["committed"] == 81
+
+
+def test_embedding_failure_stops_every_stage(fake_es, monkeypatch):
+    fake_es.add_index("test")
+    calls = []
+
+    def flaky_embed(texts):
+        calls.append(len(texts))
+        if len(calls) == 3:
+            raise RuntimeError("embedding API down")
+        return [[0.5] for _ in texts]
+
+    monkeypatch.setattr(ingest_pipeline, "get_embeddings_batch", flaky_embed)
+    source = _Counting(f"Sentence {i}." for i in count())  # endless: only a stop ends the run
+    pipeline = IngestPipeline(index="test", file_id="f", batch_size=10, embed_workers=1, queue_size=2,
+                              bulk_max_bytes=1)
+    with pytest.raises(RuntimeError, match="embedding API down"):
+        pipeline.run(source)
+    assert len(calls) == 3 and source.consumed < 100
+    # Nothing from the failed batch on was written; the watermark stops before it
+    written = sorted(doc["sentence_index"] for doc in fake_es.docs("test").values())
+    assert written == list(range(len(written))) and pipeline.committed == len(written) <= 20
+
+
+def test_bulk_failure_stops_the_producer(fake_es, embedded):
+    fake_es.add_index("test")
+    fake_es.fail_after_requests = 1
+    source = _Counting(f"Sentence {i}." for i in count())
+    pipeline = IngestPipeline(index="test", file_id="f", batch_size=10, embed_workers=1, bulk_workers=1,
+                              queue_size=2, bulk_max_bytes=1)
+    with pytest.raises(ConnectionError):
+        pipeline.run(source)
+    assert source.consumed < 200 and fake_es.requests == 2
+    assert pipeline.committed == 1 and len(fake_es.docs("test")) == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Local tests for the LLM response cache (keywords / synonyms / parallels, opt-in meaning).
+The chat client is replaced by a counting stand-in, so no API key is needed.
+
+Run: python tests/test_llm_cache.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import services.keyword_extractor as keyword_extractor
+import services.prompt_builder as prompt_builder
+from config import settings
+from services.disk_cache import DiskLRUCache
+from services.llm_cache import LLMResponseCache
+
+
+def _cache(**kwargs) -> LLMResponseCache:
+    path = str(Path(tempfile.mkdtemp()) / "llm.sqlite3")
+    return LLMResponseCache(DiskLRUCache(path, **kwargs), model="test-model")
+
+
+class _CountingChat:
+    """Stand-in for client.chat.completions returning a fixed message."""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_hit_after_first_call_and_normalized_input():
+    cache = _cache()
+    calls = []
+    compute = lambda: calls.append(1) or ["mercy", "favor"]
+    assert cache.get_or_call("synonyms", 1, "Grace", compute) == ["mercy", "favor"]
+    assert cache.get_or_call("synonyms", 1, "  grace ", compute) == ["mercy", "favor"]
+    assert len(calls) == 1
+    stats = cache.stats()["by_kind"]["synonyms"]
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_ratio"] == 0.5
+
+
+def test_version_model_and_kind_separate_entries():
+    cache = _cache()
+    keys = {
+        cache.key("synonyms", 1, "grace"),
+        cache.key("synonyms", 2, "grace"),
+        cache.key("keywords", 1, "grace"),
+        LLMResponseCache(None, model="other-model").key("synonyms", 1, "grace"),
+    }
+    assert len(keys) == 4
+
+
+def test_empty_and_failed_results_are_not_cached():
+    cache = _cache()
+    assert cache.get_or_call("keywords", 1, "q", lambda: []) == []
+    try:
+        cache.get_or_call("keywords", 1, "q", lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+    assert cache.get_or_call("keywords", 1, "q", lambda: ["faith"]) == ["faith"]
+    assert len(cache.store) == 1
+
+
+def test_ttl_expiry():
+    cache = _cache(ttl_seconds=-1)
+    calls = []
+    compute = lambda: calls.append(1) or "meaning"
+    cache.get_or_call("meaning", 1, "q", compute)
+    cache.get_or_call("meaning", 1, "q", compute)
+    assert len(calls) == 2
+
+
+def test_generate_synonyms_uses_cache():
+    chat = _CountingChat('["mercy", "favor"]')
+    original_client, original_cache = keyword_extractor.client, keyword_extractor.llm_cache
+    keyword_extractor.client = SimpleNamespace(chat=SimpleNamespace(completions=chat))
+    keyword_extractor.llm_cache = _cache()
+    try:
+        assert keyword_extractor.generate_synonyms("grace") == ["mercy", "favor"]
+        assert keyword_extractor.generate_synonyms("Grace") == ["mercy", "favor"]
+        assert chat.calls == 1
+        # A reply without a JSON array is not remembered
+        chat.content = "no idea"
+        assert keyword_extractor.generate_synonyms("hope") == []
+        assert keyword_extractor.generate_synonyms("hope") == []
+        assert chat.calls == 3
+    finally:
+        keyword_extractor.client, keyword_extractor.llm_cache = original_client, original_cache
+
+
+def test_keyword_meaning_is_cached_only_on_opt_in():
+    chat = _CountingChat("Grace is unmerited favor.")
+    original = prompt_builder.client, prompt_builder.llm_cache, settings.LLM_CACHE_MEANING
+    prompt_builder.client = SimpleNamespace(chat=SimpleNamespace(completions=chat))
+    prompt_builder.llm_cache = _cache()
+    try:
+        settings.LLM_CACHE_MEANING = False
+        prompt_builder.extract_keywords("grace")
+        prompt_builder.extract_keywords("grace")
+        assert chat.calls == 2 and len(prompt_builder.llm_cache.store) == 0  # a fresh meaning each time
+        settings.LLM_CACHE_MEANING = True
+        prompt_builder.extract_keywords("grace")
+        assert prompt_builder.extract_keywords("grace") == "Grace is unmerited favor."
+        assert chat.calls == 3
+    finally:
+        prompt_builder.client, prompt_builder.llm_cache, settings.LLM_CACHE_MEANING = original
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Local tests for the paged _msearch walk over Level 0 / Level 2 combinations
+(lazy combination generation, term-statistics pruning and the in-process
+posting-list accelerator included).
+Runs MultiLevelRetriever against a small in-memory stand-in for Elasticsearch,
+so no Elasticsearch or API key is needed.
+
+Run: python tests/test_msearch_walk.py
+"""
+import sys
+import hashlib
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import services.multi_level_retriever as mlr
+import services.term_stats as term_stats
+import services.posting_accelerator as posting_accelerator
+from config import settings
+from services.deduplicator import NearDuplicateIndex, text_hash
+from services.keyword_extractor import iter_keyword_combinations, count_keyword_combinations
+
+WORDS = "grace faith hope love mercy peace lord spirit".split()
+
+
+def _corpus():
+    docs = []
+    for i in range(400):
+        picked = [WORDS[(i * k) % len(WORDS)] for k in (1, 3, 5)]
+        docs.append(f"Verse {i} speaks of {' and '.join(picked)} for all the people.")
+    return docs
+
+
+def _vector(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [b / 255 for b in digest[:8]]
+
+
+class FakeES:
+    """Enough of the search/msearch API for multi_match + knn + text_hash exclusion + filters aggs + ids."""
+
+    def __init__(self, docs):
+        self.docs = [{"text": t, "text_hash": text_hash(t), "level": 0, "sentence_index": i, "vec": _vector(t)}
+                     for i, t in enumerate(docs)]
+        self.round_trips = 0
+
+    def _matches(self, query, doc):
+        if "bool" in query:
+            must = query["bool"].get("must", []) + query["bool"].get("filter", [])
+            must_not = query["bool"].get("must_not", [])
+            return all(self._matches(q, doc) for q in must) and not any(self._matches(q, doc) for q in must_not)
+        if "match_all" in query:
+            return True
+        if "ids" in query:
+            return str(doc["sentence_index"]) in query["ids"]["values"]
+        if "terms" in query:
+            return doc["text_hash"] in query["terms"]["text_hash"]
+        if "multi_match" in query:
+            spec = query["multi_match"]
+        else:
+            spec = dict(query["match"]["text"])
+        words = doc["text"].lower().replace(".", "").split()
+        hits = [w in words for w in spec["query"].lower().split()]
+        return all(hits) if spec.get("operator") == "and" else any(hits)
+
+    def _hit(self, doc, score=1.0):
+        return {"_id": str(doc["sentence_index"]), "_score": score, "_source": doc, "fields": {"text_hash": [doc["text_hash"]]}}
+
+    def _run(self, body):
+        if "knn" not in body["query"] and "script_score" not in body["query"]:
+            # Lexical only: score = number of query words, ties in index order
+            words = body["query"]["match"]["text"]["query"].split()
+            matched = [d for d in self.docs if self._matches(body["query"], d)]
+            hits = [self._hit(d, float(len(words)) + 1 / (1 + d["sentence_index"])) for d in matched[:body["size"]]]
+            return {"hits": {"hits": hits, "total": {"value": len(matched), "relation": "eq"}}}
+        if "knn" in body["query"]:
+            knn = body["query"]["knn"]
+            query_filter, vector = knn.get("filter"), knn["query_vector"]
+        else:
+            script_score = body["query"]["script_score"]
+            query_filter, vector = script_score["query"], script_score["script"]["params"]["query_vector"]
+        candidates = [d for d in self.docs if query_filter is None or self._matches(query_filter, d)]
+        scored = sorted(
+            candidates,
+            key=lambda d: (-sum(a * b for a, b in zip(vector, d["vec"])), d["sentence_index"]),
+        )
+        hits = [self._hit(d) for d in scored[:body["size"]]]
+        return {"hits": {"hits": hits}}
+
+    def search(self, index, body=None, aggs=None, query=None, size=10, **kwargs):
+        self.round_trips += 1
+        if query is not None:
+            return {"hits": {"hits": [self._hit(d) for d in self.docs if self._matches(query, d)][:size]}}
+        if aggs is not None:
+            filters = aggs["terms_stats"]["filters"]["filters"]
+            buckets = {key: {"doc_count": sum(1 for d in self.docs if self._matches(q, d))}
+                       for key, q in filters.items()}
+            return {"aggregations": {"terms_stats": {"buckets": buckets}}}
+        return self._run(body)
+
+    def msearch(self, searches):
+        self.round_trips += 1
+        return {"responses": [self._run(body) for body in searches[1::2]]}
+
+
+def _walk(page_size, limit=10, offset=0, used=(), keywords=("grace", "faith", "hope", "love"), pruning=True,
+          postings=False, max_docs=10000):
+    fake = FakeES(_corpus())
+    originals = (mlr.es, term_stats.es, posting_accelerator.es, mlr.get_embedding, mlr.get_embeddings_batch)
+    settings_originals = (settings.MSEARCH_PAGE_SIZE, settings.COMBINATION_PRUNING,
+                          settings.POSTING_ACCELERATOR, settings.POSTING_MAX_DOCS)
+    mlr.es = term_stats.es = posting_accelerator.es = fake
+    mlr.get_embedding = _vector
+    mlr.get_embeddings_batch = lambda texts: [_vector(t) for t in texts]
+    settings.MSEARCH_PAGE_SIZE, settings.COMBINATION_PRUNING = page_size, pruning
+    settings.POSTING_ACCELERATOR, settings.POSTING_MAX_DOCS = postings, max_docs
+    mlr.retrieval_cache.clear()  # round trips are counted from a cold cache
+    try:
+        retriever = mlr.MultiLevelRetriever(list(keywords), synonyms={})
+        used_texts = NearDuplicateIndex(used)
+        sentences, new_offset, exhausted, _ = retriever.fetch_level0_sentences(offset, limit, used_texts)
+        return [s["text"] for s in sentences], new_offset, exhausted, fake.round_trips, retriever.searches_avoided
+    finally:
+        mlr.es, term_stats.es, posting_accelerator.es, mlr.get_embedding, mlr.get_embeddings_batch = originals
+        (settings.MSEARCH_PAGE_SIZE, settings.COMBINATION_PRUNING,
+         settings.POSTING_ACCELERATOR, settings.POSTING_MAX_DOCS) = settings_originals
+
+
+# ---------- Tests ----------
+def test_paged_walk_matches_one_search_per_combo():
+    for limit, offset in [(10, 0), (3, 0), (10, 4), (40, 2)]:
+        sequential = _walk(page_size=1, limit=limit, offset=offset)
+        paged = _walk(page_size=8, limit=limit, offset=offset)
+        assert paged[:3] == sequential[:3], (limit, offset)
+
+
+def test_paged_walk_needs_fewer_round_trips():
+    sequential = _walk(page_size=1, limit=40)
+    paged = _walk(page_size=8, limit=40)
+    assert paged[1] == sequential[1] and paged[1] > 2
+    assert paged[3] < sequential[3], (paged[3], sequential[3])
+
+
+def test_used_texts_stay_excluded():
+    first, offset, _, _, _ = _walk(page_size=8, limit=5)
+    second, _, _, _, _ = _walk(page_size=8, limit=5, offset=offset, used=first)
+    assert second and not set(first) & set(second)
+
+
+def test_lazy_combinations_match_full_list():
+    keywords = ["grace", "faith", "hope", "love", "mercy"]
+    full = [combo for _, combo in iter_keyword_combinations(keywords)]
+    assert len(full) == count_keyword_combinations(len(keywords)) == 31
+    assert full[0] == tuple(keywords) and full[-1] == ("mercy",)
+    for start in (0, 1, 5, 6, 16, 30, 31):
+        for max_combos in (None, 7, 20):
+            expected = list(enumerate(full))[:max_combos][start:]
+            assert list(iter_keyword_combinations(keywords, start, max_combos)) == expected, (start, max_combos)
+
+
+def test_pruning_skips_combos_that_cannot_match():
+    # "zion" never occurs in the corpus: every combo containing it is dead
+    keywords = ("grace", "zion", "faith", "hope")
+    for limit, offset in [(10, 0), (40, 0), (10, 3)]:
+        plain = _walk(page_size=4, limit=limit, offset=offset, keywords=keywords, pruning=False)
+        pruned = _walk(page_size=4, limit=limit, offset=offset, keywords=keywords)
+        assert pruned[:3] == plain[:3], (limit, offset)
+        assert pruned[4] > 0 and plain[4] == 0
+    # Walking everything: the 8 combos containing "zion" (plus pairs that never co-occur) are skipped
+    plain = _walk(page_size=1, limit=400, keywords=keywords, pruning=False)
+    pruned = _walk(page_size=1, limit=400, keywords=keywords)
+    assert pruned[0] == plain[0] and pruned[4] >= 8 and pruned[1] == plain[1] == 15
+    # One aggregation request replaces the avoided searches
+    assert pruned[3] == plain[3] - pruned[4] + 1, (pruned[3], plain[3])
+
+
+
+def test_posting_lists_intersect_and_rank():
+    postings = posting_accelerator.PostingLists(["grace", "faith"])
+    hit = lambda i, score: {"_id": f"d{i}", "_score": score, "fields": {"text_hash": [f"h{i}"]}}
+    postings.add_term("grace", [hit(1, 2.0), hit(2, 1.0), hit(3, 0.5)])
+    postings.add_term("faith", [hit(3, 3.0), hit(2, 1.0), hit(4, 9.0)])
+    assert [d["_id"] for d in postings.rank(["grace", "faith"])] == ["d3", "d2"]
+    assert postings.rank(["grace", "faith"])[0]["_score"] == 3.5
+    assert [d["_id"] for d in postings.rank(["grace", "faith"], skip_hashes={"h3"})] == ["d2"]
+    assert postings.rank(["grace", "zion"]) == []
+    assert [d["_id"] for d in postings.rank(["faith"], limit=2)] == ["d4", "d3"]
+
+
+def test_posting_accelerator_walk():
+    keywords = ("grace", "zion", "faith", "hope")
+    words = lambda text: set(text.lower().replace(".", "").split())
+    for limit in (3, 5):
+        plain = _walk(page_size=1, limit=limit, keywords=keywords, pruning=False)
+        replaced = posting_accelerator.accelerator_stats()["searches_replaced"]
+        local = _walk(page_size=1, limit=limit, keywords=keywords, pruning=False, postings=True)
+        replaced = posting_accelerator.accelerator_stats()["searches_replaced"] - replaced
+        # Same combos consumed, same number of sentences, each matching a consumed combo
+        combos = [set(c) for _, c in iter_keyword_combinations(list(keywords), max_combos=local[1])]
+        assert local[1] == plain[1] and len(local[0]) == len(plain[0]) == limit
+        assert all(any(c <= words(t) for c in combos) for t in local[0])
+        # One posting _msearch + hydrations instead of one search per combo,
+        # counted apart from the searches term statistics pruned
+        assert local[3] < plain[3] // 3 and replaced == local[1] and local[4] == 0, (local, plain)
+    # Used sentences stay excluded (skipped by text_hash before hydration)
+    second = _walk(page_size=8, limit=3, used=local[0], keywords=keywords, postings=True)
+    assert second[0] and not set(second[0]) & set(local[0])
+
+
+def test_posting_accelerator_falls_back_for_frequent_terms():
+    plain = _walk(page_size=8, limit=20)
+    capped = _walk(page_size=8, limit=20, postings=True, max_docs=5)
+    assert capped[:3] == plain[:3] and capped[3] == plain[3] + 1
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Local tests for NearDuplicateIndex (MinHash/LSH + exact verification).
+No Elasticsearch or API key needed.
+
+Run: python tests/test_near_duplicate_index.py
+"""
+import sys
+import random
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.deduplicator import (
+    NearDuplicateIndex,
+    SentenceIdSet,
+    LINEAR_SCAN_LIMIT,
+    SKETCH_LIMIT,
+    sentence_id,
+    sentence_id_to_hash,
+    text_hash,
+    calculate_similarity,
+    deduplicate_sentences,
+    is_duplicate,
+)
+
+WAKED = 'Zechariah declares, "came again, and waked me, as a man that is waked out of his sleep, and said unto me, What seest thou.'
+WAKENED = 'Zechariah declares, "came again, and waked me, as a man that is wakened out of his sleep, and said unto me, What seest thou.'
+
+VOCAB = ("the lord and of unto he shall his in that to they for is my god be with not "
+         "them all thy was which said him as this israel king people come man house").split()
+
+
+def _corpus(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    vocab = VOCAB + [f"word{i}" for i in range(2000)]
+    return [" ".join(rng.choice(vocab) for _ in range(rng.randint(10, 30))) for _ in range(n)]
+
+
+def _mutate(text: str, rng: random.Random) -> str:
+    """Scattered single-character edits while similarity stays >= 0.95."""
+    chars = list(text)
+    for _ in range(20):
+        i = rng.randrange(len(chars))
+        candidate = chars[:i] + [rng.choice("xyzq")] + chars[i + 1:]
+        if calculate_similarity(text, "".join(candidate)) < 0.95:
+            break
+        chars = candidate
+    return "".join(chars)
+
+
+def test_waked_wakened_in_large_index():
+    index = NearDuplicateIndex(_corpus(LINEAR_SCAN_LIMIT * 10))
+    index.add(WAKED)
+    assert is_duplicate(WAKENED, index, similarity_threshold=0.95)
+
+
+def test_no_false_positives():
+    corpus = _corpus(500)
+    index = NearDuplicateIndex(corpus)
+    for text in _corpus(200, seed=99):
+        match = index.find_near_duplicate(text)
+        assert match is None or calculate_similarity(text, match) >= 0.95
+
+
+def test_recall_matches_linear_scan():
+    rng = random.Random(3)
+    corpus = _corpus(1000)
+    index = NearDuplicateIndex(corpus)
+    plain = set(corpus)
+    queries = [_mutate(rng.choice(corpus), rng) for _ in range(100)]
+    linear = sum(is_duplicate(q, plain) for q in queries)
+    indexed = sum(index.is_near_duplicate(q) for q in queries)
+    assert indexed >= linear * 0.98, (indexed, linear)
+
+
+def test_copy_and_union_are_independent():
+    index = NearDuplicateIndex(["first sentence here"])
+    clone = index.copy()
+    clone.add("second sentence here")
+    merged = index | {"third sentence here"}
+    assert len(index) == 1 and len(clone) == 2 and len(merged) == 2
+
+
+def test_deduplicate_sentences_with_index():
+    sentences = [{"text": WAKED}, {"text": WAKENED}, {"text": "Another completely different sentence."}]
+    unique, seen = deduplicate_sentences(sentences)
+    assert [s["text"] for s in unique] == [WAKED, "Another completely different sentence."]
+    assert isinstance(seen, NearDuplicateIndex) and WAKED in seen
+
+
+
+def test_sentence_ids_match_text_hash():
+    sid = sentence_id(WAKED)
+    assert 0 <= sid < 2 ** 64
+    assert sentence_id_to_hash(sid) == text_hash(WAKED)
+
+
+def test_sentence_id_set_is_compact_and_roundtrips():
+    texts = _corpus(2000)
+    ids = SentenceIdSet(texts)
+    assert len(ids) == len(set(texts))
+    assert ids.nbytes == 8 * len(ids)
+    assert all(t in ids for t in texts[:50]) and "not in the set" not in ids
+    assert list(ids) == sorted(ids)
+
+    restored = SentenceIdSet.from_base64(ids.to_base64())
+    assert restored == ids
+    merged = restored.copy()
+    merged.update([WAKED, sentence_id(WAKED)])
+    assert len(merged) == len(ids) + 1 and len(restored) == len(ids)
+
+
+def test_index_exclusion_covers_hydrated_ids():
+    index = NearDuplicateIndex()
+    index.add_ids(SentenceIdSet([WAKED]))
+    index.add(WAKENED)
+    assert set(index.exclusion_hashes()) == {text_hash(WAKED), text_hash(WAKENED)}
+    assert index.ids() == SentenceIdSet([WAKED, WAKENED])
+
+
+def test_sketch_hydrates_only_bucket_candidates():
+    corpus = _corpus(200) + [WAKED]
+    session = NearDuplicateIndex(corpus)
+    encoded = session.sketch()
+    by_id = {sentence_id(t): t for t in corpus}
+    requested = []
+
+    def hydrate(ids):
+        requested.append(list(ids))
+        return [by_id[i] for i in ids if i in by_id]
+
+    restored = NearDuplicateIndex()
+    restored.add_ids(SentenceIdSet(corpus))
+    restored.load_sketch(encoded, hydrate=hydrate)
+    assert restored and len(restored) == 0  # nothing fetched up front
+    assert is_duplicate(WAKENED, restored)
+    assert sentence_id(WAKED) in requested[0] and len(requested[0]) < 5
+    # Unrelated text: no bucket shared with the session, no fetch
+    requested.clear()
+    assert not restored.is_near_duplicate("completely different words about nothing in particular here")
+    assert sum(len(r) for r in requested) < 5
+
+
+def test_sketch_keeps_only_the_most_recent_sentences():
+    index = NearDuplicateIndex(_corpus(SKETCH_LIMIT + 50))
+    index.add(WAKED)
+    restored = NearDuplicateIndex()
+    restored.load_sketch(index.sketch(), hydrate=lambda ids: [WAKED] if sentence_id(WAKED) in ids else [])
+    assert len(restored.ids()) == SKETCH_LIMIT
+    assert restored.find_near_duplicate(WAKENED) == WAKED
+    assert NearDuplicateIndex().sketch() == "" and not NearDuplicateIndex().load_sketch("")
+
+
+def test_sentence_past_the_sketch_limit_is_excluded_only_exactly():
+    # WAKED is sentence 1 of SKETCH_LIMIT + 51: outside the default sketch window
+    session = NearDuplicateIndex([WAKED])
+    session.update(_corpus(SKETCH_LIMIT + 50))
+    hydrate = lambda ids: [WAKED] if sentence_id(WAKED) in ids else []
+    for limit, found in ((SKETCH_LIMIT, None), (SKETCH_LIMIT + 51, WAKED)):
+        restored = NearDuplicateIndex()
+        restored.add_ids(session.ids())
+        restored.load_sketch(session.sketch(limit), hydrate=hydrate)
+        assert text_hash(WAKED) in restored.exclusion_hashes()  # exact exclusion always holds
+        assert restored.find_near_duplicate(WAKENED) == found, limit
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
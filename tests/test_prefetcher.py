@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Local tests for the speculative next-batch prefetcher.
+No Elasticsearch or API key needed.
+
+Run: python tests/test_prefetcher.py
+"""
+import sys
+import time
+import tempfile
+import threading
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.deduplicator import SentenceIdSet
+from services.prefetcher import RetrievalPrefetcher, state_fingerprint, snapshot_state
+from services.session_store import InMemorySessionStore, SQLiteSessionStore
+
+STATE = {
+    "current_level": 0,
+    "level_offsets": {"0.0": -1, "0": 2, "1": 0},
+    "biblical_parallels": {"keywords": ["grace"]},
+    "used_sentence_ids": SentenceIdSet(["Grace be unto you."]),
+}
+
+
+def _batch(text="And peace from God our Father."):
+    state = {"current_level": 1, "level_offsets": {"0": 3}, "used_sentence_ids": SentenceIdSet([text])}
+    return [{"text": text, "level": 1, "score": 1.0}], state, 1
+
+
+def _wait_done(prefetcher):
+    for _ in range(100):
+        if prefetcher.stats()["inflight"] == 0 and prefetcher.counters["completed"] + prefetcher.counters["failed"]:
+            return
+        time.sleep(0.01)
+
+
+def test_fingerprint_tracks_every_input():
+    base = state_fingerprint(STATE, ["grace"], 15)
+    assert base == state_fingerprint(dict(STATE), ["grace"], 15)
+    moved = dict(STATE, level_offsets={"0.0": -1, "0": 3, "1": 0})
+    more_used = dict(STATE, used_sentence_ids=SentenceIdSet(["Grace be unto you.", "Amen."]))
+    changes = [
+        state_fingerprint(moved, ["grace"], 15),
+        state_fingerprint(more_used, ["grace"], 15),
+        state_fingerprint(STATE, ["grace", "faith"], 15),
+        state_fingerprint(STATE, ["grace"], 20),
+    ]
+    assert base not in changes and len(set(changes)) == 4
+
+
+def test_fingerprint_changes_with_the_corpus():
+    from services import prefetcher as prefetcher_module
+
+    class Generation:
+        value = 4
+
+        def current(self):
+            return self.value
+
+    generation = Generation()
+    original = prefetcher_module.retrieval_cache.generation
+    prefetcher_module.retrieval_cache.generation = generation
+    try:
+        before = state_fingerprint(STATE, ["grace"], 15)
+        generation.value += 1  # an ingest job finished
+        after = state_fingerprint(STATE, ["grace"], 15)
+    finally:
+        prefetcher_module.retrieval_cache.generation = original
+    assert before != after
+
+
+def test_snapshot_is_independent():
+    snapshot = snapshot_state(STATE)
+    snapshot["level_offsets"]["0"] = 99
+    snapshot["used_sentence_ids"].add("Amen.")
+    assert STATE["level_offsets"]["0"] == 2 and len(STATE["used_sentence_ids"]) == 1
+
+
+def test_hit_then_stale_and_miss_with_sqlite_store():
+    store = SQLiteSessionStore(str(Path(tempfile.mkdtemp()) / "s.sqlite3"), 60, table="prefetched_batches")
+    prefetcher = RetrievalPrefetcher(store)
+    fingerprint = state_fingerprint(STATE, ["grace"], 15)
+
+    prefetcher.schedule("s1", fingerprint, _batch)
+    _wait_done(prefetcher)
+    sentences, state, level = prefetcher.take("s1", fingerprint)
+    assert sentences[0]["text"].startswith("And peace") and level == 1
+    assert "And peace from God our Father." in state["used_sentence_ids"]
+    assert prefetcher.take("s1", fingerprint) is None  # consumed
+
+    prefetcher.schedule("s1", fingerprint, _batch)
+    _wait_done(prefetcher)
+    assert prefetcher.take("s1", "other-state") is None
+    stats = prefetcher.stats()
+    assert (stats["hits"], stats["misses"], stats["stale"]) == (1, 1, 1)
+    prefetcher.close()
+
+
+def test_waits_for_matching_inflight_prefetch():
+    prefetcher = RetrievalPrefetcher(InMemorySessionStore(60))
+    release = threading.Event()
+
+    def slow():
+        release.wait(2)
+        return _batch()
+
+    prefetcher.schedule("s1", "fp", slow)
+    threading.Timer(0.1, release.set).start()
+    assert prefetcher.take("s1", "fp") is not None
+    assert prefetcher.stats()["hits_inflight"] == 1
+    prefetcher.close()
+
+
+def test_disabled_and_failing_prefetch():
+    disabled = RetrievalPrefetcher(InMemorySessionStore(60), enabled=False)
+    disabled.schedule("s1", "fp", _batch)
+    assert disabled.take("s1", "fp") is None and disabled.counters["scheduled"] == 0
+
+    prefetcher = RetrievalPrefetcher(InMemorySessionStore(60))
+    prefetcher.schedule("s1", "fp", lambda: 1 / 0)
+    _wait_done(prefetcher)
+    assert prefetcher.take("s1", "fp") is None
+    assert prefetcher.stats()["failed"] == 1
+    prefetcher.close()
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Local tests for the min-window phrase proximity boost and its Elasticsearch
+rescore form. Compared against the previous Cartesian-product scoring
+(bench_proximity.py).
+No Elasticsearch or API key needed.
+
+Run: python tests/test_proximity.py
+"""
+import re
+import sys
+import random
+from itertools import product
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bench_proximity import legacy_proximity_boost, make_sentence
+from config import settings
+from services.retriever import (
+    calculate_phrase_proximity_boost,
+    build_proximity_rescore,
+    parse_proximity_tiers,
+)
+
+
+def test_known_buckets():
+    cases = [
+        ("heaven is", "The kingdom of heaven is at hand.", 2.0),
+        ("lord's table", "They ate at the Lord's table.", 2.0),  # punctuation between tokens
+        ("heaven is", "Heaven, he said, is near.", 1.0),
+        ("heaven is", "Is heaven near?", 0.0),  # wrong order only
+        ("grace", "Grace be unto you.", 0.0),  # single word
+        ("grace peace", "Grace be unto you.", 0.0),  # missing word
+    ]
+    for query, text, expected in cases:
+        assert calculate_phrase_proximity_boost(query, text) == expected, (query, text)
+        assert legacy_proximity_boost(query, text) == expected, (query, text)
+
+
+def test_repeated_query_words_need_increasing_positions():
+    # Same semantics as the ordered intervals match of the rescore phase
+    cases = [
+        ("the lord the", "The lord said the word.", 1.5),
+        ("the lord the", "Praise the lord the king.", 2.0),
+        ("lord lord", "Lord lord, open to us.", 2.0),
+        ("lord lord", "Lord, Lord, open to us.", 2.0),  # punctuation between tokens
+        ("lord lord", "The Lord is one.", 0.0),  # needs two occurrences
+        ("lord the lord", "The lord said the word.", 0.0),
+    ]
+    for query, text, expected in cases:
+        assert calculate_phrase_proximity_boost(query, text) == expected, (query, text)
+        assert _rescore_multiplier(build_proximity_rescore(query), text) == 1 + expected, (query, text)
+
+
+def test_matches_product_scoring_on_random_sentences():
+    rng = random.Random(3)
+    vocab = ["the", "lord", "is", "my", "shepherd", "grace"]
+    for _ in range(3000):
+        # The product scoring gave repeated query words no proximity boost at all
+        query = " ".join(rng.sample(vocab, rng.randint(1, 4)))
+        text = make_sentence(rng, rng.randint(0, 18), vocab)
+        assert calculate_phrase_proximity_boost(query, text) == legacy_proximity_boost(query, text), (query, text)
+
+
+def test_long_repetitive_sentence_is_fast():
+    text = " ".join(["the lord"] * 2000 + ["is my shepherd"])
+    # Product scoring would enumerate 2000^2 * ... position tuples
+    assert calculate_phrase_proximity_boost("the lord is my shepherd", text) == 2.0
+    assert calculate_phrase_proximity_boost("lord the shepherd", text) == 1.0
+
+
+
+def _analyze(text):
+    """Standard analyzer stand-in: lower-cased word tokens, punctuation dropped."""
+    return re.findall(r"\w+", text.lower())
+
+
+def _intervals_ordered_match(rule, text):
+    """
+    Elasticsearch semantics of an ordered `intervals` match over single terms,
+    by brute force: every term at a strictly increasing position, and at most
+    max_gaps other positions inside the interval.
+    """
+    terms, tokens = _analyze(rule["query"]), _analyze(text)
+    positions = [[i for i, token in enumerate(tokens) if token == term] for term in terms]
+    for combo in product(*positions):
+        if any(a >= b for a, b in zip(combo, combo[1:])):
+            continue
+        if "max_gaps" not in rule or combo[-1] - combo[0] - (len(combo) - 1) <= rule["max_gaps"]:
+            return True
+    return False
+
+
+def _rescore_multiplier(rescore, text):
+    """Evaluate the rescore query body locally (sum of matching constant_score clauses)."""
+    total = 0.0
+    for clause in rescore["query"]["rescore_query"]["bool"]["should"]:
+        spec = clause["constant_score"]
+        if "match_all" in spec["filter"] or _intervals_ordered_match(spec["filter"]["intervals"]["text"]["match"], text):
+            total += spec["boost"]
+    return round(total, 9)
+
+
+def test_rescore_tiers_reproduce_python_boost():
+    rng = random.Random(5)
+    vocab = ["the", "lord", "is", "my", "shepherd", "grace"]
+    for _ in range(2000):
+        query = " ".join(rng.choice(vocab) for _ in range(rng.randint(2, 4)))  # repeats included
+        text = make_sentence(rng, rng.randint(0, 18), vocab)
+        rescore = build_proximity_rescore(query)
+        expected = 1 + calculate_phrase_proximity_boost(query, text)
+        assert abs(_rescore_multiplier(rescore, text) - expected) < 1e-9, (query, text)
+
+
+def test_rescore_shape():
+    assert build_proximity_rescore("grace") is None
+    rescore = build_proximity_rescore("the lord is", window_size=50)
+    assert rescore["window_size"] == 50 and rescore["query"]["score_mode"] == "multiply"
+    gaps = [c["constant_score"]["filter"]["intervals"]["text"]["match"].get("max_gaps")
+            for c in rescore["query"]["rescore_query"]["bool"]["should"][1:]]
+    assert gaps == [None, 10, 6, 4, 2, 0]  # 3 words: tier distance * 2 words in between
+
+
+def test_rescore_window_covers_every_returned_hit():
+    from services import retriever
+
+    class FakeES:
+        def search(self, index, body):
+            self.body = body
+            return {"hits": {"hits": []}}
+
+    fake = FakeES()
+    originals = (retriever.es, retriever.get_embedding)
+    retriever.es, retriever.get_embedding = fake, lambda text: [0.1] * 8
+    try:
+        retriever.knn_search("the lord is", top_k=settings.PROXIMITY_RESCORE_WINDOW + 50, mode="exact")
+    finally:
+        retriever.es, retriever.get_embedding = originals
+    assert fake.body["rescore"]["window_size"] == settings.PROXIMITY_RESCORE_WINDOW + 50
+    assert fake.body["size"] == settings.PROXIMITY_RESCORE_WINDOW + 50
+
+
+def test_boost_tiers_are_configurable():
+    original = settings.PROXIMITY_BOOST_TIERS
+    settings.PROXIMITY_BOOST_TIERS = "0:3.0,2:1.0"
+    try:
+        assert calculate_phrase_proximity_boost("heaven is", "Heaven is near.") == 3.0
+        assert calculate_phrase_proximity_boost("heaven is", "Heaven, he said, is near.") == 1.0
+        assert calculate_phrase_proximity_boost("heaven is", "Heaven a b c is near.") == 0.0
+    finally:
+        settings.PROXIMITY_BOOST_TIERS = original
+    try:
+        parse_proximity_tiers("0:0.5,1:1.5")
+        assert False, "looser tier boosting more must be rejected"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
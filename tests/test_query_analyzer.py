@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Local tests for the unified query analysis (validation and fallback).
+The chat client is replaced by a stand-in, so no API key is needed.
+
+Run: python tests/test_query_analyzer.py
+"""
+import sys
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import services.query_analyzer as query_analyzer
+from services.llm_cache import LLMResponseCache
+
+VALID = {
+    "keywords": ["Faith", "Master's table", "the"],
+    "synonyms": [
+        {"keyword": "faith", "synonyms": ["Belief", "trust"]},
+        {"keyword": "master's table", "synonyms": ["Lord's table"]},
+    ],
+    "stories_characters": ["Canaanite woman"],
+    "scripture_references": ["Matthew 15:21-28"],
+    "biblical_metaphors": ["Crumbs from the Master's table"],
+    "parallel_keywords": ["faith", "crumbs"],
+    "question_variants": ["How great is her faith?", "Why did she ask for crumbs?"],
+}
+
+
+def _analyze(content: str):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    original_client, original_cache = query_analyzer.client, query_analyzer.llm_cache
+    query_analyzer.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    query_analyzer.llm_cache = LLMResponseCache(None, model="test")
+    try:
+        return query_analyzer.analyze_query("Woman at the Master's table"), calls
+    finally:
+        query_analyzer.client, query_analyzer.llm_cache = original_client, original_cache
+
+
+def test_valid_reply_maps_to_per_call_shapes():
+    analysis, calls = _analyze(json.dumps(VALID))
+    assert len(calls) == 1 and "response_format" in calls[0]
+    assert analysis.keywords == ["faith", "master's table"]  # magic word "the" filtered
+    assert analysis.synonyms == {"faith": ["belief", "trust"], "master's table": ["lord's table"]}
+    assert set(analysis.parallels) == {"stories_characters", "scripture_references", "biblical_metaphors", "keywords"}
+    assert analysis.parallels["keywords"] == ["faith", "crumbs"]
+    assert analysis.question_variants.count("\n") == 1
+
+
+def test_invalid_replies_fall_back():
+    broken = dict(VALID, synonyms={"faith": ["belief"]})  # object instead of list of entries
+    missing = {k: v for k, v in VALID.items() if k != "scripture_references"}
+    for content in ["not json", json.dumps(broken), json.dumps(missing), json.dumps(dict(VALID, keywords=[]))]:
+        analysis, _ = _analyze(content)
+        assert analysis is None, content
+
+
+def test_schema_lists_every_field_as_required():
+    schema = query_analyzer.ANALYSIS_SCHEMA
+    assert set(schema["required"]) == set(schema["properties"])
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
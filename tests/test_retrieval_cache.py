@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Local tests for the retrieval cache (services/retrieval_cache.py):
+hits shared across sessions, exclusions applied after the cache, larger
+refetch when exclusions eat the window, index generation invalidation.
+No Elasticsearch or API key needed.
+
+Run: python tests/test_retrieval_cache.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.deduplicator import NearDuplicateIndex
+from services.retrieval_cache import IndexGeneration, RetrievalCache
+
+CORPUS = [f"Sentence number {i} about grace and peace." for i in range(100)]
+
+
+class FakeFetch:
+    """fetch(requests, exclude) over CORPUS: records every call, one list per request."""
+
+    def __init__(self, corpus=CORPUS, fail=False):
+        self.corpus = corpus
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, requests, exclude):
+        self.calls.append((list(requests), exclude))
+        if self.fail:
+            return [None] * len(requests)
+        excluded = set(exclude or ())
+        docs = [t for t in self.corpus if t not in excluded]
+        return [
+            [{"_id": str(i), "_score": 1.0, "_source": {"text": t}} for i, t in enumerate(docs[:size])]
+            for _, size in requests
+        ]
+
+
+def _cache(tmp, **kwargs):
+    return RetrievalCache(IndexGeneration(str(Path(tmp) / "generation.sqlite3")), **kwargs)
+
+
+def _texts(hits):
+    return [h["_source"]["text"] for h in hits]
+
+
+def test_second_lookup_is_served_from_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache, fetch = _cache(tmp), FakeFetch()
+        shape = {"kind": "text", "query": "grace"}
+        first = cache.search([shape], [10], None, fetch)[0]
+        second = cache.search([dict(shape)], [10], None, fetch)[0]
+        assert _texts(first) == _texts(second) == CORPUS[:10]
+        assert len(fetch.calls) == 1 and fetch.calls[0][1] is None  # cached without exclusions
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_exclusions_are_applied_after_the_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache, fetch = _cache(tmp), FakeFetch()
+        shape = {"kind": "text", "query": "grace"}
+        cache.search([shape], [5], None, fetch)
+        used = NearDuplicateIndex(CORPUS[:3])
+        hits = cache.search([shape], [5], used, fetch)[0]
+        assert _texts(hits) == CORPUS[3:8] and len(fetch.calls) == 1
+
+
+def test_refetches_a_larger_window_when_exclusions_eat_it():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache, fetch = _cache(tmp), FakeFetch()
+        shape = {"kind": "vector", "query": "grace"}
+        cache.search([shape], [10], None, fetch)  # window of 30
+        hits = cache.search([shape], [10], set(CORPUS[:28]), fetch)[0]
+        assert _texts(hits) == CORPUS[28:38]
+        assert len(fetch.calls) == 2 and fetch.calls[1][0][0][1] > 30
+        assert cache.stats()["refetches"] == 1
+
+
+def test_misses_share_one_fetch_and_failures_are_not_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = _cache(tmp)
+        shapes = [{"kind": "text", "query": q} for q in ("grace", "peace", "faith")]
+        failing = FakeFetch(fail=True)
+        assert cache.search(shapes, [5, 5, 5], None, failing) == [None, None, None]
+        fetch = FakeFetch()
+        results = cache.search(shapes, [5, 5, 5], None, fetch)
+        assert len(fetch.calls) == 1 and len(fetch.calls[0][0]) == 3
+        assert all(_texts(r) == CORPUS[:5] for r in results)
+
+
+def test_generation_bump_invalidates_every_worker():
+    with tempfile.TemporaryDirectory() as tmp:
+        worker_a, worker_b = _cache(tmp), _cache(tmp)
+        shape = {"kind": "phrase", "query": "grace and peace", "slop": 0}
+        fetch_a, fetch_b = FakeFetch(), FakeFetch()
+        worker_a.search([shape], [5], None, fetch_a)
+        worker_b.search([shape], [5], None, fetch_b)
+        worker_b.generation.bump()  # e.g. /upload served by worker B
+        updated = FakeFetch(corpus=["A brand new sentence about grace."] + CORPUS)
+        hits = worker_a.search([shape], [5], None, updated)[0]
+        assert len(updated.calls) == 1 and _texts(hits)[0] == "A brand new sentence about grace."
+        assert worker_a.stats()["invalidations"] == 1
+
+
+def test_disabled_cache_passes_exclusions_through():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache, fetch = _cache(tmp, enabled=False), FakeFetch()
+        used = set(CORPUS[:2])
+        for _ in range(2):
+            hits = cache.search([{"kind": "text", "query": "grace"}], [5], used, fetch)[0]
+        assert _texts(hits) == CORPUS[2:7]
+        assert len(fetch.calls) == 2 and fetch.calls[0] == ([(0, 5)], used)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Local tests for the session stores (memory / sqlite / Redis protocol).
+The Redis test runs redis-py against a tiny in-process RESP stand-in,
+so no Redis server, Elasticsearch or API key is needed (skipped without the
+redis package).
+
+Run: python tests/test_session_store.py
+"""
+import sys
+import time
+import fnmatch
+import tempfile
+import threading
+import socketserver
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.session_store import (
+    SessionStore,
+    InMemorySessionStore,
+    SQLiteSessionStore,
+    RedisSessionStore,
+    encode_session,
+    decode_session,
+)
+from services.session_manager import SessionManager, ConversationSession
+from services.deduplicator import NearDuplicateIndex, sentence_id
+
+
+# ---------- Minimal Redis-protocol stand-in ----------
+class _RespHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line[:1] == b"*", line
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def _bulk(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        data, expiry, zsets = self.server.data, self.server.expiry, self.server.zsets
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            now = time.time()
+            for key in [k for k, t in expiry.items() if t <= now]:
+                data.pop(key, None)
+                expiry.pop(key, None)
+            if cmd == b"SET":
+                data[args[1]] = args[2]
+                expiry.pop(args[1], None)
+                if len(args) > 4 and args[3].upper() == b"EX":
+                    expiry[args[1]] = now + int(args[4])
+                reply = b"+OK\r\n"
+            elif cmd == b"GET":
+                reply = self._bulk(data.get(args[1]))
+            elif cmd == b"EXPIRE":
+                found = args[1] in data
+                if found:
+                    expiry[args[1]] = now + int(args[2])
+                reply = b":%d\r\n" % found
+            elif cmd == b"DEL":
+                removed = sum((data.pop(k, None) or zsets.pop(k, None)) is not None for k in args[1:])
+                reply = b":%d\r\n" % removed
+            elif cmd == b"ZADD":
+                members = zsets.setdefault(args[1], {})
+                added = sum(args[i + 1] not in members for i in range(2, len(args), 2))
+                for i in range(2, len(args), 2):
+                    members[args[i + 1]] = float(args[i])
+                reply = b":%d\r\n" % added
+            elif cmd == b"ZREM":
+                members = zsets.get(args[1], {})
+                reply = b":%d\r\n" % sum(members.pop(m, None) is not None for m in args[2:])
+            elif cmd == b"ZREMRANGEBYSCORE":
+                members = zsets.get(args[1], {})
+                low, high = float(args[2]), float(args[3])
+                gone = [m for m, score in members.items() if low <= score <= high]
+                for m in gone:
+                    del members[m]
+                reply = b":%d\r\n" % len(gone)
+            elif cmd == b"ZCARD":
+                reply = b":%d\r\n" % len(zsets.get(args[1], {}))
+            elif cmd == b"SCAN":
+                self.server.scans += 1
+                pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+                keys = [k for k in list(data) + list(zsets) if fnmatch.fnmatchcase(k.decode(), pattern)]
+                reply = b"*2\r\n" + self._bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(self._bulk(k) for k in keys)
+            elif cmd == b"PING":
+                reply = b"+PONG\r\n"
+            else:  # CLIENT SETINFO etc.
+                reply = b"+OK\r\n"
+            self.wfile.write(reply)
+
+
+def _resp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _RespHandler)
+    server.daemon_threads = True
+    server.data, server.expiry, server.zsets, server.scans = {}, {}, {}, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _tmp_db() -> str:
+    return str(Path(tempfile.mkdtemp()) / "sessions.sqlite3")
+
+GRACE = "Grace be unto you and peace from God our Father, and from the Lord Jesus Christ."
+
+
+# ---------- Tests ----------
+def test_encoding_is_compact_and_roundtrips():
+    small = {"a": 1}
+    assert encode_session(small) == b'j{"a":1}'
+    big = {"used_sentences": [f"sentence number {i}" for i in range(200)]}
+    blob = encode_session(big)
+    assert blob[:1] == b"z" and len(blob) < 1000
+    assert decode_session(blob) == big
+
+
+def test_memory_store_expires():
+    store = InMemorySessionStore(ttl_seconds=-1)
+    store.put("s1", {"x": 1})
+    assert store.get("s1") is None
+    assert store.count() == 0
+
+
+def test_sqlite_sessions_shared_between_managers():
+    path = _tmp_db()
+    worker_a = SessionManager(store=SQLiteSessionStore(path, ttl_seconds=60))
+    worker_b = SessionManager(store=SQLiteSessionStore(path, ttl_seconds=60))
+
+    session = worker_a.create_session("what is grace?", keywords=["grace"])
+    worker_a.update_session(
+        session.session_id,
+        used_sentences=[GRACE],
+        question_variants="v1",
+        state_dict={"current_level": 2, "level_offsets": {"0": 3}, "used_sentence_ids": ["And peace."]},
+    )
+
+    loaded = worker_b.get_session(session.session_id)
+    assert loaded is not None
+    assert loaded.keywords == ["grace"]
+    assert loaded.current_level == 2 and loaded.level_offsets == {"0": 3}
+    assert len(loaded.used_ids) == 2
+    assert GRACE in loaded.used_ids and "And peace." in loaded.used_ids
+    assert loaded.used_variants == ["v1"]
+    assert worker_b.get_active_count() == 1
+    # Near-duplicate sketch of the shown sentences travels with the session
+    sketched = NearDuplicateIndex()
+    sketched.load_sketch(loaded.get_state_dict()["used_sketch"], hydrate=lambda ids: [GRACE])
+    assert sketched.find_near_duplicate(GRACE.replace("you and", "you, and")) == GRACE
+
+
+def test_sqlite_ttl_expiry():
+    store = SQLiteSessionStore(_tmp_db(), ttl_seconds=-1)
+    store.put("s1", {"x": 1})
+    assert store.get("s1") is None
+    assert store.purge_expired() == 1
+
+
+def test_session_dict_stores_ids_and_reads_legacy_texts():
+    session = ConversationSession(session_id="s1", original_query="q")
+    session.used_ids.update([f"sentence number {i}" for i in range(1000)])
+    data = session.to_dict()
+    assert "used_sentences" not in data
+    assert len(encode_session(data)) < 1000 * 8 * 2  # base64 of 8 bytes per ID
+
+    restored = ConversationSession.from_dict(data)
+    assert restored.used_ids == session.used_ids
+
+    legacy = dict(data, used_ids="", used_sentences=["Old text."])
+    assert "Old text." in ConversationSession.from_dict(legacy).used_ids
+
+
+def test_sketch_window_follows_the_setting():
+    from config import settings
+
+    original = settings.SESSION_SKETCH_LIMIT
+    try:
+        for limit in (300, 400):
+            settings.SESSION_SKETCH_LIMIT = limit
+            session = ConversationSession("s", "q")
+            session.add_used([GRACE] + [f"Verse {i}: and the word of the Lord came unto the prophet." for i in range(350)])
+            restored = NearDuplicateIndex()
+            restored.load_sketch(session.used_sketch, hydrate=lambda ids: [GRACE] if sentence_id(GRACE) in ids else [])
+            assert len(restored.ids()) == min(limit, 351)
+            assert restored.is_near_duplicate(GRACE.replace(",", "")) == (limit > 350)
+    finally:
+        settings.SESSION_SKETCH_LIMIT = original
+
+
+def test_redis_store_against_resp_stand_in():
+    redis = pytest.importorskip("redis")  # optional dependency (SESSION_BACKEND=redis)
+
+    server = _resp_server()
+    try:
+        # The stand-in only speaks RESP2
+        client = redis.Redis(host="127.0.0.1", port=server.server_address[1], protocol=2)
+        manager = SessionManager(store=RedisSessionStore("", ttl_seconds=60, client=client))
+        session = manager.create_session("who is moses?", keywords=["moses"])
+        manager.update_session(session.session_id, used_sentences=["Moses spake."], increment_level=True)
+
+        other = SessionManager(store=RedisSessionStore("", ttl_seconds=60, client=client))
+        loaded = other.get_session(session.session_id)
+        assert loaded.continue_count == 1 and "Moses spake." in loaded.used_ids
+        assert server.expiry[f"session:{session.session_id}".encode()] > time.time()
+        # Counted from the expiry index, not by scanning the keyspace
+        assert other.get_active_count() == 1 and server.scans == 0
+        expired = manager.create_session("who is aaron?")
+        server.zsets[b"session:index"][expired.session_id.encode()] = time.time() - 1
+        assert other.get_active_count() == 1  # expired entries are dropped from the index
+        gone = manager.create_session("who is miriam?")
+        manager.delete_session(gone.session_id)
+        assert other.get_active_count() == 1
+
+        other.clear_all_sessions()
+        assert manager.get_session(session.session_id) is None and not server.zsets
+    finally:
+        server.shutdown()
+
+
+def test_slow_session_store_does_not_block_other_requests():
+    import asyncio
+    import main
+    from fastapi import HTTPException
+
+    reading, release = threading.Event(), threading.Event()
+
+    class SlowStore(InMemorySessionStore):
+        def get(self, session_id):
+            reading.set()
+            release.wait(5)  # e.g. a slow Redis round trip
+            return super().get(session_id)
+
+    async def scenario():
+        continued = asyncio.ensure_future(main.continue_conversation(main.ContinueRequest(session_id="missing")))
+        assert await asyncio.to_thread(reading.wait, 5)
+        await main.root()  # another request on the same event loop while the read waits
+        served_first = not release.is_set()
+        release.set()
+        try:
+            await continued
+        except HTTPException as e:
+            return served_first, e.status_code
+
+    original = main.session_manager
+    main.session_manager = SessionManager(store=SlowStore(ttl_seconds=60))
+    timer = threading.Timer(2.0, release.set)  # unblocks a read that holds the event loop
+    timer.start()
+    try:
+        served_first, status_code = asyncio.run(scenario())
+    finally:
+        timer.cancel()
+        release.set()
+        main.session_manager = original
+    assert served_first and status_code == 404
+
+
+def test_store_interface_is_abstract():
+    class Partial(SessionStore):
+        def get(self, session_id):
+            return None
+
+    try:
+        Partial(60)
+        raise AssertionError("a store missing methods must not be instantiable")
+    except TypeError:
+        pass
+
+
+def test_bad_backend_fails_startup():
+    from config import settings
+    from services import session_manager as sm
+
+    original = settings.SESSION_BACKEND, settings.SESSION_REDIS_URL
+    try:
+        for backend, url in (("sqlit", settings.SESSION_REDIS_URL), ("redis", "redis://127.0.0.1:1/0")):
+            settings.SESSION_BACKEND, settings.SESSION_REDIS_URL = backend, url
+            failed = False
+            try:
+                sm._create_session_manager()
+            except Exception:
+                failed = True
+            assert failed, f"{backend} must not fall back to in-memory sessions"
+    finally:
+        settings.SESSION_BACKEND, settings.SESSION_REDIS_URL = original
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
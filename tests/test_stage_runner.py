@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Local tests for the StageGraph used by /ask and /continue.
+No Elasticsearch or API key needed.
+
+Run: python tests/test_stage_runner.py
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.stage_runner import StageGraph, iterate_in_thread
+
+
+def _slow(value, seconds=0.2):
+    time.sleep(seconds)
+    return value
+
+
+def test_independent_stages_overlap():
+    graph = StageGraph()
+    for name in ["a", "b", "c"]:
+        graph.add(name, _slow, name)
+    started = time.perf_counter()
+    results = asyncio.run(graph.run())
+    elapsed = time.perf_counter() - started
+    assert results == {"a": "a", "b": "b", "c": "c"}
+    assert elapsed < 0.45, elapsed  # ~0.2s, not 0.6s
+
+
+def test_dependencies_receive_results():
+    graph = StageGraph()
+    graph.add("keywords", _slow, ["grace", "faith"], 0.05)
+    graph.add("upper", lambda r: [k.upper() for k in r["keywords"]], deps=["keywords"])
+    results = asyncio.run(graph.run())
+    assert results["upper"] == ["GRACE", "FAITH"]
+    assert graph.timings()["critical_path"] == ["keywords", "upper"]
+
+
+def test_coroutine_stage_and_second_run():
+    async def fan_out(results):
+        return await asyncio.gather(*(asyncio.to_thread(_slow, k, 0.1) for k in results["keywords"]))
+
+    async def scenario():
+        graph = StageGraph()
+        graph.add("keywords", lambda: ["a", "b", "c"])
+        graph.add("fan_out", fan_out, deps=["keywords"])
+        await graph.run()
+        graph.add("answer", "+".join, graph.results["fan_out"])
+        return graph, await graph.run()
+
+    graph, results = asyncio.run(scenario())
+    assert results["answer"] == "a+b+c"
+    assert graph.timings()["critical_path"] == ["keywords", "fan_out", "answer"]
+    assert graph.timings()["stages"]["fan_out"]["duration_ms"] < 250
+
+
+def test_failure_propagates():
+    def boom():
+        raise RuntimeError("stage failed")
+
+    graph = StageGraph()
+    graph.add("ok", _slow, 1, 0.01)
+    graph.add("bad", boom)
+    try:
+        asyncio.run(graph.run())
+    except RuntimeError as e:
+        assert "stage failed" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
+
+
+def test_unknown_dependency_rejected():
+    graph = StageGraph()
+    try:
+        graph.add("x", lambda r: r, deps=["missing"])
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+
+def test_iterate_in_thread_streams_items():
+    def tokens():
+        for t in ["a", "b", "c"]:
+            time.sleep(0.05)
+            yield t
+
+    async def consume():
+        arrivals = []
+        started = time.perf_counter()
+        async for item in iterate_in_thread(tokens):
+            arrivals.append((item, time.perf_counter() - started))
+        return arrivals
+
+    arrivals = asyncio.run(consume())
+    assert [a[0] for a in arrivals] == ["a", "b", "c"]
+    assert arrivals[0][1] < 0.12  # first item arrives before the iterator is exhausted
+
+
+def test_continue_generates_synonyms_only_when_the_walk_reaches_level2():
+    import main
+    import services.multi_level_retriever as mlr
+    from services.session_manager import ConversationSession
+
+    calls = []
+
+    def fake_synonyms(keyword):
+        calls.append(keyword)
+        return [f"{keyword}-syn"]
+
+    def fake_batch(session_state, keywords, synonyms=None, **kwargs):
+        if session_state["current_level"] >= 2:  # Level 2 asks for the synonym terms
+            mlr.MultiLevelRetriever(keywords, synonyms=synonyms)._get_all_synonym_terms()
+        return [{"text": "Grace be unto you.", "level": session_state["current_level"]}], session_state, 0
+
+    patched = {
+        (mlr, "generate_synonyms"): fake_synonyms,
+        (main, "generate_synonyms"): fake_synonyms,
+        (main, "get_next_batch"): fake_batch,
+        (main, "generate_question_variants"): lambda *args, **kwargs: "",
+        (main, "extract_keywords"): lambda *args, **kwargs: "",
+        (main.prefetcher, "take"): lambda *args, **kwargs: None,
+    }
+    originals = {target: getattr(*target) for target in patched}
+    for (module, name), fn in patched.items():
+        setattr(module, name, fn)
+    try:
+        previews = []
+        for level in (0, 2):
+            session = ConversationSession(session_id=f"s{level}", original_query="grace and faith",
+                                          keywords=["grace", "faith"], current_level=level)
+            ctx = asyncio.run(main._prepare_continue(main.ContinueRequest(session_id=session.session_id), session))
+            previews.append((list(calls), [entry["synonyms"] for entry in ctx["level2_synonyms_by_keyword"]]))
+    finally:
+        for (module, name), fn in originals.items():
+            setattr(module, name, fn)
+    # Batch filled at Level 0: no synonym LLM call, none in the preview
+    assert previews[0] == ([], [[], []])
+    # Walk at Level 2: one call per keyword, shown in the preview
+    assert previews[1] == (["grace", "faith"], [["grace-syn"], ["faith-syn"]])
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Local tests for the streaming upload path: sample-based encoding detection,
+incremental decoding, the generator splitter (services/splitter.py
+iter_sentences) and /upload feeding sentences straight into the ingest.
+No Elasticsearch, NLTK data or API key needed (sent_tokenize is replaced
+by a simple punctuation splitter).
+
+Run: python tests/test_streaming_upload.py
+"""
+import io
+import re
+import sys
+import random
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services import splitter
+from services.splitter import iter_sentences, split_into_sentences
+from services.text_decoder import detect_encoding, iter_text_chunks
+
+VERSES = [f"{i}:{i % 7} And the word of the Lord came unto him, saying {i}." for i in range(1, 160)]
+PROSE = (
+    "In the beginning God created the heaven and the earth. And the earth was without form, "
+    "and void; and darkness was upon the face of the deep.\n\nAnd God said, Let there be light: "
+    "and there was light! And God saw the light, that it was good? And God divided the light "
+    "from the darkness.   And God called the light Day, and the darkness he called Night."
+)
+
+
+def _simple_sent_tokenize(text):
+    return [p for p in re.split(r"(?<=[.!?])\s+", text) if p]
+
+
+def _chunked(text, rng, max_size=40):
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, max_size)
+        yield text[pos:pos + size]
+        pos += size
+
+
+class _PatchedTokenizer:
+    def __enter__(self):
+        self.original = splitter.sent_tokenize
+        splitter.sent_tokenize = _simple_sent_tokenize
+
+    def __exit__(self, *exc):
+        splitter.sent_tokenize = self.original
+
+
+def test_line_mode_matches_whole_text_split_across_any_chunking():
+    text = "\r\n".join(VERSES) + "\r\n\r\nx\r\n  The end of the book.  "
+    expected = split_into_sentences(text, split_mode="line")
+    rng = random.Random(1)
+    for _ in range(50):
+        assert list(iter_sentences(_chunked(text, rng), split_mode="line")) == expected
+
+
+def test_nltk_mode_matches_whole_text_split_across_any_chunking():
+    with _PatchedTokenizer():
+        expected = split_into_sentences(PROSE, split_mode="nltk")
+        assert len(expected) == 6
+        rng = random.Random(2)
+        for _ in range(50):
+            assert list(iter_sentences(_chunked(PROSE, rng), split_mode="nltk")) == expected
+
+
+def test_auto_mode_decides_from_the_sample():
+    verse_text = "\n".join(VERSES)
+    assert list(iter_sentences([verse_text[:500], verse_text[500:]])) == split_into_sentences(verse_text)
+    with _PatchedTokenizer():
+        assert list(iter_sentences(_chunked(PROSE, random.Random(3)))) == split_into_sentences(PROSE)
+
+
+def test_sentences_are_yielded_before_the_input_is_consumed():
+    consumed = []
+
+    def endless_chunks():
+        for i in range(100_000):  # ~50MB of text if fully read
+            consumed.append(i)
+            yield "".join(f"Line {i}-{j} of a very long verse file.\n" for j in range(12))
+
+    sentences = iter_sentences(endless_chunks(), split_mode="line")
+    first = [next(sentences) for _ in range(20)]
+    assert first[0] == "Line 0-0 of a very long verse file." and len(consumed) <= 2
+
+
+def test_unterminated_text_is_flushed_past_the_pending_limit():
+    original = splitter.MAX_PENDING_CHARS
+    splitter.MAX_PENDING_CHARS = 100
+    try:
+        sentences = list(iter_sentences(("word " * 10 for _ in range(30)), split_mode="line"))
+    finally:
+        splitter.MAX_PENDING_CHARS = original
+    assert len(sentences) > 1 and sum(s.count("word") for s in sentences) == 300
+
+
+def test_encoding_detection_and_incremental_decoding():
+    text = "Blessed are the meek — “for they shall inherit the earth.” Ça va.\n" * 50
+    assert detect_encoding(text.encode("utf-8")) == "utf-8"
+    assert detect_encoding("He said “grace” to all.\n".encode("cp1252")) == "cp1252"
+    assert detect_encoding(text.encode("utf-16")) == "utf-16"
+    for encoding in ("utf-8", "utf-16", "cp1252"):
+        raw = text.replace("—", "-").encode(encoding)
+        # 1-byte chunks split every multi-byte character
+        decoded = "".join(iter_text_chunks(io.BytesIO(raw), encoding, chunk_size=1))
+        assert decoded == text.replace("—", "-"), encoding
+    # A sample cut inside a character is still UTF-8
+    assert detect_encoding(("é" * 10).encode("utf-8")[:-1]) == "utf-8"
+
+
+def test_upload_streams_sentences_into_the_ingest():
+    import tempfile
+    import main
+    from fastapi.testclient import TestClient
+    from services import ingest_jobs as jobs_module
+
+    received = {}
+
+    def fake_ingest(sentences, file_id=None, batch_size=500, start_index=0, on_progress=None):
+        received["is_list"] = isinstance(sentences, list)
+        received["sentences"] = list(sentences)
+        total = len(received["sentences"])
+        return {"total_sentences": total, "max_level": (total - 1) // 5, "committed": total, "stages": {}}
+
+    original = (main.ingest_jobs, jobs_module.index_sentences_pipelined)
+    with tempfile.TemporaryDirectory() as tmp:
+        runner = jobs_module.IngestJobRunner(jobs_module.JobStore(f"{tmp}/jobs.sqlite3"), upload_dir=f"{tmp}/uploads")
+        main.ingest_jobs, jobs_module.index_sentences_pipelined = runner, fake_ingest
+        try:
+            client = TestClient(main.app)
+            body = ("\r\n".join(VERSES) + "\r\n").encode("cp1252")
+            resp = client.post("/upload?split_mode=line", files={"file": ("bible.txt", body, "text/plain")})
+            empty = client.post("/upload", files={"file": ("empty.txt", b"\n\n  \n", "text/plain")})
+            runner.run_job(runner.store.claim(runner.owner))  # what the job worker does
+            job = client.get(f"/jobs/{resp.json()['job_id']}").json()
+        finally:
+            main.ingest_jobs, jobs_module.index_sentences_pipelined = original
+    assert resp.status_code == 202, resp.text
+    assert not received["is_list"] and received["sentences"] == VERSES
+    assert job["status"] == "done" and job["sentences_indexed"] == len(VERSES)
+    assert empty.status_code == 400 and "No valid sentences" in empty.json()["detail"]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ PASS: {name}")
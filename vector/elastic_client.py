@@ -1,7 +1,21 @@
 # vector/elastic_client.pys
+import re
+import time
+import uuid
+import logging
+import threading
+import statistics
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 from elasticsearch import Elasticsearch
 from config import settings
 
+logger = logging.getLogger(__name__)
+
+VECTOR_FIELD = "embedding"
+EMBEDDING_DIMS = 1536  # embedding size của OpenAI text-embedding-3-small
+MAX_NUM_CANDIDATES = 10000  # Elasticsearch hard limit for knn num_candidates
+
 
 def get_es_client():
     if settings.ES_USERNAME and settings.ES_PASSWORD:
@@ -17,31 +31,352 @@ def get_es_client():
 
 es = get_es_client()
 
+# Flipped off by init_index() when an old index has a non-indexed embedding field
+_knn_available = True
+
+# Bulk loads in progress per index (this process) and the settings to restore after the last one
+_bulk_loads: Dict[str, int] = {}
+_bulk_restore: Dict[str, Dict[str, Any]] = {}
+_bulk_lock = threading.Lock()
+# Values only ever set by bulk_load_settings: never "restored" (a crashed load left them behind)
+_LOADING_REFRESH = "-1"
+_LOADING_REPLICAS = "0"
+FORCE_MERGE_TIMEOUT = 3600
+
 
 def init_index():
     """
     Tạo index nếu chưa tồn tại.
+    ES_INDEX_NAME là một alias trỏ tới index vật lý "<alias>-<timestamp>-<id>"
+    (/replace và DELETE /documents build index mới rồi flip alias, xem flip_alias).
     Mapping có:
     - text: câu gốc
+    - text_hash: hash 64-bit của text (keyword) để exclude bằng một terms filter
     - level: level nguyên
-    - embedding: dense_vector để search cosine
+    - embedding: dense_vector có HNSW index (similarity cosine) cho knn search
     """
+    global _knn_available
     index_name = settings.ES_INDEX_NAME
     if es.indices.exists(index=index_name):
+        if not es.indices.exists_alias(name=index_name):
+            # Concrete index from before aliases: served as is, swapped for an alias on the next /replace
+            logger.info(f"[ES] '{index_name}' is a plain index; the next /replace or delete moves it behind an alias")
+        _ensure_text_hash_field(index_name)
+        _reset_abandoned_bulk_load(index_name)
+        _knn_available = _embedding_is_indexed(index_name)
+        if not _knn_available and settings.VECTOR_SEARCH_MODE == "knn":
+            logger.warning(
+                f"[ES] '{index_name}' was created without an indexed dense_vector; "
+                "falling back to exact script_score search. Re-upload with /replace to enable knn."
+            )
         return
 
-    mapping = {
+    flip_alias(create_versioned_index())
+    _knn_available = True
+    print(f"Created index behind alias: {index_name}")
+
+
+def _index_body() -> Dict[str, Any]:
+    return {
         "mappings": {
             "properties": {
                 "text": {"type": "text"},
+                "text_hash": {"type": "keyword"},
+                "file_id": {"type": "keyword"},
+                "sentence_index": {"type": "integer"},
                 "level": {"type": "integer"},
                 "embedding": {
                     "type": "dense_vector",
-                    "dims": 1536  # embedding size của OpenAI text-embedding-3-small
+                    "dims": EMBEDDING_DIMS,
+                    "index": True,
+                    "similarity": "cosine",
+                    "index_options": {"type": settings.VECTOR_INDEX_TYPE},
                 }
             }
         }
     }
 
-    es.indices.create(index=index_name, body=mapping)
-    print(f"Created index: {index_name}")
+
+def create_versioned_index() -> str:
+    """Create an empty physical index for the next corpus generation (not searchable until flip_alias)."""
+    alias = settings.ES_INDEX_NAME
+    index_name = f"{alias}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    es.indices.create(index=index_name, body=_index_body())
+    logger.info(f"[ES] Created index {index_name}")
+    return index_name
+
+
+def index_exists(index_name: str) -> bool:
+    return bool(es.indices.exists(index=index_name))
+
+
+def current_indices() -> List[str]:
+    """Physical indices behind the alias (the alias name itself for a pre-alias concrete index)."""
+    alias = settings.ES_INDEX_NAME
+    if es.indices.exists_alias(name=alias):
+        return sorted(es.indices.get_alias(name=alias).keys())
+    if es.indices.exists(index=alias):
+        return [alias]
+    return []
+
+
+def flip_alias(new_index: str) -> List[str]:
+    """
+    Point the alias at new_index in one atomic update_aliases call, then drop
+    the indices it pointed to before. Searches see the old corpus or the new
+    one, never a mix. Returns the dropped indices.
+    """
+    alias = settings.ES_INDEX_NAME
+    old = [name for name in current_indices() if name != new_index]
+    actions: List[Dict[str, Any]] = []
+    for name in old:
+        if name == alias:
+            # A concrete index named like the alias is removed in the same atomic call
+            actions.append({"remove_index": {"index": name}})
+        else:
+            actions.append({"remove": {"index": name, "alias": alias}})
+    actions.append({"add": {"index": new_index, "alias": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    logger.info(f"[ES] Alias {alias} -> {new_index}")
+    for name in old:
+        if name != alias:
+            drop_index(name)
+    return old
+
+
+def drop_index(index_name: str):
+    """Delete a whole index: O(1) compared to delete_by_query, and no tombstones left behind."""
+    try:
+        es.indices.delete(index=index_name, ignore_unavailable=True)
+        logger.info(f"[ES] Dropped index {index_name}")
+    except Exception as e:
+        logger.warning(f"[ES] Could not drop index {index_name}: {e}")
+
+
+def prune_indices(keep: Iterable[str] = ()) -> List[str]:
+    """Drop generations left over by cancelled or crashed builds (not behind the alias, not in keep)."""
+    alias = settings.ES_INDEX_NAME
+    keep = set(keep) | set(current_indices())
+    try:
+        names = es.indices.get(index=f"{alias}-*", ignore_unavailable=True).keys()
+    except Exception as e:
+        logger.warning(f"[ES] Could not list indices: {e}")
+        return []
+    # Only names made by create_versioned_index: "<alias>-YYYYmmdd-HHMMSS-xxxxxx"
+    generation = re.compile(rf"^{re.escape(alias)}-\d{{8}}-\d{{6}}-[0-9a-f]{{6}}$")
+    dropped = [name for name in names if generation.match(name) and name not in keep]
+    for name in dropped:
+        drop_index(name)
+    return dropped
+
+
+def _ensure_text_hash_field(index_name: str):
+    """
+    Add the text_hash keyword field to an index created before it existed.
+    Documents indexed earlier have no hash and are only excluded client-side
+    (is_duplicate) until the corpus is re-uploaded.
+    """
+    try:
+        es.indices.put_mapping(index=index_name, body={"properties": {"text_hash": {"type": "keyword"}}})
+    except Exception as e:
+        logger.warning(f"[ES] Could not add text_hash mapping to '{index_name}': {e}")
+
+
+def _load_settings(index_name: str) -> Dict[str, Optional[str]]:
+    """refresh_interval / number_of_replicas as set on the index (None = Elasticsearch default)."""
+    resp = es.indices.get_settings(index=index_name)
+    index_settings = next(iter(resp.values()))["settings"].get("index", {})
+    return {
+        "refresh_interval": index_settings.get("refresh_interval"),
+        "number_of_replicas": index_settings.get("number_of_replicas"),
+    }
+
+
+def _reset_abandoned_bulk_load(index_name: str):
+    """A process that died during a bulk load leaves refresh disabled: new documents would stay invisible."""
+    try:
+        if _load_settings(index_name)["refresh_interval"] == _LOADING_REFRESH:
+            es.indices.put_settings(index=index_name, body={"index": {"refresh_interval": None}})
+            logger.warning(f"[ES] '{index_name}' had refresh disabled by an interrupted ingest; reset to default")
+    except Exception as e:
+        logger.warning(f"[ES] Could not check refresh settings of '{index_name}': {e}")
+
+
+@contextmanager
+def bulk_load_settings(index_name: str, defer_replicas: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Index settings for the duration of a bulk load: refresh_interval -1 (no
+    segment per bulk request) and, with defer_replicas (an index nobody
+    searches yet), number_of_replicas 0. The settings found on entry are
+    restored by the last load of this process to finish, then one refresh
+    makes every document visible.
+
+    Yields a report dict: refresh_disabled, replicas_deferred, restore_seconds.
+    Disabled by INGEST_BULK_TUNING=false (report says refresh_disabled False).
+    """
+    report: Dict[str, Any] = {"refresh_disabled": False, "replicas_deferred": False}
+    if not settings.INGEST_BULK_TUNING:
+        yield report
+        return
+
+    with _bulk_lock:
+        first = _bulk_loads.get(index_name, 0) == 0
+        _bulk_loads[index_name] = _bulk_loads.get(index_name, 0) + 1
+    try:
+        if first:
+            original = _load_settings(index_name)
+            restore: Dict[str, Any] = {
+                "refresh_interval": None if original["refresh_interval"] == _LOADING_REFRESH
+                else original["refresh_interval"],
+            }
+            loading: Dict[str, Any] = {"refresh_interval": _LOADING_REFRESH}
+            if defer_replicas:
+                restore["number_of_replicas"] = None if original["number_of_replicas"] == _LOADING_REPLICAS \
+                    else original["number_of_replicas"]
+                loading["number_of_replicas"] = 0
+            with _bulk_lock:
+                _bulk_restore[index_name] = restore
+            es.indices.put_settings(index=index_name, body={"index": loading})
+            logger.info(f"[ES] Bulk load settings on {index_name}: {loading}")
+        with _bulk_lock:
+            applied = _bulk_restore.get(index_name, {})
+        report["refresh_disabled"] = "refresh_interval" in applied
+        report["replicas_deferred"] = "number_of_replicas" in applied
+    except BaseException:
+        _end_bulk_load(index_name)
+        raise
+
+    try:
+        yield report
+    finally:
+        started = time.perf_counter()
+        _end_bulk_load(index_name)
+        report["restore_seconds"] = round(time.perf_counter() - started, 3)
+
+
+def _end_bulk_load(index_name: str):
+    with _bulk_lock:
+        _bulk_loads[index_name] -= 1
+        last = _bulk_loads[index_name] == 0
+        restore = _bulk_restore.pop(index_name, None) if last else None
+        if last:
+            del _bulk_loads[index_name]
+    if restore is not None:
+        es.indices.put_settings(index=index_name, body={"index": restore})
+        logger.info(f"[ES] Restored settings on {index_name}: {restore}")
+    # The only refresh of the load: every document written so far becomes searchable
+    es.indices.refresh(index=index_name)
+
+
+def segment_count(index_name: str) -> int:
+    stats = es.indices.stats(index=index_name, metric="segments")
+    return stats["_all"]["primaries"]["segments"]["count"]
+
+
+def measure_search_latency(index_name: str, samples: int = 5, size: int = 20) -> Dict[str, Any]:
+    """
+    Median server-side time ("took", ms) of text and vector searches, using
+    the first `samples` documents of the index as queries.
+    """
+    resp = es.search(index=index_name, body={"size": samples, "_source": ["text", VECTOR_FIELD]})
+    docs = [hit["_source"] for hit in resp["hits"]["hits"]]
+    text_ms, vector_ms = [], []
+    for doc in docs:
+        words = " ".join(doc.get("text", "").split()[:6])
+        text_ms.append(es.search(index=index_name, body={"size": size, "query": {"match": {"text": words}}})["took"])
+        if doc.get(VECTOR_FIELD):
+            body = {"size": size, **build_vector_query(doc[VECTOR_FIELD], size)}
+            vector_ms.append(es.search(index=index_name, body=body)["took"])
+    return {
+        "queries": len(docs),
+        "text_ms": statistics.median(text_ms) if text_ms else None,
+        "vector_ms": statistics.median(vector_ms) if vector_ms else None,
+    }
+
+
+def force_merge(index_name: str, max_num_segments: int) -> Dict[str, Any]:
+    """
+    Merge a freshly loaded index down to max_num_segments segments (only for
+    indices that are no longer written to). Reports segments and search
+    latency before and after the merge.
+    """
+    report: Dict[str, Any] = {"max_num_segments": max_num_segments}
+    report["segments_before"] = segment_count(index_name)
+    report["latency_before"] = measure_search_latency(index_name)
+    started = time.perf_counter()
+    es.options(request_timeout=FORCE_MERGE_TIMEOUT).indices.forcemerge(
+        index=index_name, max_num_segments=max_num_segments
+    )
+    es.indices.refresh(index=index_name)
+    report["merge_seconds"] = round(time.perf_counter() - started, 3)
+    report["segments_after"] = segment_count(index_name)
+    report["latency_after"] = measure_search_latency(index_name)
+    logger.info(
+        f"[ES] Force-merged {index_name}: {report['segments_before']} -> {report['segments_after']} segments "
+        f"in {report['merge_seconds']}s | vector search {report['latency_before']['vector_ms']} -> "
+        f"{report['latency_after']['vector_ms']} ms, text {report['latency_before']['text_ms']} -> "
+        f"{report['latency_after']['text_ms']} ms"
+    )
+    return report
+
+
+def _embedding_is_indexed(index_name: str) -> bool:
+    """Check whether the embedding field supports approximate knn."""
+    try:
+        resp = es.indices.get_mapping(index=index_name)
+        for index_mapping in resp.values():
+            field = index_mapping["mappings"].get("properties", {}).get(VECTOR_FIELD, {})
+            # dense_vector is indexed by default since Elasticsearch 8.11
+            if field and field.get("index", True) is False:
+                return False
+        return True
+    except Exception as e:
+        logger.warning(f"[ES] Could not read mapping for '{index_name}': {e}")
+        return True
+
+
+def get_vector_search_mode() -> str:
+    """Effective vector search mode: 'knn' (HNSW) or 'exact' (brute-force cosine)."""
+    if settings.VECTOR_SEARCH_MODE == "exact" or not _knn_available:
+        return "exact"
+    return "knn"
+
+
+def build_vector_query(
+    query_vector: list,
+    size: int,
+    filter_query: Optional[Dict[str, Any]] = None,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Build the vector part of a search body.
+
+    - knn: native approximate knn query over the HNSW graph, filters applied
+      during graph traversal. boost=2 keeps scores on the same 0..2 scale as
+      the old "cosineSimilarity + 1.0" script ((1 + cos) / 2 * 2).
+    - exact: script_score brute-force cosine over every filtered document.
+      Kept opt-in so relevance can be compared against knn.
+    """
+    mode = mode or get_vector_search_mode()
+
+    if mode == "knn":
+        num_candidates = min(MAX_NUM_CANDIDATES, max(size * settings.KNN_NUM_CANDIDATES_FACTOR, 100))
+        knn: Dict[str, Any] = {
+            "field": VECTOR_FIELD,
+            "query_vector": query_vector,
+            "num_candidates": max(num_candidates, size),
+            "boost": 2.0,
+        }
+        if filter_query is not None:
+            knn["filter"] = filter_query
+        return {"knn": knn}
+
+    return {
+        "script_score": {
+            "query": filter_query if filter_query is not None else {"match_all": {}},
+            "script": {
+                "source": f"cosineSimilarity(params.query_vector, '{VECTOR_FIELD}') + 1.0",
+                "params": {"query_vector": query_vector},
+            },
+        }
+    }